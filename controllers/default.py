@@ -997,6 +997,63 @@ def table():
     else:
         raise HTTP(400, "No resource specified")
 
+# -----------------------------------------------------------------------------
+def task_status():
+    """
+        Status of an asynchronous task (e.g. to poll for completion)
+            - GET default/task_status/<task_id> returns the status as JSON
+            - POST default/task_status/<task_id>/cancel cancels the task,
+              requires the formkey from the status (as _formkey post var)
+            - only accessible for admins and the user who started the task
+    """
+
+    args = request.args
+    if not args:
+        raise HTTP(400, "No task specified")
+
+    task_id = args[0]
+    if task_id.isdigit():
+        task_id = int(task_id)
+
+    status = s3task.status(task_id)
+    if not status or \
+       not auth.s3_has_role("ADMIN") and \
+       (not auth.user or status.user_id != auth.user.id):
+        raise HTTP(404)
+
+    keyname = "_formkey[task_status/%s]" % task_id
+
+    if len(args) > 1 and args[1] == "cancel":
+        if request.env.request_method != "POST":
+            raise HTTP(405)
+        # Validate the formkey
+        formkey = request.post_vars.get("_formkey")
+        keys = session.get(keyname)
+        if not formkey or not keys or formkey not in keys:
+            raise HTTP(403, body=current.ERROR.NOT_PERMITTED)
+        session[keyname] = None
+        s3task.cancel(task_id)
+        status = s3task.status(task_id)
+
+    output = {"task_id": status.task_id,
+              "task": status.task,
+              "status": status.status,
+              "result": status.result,
+              "error": status.error,
+              "start_time": s3_str(status.start_time) if status.start_time else None,
+              "stop_time": s3_str(status.stop_time) if status.stop_time else None,
+              }
+
+    # Formkey to cancel the task
+    if status.status in ("QUEUED", "ASSIGNED", "RUNNING"):
+        import uuid
+        formkey = uuid.uuid4().hex
+        keys = session.get(keyname)
+        session[keyname] = [formkey] if not keys else [formkey] + keys[:9]
+        output["formkey"] = formkey
+
+    return response.json(output)
+
 # -----------------------------------------------------------------------------
 def tos():
     """ Custom View """
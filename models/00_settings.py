@@ -6,6 +6,9 @@
 #   shouldn't typically need to edit any settings here.
 # =============================================================================
 
+# Snapshot the settings after the template config (see S3Config.freeze)
+settings.freeze()
+
 # Keep all our configuration options off the main global variables
 
 # Use response.s3 for one-off variables which are visible in views without explicit passing
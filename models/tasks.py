@@ -125,7 +125,12 @@ def gis_update_location_tree(feature, user_id=None):
     # Run the Task & return the result
     feature = json.loads(feature)
     path = gis.update_location_tree(feature)
+    if feature.get("subtree"):
+        # Update all descendants too (e.g. after moving a parent)
+        gis.rebuild_location_tree(root=feature["id"])
     db.commit()
+    # Remove map tiles cached while the tree was updated
+    s3base.FeatureTiles.invalidate()
     return path
 
 # -----------------------------------------------------------------------------
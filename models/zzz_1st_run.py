@@ -136,6 +136,10 @@ if len(pop_list) > 0:
     # Create indexes for permission table
     auth.permission.create_indexes()
 
+    # Create indexes for the text search index table
+    if settings.get_database_search_index():
+        s3base.SearchIndex.create_indexes()
+
     # =========================================================================
     # Configure Scheduled Tasks
     #
@@ -277,6 +281,13 @@ if len(pop_list) > 0:
 
         duration("Imports for %s complete" % task, start)
 
+    # Report the slowest import tasks
+    timings = sorted(bi.timings, key=lambda t: t[1], reverse=True)[:10]
+    if timings:
+        info("\nSlowest import tasks:")
+        for label, seconds in timings:
+            info("%s (%s sec)" % (label, "{:.2f}".format(seconds)))
+
     if error_list:
         info("\nImport Warnings (some data could not be imported):")
         for error in error_list:
@@ -367,6 +378,13 @@ if len(pop_list) > 0:
         # autovacuum should be on anyway so will run ANALYZE after 50 rows inserted/updated/deleted
         #db.executesql("VACUUM ANALYZE;")
 
+    # OU Hierarchy
+    # Add indexes for ancestor/descendant lookups
+    tablename = "pr_ancestor"
+    s3db.table(tablename)
+    for field in ("ancestor_id", "pe_id"):
+        db.executesql("CREATE INDEX %s_%s__idx on %s(%s);" % (tablename, field, tablename, field))
+
     # =========================================================================
     info("\n*** FIRST RUN COMPLETE ***\n")
 
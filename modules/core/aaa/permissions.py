@@ -25,9 +25,12 @@
     OTHER DEALINGS IN THE SOFTWARE.
 """
 
-__all__ = ("S3Permission",
+__all__ = ("ACLCache",
+           "S3Permission",
            )
 
+import threading
+
 from collections import OrderedDict
 
 from gluon import current, redirect, HTTP, URL
@@ -37,7 +40,165 @@ from s3dal import Field, Row, Table, original_tablename
 
 from ..model import MetaFields
 from ..errors import S3PermissionError
-from ..tools import s3_get_extension
+from ..tools import CacheGenerations, s3_get_extension
+
+# =============================================================================
+class ACLCache:
+    """
+        Process-wide cache for compiled ACLs, to share the results of
+        S3Permission.applicable_acls across requests
+
+        - entries are keyed by (security policy, realms, controller,
+          function, table), where realms are the roles of the user
+          with their realm entities, so that changes of role memberships
+          or realms lead to a different key
+        - the number of entries is limited (least-recently-used eviction)
+        - all entries are invalidated whenever the permissions table is
+          written to (via DAL callbacks, see S3Permission.define_table),
+          and again after the end of the writing transaction, so that
+          ACLs compiled concurrently from outdated (or rolled back)
+          permissions are discarded (see CacheGenerations)
+        - with settings.security.acl_cache_shared, invalidations are
+          propagated across worker processes through the disk cache
+    """
+
+    lock = threading.RLock()
+
+    entries = OrderedDict()
+    generations = CacheGenerations("acl_cache",
+                                   shared = lambda: current.deployment_settings \
+                                                           .get_security_acl_cache_shared(),
+                                   )
+
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def current_generation(cls):
+        """
+            Get the current cache generation
+
+            Returns:
+                the generation
+
+            Note:
+                Callers must capture the generation before compiling the
+                ACLs, and store the compiled ACLs with it
+        """
+
+        return cls.generations.get()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get(cls, key, generation=None):
+        """
+            Look up a compiled ACL set
+
+            Args:
+                key: the cache key
+                generation: the current generation (if already known)
+
+            Returns:
+                the cached item, or None if not found
+        """
+
+        if generation is None:
+            generation = cls.current_generation()
+
+        with cls.lock:
+            entries = cls.entries
+            entry = entries.get(key)
+            if entry is not None:
+                if entry[0] == generation:
+                    entries.move_to_end(key)
+                    cls.hits += 1
+                    return entry[1]
+                # Outdated
+                del entries[key]
+            cls.misses += 1
+        return None
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def store(cls, key, item, generation):
+        """
+            Add a compiled ACL set to the cache
+
+            Args:
+                key: the cache key
+                item: the item to store (must not be modified afterwards)
+                generation: the generation captured before compiling the item
+        """
+
+        maxsize = current.deployment_settings.get_security_acl_cache_size()
+
+        with cls.lock:
+            entries = cls.entries
+            entries[key] = (generation, item)
+            entries.move_to_end(key)
+            while len(entries) > maxsize:
+                entries.popitem(last=False)
+                cls.evictions += 1
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls):
+        """
+            Invalidate all cached ACLs, both immediately and after the
+            end of the current transaction
+        """
+
+        cls.generations.invalidate()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def clear(cls):
+        """
+            Remove all entries from the cache, and reset the counters
+        """
+
+        with cls.lock:
+            cls.entries.clear()
+            cls.hits = cls.misses = cls.evictions = 0
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def attach(cls, table):
+        """
+            Attach invalidation callbacks to the permissions table
+
+            Args:
+                table: the Table
+        """
+
+        cls.generations.attach(table)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def stats(cls):
+        """
+            Cache statistics, for performance monitoring
+
+            Returns:
+                dict {"hits": number of cache hits,
+                      "misses": number of cache misses,
+                      "ratio": hit rate (0.0..1.0),
+                      "size": current number of entries,
+                      "evictions": number of LRU evictions,
+                      }
+        """
+
+        with cls.lock:
+            hits, misses = cls.hits, cls.misses
+            total = hits + misses
+            return {"hits": hits,
+                    "misses": misses,
+                    "ratio": float(hits) / total if total else 0.0,
+                    "size": len(cls.entries),
+                    "evictions": cls.evictions,
+                    }
 
 # =============================================================================
 class S3Permission:
@@ -230,6 +391,9 @@ class S3Permission:
                             )
             self.table = db[self.tablename]
 
+            if current.deployment_settings.get_security_acl_cache():
+                ACLCache.attach(self.table)
+
     # -------------------------------------------------------------------------
     def create_indexes(self):
         """
@@ -394,6 +558,9 @@ class S3Permission:
                     acl["group_id"] = group_id
                     success = table.insert(**acl)
 
+        if success:
+            ACLCache.invalidate()
+
         return success
 
     # -------------------------------------------------------------------------
@@ -1398,13 +1565,129 @@ class S3Permission:
             # No roles available (deny all)
             return acls
 
-        db = current.db
-        table = self.table
-
         c = c or self.controller
         f = f or self.function
         page_restricted = self.page_restricted(c=c, f=f)
 
+        # Be sure to use the original table name
+        if t and hasattr(t, "_tablename"):
+            t = original_tablename(t)
+
+        # Look up the compiled ACLs in the process-wide cache
+        use_cache = current.deployment_settings.get_security_acl_cache()
+        if use_cache:
+            ckey = (self.policy,
+                    tuple(sorted((role, None if e is None else tuple(sorted(e)))
+                                 for role, e in realms.items())),
+                    c,
+                    f if self.use_facls else None,
+                    t if self.use_tacls else None,
+                    page_restricted,
+                    )
+            generation = ACLCache.current_generation()
+            compiled = ACLCache.get(ckey, generation=generation)
+        else:
+            compiled = None
+
+        if compiled is None:
+            compiled = self.compile_acls(roles, realms, c, f, t, page_restricted)
+            if use_cache:
+                ACLCache.store(ckey, compiled, generation)
+
+        acls, default_page_acl, default_table_acl, table_restricted = compiled
+
+        ALL = (self.ALL, self.ALL)
+
+        most_permissive = lambda x, y: (x[0] | y[0], x[1] | y[1])
+        most_restrictive = lambda x, y: (x[0] & y[0], x[1] & y[1])
+
+        ANY = "ANY"
+
+        # Order by precedence
+        s3db = current.s3db
+        ancestors = set()
+        if entity and self.entity_hierarchy and \
+           s3db.pr_instance_type(entity) == "pr_person":
+            # If the realm entity is a person, then we apply the ACLs
+            # for the immediate OU ancestors, for two reasons:
+            # a) it is not possible to assign roles for personal realms anyway
+            # b) looking up OU ancestors of a person (=a few) is much more
+            #    efficient than looking up pr_person OU descendants of the
+            #    role realm (=could be tens or hundreds of thousands)
+            ancestors = set(s3db.pr_default_realms(entity))
+
+        result = {}
+        for e in acls:
+            # Skip irrelevant ACLs
+            if entity and e != entity and e != ANY:
+                if e in ancestors:
+                    key = entity
+                else:
+                    continue
+            else:
+                key = e
+
+            acl = acls[e]
+
+            # Get the page ACL
+            if "f" in acl:
+                page_acl = most_permissive(default_page_acl, acl["f"])
+            elif "c" in acl:
+                page_acl = most_permissive(default_page_acl, acl["c"])
+            elif page_restricted:
+                page_acl = default_page_acl
+            else:
+                page_acl = ALL
+
+            # Get the table ACL
+            if "t" in acl:
+                table_acl = most_permissive(default_table_acl, acl["t"])
+            elif table_restricted:
+                table_acl = default_table_acl
+            else:
+                table_acl = ALL
+
+            # Merge
+            acl = most_restrictive(page_acl, table_acl)
+
+            # Include ACL if relevant
+            if acl[0] & racl == racl or acl[1] & racl == racl:
+                result[key] = acl
+
+        #for pe in result:
+        #    import sys
+        #    sys.stderr.write("ACL for PE %s: %04X %04X\n" %
+        #                        (pe, result[pe][0], result[pe][1]))
+
+        return result
+
+    # -------------------------------------------------------------------------
+    def compile_acls(self, roles, realms, c, f, t, page_restricted):
+        """
+            Look up and merge the ACLs for a set of roles, and determine
+            the default page and table ACLs; helper for applicable_acls
+
+            Args:
+                roles: the role IDs (set)
+                realms: the realms, dict {role: [entity, ...] or None}
+                c: the controller name
+                f: the function name
+                t: the (original) tablename
+                page_restricted: whether the page is restricted
+
+            Returns:
+                tuple (acls, default_page_acl, default_table_acl,
+                       table_restricted), where acls is a dict
+                {entity: {rule_type: (uacl, oacl)}}
+
+            Note:
+                The result can be cached across requests (see ACLCache),
+                so it must not be modified by the caller
+        """
+
+        db = current.db
+        table = self.table
+
         # Base query
         query = (table.group_id.belongs(roles)) & \
                 (table.deleted == False)
@@ -1420,9 +1703,6 @@ class S3Permission:
 
         # Table ACLs
         if t and self.use_tacls:
-            # Be sure to use the original table name
-            if hasattr(t, "_tablename"):
-                t = original_tablename(t)
             tq = (table.tablename == t) & \
                  (table.controller == None) & \
                  (table.function == None)
@@ -1465,9 +1745,9 @@ class S3Permission:
             return None
 
         most_permissive = lambda x, y: (x[0] | y[0], x[1] | y[1])
-        most_restrictive = lambda x, y: (x[0] & y[0], x[1] & y[1])
 
         # Realms
+        acls = {}
         use_realms = self.entity_realm
         for row in rows:
 
@@ -1537,63 +1817,7 @@ class S3Permission:
             elif not page_restricted:
                 acls[ANY] = {"c": default_page_acl}
 
-        # Order by precedence
-        s3db = current.s3db
-        ancestors = set()
-        if entity and self.entity_hierarchy and \
-           s3db.pr_instance_type(entity) == "pr_person":
-            # If the realm entity is a person, then we apply the ACLs
-            # for the immediate OU ancestors, for two reasons:
-            # a) it is not possible to assign roles for personal realms anyway
-            # b) looking up OU ancestors of a person (=a few) is much more
-            #    efficient than looking up pr_person OU descendants of the
-            #    role realm (=could be tens or hundreds of thousands)
-            ancestors = set(s3db.pr_default_realms(entity))
-
-        result = {}
-        for e in acls:
-            # Skip irrelevant ACLs
-            if entity and e != entity and e != ANY:
-                if e in ancestors:
-                    key = entity
-                else:
-                    continue
-            else:
-                key = e
-
-            acl = acls[e]
-
-            # Get the page ACL
-            if "f" in acl:
-                page_acl = most_permissive(default_page_acl, acl["f"])
-            elif "c" in acl:
-                page_acl = most_permissive(default_page_acl, acl["c"])
-            elif page_restricted:
-                page_acl = default_page_acl
-            else:
-                page_acl = ALL
-
-            # Get the table ACL
-            if "t" in acl:
-                table_acl = most_permissive(default_table_acl, acl["t"])
-            elif table_restricted:
-                table_acl = default_table_acl
-            else:
-                table_acl = ALL
-
-            # Merge
-            acl = most_restrictive(page_acl, table_acl)
-
-            # Include ACL if relevant
-            if acl[0] & racl == racl or acl[1] & racl == racl:
-                result[key] = acl
-
-        #for pe in result:
-        #    import sys
-        #    sys.stderr.write("ACL for PE %s: %04X %04X\n" %
-        #                        (pe, result[pe][0], result[pe][1]))
-
-        return result
+        return acls, default_page_acl, default_table_acl, table_restricted
 
     # -------------------------------------------------------------------------
     # Utilities
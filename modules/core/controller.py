@@ -484,11 +484,11 @@ class CRUDRequest:
         methods = self._default_methods
 
         if not methods:
-            from .methods import RESTful, FilterManager, ColumnConfigManager, \
-                                 S3GroupedItemsReport, S3HierarchyCRUD, S3Map, \
-                                 S3Merge, S3MobileCRUD, S3Organizer, S3Profile, \
-                                 S3Report, S3Summary, S3XForms, \
-                                 Select, SpreadsheetImporter, TimePlot
+            from .methods import RESTful, FeatureTiles, FilterManager, \
+                                 ColumnConfigManager, S3GroupedItemsReport, \
+                                 S3HierarchyCRUD, S3Map, S3Merge, S3MobileCRUD, \
+                                 S3Organizer, S3Profile, S3Report, S3Summary, \
+                                 S3XForms, Select, SpreadsheetImporter, TimePlot
 
             methods = {"columns": ColumnConfigManager,
                        "deduplicate": S3Merge,
@@ -506,6 +506,7 @@ class CRUDRequest:
                        "select": Select,
                        "summary": S3Summary,
                        "sync": current.sync,
+                       "tile": FeatureTiles,
                        "timeplot": TimePlot,
                        "xform": S3XForms,
                        }
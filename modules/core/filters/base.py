@@ -693,6 +693,10 @@ class FilterForm:
                 a list of form rows
         """
 
+        # Look up the options of all options filters at once
+        from .options import OptionsFilter
+        OptionsFilter.prefetch(resource, [f for f in self.widgets if f])
+
         rows = []
         rappend = rows.append
         advanced = False
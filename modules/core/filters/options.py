@@ -27,16 +27,21 @@
 
 __all__ = ("OptionsFilter",
            "HierarchyFilter",
+           "FilterOptionsCache",
            )
 
 import re
+import threading
+import time
 
 from collections import OrderedDict
 
 from gluon import current, DIV, INPUT, LABEL, SPAN, TAG, IS_IN_SET
 from gluon.storage import Storage
 
-from ..tools import s3_get_foreign_key, s3_str
+from s3dal import Table, original_tablename
+
+from ..tools import CacheGenerations, s3_get_foreign_key, s3_str
 from ..ui import S3CascadeSelectWidget, S3GroupedOptionsWidget, \
                  S3HierarchyWidget, S3MultiSelectWidget
 from ..resource import S3ResourceField, S3ResourceQuery, S3URLQuery
@@ -381,78 +386,49 @@ class OptionsFilter(FilterWidget):
                 list of options (keys only, no represent)
         """
 
-        colname, rows = None, None
-
         field = rfield.field
+        virtual = not bool(field)
+
         if field and self.opts.reverse_lookup is not False:
-            virtual = False
-
-            ktablename, key = s3_get_foreign_key(field, m2m=False)[:2]
-            if ktablename:
-                ktable = current.s3db.table(ktablename)
-                key_field = ktable[key]
-                colname = str(key_field)
-
-                # Try a reverse-lookup, i.e. select records from the
-                # referenced table that are linked to at least one
-                # record in the filtered table
-                query = resource.get_query()
-                rfilter = resource.rfilter
-                if rfilter:
-                    join = rfilter.get_joins()
-                    left = rfilter.get_joins(left=True)
-                else:
-                    join = left = None
-
-                query &= (key_field == field) & \
-                         current.auth.s3_accessible_query("read", ktable)
-
-                # If the filter field is in a joined table itself,
-                # include the join for that table
-                joins = rfield.join
-                for tname in joins:
-                    query &= joins[tname]
-
-                opts = self.opts
-
-                # Filter options by location?
-                location_filter = opts.get("location_filter")
-                if location_filter and "location_id" in ktable:
-                    location = current.session.s3.location_filter
-                    if location:
-                        query &= (ktable.location_id == location)
-
-                # Filter options by organisation?
-                org_filter = opts.get("org_filter")
-                if org_filter and "organisation_id" in ktable:
-                    root_org = current.auth.root_org()
-                    if root_org:
-                        query &= ((ktable.organisation_id == root_org) | \
-                                  (ktable.organisation_id == None))
-
-                rows = current.db(query).select(key_field,
-                                                resource._id.min(),
-                                                groupby = key_field,
-                                                join = join,
-                                                left = left,
-                                                )
+            lookup = self._reverse_lookup(resource, rfield)
         else:
-            virtual = not bool(field)
-
-        if rows is None:
-            # Fall back to regular forward-lookup, i.e. select all
-            # unique values in the filter field
-            multiple = rfield.ftype[:5] == "list:"
-            groupby = field if field and not multiple else None
-            rows = resource.select([rfield.selector],
-                                   limit = None,
-                                   groupby = groupby,
-                                   virtual = virtual,
-                                   as_rows = True,
-                                   )
-            colname = rfield.colname
-        else:
-            multiple = False
+            lookup = None
+
+        if lookup:
+            # Try a reverse-lookup, i.e. select records from the
+            # referenced table that are linked to at least one
+            # record in the filtered table
+            key_field, query, join, left = lookup
+
+            cache_key = self._cache_key(resource, *lookup)
+            opt_keys = self._cached_options(resource, cache_key)
+            if opt_keys is not None:
+                return opt_keys
+
+            generations = self._cache_generations(resource, lookup)
+            rows = current.db(query).select(key_field,
+                                            resource._id.min(),
+                                            groupby = key_field,
+                                            join = join,
+                                            left = left,
+                                            )
+            colname = str(key_field)
+            opt_keys = list(set(row[colname] for row in rows))
+
+            self._cache_options(resource, cache_key, opt_keys, generations)
+            return list(opt_keys)
+
+        # Fall back to regular forward-lookup, i.e. select all
+        # unique values in the filter field
+        multiple = rfield.ftype[:5] == "list:"
+        groupby = field if field and not multiple else None
+        rows = resource.select([rfield.selector],
+                               limit = None,
+                               groupby = groupby,
+                               virtual = virtual,
+                               as_rows = True,
+                               )
+        colname = rfield.colname
 
         # Extract option keys from rows
         opt_keys = set()
@@ -468,6 +444,261 @@ class OptionsFilter(FilterWidget):
 
         return list(opt_keys)
 
+    # -------------------------------------------------------------------------
+    def _reverse_lookup(self, resource, rfield):
+        """
+            Construct the query for a reverse-lookup of the filter options
+
+            Args:
+                resource: the CRUDResource to filter
+                rfield: the filter field (S3ResourceField)
+
+            Returns:
+                tuple (key_field, query, join, left), or None if the
+                filter field is not a foreign key
+        """
+
+        field = rfield.field
+
+        ktablename, key = s3_get_foreign_key(field, m2m=False)[:2]
+        if not ktablename:
+            return None
+
+        ktable = current.s3db.table(ktablename)
+        key_field = ktable[key]
+
+        query = resource.get_query()
+        rfilter = resource.rfilter
+        if rfilter:
+            join = rfilter.get_joins()
+            left = rfilter.get_joins(left=True)
+        else:
+            join = left = None
+
+        query &= (key_field == field) & \
+                 current.auth.s3_accessible_query("read", ktable)
+
+        # If the filter field is in a joined table itself,
+        # include the join for that table
+        joins = rfield.join
+        for tname in joins:
+            query &= joins[tname]
+
+        opts = self.opts
+
+        # Filter options by location?
+        location_filter = opts.get("location_filter")
+        if location_filter and "location_id" in ktable:
+            location = current.session.s3.location_filter
+            if location:
+                query &= (ktable.location_id == location)
+
+        # Filter options by organisation?
+        org_filter = opts.get("org_filter")
+        if org_filter and "organisation_id" in ktable:
+            root_org = current.auth.root_org()
+            if root_org:
+                query &= ((ktable.organisation_id == root_org) | \
+                          (ktable.organisation_id == None))
+
+        return key_field, query, join, left
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _cache_key(resource, key_field, query, join, left):
+        """
+            Get the cache key for a reverse-lookup
+
+            Args:
+                resource: the CRUDResource to filter
+                key_field: the key field in the referenced table
+                query: the lookup query
+                join: the inner joins for the lookup
+                left: the left joins for the lookup
+
+            Returns:
+                the cache key (str)
+
+            Note:
+                The key is the SQL of the lookup, so it covers both the
+                resource filter and the realms accessible for the user
+        """
+
+        sql = current.db(query)._select(key_field,
+                                        groupby = key_field,
+                                        join = join,
+                                        left = left,
+                                        )
+        return "%s:%s" % (resource.tablename, sql)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _cached_options(resource, cache_key):
+        """
+            Get previously looked-up options, from the current request
+            or from the option set cache
+
+            Args:
+                resource: the CRUDResource to filter
+                cache_key: the cache key
+
+            Returns:
+                list of option keys, or None if not found
+        """
+
+        s3 = current.response.s3
+        looked_up = s3.filter_options
+        if looked_up is None:
+            looked_up = s3.filter_options = {}
+
+        opt_keys = looked_up.get(cache_key)
+        if opt_keys is None and FilterOptionsCache.enabled(resource.tablename):
+            opt_keys = FilterOptionsCache.get(cache_key)
+            if opt_keys is not None:
+                looked_up[cache_key] = opt_keys
+
+        return list(opt_keys) if opt_keys is not None else None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _cache_generations(resource, lookup):
+        """
+            Capture the cache generations of all tables involved in a
+            lookup; to be called before running the lookup query
+
+            Args:
+                resource: the CRUDResource to filter
+                lookup: the lookup, tuple (key_field, query, join, left)
+
+            Returns:
+                dict {tablename: generation}, or None if the option set
+                cache is not enabled for the resource
+        """
+
+        if not FilterOptionsCache.enabled(resource.tablename):
+            return None
+
+        key_field, query, join, left = lookup
+
+        # All tables involved in the lookup
+        tables = current.db._adapter.tables(query, *(join or []), *(left or []))
+        tablenames = {original_tablename(t) for t in tables.values()}
+        for j in (join or []) + (left or []):
+            if isinstance(j, Table):
+                tablenames.add(original_tablename(j))
+
+        generation = FilterOptionsCache.generation
+        return {tn: generation(tn) for tn in tablenames}
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _cache_options(resource, cache_key, opt_keys, generations=None):
+        """
+            Retain looked-up options for the current request, and store
+            them in the option set cache if enabled
+
+            Args:
+                resource: the CRUDResource to filter
+                cache_key: the cache key
+                opt_keys: the option keys
+                generations: the generations of the tables involved in
+                             the lookup, as captured before the lookup
+                             (see _cache_generations)
+        """
+
+        s3 = current.response.s3
+        looked_up = s3.filter_options
+        if looked_up is None:
+            looked_up = s3.filter_options = {}
+        looked_up[cache_key] = opt_keys
+
+        if generations is not None:
+            FilterOptionsCache.store(cache_key, generations, opt_keys)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def prefetch(cls, resource, widgets):
+        """
+            Look up the options of multiple option filters for the same
+            resource in a single combined query, so that rendering the
+            widgets thereafter does not need to run individual lookups
+
+            Args:
+                resource: the CRUDResource to filter
+                widgets: the filter widgets (any types)
+
+            Note:
+                Only reverse-lookups of integer keys can be combined,
+                other options are looked up by the widgets individually
+        """
+
+        if not resource:
+            return
+
+        lookups = []
+        seen = set()
+        for widget in widgets:
+            if not isinstance(widget, cls):
+                continue
+            opts = widget.opts
+            if opts.options is not None or opts.reverse_lookup is False:
+                continue
+
+            selector = widget.field
+            if isinstance(selector, (tuple, list)):
+                selector = selector[0]
+            try:
+                rfield = S3ResourceField(resource, selector)
+            except (SyntaxError, AttributeError):
+                continue
+            if not rfield.field or rfield.ftype == "boolean":
+                continue
+
+            lookup = widget._reverse_lookup(resource, rfield)
+            if not lookup or lookup[0].type not in ("id", "integer"):
+                continue
+
+            cache_key = cls._cache_key(resource, *lookup)
+            if cache_key in seen or \
+               cls._cached_options(resource, cache_key) is not None:
+                continue
+            seen.add(cache_key)
+            lookups.append((cache_key, lookup))
+
+        if len(lookups) < 2:
+            # Nothing to combine
+            return
+
+        db = current.db
+
+        generations = [cls._cache_generations(resource, lookup)
+                       for _, lookup in lookups
+                       ]
+
+        subqueries = []
+        for index, (_, lookup) in enumerate(lookups):
+            key_field, query, join, left = lookup
+            sql = db(query)._select(key_field.with_alias("opt"),
+                                    groupby = key_field,
+                                    join = join,
+                                    left = left,
+                                    )
+            subqueries.append("SELECT %(i)s AS w,l%(i)s.opt FROM (%(sql)s) l%(i)s" % \
+                              {"i": index, "sql": sql.rstrip().rstrip(";")})
+
+        rows = db.executesql("%s;" % " UNION ALL ".join(subqueries))
+
+        options = [set() for _ in lookups]
+        for index, opt in rows:
+            options[index].add(opt)
+
+        for index, (cache_key, _) in enumerate(lookups):
+            cls._cache_options(resource,
+                               cache_key,
+                               list(options[index]),
+                               generations[index],
+                               )
+
     # -------------------------------------------------------------------------
     @staticmethod
     def _add_selected(opt_keys, values, ftype):
@@ -784,4 +1015,253 @@ class HierarchyFilter(FilterWidget):
 
         return variable
 
+# =============================================================================
+class FilterOptionsCache:
+    """
+        Process-wide cache for looked-up option sets of OptionsFilters,
+        to avoid repeating the (aggregate) lookup queries with every page
+        load and Ajax-refresh of filter forms
+
+        - entries are keyed by the lookup query (see OptionsFilter._cache_key),
+          i.e. per resource, filter selector and accessible realms
+        - entries expire after settings.search.filter_options_cache_ttl
+        - entries are invalidated whenever records in any of the tables
+          involved in the lookup are inserted, updated or deleted, and
+          again after the end of the writing transaction (see
+          CacheGenerations)
+        - only tables involved in previously cached lookups are monitored
+          for writes (via DAL callbacks that are attached when the table
+          is defined, or when a lookup involving it is first cached)
+        - with settings.search.filter_options_cache_shared, invalidations
+          (and the set of monitored tables) are propagated across worker
+          processes through the disk cache
+
+        Note:
+            Caching must be enabled in deployment settings, either for all
+            tables or for filter forms of particular resources, e.g.:
+
+                settings.search.filter_options_cache = ("pr_person",
+                                                        "org_organisation",
+                                                        )
+
+            In the latter case, only these tables are monitored for updates,
+            so changes in other tables involved in the lookups take effect
+            only after the TTL.
+
+            With multiple worker processes, a process only learns about
+            newly monitored tables with its next request, so writes in a
+            concurrent request may take effect only after the TTL.
+    """
+
+    lock = threading.RLock()
+
+    entries = OrderedDict()
+    generations = CacheGenerations("filter_options",
+                                   shared = lambda: current.deployment_settings \
+                                                           .get_search_filter_options_cache_shared(),
+                                   )
+
+    # Names of the tables to monitor for writes
+    monitored = set()
+
+    # Maximum number of entries
+    MAXSIZE = 1000
+
+    MONITORED = "filter_options_monitored"
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def enabled(tablename):
+        """
+            Check whether option set caching is enabled for a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                boolean
+        """
+
+        setting = current.deployment_settings.get_search_filter_options_cache()
+        if isinstance(setting, (tuple, list, set)):
+            return tablename in setting
+        return bool(setting)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def generation(cls, tablename):
+        """
+            Get the current cache generation for a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                the generation
+        """
+
+        return cls.generations.get(tablename)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get(cls, key):
+        """
+            Look up a cached option set
+
+            Args:
+                key: the cache key
+
+            Returns:
+                list of option keys, or None if not found or outdated
+        """
+
+        with cls.lock:
+            entries = cls.entries
+            entry = entries.get(key)
+            if entry is None:
+                return None
+
+            expires, generations, opt_keys = entry
+            if expires < time.time() or \
+               any(cls.generation(tn) != g for tn, g in generations.items()):
+                # Outdated
+                del entries[key]
+                return None
+
+            entries.move_to_end(key)
+            return list(opt_keys)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def store(cls, key, generations, opt_keys):
+        """
+            Add an option set to the cache
+
+            Args:
+                key: the cache key
+                generations: the generations of all tables involved in
+                             the lookup, dict {tablename: generation},
+                             as captured before the lookup
+                opt_keys: the option keys
+        """
+
+        ttl = current.deployment_settings.get_search_filter_options_cache_ttl()
+
+        # Make sure all involved tables are monitored
+        cls.monitor(generations.keys())
+
+        with cls.lock:
+            entries = cls.entries
+            entries[key] = (time.time() + ttl, dict(generations), tuple(opt_keys))
+            entries.move_to_end(key)
+
+            # LRU eviction
+            excess = len(entries) - cls.MAXSIZE
+            if excess > 0:
+                popitem = entries.popitem
+                for _ in range(excess):
+                    popitem(last=False)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, tablename):
+        """
+            Invalidate all cached option sets involving a table
+
+            Args:
+                tablename: the table name
+        """
+
+        cls.generations.invalidate(tablename)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def is_monitored(cls, tablename):
+        """
+            Check whether a table is monitored for writes; synchronizes
+            the set of monitored tables with other processes once per
+            request if invalidations are shared
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                boolean
+        """
+
+        s3 = current.response.s3
+        if not s3.filter_options_monitored and cls.generations.is_shared():
+            s3.filter_options_monitored = True
+
+            disk = current.cache.disk
+            shared = disk(cls.MONITORED, lambda: set(), time_expire=None)
+            with cls.lock:
+                monitored = cls.monitored
+                missing = monitored - shared
+                monitored |= shared
+                if missing:
+                    # Publish local additions that have not been shared yet
+                    union = set(monitored)
+                    disk(cls.MONITORED, lambda: union, time_expire=0)
+
+        return tablename in cls.monitored
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def monitor(cls, tablenames):
+        """
+            Start monitoring tables for writes
+
+            Args:
+                tablenames: the table names
+        """
+
+        with cls.lock:
+            added = set(tablenames) - cls.monitored
+            if not added:
+                return
+            cls.monitored |= added
+            union = set(cls.monitored)
+
+        if cls.generations.is_shared():
+            current.cache.disk(cls.MONITORED, lambda: union, time_expire=0)
+
+        # Attach to tables that have already been instantiated in this
+        # request, all others will attach when they are defined
+        db = current.db
+        lazy = db._LAZY_TABLES
+        for tablename in added:
+            if tablename in db.tables and tablename not in lazy:
+                cls.attach(db[tablename])
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def attach(cls, table):
+        """
+            Attach invalidation callbacks to a table if it is monitored;
+            to be called when the table is defined (on_define)
+
+            Args:
+                table: the Table
+        """
+
+        tablename = original_tablename(table)
+
+        if getattr(table, "_filter_options_cache", False) or \
+           not cls.is_monitored(tablename):
+            return
+        table._filter_options_cache = True
+
+        cls.generations.attach(table, tablename)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def clear(cls):
+        """
+            Remove all entries from the cache
+        """
+
+        with cls.lock:
+            cls.entries.clear()
+
 # END =========================================================================
@@ -31,14 +31,15 @@ __all__ = ("XLSXWriter",
 
 import datetime
 import re
+import time
 
 from io import BytesIO
 
 from gluon import HTTP, current
 from gluon.contenttype import contenttype
 
-from ..tools import S3DateTime, get_crud_string, s3_get_foreign_key, \
-                    s3_has_foreign_key, s3_str, s3_strip_markup
+from ..tools import RepresentCache, S3DateTime, S3Represent, get_crud_string, \
+                    s3_get_foreign_key, s3_has_foreign_key, s3_str, s3_strip_markup
 from .base import FormatWriter
 
 ROWS_PER_SHEET = 1048576
@@ -70,6 +71,8 @@ class XLSXWriter(FormatWriter):
                 even_odd: when using colors, render different background colors
                           for even/odd rows (boolean, default True)
                 as_stream: return BytesIO rather than bytes
+                stream: use streaming mode (see encode_stream), None to
+                        decide by number of records (settings.base.xls_stream_threshold)
                 append_to: append to this workbook rather than creating a new one,
                            either a filename, or a byte stream
 
@@ -101,6 +104,17 @@ class XLSXWriter(FormatWriter):
             title = current.T("Report")
 
         list_fields = attr_get("list_fields")
+        if not isinstance(resource, dict) and not attr_get("append_to"):
+            # Use streaming mode for large exports
+            stream = attr_get("stream")
+            if stream is None:
+                threshold = settings.get_xls_stream_threshold()
+                stream = threshold is not None and \
+                         not callable(settings.get_xls_title_row()) and \
+                         resource.count() > threshold
+            if stream:
+                return cls.encode_stream(resource, **attr)
+
         if isinstance(resource, dict):
             # Pre-extracted data dict
             headers = resource.get("headers", {})
@@ -244,6 +258,248 @@ class XLSXWriter(FormatWriter):
 
         return output
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def encode_stream(cls, resource, **attr):
+        """
+            Export a CRUDResource as Microsoft Excel spreadsheet in
+            streaming mode, i.e. extracting, representing and writing
+            the records in batches, using a write-only workbook; memory
+            consumption remains flat regardless of the number of rows
+
+            Args:
+                resource: the CRUDResource
+
+            Keyword Args:
+                see encode(); as_stream and title are supported,
+                append_to is not
+
+            Note:
+                - records are exported in order of their record ID,
+                  any orderby of the resource is ignored
+                - column widths are determined from the first batch
+        """
+
+        T = current.T
+        request = current.request
+        settings = current.deployment_settings
+
+        try:
+            from openpyxl import Workbook
+            from openpyxl.cell import Cell
+            from openpyxl.utils import get_column_letter
+        except ImportError:
+            error = T("Export failed: OpenPyXL library not installed on server")
+            current.log.error(error)
+            raise HTTP(503, body=error)
+
+        start = time.time()
+
+        attr_get = attr.get
+
+        list_fields = attr_get("list_fields")
+        if not list_fields:
+            list_fields = resource.list_fields()
+
+        title = attr_get("title")
+        if title is None:
+            title = get_crud_string(resource.tablename, "title_list")
+
+        # Apply datatable filters
+        get_vars = dict(request.vars)
+        get_vars["iColumns"] = len(list_fields)
+        query, _, left = resource.datatable_filter(list_fields, get_vars)
+        resource.add_filter(query)
+
+        expand_hierarchy = resource.get_config("xls_expand_hierarchy")
+
+        batch_size = settings.get_xls_stream_batch_size()
+        batches = cls.batches(resource,
+                              list_fields,
+                              left = left,
+                              batch_size = batch_size,
+                              )
+
+        # Use the first batch to determine the columns
+        data = next(batches, None)
+        if data is not None:
+            rfields, rows = data.rfields, data.rows
+        else:
+            rfields = resource.resolve_selectors(list_fields)[0]
+            rows = []
+        types, lfields, headers, expanded = cls.columns(rfields,
+                                                        rows,
+                                                        expand_hierarchy,
+                                                        )
+
+        labels = [s3_str(headers[selector]) for selector in lfields
+                  if headers[selector] not in ("Id", "Sort")]
+        num_columns = len(labels)
+
+        # Estimate column widths from the first batch
+        column_widths = [len(label) for label in labels]
+        cls.write_rows(None, rows, lfields, types, column_widths)
+
+        # Create the workbook
+        wb = Workbook(write_only=True, iso_dates=True)
+        cls.add_styles(wb,
+                       use_color = attr_get("use_color", False),
+                       even_odd = attr_get("even_odd", True),
+                       )
+
+        title_row = settings.get_xls_title_row()
+        title_row_length = 2 if title_row else 0
+        rows_per_sheet = ROWS_PER_SHEET - title_row_length - 1
+
+        dt = S3DateTime.to_local(request.utcnow)
+        now = current.calendar.format_datetime(dt, local=True)
+
+        sheet_name = attr_get("sheet_title")
+        if not sheet_name:
+            sheet_name = " ".join(re.sub(r"[\\\/\?\*\[\]:]", " ", s3_str(title)).split())
+        total = resource.count(left=left)
+        multiple = total > rows_per_sheet
+
+        def add_sheet(sheet_number):
+            # Create a new work sheet, with title and label rows
+
+            ws_title = "%s-%s" % (sheet_name[:28], sheet_number) if multiple else sheet_name[:31]
+            ws = wb.create_sheet(ws_title)
+
+            # Column widths must be set before writing any rows
+            for i in range(1, num_columns + 1):
+                ws.column_dimensions[get_column_letter(i)].width = column_widths[i-1] * 1.23
+            ws.freeze_panes = "A%d" % (title_row_length + 2)
+
+            if title_row:
+                # Merging cells is not supported in write-only mode
+                top = Cell(ws, value=s3_str(title))
+                top.style = "large_header"
+                ws.append([top])
+                sub = Cell(ws, value="%s: %s" % (T("Date Exported"), now))
+                sub.style = "header"
+                ws.append([sub])
+
+            label_row = []
+            for l in labels:
+                cell = Cell(ws, value=l)
+                cell.style = "label"
+                label_row.append(cell)
+            ws.append(label_row)
+
+            return ws
+
+        sheet_number = 1
+        ws = add_sheet(sheet_number)
+        written = exported = 0
+
+        while rows:
+            if exported:
+                # Expand hierarchical columns in subsequent batches
+                for rfield, num_levels in expanded:
+                    cls.expand_hierarchy(rfield, num_levels, rows)
+
+            while rows:
+                if written == rows_per_sheet:
+                    sheet_number += 1
+                    ws = add_sheet(sheet_number)
+                    written = 0
+                chunk = rows[:rows_per_sheet - written]
+                rows = rows[len(chunk):]
+                cls.write_rows(ws, chunk, lfields, types, column_widths)
+                written += len(chunk)
+                exported += len(chunk)
+
+            data = next(batches, None)
+            rows = data.rows if data is not None else None
+
+        # Save workbook
+        from tempfile import NamedTemporaryFile
+        with NamedTemporaryFile() as tmp:
+            wb.save(tmp.name)
+            tmp.seek(0)
+            output = tmp.read()
+
+        # Report performance
+        duration = time.time() - start
+        rate = exported / duration if duration else 0
+        try:
+            import resource as rusage
+        except ImportError:
+            peak = "n/a"
+        else:
+            peak = "%.1f MB" % (rusage.getrusage(rusage.RUSAGE_SELF).ru_maxrss / 1024.0)
+        current.log.info("XLSXWriter: exported %s rows from %s in %.2fs (%.0f rows/sec), peak memory %s" % \
+                         (exported, resource.tablename, duration, rate, peak))
+        current.log.debug("XLSXWriter: representation cache %s" % RepresentCache.stats())
+
+        if not attr_get("as_stream", False):
+            filename = "%s_%s.xlsx" % (request.env.server_name, title)
+            disposition = "attachment; filename=\"%s\"" % filename
+            response = current.response
+            response.headers["Content-Type"] = contenttype(".xlsx")
+            response.headers["Content-disposition"] = disposition
+        else:
+            output = BytesIO(output)
+
+        return output
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def batches(resource, list_fields, left=None, batch_size=1000):
+        """
+            Generator to extract and represent the records of a resource
+            in batches, ordered by record ID (keyset pagination, so that
+            each batch costs the same regardless of its position)
+
+            Args:
+                resource: the CRUDResource
+                list_fields: the fields to extract
+                left: additional left joins required for filters
+                batch_size: the number of records per batch
+
+            Yields:
+                ResourceData instances
+        """
+
+        table = resource.table
+        pkey = table._id
+        colname = str(pkey)
+
+        last_id = 0
+        while True:
+            # Select the next batch from a subset of the resource
+            # (leaving the filter of the resource itself unaltered)
+            subset = resource.subset(pkey > last_id)
+            data = subset.select(list_fields,
+                                 left = left,
+                                 limit = batch_size,
+                                 orderby = pkey,
+                                 represent = True,
+                                 show_links = False,
+                                 raw_data = True,
+                                 )
+
+            rows = data.rows
+            if not rows:
+                break
+            last_id = rows[-1]["_row"][colname]
+
+            yield data
+
+            if len(rows) < batch_size:
+                break
+
+            # Release per-request representation caches, so that memory
+            # does not grow with the number of batches
+            for rfield in data.rfields:
+                field = rfield.field
+                renderer = field.represent if field else None
+                if isinstance(renderer, S3Represent) and \
+                   renderer.options is None and renderer.setup:
+                    renderer.theset = {}
+                    renderer.rows = {}
+
     # -------------------------------------------------------------------------
     @classmethod
     def write_rows(cls, ws, batch, lfields, types, column_widths):
@@ -251,7 +507,7 @@ class XLSXWriter(FormatWriter):
             Write the data rows
 
             Args:
-                ws: the worksheet
+                ws: the worksheet, None to only determine the column widths
                 batch: the rows batch
                 lfields: the column selectors
                 types: the column types
@@ -288,6 +544,9 @@ class XLSXWriter(FormatWriter):
                 width = len(value)
                 if width > column_widths[col_idx]:
                     column_widths[col_idx] = width
+                if ws is None:
+                    col_idx += 1
+                    continue
 
                 if ftype == "integer":
                     try:
@@ -319,7 +578,8 @@ class XLSXWriter(FormatWriter):
                     cell.number_format = num_format
                 outrow.append(cell)
                 col_idx += 1
-            ws.append(outrow)
+            if ws is not None:
+                ws.append(outrow)
 
     # -------------------------------------------------------------------------
     @classmethod
@@ -359,12 +619,35 @@ class XLSXWriter(FormatWriter):
                                raw_data = bool(expand_hierarchy),
                                )
 
-        rfields = data.rfields
         rows = data.rows
+        types, lfields, heading = cls.columns(data.rfields, rows, expand_hierarchy)[:3]
+
+        return (title, types, lfields, heading, rows)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def columns(cls, rfields, rows, expand_hierarchy=None):
+        """
+            Determine the columns of the export, expanding hierarchical
+            foreign keys as configured
+
+            Args:
+                rfields: the resource fields (S3ResourceField)
+                rows: the rows extracted from the resource
+                expand_hierarchy: the hierarchy expansion setting,
+                                  {field_selector: [LevelLabel, ...]}
+
+            Returns:
+                tuple (types, lfields, heading, expanded), with expanded
+                being a list of tuples (rfield, num_levels) of all columns
+                that have been expanded
+        """
 
         types = []
         lfields = []
         heading = {}
+        expanded = []
+
         for rfield in rfields:
             if rfield.show:
                 if expand_hierarchy:
@@ -379,6 +662,7 @@ class XLSXWriter(FormatWriter):
                     T = current.T
                     for i, colname in enumerate(colnames):
                         heading[colname] = T(levels[i])
+                    expanded.append((rfield, num_levels))
                 else:
                     lfields.append(rfield.colname)
                     heading[rfield.colname] = rfield.label or \
@@ -388,7 +672,7 @@ class XLSXWriter(FormatWriter):
                     else:
                         types.append(rfield.ftype)
 
-        return (title, types, lfields, heading, rows)
+        return types, lfields, heading, expanded
 
     # -------------------------------------------------------------------------
     @staticmethod
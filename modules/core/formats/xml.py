@@ -29,7 +29,9 @@ import json
 import os
 import re
 import sys
+import threading
 
+from collections import OrderedDict
 from lxml import etree
 from urllib import parse as urlparse
 from urllib.request import urlopen
@@ -230,6 +232,33 @@ class S3XML:
             self.error = "XML Parse error: %s" % sys.exc_info()[1]
             return None
 
+    # -------------------------------------------------------------------------
+    def stylesheet(self, path, entry=None):
+        """
+            Parse an XSLT stylesheet, using the XSLTCache if possible
+
+            Args:
+                path: the stylesheet (pathname or stream)
+                entry: the XSLTCache entry for the path, if already
+                       looked up
+
+            Returns:
+                the stylesheet element tree, or None on parse error
+        """
+
+        if entry is None:
+            entry = XSLTCache.lookup(path)
+
+        stylesheet = entry.tree if entry else None
+        if stylesheet is None:
+            stylesheet = self.parse(path)
+            if entry and stylesheet is not None:
+                entry.tree = stylesheet
+        else:
+            self.error = None
+
+        return stylesheet
+
     # -------------------------------------------------------------------------
     def transform(self, tree, stylesheet_path, **args):
         """
@@ -248,16 +277,25 @@ class S3XML:
         else:
             _args = None
 
-        if isinstance(stylesheet_path, (etree._ElementTree, etree._Element)):
+        # Look up the compiled stylesheet
+        entry = XSLTCache.lookup(stylesheet_path)
+        transformer = entry.transformer if entry else None
+
+        if transformer is not None:
+            stylesheet = entry.tree
+        elif isinstance(stylesheet_path, (etree._ElementTree, etree._Element)):
             # Pre-parsed stylesheet
             stylesheet = stylesheet_path
         else:
-            stylesheet = self.parse(stylesheet_path)
+            stylesheet = self.stylesheet(stylesheet_path, entry=entry)
 
         if stylesheet is not None:
             try:
-                ac = etree.XSLTAccessControl(read_file=True, read_network=True)
-                transformer = etree.XSLT(stylesheet, access_control=ac)
+                if transformer is None:
+                    ac = etree.XSLTAccessControl(read_file=True, read_network=True)
+                    transformer = etree.XSLT(stylesheet, access_control=ac)
+                    if entry:
+                        entry.transformer = transformer
                 if _args:
                     result = transformer(tree, **_args)
                 else:
@@ -2453,6 +2491,57 @@ class S3XML:
             The returned ElementTree can be imported using S3CSV
             stylesheets (through CRUDResource.import_xml()).
 
+            Args:
+                source: the XLS source (stream, or OpenPyXL book, or
+                        None if sheet is an open OpenPyXL sheet)
+                resourcename: the resource name
+                extra_data: dict of extra cols {key:value} to add to each row
+                hashtags: dict of hashtags for extra cols {key:hashtag}
+                sheet: sheet name or index, or an open OpenPyXL sheet
+                       (open worksheet overrides source)
+                rows: Rows range (see xlsx2trees)
+                cols: Columns range (see xlsx2trees)
+                fields: Field map (see xlsx2trees)
+                header_row: the first row contains column headers
+                            (see xlsx2trees)
+
+            Returns:
+                an etree.ElementTree representing the table
+        """
+
+        trees = cls.xlsx2trees(source,
+                               resourcename = resourcename,
+                               extra_data = extra_data,
+                               hashtags = hashtags,
+                               sheet = sheet,
+                               rows = rows,
+                               cols = cols,
+                               fields = fields,
+                               header_row = header_row,
+                               )
+        return next(trees)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def xlsx2trees(cls, source,
+                   resourcename = None,
+                   extra_data = None,
+                   hashtags = None,
+                   sheet = None,
+                   rows = None,
+                   cols = None,
+                   fields = None,
+                   header_row = True,
+                   chunk_size = None):
+        """
+            Generator to convert a table in an XLSX (MS Excel) sheet into
+            ElementTrees, consisting of <table name="format">, <row> and
+            <col field="fieldname"> elements (see: L{csv2tree}), reading
+            the sheet in chunks of rows.
+
+            The returned ElementTree can be imported using S3CSV
+            stylesheets (through CRUDResource.import_xml()).
+
             Args:
                 source: the XLS source (stream, or OpenPyXL book, or
                         None if sheet is an open OpenPyXL sheet)
@@ -2476,9 +2565,11 @@ class S3XML:
                             (if fields is None, they will be used
                             as field names in the output - otherwise
                             they will be ignored)
+                chunk_size: the maximum number of rows per tree, None
+                            to convert the whole table into a single tree
 
-            Returns:
-                an etree.ElementTree representing the table
+            Yields:
+                etree.ElementTree, at least one (possibly empty)
         """
 
         try:
@@ -2493,7 +2584,8 @@ class S3XML:
                 raise HTTP(500, body=cls.json_message(False, 500, "ERROR: %s" % error))
             if int(xlrd.__VERSION__[0]) < 2:
                 current.log.warning("OpenPyXL module should be used for importing XLSX files. Currently using old XLRD for backwards-compatibility, although this has security concerns")
-                return cls.xls2tree(source, resourcename, extra_data, hashtags, sheet, rows, cols, fields, header_row)
+                yield cls.xls2tree(source, resourcename, extra_data, hashtags, sheet, rows, cols, fields, header_row)
+                return
             else:
                 error = "OpenPyXL module is needed for importing XLSX files"
                 current.log.error(error)
@@ -2504,9 +2596,13 @@ class S3XML:
         TAG = cls.TAG
 
         # Root element
-        root = etree.Element(TAG.table)
-        if resourcename is not None:
-            root.set(ATTRIBUTE.name, resourcename)
+        def new_root():
+            root = etree.Element(TAG.table)
+            if resourcename is not None:
+                root.set(ATTRIBUTE.name, resourcename)
+            return root
+        root = new_root()
+        chunks = 0
 
         if isinstance(sheet, openpyxl.worksheet.worksheet.Worksheet):
             # Open worksheet passed as argument => use this
@@ -2712,13 +2808,19 @@ class S3XML:
                     for key in extra_fields:
                         add_col(orow, key, extra_data[key], hashtags=hashtags)
 
+                if chunk_size and len(root) >= chunk_size:
+                    yield etree.ElementTree(root)
+                    chunks += 1
+                    root = new_root()
+
         # OpenPyXL read_only mode requires explicit close
         wb.close()
 
         # Use this to debug the source tree if needed:
         #sys.stderr.write(cls.tostring(root, pretty_print=True))
 
-        return etree.ElementTree(root)
+        if len(root) or not chunks:
+            yield etree.ElementTree(root)
 
     # -------------------------------------------------------------------------
     @classmethod
@@ -2743,6 +2845,43 @@ class S3XML:
             TODO add a character encoding parameter to skip the guessing
         """
 
+        trees = cls.csv2trees(source,
+                              resourcename = resourcename,
+                              extra_data = extra_data,
+                              hashtags = hashtags,
+                              delimiter = delimiter,
+                              quotechar = quotechar,
+                              )
+        return next(trees)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def csv2trees(cls, source,
+                  resourcename = None,
+                  extra_data = None,
+                  hashtags = None,
+                  delimiter = ",",
+                  quotechar = '"',
+                  chunk_size = None):
+        """
+            Generator to convert a table-form CSV source into element trees
+            (see csv2tree), reading the source in chunks of rows
+
+            Args:
+                source: the source (file-like object)
+                resourcename: the resource name
+                extra_data: dict of extra cols {key:value} to add to each row
+                hashtags: dict of hashtags for extra cols {key:hashtag}
+                delimiter: delimiter for values
+                quotechar: quotation character
+                chunk_size: the maximum number of rows per tree,
+                            None to convert the whole source into
+                            a single tree
+
+            Yields:
+                etree.ElementTree, at least one (possibly empty)
+        """
+
         import csv
 
         # Increase field size to be able to import WKTs
@@ -2756,10 +2895,6 @@ class S3XML:
         COL = TAG.col
         SubElement = etree.SubElement
 
-        root = etree.Element(TAG.table)
-        if resourcename is not None:
-            root.set(ATTRIBUTE.name, resourcename)
-
         def add_col(row, key, value, hashtags=None):
             col = SubElement(row, COL)
             col.set(FIELD, s3_str(key))
@@ -2824,7 +2959,7 @@ class S3XML:
                         if all(v[0] == "#" for v in items.values()):
                             hashtags.update(items)
                             continue
-                    row = SubElement(root, ROW)
+                    row = etree.Element(ROW)
                     for k in r:
                         if k:
                             add_col(row, k, r[k], hashtags=hashtags)
@@ -2832,15 +2967,21 @@ class S3XML:
                         for key in extra_data:
                             if key not in r:
                                 add_col(row, key, extra_data[key], hashtags=hashtags)
+                    yield row
             except csv.Error:
                 e = sys.exc_info()[1]
                 raise HTTP(400, body=cls.json_message(False, 400, e))
 
-
-        from io import StringIO
-        if not isinstance(source, StringIO):
+        def read_rows(source):
+            from io import StringIO
+            if isinstance(source, StringIO):
+                yield from read_from_csv(source)
+                return
+            count = 0
             try:
-                read_from_csv(source)
+                for row in read_from_csv(source):
+                    count += 1
+                    yield row
             except UnicodeDecodeError:
                 e = sys.exc_info()[1]
                 try:
@@ -2849,19 +2990,36 @@ class S3XML:
                     fname = fmode = None
                 if fname and fmode and "b" not in fmode:
                     # Perhaps a file opened in text mode with wrong encoding,
-                    # => try to reopen in binary mode
+                    # => try to reopen in binary mode, skipping the rows
+                    # which have already been read
                     with open(fname, "rb") as bsource:
-                        read_from_csv(bsource)
+                        for i, row in enumerate(read_from_csv(bsource)):
+                            if i >= count:
+                                yield row
                 else:
                     raise HTTP(400, body=cls.json_message(False, 400, e))
-        else:
-            read_from_csv(source)
+
+        def new_root():
+            root = etree.Element(TAG.table)
+            if resourcename is not None:
+                root.set(ATTRIBUTE.name, resourcename)
+            return root
+
+        root = new_root()
+        chunks = 0
+        for row in read_rows(source):
+            root.append(row)
+            if chunk_size and len(root) >= chunk_size:
+                yield etree.ElementTree(root)
+                chunks += 1
+                root = new_root()
 
         # Use this to debug the source tree if needed:
         #if source.name[-16:] == "organisation.csv":
         #sys.stderr.write(cls.tostring(root, pretty_print=True).decode("utf-8"))
 
-        return  etree.ElementTree(root)
+        if len(root) or not chunks:
+            yield etree.ElementTree(root)
 
     # -------------------------------------------------------------------------
     # Utilities
@@ -3001,6 +3159,73 @@ class S3EntityResolver(etree.Resolver):
         # Allow everything else (fall back to default resolver)
         return None
 
+# =============================================================================
+class XSLTCache:
+    """
+        Process-wide cache for parsed and compiled XSLT stylesheets, to
+        avoid re-compiling the same stylesheet for every import/export
+
+        - only stylesheets from local files are cached, keyed by their
+          real path, and re-compiled whenever the file is modified (but
+          not if only a stylesheet imported by it has been modified)
+        - lxml XSLT objects must not be used in other threads than the
+          one that created them, so every thread keeps its own entries
+        - the number of entries per thread is limited (least-recently-used
+          eviction)
+    """
+
+    SIZE = 64
+
+    local = threading.local()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def lookup(cls, path):
+        """
+            Look up the cache entry for a stylesheet
+
+            Args:
+                path: the stylesheet path
+
+            Returns:
+                the cache entry (Storage with tree and transformer, both
+                None if not cached yet), or None if the stylesheet can
+                not be cached
+        """
+
+        if not isinstance(path, str) or "://" in path or \
+           not current.deployment_settings.get_base_xslt_cache():
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = os.path.realpath(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+
+        entries = getattr(cls.local, "entries", None)
+        if entries is None:
+            entries = cls.local.entries = OrderedDict()
+
+        entry = entries.get(key)
+        if entry is None or entry.mtime != mtime:
+            entry = Storage(mtime=mtime, tree=None, transformer=None)
+            entries[key] = entry
+            if len(entries) > cls.SIZE:
+                entries.popitem(last=False)
+        else:
+            entries.move_to_end(key)
+
+        return entry
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def clear(cls):
+        """ Remove all entries (of the current thread) """
+
+        cls.local.entries = OrderedDict()
+
 # =============================================================================
 class S3XMLFormat:
     """ Helper class to store a pre-parsed stylesheet """
@@ -3011,7 +3236,13 @@ class S3XMLFormat:
                 stylesheet: the stylesheet (pathname or stream)
         """
 
-        self.tree = current.xml.parse(stylesheet)
+        # Keep the path to use the compiled stylesheet from cache
+        if XSLTCache.lookup(stylesheet):
+            self.path = stylesheet
+        else:
+            self.path = None
+
+        self.tree = current.xml.stylesheet(stylesheet)
         if not self.tree:
             current.log.error("%s parse error: %s" %
                               (stylesheet, current.xml.error))
@@ -3127,6 +3358,6 @@ class S3XMLFormat:
             current.log.error("XMLFormat: no stylesheet available")
             return tree
 
-        return current.xml.transform(tree, self.tree, **args)
+        return current.xml.transform(tree, self.path or self.tree, **args)
 
 # End =========================================================================
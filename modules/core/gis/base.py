@@ -44,7 +44,7 @@ from gluon.languages import lazyT
 from gluon.settings import global_settings
 from gluon.storage import Storage
 
-from s3dal import Rows
+from s3dal import Rows, S3DAL
 
 from ..tools import JSONSEPARATORS, S3Trackable, s3_str
 
@@ -2514,15 +2514,7 @@ class GIS:
         if geojson:
             if count and \
                count > current.deployment_settings.get_gis_max_features():
-                headers = {"Content-Type": "application/json"}
-                message = "Too Many Records"
-                status = 509
-                raise HTTP(status,
-                           body=current.xml.json_message(success=False,
-                                                         statuscode=status,
-                                                         message=message),
-                           web2py_error=message,
-                           **headers)
+                GIS.too_many_records()
             # Lookups per layer not per record
             if len(tablename) > 19 and \
                tablename.startswith("gis_layer_shapefile"):
@@ -2545,7 +2537,6 @@ class GIS:
             # @ToDo: Bulk lookup of LatLons for S3XML.latlon()
             return {}
 
-        NONE = current.messages["NONE"]
         #if DEBUG:
         #    start = datetime.datetime.now()
 
@@ -2637,67 +2628,7 @@ class GIS:
                 # Old-style
                 attr_fields = list(set(popup_fields + attr_fields))
             if attr_fields:
-                attr = {}
-
-                # Make a copy for the pkey insertion
-                fields = list(attr_fields)
-
-                if pkey not in fields:
-                    fields.insert(0, pkey)
-
-                data = resource.select(fields,
-                                       limit = None,
-                                       raw_data = True,
-                                       represent = True,
-                                       show_links = False)
-
-                attr_cols = {}
-                for f in data["rfields"]:
-                    fname = f.fname
-                    selector = f.selector
-                    if fname in attr_fields or selector in attr_fields:
-                        fieldname = f.colname
-                        tname, fname = fieldname.split(".")
-                        try:
-                            ftype = db[tname][fname].type
-                        except AttributeError:
-                            # FieldMethod
-                            ftype = None
-                        except KeyError:
-                            current.log.debug("SGIS: Field %s doesn't exist in table %s" % (fname, tname))
-                            continue
-                        attr_cols[fieldname] = (ftype, fname)
-
-                _pkey = str(_pkey)
-                for row in data["rows"]:
-                    record_id = int(row[_pkey])
-                    if attr_cols:
-                        attribute = {}
-                        for fieldname in attr_cols:
-                            represent = row[fieldname]
-                            if represent is not None and \
-                               represent not in (NONE, ""):
-                                # Skip empty fields
-                                _attr = attr_cols[fieldname]
-                                ftype = _attr[0]
-                                if ftype == "integer":
-                                    if isinstance(represent, lazyT):
-                                        # Integer is just a lookup key
-                                        represent = s3_str(represent)
-                                    else:
-                                        # Attributes should be numbers not strings
-                                        # (@ToDo: Add a JS i18n formatter for the tooltips)
-                                        # NB This also relies on decoding within geojson/export.xsl and S3XML.__element2json()
-                                        represent = row["_row"][fieldname]
-                                elif ftype in ("double", "float"):
-                                    # Attributes should be numbers not strings
-                                    # (@ToDo: Add a JS i18n formatter for the tooltips)
-                                    represent = row["_row"][fieldname]
-                                else:
-                                    represent = s3_str(represent)
-                                attribute[_attr[1]] = represent
-                        attr[record_id] = attribute
-
+                attr = GIS.get_feature_attributes(resource, attr_fields)
                 attributes[tablename] = attr
 
                 #if DEBUG:
@@ -2884,6 +2815,236 @@ class GIS:
                 "styles": styles,
                 }
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_feature_attributes(resource, attr_fields):
+        """
+            Looks up the attributes of features (for popups and styles),
+            with representations looked up in bulk
+
+            Args:
+                resource: the CRUDResource
+                attr_fields: list of field selectors
+
+            Returns:
+                dict {record_id: {fieldname: value}}
+        """
+
+        NONE = current.messages["NONE"]
+
+        db = current.db
+
+        table = resource.table
+        pkey = table._id.name
+
+        attr = {}
+
+        # Make a copy for the pkey insertion
+        fields = list(attr_fields)
+
+        if pkey not in fields:
+            fields.insert(0, pkey)
+
+        data = resource.select(fields,
+                               limit = None,
+                               raw_data = True,
+                               represent = True,
+                               show_links = False)
+
+        attr_cols = {}
+        for f in data["rfields"]:
+            fname = f.fname
+            selector = f.selector
+            if fname in attr_fields or selector in attr_fields:
+                fieldname = f.colname
+                tname, fname = fieldname.split(".")
+                try:
+                    ftype = db[tname][fname].type
+                except AttributeError:
+                    # FieldMethod
+                    ftype = None
+                except KeyError:
+                    current.log.debug("SGIS: Field %s doesn't exist in table %s" % (fname, tname))
+                    continue
+                attr_cols[fieldname] = (ftype, fname)
+
+        _pkey = str(table[pkey])
+        for row in data["rows"]:
+            record_id = int(row[_pkey])
+            if attr_cols:
+                attribute = {}
+                for fieldname in attr_cols:
+                    represent = row[fieldname]
+                    if represent is not None and \
+                       represent not in (NONE, ""):
+                        # Skip empty fields
+                        _attr = attr_cols[fieldname]
+                        ftype = _attr[0]
+                        if ftype == "integer":
+                            if isinstance(represent, lazyT):
+                                # Integer is just a lookup key
+                                represent = s3_str(represent)
+                            else:
+                                # Attributes should be numbers not strings
+                                # (@ToDo: Add a JS i18n formatter for the tooltips)
+                                # NB This also relies on decoding within geojson/export.xsl and S3XML.__element2json()
+                                represent = row["_row"][fieldname]
+                        elif ftype in ("double", "float"):
+                            # Attributes should be numbers not strings
+                            # (@ToDo: Add a JS i18n formatter for the tooltips)
+                            represent = row["_row"][fieldname]
+                        else:
+                            represent = s3_str(represent)
+                        attribute[_attr[1]] = represent
+                attr[record_id] = attribute
+
+        return attr
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def too_many_records():
+        """
+            Raises a HTTP 509 error to tell the map client that there are
+            too many features in a layer (=prompt the user to zoom in)
+        """
+
+        headers = {"Content-Type": "application/json"}
+        message = "Too Many Records"
+        status = 509
+        raise HTTP(status,
+                   body=current.xml.json_message(success=False,
+                                                 statuscode=status,
+                                                 message=message),
+                   web2py_error=message,
+                   **headers)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def export_features(resource, attr_fields=None, chunk_size=500):
+        """
+            Exports the features of a Feature Layer as GeoJSON
+            FeatureCollection, encoding the location data looked-up in
+            bulk directly rather than building an S3XML tree and
+            transforming it with geojson/export.xsl
+
+            Called by RESTful.get_tree() if gis.geojson_bulk is enabled
+
+            Args:
+                resource: the CRUDResource
+                attr_fields: list of attr_fields to use instead of reading
+                             from get_vars or looking up in gis_layer_feature
+                chunk_size: the number of features per output chunk
+
+            Returns:
+                a generator of UTF-8 encoded JSON chunks, or None if the
+                resource requires the XSLT export
+        """
+
+        tablename = resource.tablename
+        if tablename in ("gis_location",
+                         "gis_feature_query",
+                         "gis_cache",
+                         "gis_theme_data",
+                         ) or \
+           tablename.startswith("gis_layer_shapefile"):
+            # Special handling in XSLT
+            return None
+
+        count = resource.count()
+        if count > current.deployment_settings.get_gis_max_features_bulk():
+            GIS.too_many_records()
+
+        # Load the records (=>record IDs, and records for marker_fn)
+        resource.load(limit=None, virtual=False)
+        record_ids = list(resource._ids)
+
+        if record_ids:
+            location_data = GIS.get_location_data(resource,
+                                                  attr_fields = attr_fields,
+                                                  )
+            if location_data is None:
+                # Per-record lookups required
+                return None
+        else:
+            location_data = {}
+
+        get_data = lambda key: location_data.get(key, {}).get(tablename)
+
+        geojsons = get_data("geojsons")
+        latlons = get_data("latlons") or {}
+        attributes = get_data("attributes") or {}
+        styles = get_data("styles") or {}
+
+        markers = get_data("markers")
+        if markers and markers.get("image"):
+            # Single Marker for all features
+            marker, markers = markers, None
+        else:
+            marker = None
+
+        # Assume being used within the Sahana Mapping client
+        # so use local URLs to keep filesize down
+        download_url = "/%s/static/img/markers" % current.request.application
+
+        dumps = json.dumps
+        POINT = '{"type":"Point","coordinates":[%.4f,%.4f]}'
+        FEATURE = '{"type":"Feature","geometry":%s,"properties":%s}'
+
+        def features():
+
+            for record_id in record_ids:
+
+                # Geometries
+                if geojsons is not None:
+                    geometries = geojsons.get(record_id)
+                    if not geometries:
+                        continue
+                else:
+                    latlon = latlons.get(record_id)
+                    if not latlon:
+                        continue
+                    lat, lon = latlon
+                    if lat is None or lon is None:
+                        continue
+                    geometries = [POINT % (lon, lat)]
+
+                # Properties
+                properties = {}
+                m = markers.get(record_id) if markers else marker
+                if m:
+                    properties["marker_url"] = "%s/%s" % (download_url, m["image"])
+                    properties["marker_height"] = m["height"]
+                    properties["marker_width"] = m["width"]
+                properties["id"] = record_id
+                style = styles.get(record_id)
+                if style:
+                    properties["style"] = json.loads(style)
+                attr = attributes.get(record_id)
+                if attr:
+                    properties.update(attr)
+                properties = dumps(properties, separators=JSONSEPARATORS)
+
+                for geometry in geometries:
+                    if geometry:
+                        yield FEATURE % (geometry, properties)
+
+        def collection():
+
+            yield b'{"type":"FeatureCollection","features":['
+
+            chunk, separator = [], ""
+            for feature in features():
+                chunk.append(feature)
+                if len(chunk) == chunk_size:
+                    yield (separator + ",".join(chunk)).encode("utf-8")
+                    chunk, separator = [], ","
+            if chunk:
+                yield (separator + ",".join(chunk)).encode("utf-8")
+
+            yield b"]}"
+
+        return collection()
+
     # -------------------------------------------------------------------------
     @staticmethod
     def get_marker(controller=None,
@@ -4307,11 +4468,10 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
 
         current.log.debug("Updating Location Tree...")
         try:
-            self.update_location_tree()
+            self.rebuild_location_tree()
         except MemoryError:
             # If doing all L2s, it can break memory limits
-            # @ToDo: Check now that we're doing by level
-            current.log.critical("Memory error when trying to update_location_tree()!")
+            current.log.critical("Memory error when trying to rebuild_location_tree()!")
 
         db.commit()
 
@@ -4699,6 +4859,13 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
             else:
                 continue
 
+        db.commit()
+
+        current.log.debug("Updating Location Tree...")
+        self.rebuild_location_tree()
+
+        db.commit()
+
         current.log.debug("All done!")
         return
 
@@ -4871,30 +5038,8 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
 
 
         if not feature:
-            # We are updating all locations.
-            all_locations = True
-            # Do in chunks to save memory and also do in correct order
-            all_fields = (table.id, table.name, table.gis_feature_type,
-                          table.L0, table.L1, table.L2, table.L3, table.L4,
-                          table.lat, table.lon, table.wkt, table.inherited,
-                          # Handle Countries which start with Bounds set, yet are Points
-                          table.lat_min, table.lon_min, table.lat_max, table.lon_max,
-                          table.path, table.parent)
-            for level in ("L0", "L1", "L2", "L3", "L4", "L5", None):
-                query = (table.level == level) & (table.deleted == False)
-                try:
-                    features = db(query).select(*all_fields)
-                except MemoryError:
-                    current.log.error("S3GIS: Unable to update Location Tree for level %s: MemoryError" % level)
-                else:
-                    for feature in features:
-                        feature["level"] = level
-                        wkt = feature["wkt"]
-                        if wkt and not wkt.startswith("POI"):
-                            # Polygons aren't inherited
-                            feature["inherited"] = False
-                        update_location_tree(feature)  # all_locations is False here
-            # All Done!
+            # We are updating all locations
+            GIS.rebuild_location_tree()
             return None
 
 
@@ -5905,6 +6050,222 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
 
         return _path
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def rebuild_location_tree(root=None, batch_size=500):
+        """
+            Bulk-update Materialized path, Lx locations, inherited Lat/Lon
+            and Bounds for all locations in a (sub-)tree
+
+            - other than update_location_tree, this loads the entire
+              (sub-)tree at once and computes all values in a single
+              top-down pass in memory, then writes back only those
+              records which have actually changed
+            - to use after bulk imports of locations (e.g. admin areas),
+              or when moving a parent location
+
+            Args:
+                root: the gis_location record ID of the subtree root,
+                      None to rebuild the whole tree
+                batch_size: the maximum number of records per query, i.e.
+                            parent IDs when collecting the subtree, and
+                            updated locations when writing back the changes
+
+            Returns:
+                the number of updated locations
+        """
+
+        # During prepopulate, for efficiency, we don't update the location
+        # tree, but rather leave that til after prepopulate is complete.
+        if GIS.disable_update_location_tree:
+            return None
+
+        db = current.db
+        try:
+            table = db.gis_location
+        except:
+            table = current.s3db.gis_location
+
+        LEVELS = ("L0", "L1", "L2", "L3", "L4", "L5")
+
+        spatialdb = current.deployment_settings.get_gis_spatialdb() and \
+                    "the_geom" in table.fields
+
+        # Only the start of the WKT is needed to tell points from polygons
+        wkt_start = table.wkt[:5]
+        fields = [table.id,
+                  table.parent,
+                  table.level,
+                  table.name,
+                  table.path,
+                  table.inherited,
+                  table.lat,
+                  table.lon,
+                  table.lat_min,
+                  table.lat_max,
+                  table.lon_min,
+                  table.lon_max,
+                  wkt_start,
+                  ] + [table[level] for level in LEVELS]
+
+        # Collect all locations in the (sub-)tree
+        rows = {}
+        children = {}
+        ancestor = None
+
+        def add(row):
+            rows[row.id] = row
+            children.setdefault(row.parent, []).append(row.id)
+
+        if root is None:
+            query = (table.deleted == False)
+            for row in db(query).select(*fields):
+                add(row)
+            # Locations with unknown (or deleted) parent are tree roots
+            roots = [row_id for row_id, row in rows.items()
+                     if not row.parent or row.parent not in rows]
+        else:
+            row = db(table.id == root).select(limitby=(0, 1), *fields).first()
+            if not row:
+                return 0
+            add(row)
+            roots = [row.id]
+
+            # Assume the parent of the root to be up-to-date
+            if row.parent:
+                parent = db(table.id == row.parent).select(limitby=(0, 1),
+                                                           *fields).first()
+                if parent:
+                    ancestor = {"path": parent.path or str(parent.id),
+                                "names": [parent[level] for level in LEVELS],
+                                "lat": parent.lat,
+                                "lon": parent.lon,
+                                }
+
+            # Collect all descendants, one depth-level at a time
+            parents = roots
+            while parents:
+                found = []
+                for i in range(0, len(parents), batch_size):
+                    query = (table.parent.belongs(parents[i:i+batch_size])) & \
+                            (table.deleted == False)
+                    for row in db(query).select(*fields):
+                        if row.id not in rows:
+                            add(row)
+                            found.append(row.id)
+                parents = found
+
+        # Compute the values top-down
+        updates = {}
+        fixups = []
+
+        stack = [(row_id, ancestor if root is not None else None)
+                 for row_id in roots]
+        visited = set()
+        while stack:
+            row_id, parent = stack.pop()
+            if row_id in visited:
+                current.log.error("S3GIS: circular hierarchy at location %s" % row_id)
+                continue
+            visited.add(row_id)
+
+            row = rows[row_id]
+            level = row.level
+            start = row[wkt_start]
+            polygon = bool(start) and not start.startswith("POI")
+
+            # Materialized path and Lx names
+            if parent and level != "L0":
+                path = "%s/%s" % (parent["path"], row_id)
+                names = list(parent["names"])
+            else:
+                path = str(row_id)
+                names = [None] * len(LEVELS)
+            if level in LEVELS:
+                index = LEVELS.index(level)
+                names[index] = row.name
+                for i in range(index + 1, len(LEVELS)):
+                    names[i] = None
+
+            # Lat/Lon
+            lat, lon = row.lat, row.lon
+            if polygon:
+                # Polygons aren't inherited
+                inherited = False
+                if lat is None or lon is None or row.lat_min is None:
+                    # Needs the centroid and bounds to be computed
+                    fixups.append(row_id)
+            elif level != "L0" and (row.inherited or lat is None or lon is None):
+                inherited = True
+                if parent:
+                    lat, lon = parent["lat"], parent["lon"]
+                else:
+                    lat = lon = None
+            else:
+                inherited = bool(row.inherited) if level != "L0" else False
+
+            values = {"path": path,
+                      "inherited": inherited,
+                      "lat": lat,
+                      "lon": lon,
+                      }
+            for i, name in enumerate(names):
+                values[LEVELS[i]] = name
+            update = {k: v for k, v in values.items() if row[k] != v}
+
+            if not polygon and lat is not None and lon is not None and \
+               (not start or "lat" in update or "lon" in update):
+                # (Re-)generate WKT and bounds of the point
+                update.update(wkt = "POINT (%s %s)" % (lon, lat),
+                              lat_min = lat,
+                              lat_max = lat,
+                              lon_min = lon,
+                              lon_max = lon,
+                              )
+            elif inherited and lat is None and start:
+                # Inherited from a location without geometry
+                update["wkt"] = None
+
+            if spatialdb and "wkt" in update:
+                # Also update the spatial field
+                update["the_geom"] = update["wkt"]
+
+            if update:
+                updates[row_id] = update
+
+            node = {"path": path,
+                    "names": names,
+                    "lat": lat,
+                    "lon": lon,
+                    }
+            for child_id in children.get(row_id, ()):
+                stack.append((child_id, node))
+
+        if len(visited) < len(rows):
+            current.log.error("S3GIS: %s locations not reachable from any root" %
+                              (len(rows) - len(visited)))
+
+        # Write back the changes, one UPDATE statement per batch
+        S3DAL.bulk_update(table, updates, batch_size=batch_size)
+
+        # Compute centroids and bounds of polygons where missing
+        wkt_centroid = GIS.wkt_centroid
+        for row_id in fixups:
+            row = db(table.id == row_id).select(table.id,
+                                                table.wkt,
+                                                limitby = (0, 1),
+                                                ).first()
+            form = Storage(vars = Storage(wkt = row.wkt), errors = Storage())
+            # Also sets the_geom if using a spatial DB
+            wkt_centroid(form)
+            if form.errors:
+                current.log.error("S3GIS: %s" % form.errors)
+                continue
+            form_vars = {k: v for k, v in form.vars.items() if k in table.fields}
+            db(table.id == row_id).update(**form_vars)
+
+        return len(updates) + len(fixups)
+
     # -------------------------------------------------------------------------
     @staticmethod
     def wkt_centroid(form):
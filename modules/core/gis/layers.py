@@ -491,6 +491,17 @@ class LayerFeature(Layer):
             if self.trackable:
                 url = "%s&track=1" % url
 
+            # Per-tile GeoJSON (see FeatureTiles)
+            if not self.aggregate and not self.trackable and \
+               current.deployment_settings.get_gis_feature_tiles():
+                tile_url = "%s.geojson?layer=%i&z={z}&x={x}&y={y}" % \
+                    (URL(c=self.controller, f=self.function, args="tile"),
+                     self.layer_id)
+                if self.filter:
+                    tile_url = "%s&%s" % (tile_url, self.filter)
+            else:
+                tile_url = None
+
             # Mandatory attributes
             output = {"id": self.layer_id,
                       # Defaults client-side if not-provided
@@ -499,6 +510,8 @@ class LayerFeature(Layer):
                       "url_format": url_format,
                       "url": url,
                       }
+            if tile_url:
+                output["tile_url"] = tile_url
 
             popup_format = self.popup_format
             if popup_format:
@@ -4,7 +4,7 @@ from .anonymize import *
 from .cico import *
 from .colmgr import *
 from .crud import *
-from .checkpoint import Checkpoint
+from .checkpoint import Checkpoint, CaseEventRules
 from .distribution import Distribution
 from .dseries import *
 from .filtermgr import *
@@ -24,5 +24,6 @@ from .rolemgr import *
 from .select import Select
 from .ssi import SpreadsheetImporter
 from .summary import *
+from .tiles import FeatureTiles
 from .timeplot import *
 from .xforms import *
@@ -26,6 +26,7 @@
 """
 
 __all__ = ("Checkpoint",
+           "CaseEventRules",
            )
 
 import datetime
@@ -55,6 +56,9 @@ class Checkpoint(CRUDMethod):
     # Event class this method is intended for
     EVENT_CLASS = "C" # Checkpoint
 
+    # Maximum number of labels per batch check
+    MAX_BATCH_SIZE = 200
+
     # -------------------------------------------------------------------------
     def apply_method(self, r, **attr):
         """
@@ -338,12 +342,15 @@ class Checkpoint(CRUDMethod):
 
             Note:
                 Request body is expected to contain a JSON-object like:
-                    {"a": the action ("check"|"register")
+                    {"a": the action ("check"|"register"|"batch")
                      "k": XSRF token
                      "l": the PE label(s)
                      "o": the organisation ID
                      "t": the event type code
                      }
+
+                For the "batch" action (check multiple labels at once), the
+                output format is different, see check_batch
         """
 
         # Load JSON data from request body
@@ -365,6 +372,8 @@ class Checkpoint(CRUDMethod):
             output = self.check(r, json_data)
         elif action == "register":
             output = self.register(r, json_data)
+        elif action == "batch":
+            output = self.check_batch(r, json_data)
         else:
             r.error(400, current.ERROR.BAD_REQUEST)
 
@@ -437,8 +446,14 @@ class Checkpoint(CRUDMethod):
                                                  organisation_id = organisation_id,
                                                  )
 
+            # Event rules for the person and their family members
+            rules = self.event_rules(organisation_id)
+
             # Family members
-            family = self.get_family_members(person.id, organisation_id)
+            family = self.get_family_members(person.id,
+                                             organisation_id,
+                                             rules = rules,
+                                             )
             if family:
                 output["x"] = family
 
@@ -447,6 +462,7 @@ class Checkpoint(CRUDMethod):
                                               organisation_id,
                                               is_resident = is_resident,
                                               serializable = True,
+                                              rules = rules,
                                               )
             if blocked:
                 # TODO format as r: {event_code: {m: message, e: earliest}}
@@ -459,6 +475,97 @@ class Checkpoint(CRUDMethod):
 
         return output
 
+    # -------------------------------------------------------------------------
+    def check_batch(self, r, json_data):
+        """
+            Checks multiple ID labels at once (e.g. for uploads of scans
+            collected offline), looking up all persons, their residence
+            status and their registered events in bulk
+
+            Args:
+                r: the CRUDRequest
+                json_data: the input JSON, see check_or_register
+
+            Returns:
+                a JSON-serializable dict {"r": [item, ...]}, with one item
+                per label (in order of the input, at most MAX_BATCH_SIZE
+                labels per request), like:
+                    {"l": the PE label,
+                     "p": the person details (HTML), or None if not found,
+                     "i": blocked events {<event_code>: [<msg>, <blocked_until_datetime>, <permit_others>]},
+                     "s": whether a person has been found,
+                     "a": advice (e.g. person not found),
+                     "e": error message,
+                     }
+        """
+
+        organisation_id = json_data.get("o")
+        if not organisation_id:
+            r.error(400, current.ERROR.BAD_REQUEST)
+
+        labels = json_data.get("l")
+        if not labels:
+            labels = []
+        elif not isinstance(labels, list):
+            labels = [labels]
+        if len(labels) > self.MAX_BATCH_SIZE:
+            r.error(400, "Too many ID labels (max %s per request)" % self.MAX_BATCH_SIZE)
+
+        # Validate the labels
+        validate = current.deployment_settings.get_org_site_presence_validate_id()
+        items = []
+        for label in labels:
+            if not isinstance(label, str):
+                label = s3_str(label)
+            if callable(validate):
+                label, advice, error = validate(label)
+            else:
+                advice, error = None, None
+            items.append((label, advice, error))
+
+        # Look up all persons at once
+        persons = self.get_persons([item[0] for item in items if item[0]],
+                                   organisation_id,
+                                   )
+        person_ids = [person.id for person in persons.values()]
+
+        # Residence status and event rules for all persons
+        residents = self.get_residents(person_ids, organisation_id)
+        rules = self.event_rules(organisation_id)
+        rules.load(person_ids)
+
+        T = current.T
+        results = []
+        for label, advice, error in items:
+            person = persons.get(label.upper()) if label else None
+
+            if person:
+                if residents is None:
+                    is_resident = None
+                else:
+                    is_resident = person.id in residents
+                result = {"l": person.pe_label,
+                          "p": s3_str(self.person_details(person).xml()),
+                          "i": rules.blocked_events(person.id,
+                                                    is_resident = is_resident,
+                                                    serializable = True,
+                                                    ),
+                          "s": True,
+                          }
+            else:
+                if not error:
+                    advice = T("No person found with this ID number")
+                result = {"l": label,
+                          "p": None,
+                          "s": False,
+                          }
+            result["a"] = s3_str(advice) if advice else None
+            result["e"] = s3_str(error) if error else None
+
+            results.append(result)
+
+        return {"r": results}
+
     # -------------------------------------------------------------------------
     def register(self, r, json_data):
         """
@@ -848,6 +955,55 @@ class Checkpoint(CRUDMethod):
 
         return rows[0] if rows else None
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_persons(labels, organisation_id):
+        """
+            Returns the person records for multiple labels (bulk version
+            of get_person)
+
+            Args:
+                labels: list of PE labels
+                organisation_id: the organisation ID
+
+            Returns:
+                a dict {label: person record}, with labels in upper case
+        """
+
+        labels = {label.upper() for label in labels if label}
+        if not labels or not organisation_id:
+            return {}
+
+        # Fields to extract
+        fields = ["id",
+                  "pe_id",
+                  "pe_label",
+                  "first_name",
+                  "middle_name",
+                  "last_name",
+                  "date_of_birth",
+                  "gender",
+                  ]
+
+        query = (FS("pe_label").upper().belongs(labels)) & \
+                (FS("dvr_case.organisation_id") == organisation_id) & \
+                (FS("dvr_case.archived") == False) & \
+                (FS("dvr_case.status_id$is_closed") == False)
+
+        presource = current.s3db.resource("pr_person",
+                                          components = [],
+                                          filter = query,
+                                          )
+        rows = presource.select(fields, as_rows=True)
+
+        persons = {}
+        for row in rows:
+            label = row.pe_label.upper()
+            if label in labels and label not in persons:
+                persons[label] = row
+
+        return persons
+
     # -------------------------------------------------------------------------
     @staticmethod
     def person_details(person):
@@ -901,8 +1057,8 @@ class Checkpoint(CRUDMethod):
         return URL(c="default", f="download", args=row.image) if row else None
 
     # -------------------------------------------------------------------------
-    @staticmethod
-    def is_resident(person_id, organisation_id):
+    @classmethod
+    def is_resident(cls, person_id, organisation_id):
         """
             Check if a person is a current resident of a shelter of
             the organisation
@@ -915,28 +1071,62 @@ class Checkpoint(CRUDMethod):
                 tuple (is_resident, site_id)
         """
 
+        residents = cls.get_residents([person_id], organisation_id)
+        if residents is None:
+            # Organisation has no shelters
+            is_resident, site_id = None, None
+        elif person_id in residents:
+            is_resident, site_id = True, residents[person_id]
+        else:
+            is_resident, site_id = False, None
+
+        return is_resident, site_id
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_residents(person_ids, organisation_id):
+        """
+            Looks up which of the persons are current residents of a
+            shelter of the organisation (bulk version of is_resident)
+
+            Args:
+                person_ids: the person IDs
+                organisation_id: the organisation ID
+
+            Returns:
+                a dict {person_id: site_id} for all current residents, or
+                None if the organisation does not have any shelters
+        """
+
         db = current.db
         s3db = current.s3db
 
-        is_resident, site_id = None, None
-
         stable = s3db.cr_shelter
         query = (stable.organisation_id == organisation_id) & \
                 (stable.deleted == False)
         has_shelters = db(query).select(stable.id, limitby=(0, 1)).first()
-        if has_shelters:
+        if not has_shelters:
+            return None
+
+        residents = {}
+
+        person_ids = set(person_ids)
+        if person_ids:
             rtable = s3db.cr_shelter_registration
             join = rtable.on((rtable.shelter_id == stable.id) & \
-                             (rtable.person_id == person_id) & \
+                             (rtable.person_id.belongs(person_ids)) & \
                              (rtable.registration_status == 2) & \
                              (rtable.deleted == False))
-            row = db(query).select(stable.site_id, join=join, limitby=(0, 1)).first()
-            if row:
-                is_resident, site_id = True, row.site_id
-            else:
-                is_resident = False
+            rows = db(query).select(rtable.person_id,
+                                    stable.site_id,
+                                    join = join,
+                                    )
+            for row in rows:
+                person_id = row[rtable.person_id]
+                if person_id not in residents:
+                    residents[person_id] = row[stable.site_id]
 
-        return is_resident, site_id
+        return residents
 
     # -------------------------------------------------------------------------
     @staticmethod
@@ -968,13 +1158,15 @@ class Checkpoint(CRUDMethod):
         return flags
 
     # -------------------------------------------------------------------------
-    def get_family_members(self, person_id, organisation_id):
+    def get_family_members(self, person_id, organisation_id, rules=None):
         """
             Extracts and formats family details for a client
 
             Args:
                 person_id: the client person record ID
                 organisation_id: the organisation record ID
+                rules: the CaseEventRules for the organisation (to share
+                       them with other lookups)
 
             Returns:
                 array with family member infos, format:
@@ -1039,6 +1231,15 @@ class Checkpoint(CRUDMethod):
             if member_id not in members:
                 members[member_id] = row
 
+        if not members:
+            return []
+
+        # Residence status and registered events of all members
+        residents = self.get_residents(members.keys(), organisation_id)
+        if rules is None:
+            rules = self.event_rules(organisation_id)
+        rules.load(members.keys())
+
         output = []
         for member_id, row in members.items():
             # Person data
@@ -1058,12 +1259,11 @@ class Checkpoint(CRUDMethod):
                                 args = picture.image,
                                 )
             # Blocking rules
-            is_resident = self.is_resident(member_id, organisation_id)[0]
-            event_rules = self.get_blocked_events(member_id,
-                                                  organisation_id,
-                                                  is_resident = is_resident,
-                                                  serializable = True,
-                                                  )
+            is_resident = None if residents is None else member_id in residents
+            event_rules = rules.blocked_events(member_id,
+                                               is_resident = is_resident,
+                                               serializable = True,
+                                               )
             if event_rules:
                 data["r"] = event_rules
 
@@ -1079,6 +1279,7 @@ class Checkpoint(CRUDMethod):
                            is_resident = True,
                            event_type_id = None,
                            serializable = True,
+                           rules = None,
                            ):
         """
             Returns currently excluded events for a person including reasons
@@ -1092,6 +1293,8 @@ class Checkpoint(CRUDMethod):
                 event_type_id: check only this event type (rather than all
                                event types defined by the organisation)
                 serializable: return JSON-serializable data
+                rules: the CaseEventRules for the organisation (to share
+                       them with other lookups)
 
             Returns:
                 a dict with exclusion details
@@ -1103,57 +1306,29 @@ class Checkpoint(CRUDMethod):
                   the person whose ID is being used for the registration
         """
 
-        now = current.request.utcnow.replace(microsecond=0)
-        day_start = now.replace(hour=0, minute=0, second=0)
+        if rules is None:
+            rules = cls.event_rules(organisation_id)
 
-        # Get event types for organisation
-        event_types = cls.get_event_types(organisation_id)
+        return rules.blocked_events(person_id,
+                                    is_resident = is_resident,
+                                    event_type_id = event_type_id,
+                                    serializable = serializable,
+                                    )
 
-        # Get event types to check
-        event_type_ids = set(event_types.keys())
-        event_type_ids.discard("_default")
-        if event_type_id and event_type_id in event_type_ids:
-            check = {event_type_id}
-        else:
-            check = event_type_ids
-
-        excluded = {}
+    # -------------------------------------------------------------------------
+    @classmethod
+    def event_rules(cls, organisation_id):
+        """
+            Returns the rule engine to check for blocked events
 
-        # Exclude residents-only event types if the person is not currently
-        # a resident at a shelter of the organisation
-        if not is_resident:
-            not_applicable = cls.check_residents_only(check, event_types)
-            excluded.update(not_applicable)
-            check -= set(not_applicable.keys())
-
-        # Exclude event types that are not combinable with other events
-        # registered today
-        non_combinable = cls.check_non_combinable(person_id, check, day_start, event_types)
-        excluded.update(non_combinable)
-        check -= set(non_combinable.keys())
-
-        # Exclude event types for which maximum number of occurences per
-        # day have been reached
-        max_per_day = cls.check_max_per_day(person_id, check, day_start, event_types)
-        excluded.update(max_per_day)
-        check -= set(max_per_day.keys())
-
-        # Exclude event types for which minimum interval between consecutive
-        # occurences has not yet been reached
-        min_interval = cls.check_min_interval(person_id, check, now, event_types)
-        excluded.update(min_interval)
-        check -= set(min_interval.keys())
+            Args:
+                organisation_id: the organisation record ID
 
-        if serializable:
-            formatted = {}
-            for type_id, reason in excluded.items():
-                msg, earliest, permit_others = reason
-                earliest = earliest.isoformat() + "Z" if earliest else None
-                event_type = event_types[type_id]
-                formatted[event_type.code] = [s3_str(msg), earliest, permit_others]
-            excluded = formatted
+            Returns:
+                CaseEventRules
+        """
 
-        return excluded
+        return CaseEventRules(cls.get_event_types(organisation_id))
 
     # -------------------------------------------------------------------------
     # Helper functions
@@ -1362,213 +1537,6 @@ class Checkpoint(CRUDMethod):
 
         return event_types
 
-    # -------------------------------------------------------------------------
-    @staticmethod
-    def check_residents_only(check, event_types):
-        """
-            Returns exclusion details for event types that can only be
-            registered if the person is currently a resident of a shelter
-
-            Args:
-                check: the event types to check
-                event_types: all event types to consider
-
-            Returns: a dict with exclusion details
-                     {event_type_id: (error_message, blocked_until_datetime, permit_others)}
-
-            Note:
-                When an event is blocked because the person whose ID is being used
-                to register the event is not a resident, then it cannot be registered
-                for any family member (that is, permit_others=False in this case)
-        """
-
-        msg = current.T("Not currently a resident")
-
-        exclude = {}
-        for type_id in check:
-            event_type = event_types.get(type_id)
-            if event_type and event_type.residents_only:
-                exclude[type_id] = (msg, None, False)
-
-        return exclude
-
-    # -------------------------------------------------------------------------
-    @staticmethod
-    def check_non_combinable(person_id, check, day_start, event_types):
-        """
-            Returns exclusion details for event types that are not combinable
-            with events already registered for the person on the given day
-
-            Args:
-                person_id: the person record ID
-                check: the event types to check
-                day_start: the start of the 24h persion to check
-                event_types: all event types to consider
-
-            Returns: a dict with exclusion details
-                     {event_type_id: (error_message, blocked_until_datetime, permit_others)}
-        """
-
-        T = current.T
-        db = current.db
-        s3db = current.s3db
-
-        etable = s3db.dvr_case_event
-        xtable = s3db.dvr_case_event_exclusion
-
-        event_type_ids = set(event_types.keys())
-        event_type_ids.discard("_default")
-
-        # Event type IDs that have been registered for the person today
-        query = (etable.person_id == person_id) & \
-                (etable.type_id.belongs(event_type_ids)) & \
-                (etable.date >= day_start) & \
-                (etable.deleted == False)
-        registered_today = db(query)._select(etable.type_id, distinct=True)
-
-        query = (xtable.type_id.belongs(check)) & \
-                (xtable.excluded_by_id.belongs(registered_today)) & \
-                (xtable.deleted == False)
-        rows = db(query).select(xtable.type_id,
-                                xtable.excluded_by_id,
-                                )
-
-        exclusions = {}
-        for row in rows:
-            type_id = row.type_id
-            if type_id in exclusions:
-                exclusions[type_id].add(row.excluded_by_id)
-            else:
-                exclusions[type_id] = {row.excluded_by_id}
-
-        exclude = {}
-        next_day = day_start + datetime.timedelta(days=1)
-        for type_id, excluded_by in exclusions.items():
-            names = ", ".join(s3_str(T(event_types[i].name)) for i in excluded_by)
-            msg = T("%(event)s already registered today, not combinable") % \
-                   {"event": names}
-            exclude[type_id] = (msg, next_day, True)
-
-        return exclude
-
-    # -------------------------------------------------------------------------
-    @staticmethod
-    def check_max_per_day(person_id, check, day_start, event_types):
-        """
-            Returns exclusion details for event types for which the maximum
-            number of registrations for a person has been reached on the
-            given day
-
-            Args:
-                person_id: the person record ID
-                check: the event types to check
-                day_start: the start of the 24h persion to check
-                event_types: all event types to consider
-
-            Returns: a dict with exclusion details
-                     {event_type_id: (error_message, blocked_until_datetime, permit_others)}
-        """
-
-        T = current.T
-        db = current.db
-        s3db = current.s3db
-
-        etable = s3db.dvr_case_event
-        ttable = s3db.dvr_case_event_type
-
-        # Number of registrations for each event type where the
-        # of registrations for the person is greater than max_per_day
-        join = ttable.on((ttable.id == etable.type_id) & \
-                         (ttable.max_per_day != None))
-        query = (etable.person_id == person_id) & \
-                (etable.type_id.belongs(check)) & \
-                (etable.date >= day_start) & \
-                (etable.deleted == False)
-        count = etable.id.count()
-        rows = db(query).select(ttable.id,
-                                ttable.max_per_day,
-                                count,
-                                groupby = ttable.id,
-                                having = (count >= ttable.max_per_day),
-                                join = join,
-                                )
-        exclude = {}
-        next_day = day_start + datetime.timedelta(days=1)
-        for row in rows:
-            number = row[count]
-            type_id = row.dvr_case_event_type.id
-            event_type = event_types[type_id]
-            if number > 1:
-                msg = T("%(event)s already registered %(number)s times today") % \
-                       {"event": T(event_type.name), "number": number}
-            else:
-                msg = T("%(event)s already registered today") % \
-                       {"event": T(event_type.name)}
-            exclude[type_id] = (msg, next_day, True)
-
-        return exclude
-
-    # -------------------------------------------------------------------------
-    @staticmethod
-    def check_min_interval(person_id, check, now, event_types):
-        """
-            Returns exclusion details for event types for which the minimum
-            interval between consecutive registrations for the same person
-            has not been reached yet
-
-            Args:
-                person_id: the person record ID
-                check: the event types to check
-                now: the current date/time
-                event_types: all event types to consider
-
-            Returns: a dict with exclusion details
-                     {event_type_id: (error_message, blocked_until_datetime, permit_others)}
-        """
-
-        T = current.T
-        db = current.db
-        s3db = current.s3db
-
-        etable = s3db.dvr_case_event
-        ttable = s3db.dvr_case_event_type
-
-        # Last registration of types with a minimum interval
-        join = ttable.on((ttable.id == etable.type_id) & \
-                         (ttable.min_interval != None))
-        query = (etable.person_id == person_id) & \
-                (etable.type_id.belongs(check)) & \
-                (etable.deleted == False)
-        interval = ttable.min_interval.max()
-        last_reg = etable.date.max()
-        rows = db(query).select(ttable.id,
-                                interval,
-                                last_reg,
-                                groupby = ttable.id,
-                                join = join,
-                                )
-
-        exclude = {}
-        represent = etable.date.represent
-        for row in rows:
-            type_id = row.dvr_case_event_type.id
-            event_type = event_types[type_id]
-            latest, hours = row[last_reg], row[interval]
-
-            # Compute the earliest next registration time
-            if latest and hours:
-                earliest = latest + datetime.timedelta(hours=hours)
-            else:
-                # Either no previous registration or no waiting interval
-                continue
-
-            if earliest > now:
-                msg = T("%(event)s already registered on %(timestamp)s") % \
-                      {"event": T(event_type.name), "timestamp": represent(latest)}
-                exclude[type_id] = (msg, earliest, True)
-
-        return exclude
-
     # -------------------------------------------------------------------------
     @staticmethod
     def permitted(method, tablename, organisation_id=None):
@@ -1629,5 +1597,230 @@ class Checkpoint(CRUDMethod):
         if script not in scripts:
             scripts.append(script)
 
+# =============================================================================
+class CaseEventRules:
+    """
+        Rule engine to determine which case events can currently not be
+        registered for a person; loads the relevant events of any number
+        of persons with a single query, and evaluates the rules in memory:
+
+            - residents-only event types
+            - event types not combinable with other events registered today
+            - maximum number of registrations per day
+            - minimum interval between consecutive registrations
+    """
+
+    def __init__(self, event_types, now=None):
+        """
+            Args:
+                event_types: the event types to consider, a dict
+                             {event_type_id: Row}, as returned by
+                             Checkpoint.get_event_types
+                now: the current date/time (default: request time)
+        """
+
+        if now is None:
+            now = current.request.utcnow
+        self.now = now = now.replace(microsecond=0)
+        self.day_start = now.replace(hour=0, minute=0, second=0)
+
+        self.event_types = event_types
+
+        type_ids = set(event_types.keys())
+        type_ids.discard("_default")
+        self.type_ids = type_ids
+
+        # Registered events per person {person_id: [(type_id, date), ...]}
+        self.events = {}
+
+        self._exclusions = None
+
+    # -------------------------------------------------------------------------
+    @property
+    def exclusions(self):
+        """
+            The exclusions between event types (lazy property)
+
+            Returns:
+                a dict {type_id: {excluded_by_id, ...}}
+        """
+
+        exclusions = self._exclusions
+        if exclusions is None:
+
+            exclusions = {}
+
+            type_ids = self.type_ids
+            if type_ids:
+                xtable = current.s3db.dvr_case_event_exclusion
+                query = (xtable.type_id.belongs(type_ids)) & \
+                        (xtable.excluded_by_id.belongs(type_ids)) & \
+                        (xtable.deleted == False)
+                rows = current.db(query).select(xtable.type_id,
+                                                xtable.excluded_by_id,
+                                                )
+                for row in rows:
+                    type_id = row.type_id
+                    if type_id in exclusions:
+                        exclusions[type_id].add(row.excluded_by_id)
+                    else:
+                        exclusions[type_id] = {row.excluded_by_id}
+
+            self._exclusions = exclusions
+
+        return exclusions
+
+    # -------------------------------------------------------------------------
+    def load(self, person_ids):
+        """
+            Loads the registered events relevant for the rules for multiple
+            persons, i.e. all events of today, and earlier events that are
+            still within the minimum interval of their type
+
+            Args:
+                person_ids: the person record IDs
+        """
+
+        events = self.events
+
+        person_ids = set(person_ids) - set(events.keys())
+        if not person_ids:
+            return
+        for person_id in person_ids:
+            events[person_id] = []
+
+        type_ids = self.type_ids
+        if not type_ids:
+            return
+
+        # Earliest registration date still relevant for any rule
+        earliest = self.day_start
+        intervals = [self.event_types[type_id].min_interval for type_id in type_ids]
+        intervals = [hours for hours in intervals if hours]
+        if intervals:
+            earliest = min(earliest, self.now - datetime.timedelta(hours=max(intervals)))
+
+        table = current.s3db.dvr_case_event
+        query = (table.person_id.belongs(person_ids)) & \
+                (table.type_id.belongs(type_ids)) & \
+                (table.date >= earliest) & \
+                (table.deleted == False)
+        rows = current.db(query).select(table.person_id,
+                                        table.type_id,
+                                        table.date,
+                                        )
+        for row in rows:
+            events[row.person_id].append((row.type_id, row.date))
+
+    # -------------------------------------------------------------------------
+    def blocked_events(self,
+                       person_id,
+                       is_resident = True,
+                       event_type_id = None,
+                       serializable = True,
+                       ):
+        """
+            Returns currently excluded events for a person including reasons
+            for their exclusion (see Checkpoint.get_blocked_events)
+
+            Args:
+                person_id: the person record ID
+                is_resident: whether the person is currently a checked-in
+                             resident at a shelter of the organisation
+                event_type_id: check only this event type (rather than all
+                               event types)
+                serializable: return JSON-serializable data
+
+            Returns:
+                a dict with exclusion details
+                {event_type_id: (error_message, blocked_until_datetime, permit_others)}
+        """
+
+        T = current.T
+
+        event_types = self.event_types
+        now, day_start = self.now, self.day_start
+        next_day = day_start + datetime.timedelta(days=1)
+
+        # Get event types to check
+        if event_type_id and event_type_id in self.type_ids:
+            check = [event_type_id]
+        else:
+            check = list(self.type_ids)
+
+        events = self.events.get(person_id)
+        if events is None:
+            self.load([person_id])
+            events = self.events[person_id]
+
+        # Number of registrations today, and latest registration, per type
+        registered_today, latest = {}, {}
+        for type_id, date in events:
+            if date >= day_start:
+                registered_today[type_id] = registered_today.get(type_id, 0) + 1
+            if type_id not in latest or date > latest[type_id]:
+                latest[type_id] = date
+
+        excluded = {}
+
+        for type_id in check:
+            event_type = event_types[type_id]
+
+            # Exclude residents-only event types if the person is not
+            # currently a resident at a shelter of the organisation
+            # - blocks the registration for family members as well
+            if not is_resident and event_type.residents_only:
+                excluded[type_id] = (T("Not currently a resident"), None, False)
+                continue
+
+            # Exclude event types that are not combinable with other
+            # events registered today
+            excluded_by = [i for i in self.exclusions.get(type_id, ())
+                           if i in registered_today
+                           ] if registered_today else None
+            if excluded_by:
+                names = ", ".join(s3_str(T(event_types[i].name)) for i in excluded_by)
+                msg = T("%(event)s already registered today, not combinable") % \
+                       {"event": names}
+                excluded[type_id] = (msg, next_day, True)
+                continue
+
+            # Exclude event types for which maximum number of occurences
+            # per day have been reached
+            limit = event_type.max_per_day
+            number = registered_today.get(type_id)
+            if limit is not None and number and number >= limit:
+                if number > 1:
+                    msg = T("%(event)s already registered %(number)s times today") % \
+                           {"event": T(event_type.name), "number": number}
+                else:
+                    msg = T("%(event)s already registered today") % \
+                           {"event": T(event_type.name)}
+                excluded[type_id] = (msg, next_day, True)
+                continue
+
+            # Exclude event types for which minimum interval between
+            # consecutive occurences has not yet been reached
+            hours = event_type.min_interval
+            last = latest.get(type_id)
+            if last and hours:
+                earliest = last + datetime.timedelta(hours=hours)
+                if earliest > now:
+                    represent = current.s3db.dvr_case_event.date.represent
+                    msg = T("%(event)s already registered on %(timestamp)s") % \
+                          {"event": T(event_type.name), "timestamp": represent(last)}
+                    excluded[type_id] = (msg, earliest, True)
+
+        if serializable:
+            formatted = {}
+            for type_id, reason in excluded.items():
+                msg, earliest, permit_others = reason
+                earliest = earliest.isoformat() + "Z" if earliest else None
+                event_type = event_types[type_id]
+                formatted[event_type.code] = [s3_str(msg), earliest, permit_others]
+            excluded = formatted
+
+        return excluded
+
 # END =========================================================================
 
@@ -1626,6 +1626,7 @@ class BasicCRUD(CRUDMethod):
                                                      orderby = orderby,
                                                      distinct = False,
                                                      list_id = list_id,
+                                                     seek = get_vars.get("seek"),
                                                      )
             else:
                 dt, displayrows = None, 0
@@ -1816,6 +1817,7 @@ class BasicCRUD(CRUDMethod):
                                                   orderby = orderby,
                                                   list_id = list_id,
                                                   layout = layout,
+                                                  seek = get_vars.get("seek"),
                                                   )
 
             if numrows == 0:
@@ -2036,6 +2038,7 @@ class BasicCRUD(CRUDMethod):
                                                      orderby = orderby,
                                                      distinct = distinct,
                                                      list_id = list_id,
+                                                     seek = get_vars.get("seek"),
                                                      )
             else:
                 dt, displayrows = None, 0
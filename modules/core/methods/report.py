@@ -38,6 +38,11 @@ import sys
 
 from itertools import product, chain
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from gluon import current
 from gluon.contenttype import contenttype
 from gluon.html import BUTTON, DIV, FIELDSET, FORM, INPUT, LABEL, LEGEND, TAG, XML
@@ -410,6 +415,7 @@ class S3Report(CRUDMethod):
             facts = S3PivotTableFact.parse(layer)[:1]
             pivottable = S3PivotTable(resource, rows, cols, facts,
                                       precision = report_options.get("precision"),
+                                      explore = False,
                                       )
 
             # Extract the Location Data
@@ -1743,7 +1749,15 @@ class S3PivotTableFact:
 class S3PivotTable:
     """ Class representing a pivot table of a resource """
 
-    def __init__(self, resource, rows, cols, facts, strict=True, precision=None):
+    def __init__(self,
+                 resource,
+                 rows,
+                 cols,
+                 facts,
+                 strict = True,
+                 precision = None,
+                 explore = True,
+                 ):
         """
             Args:
                 resource: the CRUDResource
@@ -1754,6 +1768,9 @@ class S3PivotTable:
                         the resource filter
                 precision: maximum precision of aggregate computations,
                            a dict {selector: number_of_decimals}
+                explore: retain the record IDs per cell for cell explore
+                         (drill-down); False allows push-down aggregation
+                         to skip extracting the records
 
             Note:
                 Constructor extracts all unique records, generates a pivot
@@ -1777,6 +1794,7 @@ class S3PivotTable:
         self.facts = facts
 
         self.precision = precision if isinstance(precision, dict) else {}
+        self.explore = explore
 
         # API variables -------------------------------------------------------
         #
@@ -1787,6 +1805,11 @@ class S3PivotTable:
                 }
         """
 
+        self.numrecords = None
+        """ The number of records in the pivot table (push-down only,
+            where records are not extracted)
+        """
+
         self.empty = False
         """ Empty-flag (True if no records could be found) """
         self.numrows = None
@@ -1855,6 +1878,11 @@ class S3PivotTable:
                 if axis in exclude_empty:
                     resource.add_filter(FS(axis) != None)
 
+        # Push-down aggregation -----------------------------------------------
+        #
+        if self._pushdown(fields):
+            return
+
         # Retrieve the records ------------------------------------------------
         #
         data = resource.select(list(self.rfields.keys()), limit=None)
@@ -1880,6 +1908,22 @@ class S3PivotTable:
             else:
                 axisfilter = None
 
+            self.records = records
+
+            if self._columnar(len(records)):
+                # Use the columnar engine
+                frame, rnames, cnames = self._pivot_columnar(records,
+                                                             rows_colname,
+                                                             cols_colname,
+                                                             axisfilter = axisfilter,
+                                                             )
+                self._init_axes(rnames, cnames)
+                self._add_records(frame)
+                add_layer = self._add_layer_columnar
+                for fact in self.facts:
+                    add_layer(frame, fact)
+                return
+
             dataframe = []
             extend = dataframe.extend
             expand = self._expand
@@ -1893,8 +1937,6 @@ class S3PivotTable:
                     item[cols_colname] = row[cols_colname]
                 extend(expand(item, axisfilter=axisfilter))
 
-            self.records = records
-
             # Group the records -----------------------------------------------
             #
             matrix, rnames, cnames = self._pivot(dataframe,
@@ -1904,19 +1946,7 @@ class S3PivotTable:
 
             # Initialize columns and rows -------------------------------------
             #
-            if cols:
-                self.col = [Storage({"value": v}) for v in cnames]
-                self.numcols = len(self.col)
-            else:
-                self.col = [Storage({"value": None})]
-                self.numcols = 1
-
-            if rows:
-                self.row = [Storage({"value": v}) for v in rnames]
-                self.numrows = len(self.row)
-            else:
-                self.row = [Storage({"value": None})]
-                self.numrows = 1
+            self._init_axes(rnames, cnames)
 
             # Add the layers --------------------------------------------------
             #
@@ -1935,6 +1965,9 @@ class S3PivotTable:
     def __len__(self):
         """ Total number of records in the report """
 
+        if self.numrecords is not None:
+            return self.numrecords
+
         items = self.records
         if items is None:
             return 0
@@ -2770,6 +2803,600 @@ class S3PivotTable:
                                           )
         self.values[layer] = all_values
 
+    # -------------------------------------------------------------------------
+    def _init_axes(self, rnames, cnames):
+        """
+            Initialize the row and column headers
+
+            Args:
+                rnames: the row axis values
+                cnames: the column axis values
+        """
+
+        if self.cols:
+            self.col = [Storage({"value": v}) for v in cnames]
+            self.numcols = len(self.col)
+        else:
+            self.col = [Storage({"value": None})]
+            self.numcols = 1
+
+        if self.rows:
+            self.row = [Storage({"value": v}) for v in rnames]
+            self.numrows = len(self.row)
+        else:
+            self.row = [Storage({"value": None})]
+            self.numrows = 1
+
+    # -------------------------------------------------------------------------
+    # Push-down aggregation
+    # -------------------------------------------------------------------------
+    def _pushdown(self, fields=None):
+        """
+            Compute the pivot table with a single GROUP BY query rather
+            than extracting and aggregating all records in Python, only
+            possible if:
+                - there are no report_fields
+                - there are no virtual or extra filters
+                - the axes and facts are real (non-virtual, non-list) fields
+                - the facts are counts, or sum/min/max/avg of numeric fields
+                - all joins are single-valued
+
+            Args:
+                fields: the report_fields for the table
+
+            Returns:
+                True if the pivot table has been computed, or False if
+                it must be computed from the records instead
+
+            Note:
+                Without explore, records are not extracted at all, and
+                cells, rows and columns will not contain any record IDs;
+                otherwise, the record IDs (and raw fact values) are
+                extracted with a separate query, for cell explore
+        """
+
+        if fields or not current.deployment_settings.get_ui_report_pushdown():
+            return False
+
+        resource = self.resource
+        if resource.get_config("postprocess_select"):
+            return False
+
+        query = resource.get_query()
+        rfilter = resource.rfilter
+        if rfilter.get_filter() is not None or rfilter.get_extra_filters():
+            return False
+
+        db = current.db
+        table = resource.table
+        tablename = table._tablename
+        rfields = self.rfields
+        pkey = self.pkey
+
+        # Check the axes
+        selectors = []
+        for axis in (self.rows, self.cols):
+            if not axis:
+                continue
+            rfield = rfields[axis]
+            if rfield is None or \
+               rfield.field is None or rfield.ftype[:5] == "list:":
+                return False
+            selectors.append(rfield.selector)
+        rows_rfield = rfields[self.rows] if self.rows else None
+        cols_rfield = rfields[self.cols] if self.cols else None
+
+        # Check the facts
+        for fact in self.facts:
+            rfield = rfields[fact.selector]
+            if rfield is None or \
+               rfield.field is None or rfield.ftype[:5] == "list:":
+                return False
+            method = fact.method
+            if method != "count" and \
+               (method not in ("sum", "min", "max", "avg") or
+                rfield.ftype not in ("integer", "bigint", "double")):
+                return False
+            selectors.append(rfield.selector)
+
+        # Joins for the axis and fact fields, must be single-valued
+        # so that every record is counted exactly once
+        ijoins_, ljoins_ = resource.resolve_selectors(selectors,
+                                                     extra_fields = False,
+                                                     )[1:3]
+        ijoins = S3Joins(tablename)
+        ijoins.extend(ijoins_)
+        ljoins = S3Joins(tablename)
+        ljoins.extend(ljoins_)
+        if not ijoins.single_valued() or not ljoins.single_valued():
+            return False
+
+        # Filter joins can be multi-valued => apply the resource query
+        # as subselect
+        fjoin = rfilter.get_joins(left=False)
+        fleft = rfilter.get_joins(left=True)
+        if fjoin or fleft:
+            query = table._id.belongs(db(query)._select(table._id,
+                                                        join = fjoin,
+                                                        left = fleft,
+                                                        ))
+
+        aqueries = {}
+        join = ijoins.as_list(aqueries=aqueries, prefer=ljoins)
+        left = ljoins.as_list(aqueries=aqueries)
+
+        # Aggregate expressions
+        number = table._id.count()
+        expressions = {}
+        for fact in self.facts:
+            method = fact.method
+            if fact.selector == pkey:
+                expr = number
+            else:
+                field = rfields[fact.selector].field
+                if method == "count":
+                    expr = field.count(distinct=True)
+                elif method == "min":
+                    expr = field.min()
+                elif method == "max":
+                    expr = field.max()
+                else:
+                    expr = field.sum()
+                    if method == "avg":
+                        expressions[(fact.selector, "number")] = field.count()
+            expressions[fact.layer] = expr
+
+        groupby = [rfield.field for rfield in (rows_rfield, cols_rfield) if rfield]
+        items = db(query).select(number,
+                                 *(groupby + list(expressions.values())),
+                                 join = join,
+                                 left = left,
+                                 groupby = groupby,
+                                 )
+
+        self.records = Storage()
+        self.numrecords = 0
+        if not items:
+            self.empty = True
+            return True
+
+        # Index the axis values
+        rows_colname = rows_rfield.colname if rows_rfield else None
+        cols_colname = cols_rfield.colname if cols_rfield else None
+
+        rvalues, cvalues, cells = {}, {}, {}
+        for item in items:
+            rvalue = item[rows_colname] if rows_colname else None
+            cvalue = item[cols_colname] if cols_colname else None
+            r = rvalues.setdefault(rvalue, len(rvalues))
+            c = cvalues.setdefault(cvalue, len(cvalues))
+            cells[(r, c)] = item
+            self.numrecords += item[number]
+
+        self._init_axes(list(rvalues), list(cvalues))
+
+        numrows, numcols = self.numrows, self.numcols
+        RECORDS = "records"
+        for header in self.row + self.col:
+            header[RECORDS] = []
+        self.cell = [[Storage({RECORDS: []}) for c in range(numcols)]
+                     for r in range(numrows)]
+
+        if self.explore:
+            # Extract the record IDs per cell for cell explore, with the
+            # raw fact values (to determine the contributing records)
+            fields = {str(table._id): table._id}
+            for field in groupby:
+                fields[str(field)] = field
+            for fact in self.facts:
+                field = rfields[fact.selector].field
+                fields[str(field)] = field
+            records = db(query).select(*fields.values(),
+                                       join = join,
+                                       left = left,
+                                       )
+            pkey_colname = str(table._id)
+            for record in records:
+                record_id = record[pkey_colname]
+                self.records[record_id] = record
+                r = rvalues[record[rows_colname] if rows_colname else None]
+                c = cvalues[record[cols_colname] if cols_colname else None]
+                self.cell[r][c][RECORDS].append(record_id)
+                self.row[r][RECORDS].append(record_id)
+                self.col[c][RECORDS].append(record_id)
+
+        # Add the layers
+        for fact in self.facts:
+
+            layer = fact.layer
+            method = fact.method
+            precision = self.precision.get(fact.selector)
+
+            expr = expressions[layer]
+            nexpr = expressions.get((fact.selector, "number"))
+            if rfields[fact.selector].ftype == "double":
+                convert = float
+            else:
+                convert = int
+
+            # Partial aggregates (value, number) per cell
+            partials = []
+            for r in range(numrows):
+                row = []
+                for c in range(numcols):
+                    item = cells.get((r, c))
+                    if item is None:
+                        row.append((None, 0))
+                        continue
+                    value = item[expr]
+                    row.append((convert(value) if value is not None else None,
+                                item[nexpr] if nexpr is not None else None,
+                                ))
+                partials.append(row)
+
+            def aggregate(partials, method=method, precision=precision):
+                if method == "count":
+                    return sum(p[0] or 0 for p in partials)
+                values = [p[0] for p in partials if p[0] is not None]
+                if method == "sum":
+                    result = sum(values)
+                elif method == "avg":
+                    number = sum(p[1] or 0 for p in partials)
+                    if not number:
+                        return 0.0
+                    result = sum(values) / float(number)
+                elif not values:
+                    return None
+                else:
+                    result = min(values) if method == "min" else max(values)
+                if type(result) is float and precision is not None:
+                    result = round(result, precision)
+                return result
+
+            for r in range(numrows):
+                row = self.cell[r]
+                for c in range(numcols):
+                    row[c][layer] = aggregate([partials[r][c]])
+                self.row[r][layer] = aggregate(partials[r])
+            for c in range(numcols):
+                self.col[c][layer] = aggregate([row[c] for row in partials])
+            self.totals[layer] = aggregate(list(chain.from_iterable(partials)))
+            self.values[layer] = []
+
+        return True
+
+    # -------------------------------------------------------------------------
+    # Columnar engine
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _columnar(numrecords):
+        """
+            Check whether to use the columnar (NumPy-based) engine to
+            compute the pivot table
+
+            Args:
+                numrecords: the number of records in the report
+
+            Returns:
+                boolean
+        """
+
+        if np is None:
+            return False
+
+        setting = current.deployment_settings.get_ui_report_columnar()
+        if setting is True:
+            return True
+        elif type(setting) is int:
+            return numrecords >= setting
+        return False
+
+    # -------------------------------------------------------------------------
+    def _pivot_columnar(self, records, rows_colname, cols_colname, axisfilter=None):
+        """
+            2-dimensional pivoting of records, columnar variant of
+            _expand and _pivot: encodes the axis values as integer codes
+            and groups the items (=record/row value/column value
+            combinations) by cell using NumPy
+
+            Args:
+                records: the records, dict {record_id: row}
+                rows_colname: column name of the row dimension
+                cols_colname: column name of the column dimension
+                axisfilter: dict of filtered axis values by column names
+
+            Returns:
+                tuple of (frame, row headers, column headers), where
+                frame is a Storage with the item arrays for _add_layer_columnar
+        """
+
+        rcodes = {}
+        ccodes = {}
+
+        def axis_values(value, colname):
+            # Same as _expand, for a single list:type axis value
+            if not value:
+                value = [None]
+            if axisfilter and colname in axisfilter:
+                subset = axisfilter[colname]
+                value = [v for v in value if v in subset]
+                if not value:
+                    raise RuntimeError("record does not match query")
+            return value
+
+        item_rec = []
+        item_row = []
+        item_col = []
+        append_rec = item_rec.append
+        append_row = item_row.append
+        append_col = item_col.append
+
+        same = rows_colname == cols_colname
+
+        record_ids = list(records.keys())
+        for index, record_id in enumerate(record_ids):
+            row = records[record_id]
+            rvalue = row[rows_colname] if rows_colname else None
+            cvalue = row[cols_colname] if cols_colname else None
+            if type(rvalue) is not list and type(cvalue) is not list:
+                pairs = ((rvalue, cvalue),)
+            elif same:
+                pairs = [(v, v) for v in axis_values(rvalue, rows_colname)]
+            else:
+                if type(rvalue) is list:
+                    rvalue = axis_values(rvalue, rows_colname)
+                else:
+                    rvalue = [rvalue]
+                if type(cvalue) is list:
+                    cvalue = axis_values(cvalue, cols_colname)
+                else:
+                    cvalue = [cvalue]
+                pairs = product(rvalue, cvalue)
+            for rvalue, cvalue in pairs:
+                r = rcodes.get(rvalue)
+                if r is None:
+                    r = rcodes[rvalue] = len(rcodes)
+                c = ccodes.get(cvalue)
+                if c is None:
+                    c = ccodes[cvalue] = len(ccodes)
+                append_rec(index)
+                append_row(r)
+                append_col(c)
+
+        numrows = len(rcodes)
+        numcols = len(ccodes)
+
+        item_rec = np.array(item_rec, dtype=np.int64)
+        item_row = np.array(item_row, dtype=np.int64)
+        item_col = np.array(item_col, dtype=np.int64)
+
+        frame = Storage(record_ids = record_ids,
+                        numrows = numrows,
+                        numcols = numcols,
+                        item_rec = item_rec,
+                        item_cell = item_row * numcols + item_col,
+                        item_row = item_row,
+                        item_col = item_col,
+                        )
+
+        rnames = [None] * numrows
+        for k, v in rcodes.items():
+            rnames[v] = k
+        cnames = [None] * numcols
+        for k, v in ccodes.items():
+            cnames[v] = k
+
+        return frame, rnames, cnames
+
+    # -------------------------------------------------------------------------
+    def _add_records(self, frame):
+        """
+            Set the record IDs per cell, row and column from the
+            columnar frame
+
+            Args:
+                frame: the frame produced by _pivot_columnar
+        """
+
+        numrows, numcols = frame.numrows, frame.numcols
+        ncells = numrows * numcols
+
+        ids = np.array(frame.record_ids)
+
+        def group(keys, size):
+            # Record IDs grouped by keys, retaining the item order in groups
+            order = np.argsort(keys, kind="stable")
+            bounds = np.searchsorted(keys[order], np.arange(size + 1))
+            return ids[frame.item_rec[order]].tolist(), bounds.tolist()
+
+        RECORDS = "records"
+
+        cell_ids, bounds = group(frame.item_cell, ncells)
+        self.cell = cells = []
+        for r in range(numrows):
+            row = []
+            for c in range(numcols):
+                k = r * numcols + c
+                row.append(Storage({RECORDS: cell_ids[bounds[k]:bounds[k+1]]}))
+            cells.append(row)
+            # Row records in cell order = contiguous range of cells
+            self.row[r][RECORDS] = cell_ids[bounds[r * numcols]:bounds[(r + 1) * numcols]]
+
+        col_ids, bounds = group(frame.item_col * numrows + frame.item_row, ncells)
+        for c in range(numcols):
+            self.col[c][RECORDS] = col_ids[bounds[c * numrows]:bounds[(c + 1) * numrows]]
+
+    # -------------------------------------------------------------------------
+    def _add_layer_columnar(self, frame, fact):
+        """
+            Compute an aggregation layer, columnar variant of _add_layer
+
+            Args:
+                frame: the frame produced by _pivot_columnar
+                fact: the fact
+        """
+
+        records = self.records
+        extract = self._extract
+
+        layer = fact.layer
+        method = fact.method
+        precision = self.precision.get(fact.selector)
+
+        numrows, numcols = frame.numrows, frame.numcols
+        ncells = numrows * numcols
+
+        selector = fact.selector
+        item_rec = frame.item_rec
+
+        if selector == self.pkey:
+            # Fact values are the record IDs themselves
+            flat = frame.record_ids
+            vidx = item_rec
+            vcell = frame.item_cell
+        else:
+            # Extract the (flattened, non-None) fact values per record
+            flat = []
+            counts = []
+            for record_id in frame.record_ids:
+                value = extract(records[record_id], selector)
+                if value is None:
+                    counts.append(0)
+                elif isinstance(value, (list, tuple)):
+                    values = list(s3_flatlist(value))
+                    flat.extend(values)
+                    counts.append(len(values))
+                else:
+                    flat.append(value)
+                    counts.append(1)
+            counts = np.array(counts, dtype=np.int64)
+
+            # Map the values to the items (vidx = index into flat)
+            repeats = counts[item_rec]
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            ends = np.cumsum(repeats)
+            vidx = np.repeat(offsets[item_rec] - (ends - repeats), repeats) + \
+                   np.arange(ends[-1] if len(ends) else 0)
+            vcell = np.repeat(frame.item_cell, repeats)
+
+        if method in ("list", "count"):
+            # Distinct values per cell
+            if flat is frame.record_ids:
+                values = flat
+                vcode = vidx
+            else:
+                codes = {}
+                fcodes = np.array([codes.setdefault(v, len(codes)) for v in flat],
+                                  dtype = np.int64,
+                                  )
+                values = list(codes.keys())
+                vcode = fcodes[vidx]
+            ncodes = max(len(values), 1)
+
+            pairs = np.unique(vcell * ncodes + vcode)
+            pcell = pairs // ncodes
+            pcode = (pairs % ncodes).tolist()
+            bounds = np.searchsorted(pcell, np.arange(ncells + 1)).tolist()
+
+            none = None if flat is frame.record_ids else codes.get(None)
+            counted = pairs % ncodes != none if none is not None else None
+            if counted is not None:
+                cell_counts = np.bincount(pcell[counted], minlength=ncells)
+            else:
+                cell_counts = np.bincount(pcell, minlength=ncells)
+            cell_counts = cell_counts.reshape(numrows, numcols)
+
+            row_totals = cell_counts.sum(axis=1).tolist()
+            col_totals = cell_counts.sum(axis=0).tolist()
+            total = int(cell_counts.sum())
+            cell_counts = cell_counts.tolist()
+
+            for r in range(numrows):
+                row = self.cell[r]
+                for c in range(numcols):
+                    if method == "count":
+                        row[c][layer] = cell_counts[r][c]
+                    else:
+                        k = r * numcols + c
+                        cell_values = [values[i] for i in pcode[bounds[k]:bounds[k+1]]]
+                        row[c][layer] = cell_values if cell_values else None
+            all_values = [values[i] for i in pcode]
+
+        else:
+            # Numeric values required
+            array = np.array(flat)
+            if array.dtype.kind in "biuf":
+                # All values are numeric
+                numeric = array.astype(np.float64)
+                isnum = np.ones(len(flat), dtype=bool)
+                isfloat = np.full(len(flat), array.dtype.kind == "f")
+            else:
+                isnum = [isinstance(v, (int, float)) for v in flat]
+                isfloat = np.array([isinstance(v, float) for v in flat], dtype=bool)
+                numeric = np.array([v if n else 0 for v, n in zip(flat, isnum)],
+                                   dtype = np.float64,
+                                   )
+                isnum = np.array(isnum, dtype=bool)
+            if len(flat):
+                mask = isnum[vidx]
+                vcell = vcell[mask]
+                vvalue = numeric[vidx][mask]
+                vfloat = isfloat[vidx][mask]
+            else:
+                vvalue = vfloat = np.zeros(0)
+
+            def aggregate(groups, size):
+                number = np.bincount(groups, minlength=size).tolist()
+                floats = (np.bincount(groups,
+                                      weights = vfloat,
+                                      minlength = size,
+                                      ) > 0).tolist()
+                if method in ("sum", "avg"):
+                    results = np.bincount(groups, weights=vvalue, minlength=size)
+                elif method == "min":
+                    results = np.full(size, np.inf)
+                    np.minimum.at(results, groups, vvalue)
+                else:
+                    results = np.full(size, -np.inf)
+                    np.maximum.at(results, groups, vvalue)
+                results = results.tolist()
+                for i in range(size):
+                    n = number[i]
+                    if method == "avg":
+                        if not n:
+                            results[i] = 0.0
+                            continue
+                        result = results[i] / n
+                    elif not n:
+                        results[i] = 0 if method == "sum" else None
+                        continue
+                    elif floats[i]:
+                        result = results[i]
+                    else:
+                        result = int(results[i])
+                    if type(result) is float and precision is not None:
+                        result = round(result, precision)
+                    results[i] = result
+                return results
+
+            cell_values = aggregate(vcell, ncells)
+            row_totals = aggregate(vcell // numcols, numrows)
+            col_totals = aggregate(vcell % numcols, numcols)
+            total = aggregate(np.zeros(len(vcell), dtype=np.int64), 1)[0]
+
+            for r in range(numrows):
+                row = self.cell[r]
+                for c in range(numcols):
+                    row[c][layer] = cell_values[r * numcols + c]
+            all_values = np.array(flat, dtype=object)[vidx].tolist() if flat else []
+
+        for r in range(numrows):
+            self.row[r][layer] = row_totals[r]
+        for c in range(numcols):
+            self.col[c][layer] = col_totals[c]
+        self.totals[layer] = total
+        self.values[layer] = all_values
+
     # -------------------------------------------------------------------------
     def _get_fields(self, fields=None):
         """
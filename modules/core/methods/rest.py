@@ -28,12 +28,14 @@
 __all__ = ("RESTful",)
 
 import json
+import os
 import sys
 
 from urllib.request import urlopen
 
 from gluon import current
 from gluon.storage import Storage
+from gluon.streamer import DEFAULT_CHUNK_SIZE
 
 from ..tools import s3_parse_datetime
 
@@ -227,6 +229,58 @@ class RESTful(CRUDMethod):
         if target == resource.tablename:
             # Master resource targetted
             target = None
+
+        # GeoJSON bulk export for Map Layers
+        # - not with slicing, components or custom stylesheets
+        settings = current.deployment_settings
+        xml_formats = settings.get_xml_formats()
+        if representation == "geojson" and \
+           settings.get_gis_geojson_bulk() and \
+           not target and not r.component and \
+           start is None and limit is None and msince is None and \
+           "transform" not in r.vars and \
+           not (isinstance(xml_formats, dict) and "geojson" in xml_formats):
+            output = current.gis.export_features(resource)
+            if output is not None:
+                return output
+
+        # Streaming export for large S3XML/S3JSON exports
+        # - not with slicing, components or custom stylesheets
+        # - s3json/export.xsl is an identity transformation, so can be skipped
+        if representation == "s3json":
+            native = stylesheet == os.path.join(r.folder, r.XSLT_PATH, "s3json", "export.xsl")
+        else:
+            native = representation == "xml" and stylesheet is None
+        threshold = settings.get_xml_stream_threshold()
+        if native and threshold is not None and \
+           not target and not r.component and \
+           start is None and limit is None and \
+           resource.count() > threshold:
+            stream = resource.export_xml(msince = msince,
+                                         fields = fields,
+                                         dereference = True,
+                                         references = references,
+                                         mdata = mdata,
+                                         mcomponents = mcomponents,
+                                         rcomponents = rcomponents,
+                                         as_json = as_json,
+                                         maxbounds = maxbounds,
+                                         as_stream = True,
+                                         # maxdepth in args
+                                         **args)
+            # Spool the output to a temporary file (the database
+            # connection is no longer available once the controller
+            # has returned), then stream it from there
+            from tempfile import TemporaryFile
+            output = TemporaryFile()
+            for chunk in stream:
+                output.write(chunk)
+            output.seek(0)
+            return response.stream(output,
+                                   chunk_size = DEFAULT_CHUNK_SIZE,
+                                   request = current.request,
+                                   )
+
         output = resource.export_xml(start = start,
                                      limit = limit,
                                      msince = msince,
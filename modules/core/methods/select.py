@@ -493,6 +493,7 @@ class Select(CRUDMethod):
                                                      orderby = orderby,
                                                      distinct = False,
                                                      list_id = list_id,
+                                                     seek = get_vars.get("seek"),
                                                      )
             else:
                 dt, displayrows = None, 0
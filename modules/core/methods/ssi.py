@@ -686,12 +686,15 @@ class SpreadsheetImporter(CRUDMethod):
                 import job UUID
         """
 
+        chunk_size = current.deployment_settings.get_base_import_chunk_size()
+
         result = resource.import_xml(source,
                                      source_type = fmt,
                                      extra_data = extra_data,
                                      commit = commit,
                                      ignore_errors = True,
                                      stylesheet = stylesheet,
+                                     chunk_size = chunk_size,
                                      **args)
 
         job_id = result.job_id
@@ -0,0 +1,633 @@
+"""
+    Feature Layer Tiles
+
+    Copyright: 2026-2026 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+
+from uuid import uuid4
+
+from gluon import current
+
+from ..gis import GIS
+from ..gis.layers import CLUSTER_DISTANCE, CLUSTER_THRESHOLD
+from ..resource import FS
+from ..tools import CacheGenerations, JSONSEPARATORS
+
+from .base import CRUDMethod
+
+__all__ = ("FeatureTiles",
+           )
+
+TILE_SIZE = 256 # pixels
+MAX_ZOOM = 22
+
+# =============================================================================
+class FeatureTiles(CRUDMethod):
+    """
+        Per-tile GeoJSON for Feature Layers: points are clustered on a
+        pixel grid, and lines/polygons simplified according to the zoom
+        level, so that maps only need to load the features of the visible
+        tiles rather than the whole layer
+
+        URL:
+            c/f/tile.geojson?z=<zoom>&x=<column>&y=<row>
+
+        URL options:
+            - layer     the gis_layer_feature.layer_id (for its settings)
+            - cluster   the cluster distance in pixels
+            - threshold the minimum number of points to form a cluster,
+                        0 to disable clustering
+            - attr      comma-separated list of attributes to include
+                        (overrides the layer setting)
+            - popup     comma-separated list of popup fields to include
+                        (overrides the layer setting)
+            - markers   include per-feature markers (marker_fn)
+
+        Notes:
+            - uses the XYZ tiling scheme (as OpenStreetMap), tile bounds
+              in WGS84
+            - points are assigned to the tile containing their lat/lon,
+              i.e. each point is returned in exactly one tile
+            - lines and polygons are returned (complete) in every tile
+              their bounding box intersects, with a feature ID so that
+              the client can drop duplicates
+            - features carry the same properties as in the GeoJSON export
+              of the layer (attributes, individual styles, markers)
+            - tiles are cached on disk (gis.feature_tiles_cache), using a
+              key that includes the resource query (=filters and access
+              rules), the last update of the table, and a generation that
+              changes after every transaction updating locations (see
+              invalidate()); superseded tiles are removed
+    """
+
+    generations = CacheGenerations("feature_tiles", shared=True)
+
+    # -------------------------------------------------------------------------
+    def apply_method(self, r, **attr):
+        """
+            Entry point for REST API
+
+            Args:
+                r: the CRUDRequest
+                attr: controller parameters
+        """
+
+        if r.http != "GET":
+            r.error(405, current.ERROR.BAD_METHOD)
+        if r.representation != "geojson":
+            r.error(415, current.ERROR.BAD_FORMAT)
+
+        return self.tile(r, **attr)
+
+    # -------------------------------------------------------------------------
+    def tile(self, r, **attr):
+        """
+            Returns a tile as GeoJSON FeatureCollection
+
+            Args:
+                r: the CRUDRequest
+                attr: controller parameters
+
+            Returns:
+                a JSON string
+        """
+
+        get_vars = r.get_vars
+
+        try:
+            z, x, y = int(get_vars["z"]), int(get_vars["x"]), int(get_vars["y"])
+        except (KeyError, TypeError, ValueError):
+            r.error(400, current.ERROR.BAD_REQUEST)
+        n = 2 ** z if 0 <= z <= MAX_ZOOM else 0
+        if not 0 <= x < n or not 0 <= y < n:
+            r.error(400, current.ERROR.BAD_REQUEST)
+
+        try:
+            distance = int(get_vars.get("cluster", CLUSTER_DISTANCE))
+            threshold = int(get_vars.get("threshold", CLUSTER_THRESHOLD))
+        except (TypeError, ValueError):
+            r.error(400, current.ERROR.BAD_REQUEST)
+        distance = min(max(distance, 1), TILE_SIZE)
+
+        response = current.response
+        response.headers["Content-Type"] = response.s3.content_type.get("geojson",
+                                                                        "application/json")
+
+        resource = self.resource
+
+        prefix = self.location_prefix(resource)
+        if prefix is None:
+            # Can't display this resource on the Map
+            r.error(400, current.ERROR.BAD_REQUEST)
+
+        # Feature Layer settings
+        layer = None
+        layer_id = get_vars.get("layer")
+        if layer_id:
+            ftable = current.s3db.gis_layer_feature
+            layer = current.db(ftable.layer_id == layer_id).select(ftable.attr_fields,
+                                                                   ftable.popup_fields,
+                                                                   ftable.individual,
+                                                                   ftable.points,
+                                                                   limitby = (0, 1),
+                                                                   ).first()
+
+        # Feature properties (as in GIS.get_location_data)
+        attr_fields = get_vars.get("attr")
+        attr_fields = attr_fields.split(",") if attr_fields else []
+        popup_fields = get_vars.get("popup")
+        popup_fields = popup_fields.split(",") if popup_fields else []
+        if layer:
+            if not popup_fields:
+                popup_fields = layer.popup_fields or []
+            if not attr_fields:
+                attr_fields = layer.attr_fields or []
+            individual = layer.individual
+            points = layer.points
+        else:
+            if not popup_fields:
+                popup_fields = ["name"]
+            individual = points = False
+        attr_fields = sorted(set(popup_fields + attr_fields))
+        markers = bool(get_vars.get("markers"))
+
+        # Look up the tile cache
+        path = None
+        if current.deployment_settings.get_gis_feature_tiles_cache():
+            params = (points, distance, threshold, attr_fields, individual, markers)
+            path = self.cache_path(resource, params, z, x, y)
+            try:
+                with open(path, "r") as cached:
+                    return cached.read()
+            except (IOError, OSError):
+                pass
+
+        output = self.encode(resource, prefix, z, x, y,
+                             points = points,
+                             distance = distance,
+                             threshold = threshold,
+                             attr_fields = attr_fields,
+                             style_layer = layer_id if individual else None,
+                             markers = markers,
+                             )
+
+        if path:
+            self.cache_store(path, output)
+
+        return output
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def tile_bounds(z, x, y):
+        """
+            Computes the WGS84 bounds of a tile
+
+            Args:
+                z: the zoom level
+                x: the tile column
+                y: the tile row
+
+            Returns:
+                tuple (lon_min, lat_min, lon_max, lat_max)
+        """
+
+        n = 2.0 ** z
+
+        lat = lambda row: math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+        return (x / n * 360.0 - 180.0,
+                lat(y + 1),
+                (x + 1) / n * 360.0 - 180.0,
+                lat(y),
+                )
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def location_prefix(resource):
+        """
+            Determines the selector prefix for the location of the
+            features in a resource
+
+            Args:
+                resource: the CRUDResource
+
+            Returns:
+                the selector prefix, or None if the resource has
+                no location reference
+        """
+
+        if resource.tablename == "gis_location":
+            return ""
+
+        context = resource.get_config("context")
+        if context and "location" in context:
+            return "(location)$"
+
+        fields = resource.table.fields
+        if "location_id" in fields:
+            return "location_id$"
+        elif "site_id" in fields:
+            return "site_id$location_id$"
+
+        return None
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def encode(cls,
+               resource,
+               prefix,
+               z,
+               x,
+               y,
+               points = False,
+               distance = CLUSTER_DISTANCE,
+               threshold = CLUSTER_THRESHOLD,
+               attr_fields = None,
+               style_layer = None,
+               markers = False,
+               ):
+        """
+            Encodes the features of a resource within a tile
+
+            Args:
+                resource: the CRUDResource
+                prefix: the selector prefix for the location
+                z: the zoom level
+                x: the tile column
+                y: the tile row
+                points: always show points, even for lines/polygons
+                distance: the cluster distance (pixels)
+                threshold: the minimum number of points to form a cluster
+                attr_fields: selectors of the attributes to include
+                style_layer: the layer_id to include individual styles for
+                markers: include per-feature markers
+
+            Returns:
+                a GeoJSON FeatureCollection (JSON string)
+        """
+
+        lon_min, lat_min, lon_max, lat_max = cls.tile_bounds(z, x, y)
+
+        # Points within the tile bounds (lower bounds inclusive, upper
+        # exclusive, so that points on edges belong to exactly one tile)
+        lat, lon = FS("%slat" % prefix), FS("%slon" % prefix)
+        query = (lat >= lat_min) & (lat < lat_max) & \
+                (lon >= lon_min) & (lon < lon_max)
+        if not points:
+            # Lines and polygons with bounds intersecting the tile
+            ftype = FS("%sgis_feature_type" % prefix)
+            intersects = (FS("%slat_min" % prefix) < lat_max) & \
+                         (FS("%slat_max" % prefix) >= lat_min) & \
+                         (FS("%slon_min" % prefix) < lon_max) & \
+                         (FS("%slon_max" % prefix) >= lon_min)
+            query = (((ftype == None) | (ftype == 1) | (FS("%slat_min" % prefix) == None)) & query) | \
+                    ((ftype > 1) & intersects)
+        resource.add_filter(query)
+
+        selectors = ["id", "%slat" % prefix, "%slon" % prefix]
+        if not points:
+            selectors.extend(["%swkt" % prefix,
+                              "%sgis_feature_type" % prefix,
+                              "%sid" % prefix,
+                              ])
+        colnames = [resource.resolve_selector(s).colname for s in selectors]
+
+        data = resource.select(selectors,
+                               limit = None,
+                               represent = False,
+                               virtual = False,
+                               )
+
+        settings = current.deployment_settings
+        precision = settings.get_gis_precision()
+
+        # Tolerance for simplification = size of a pixel
+        tolerance = (lon_max - lon_min) / TILE_SIZE
+
+        # Cluster grid, aligned with tile edges
+        cells = max(1, TILE_SIZE // distance)
+        cell_lon = (lon_max - lon_min) / cells
+        cell_lat = (lat_max - lat_min) / cells
+
+        dumps = json.dumps
+        POINT = '{"type":"Point","coordinates":[%.*f,%.*f]}'
+        FEATURE = '{"type":"Feature","geometry":%s,"properties":%s}'
+        SHAPE = '{"type":"Feature","id":"%s","geometry":%s,"properties":%s}'
+
+        id_col, lat_col, lon_col = colnames[:3]
+        wkt_col, type_col, location_col = colnames[3:] if not points else (None, None, None)
+
+        shapes = []
+        clusters = {}
+        seen = set()
+        for row in data.rows:
+
+            record_id = row[id_col]
+            lat, lon = row[lat_col], row[lon_col]
+            if lat is None or lon is None or (record_id, lat, lon) in seen:
+                continue
+            seen.add((record_id, lat, lon))
+
+            if wkt_col and row[wkt_col] and row[type_col] not in (None, 1):
+                # Line or polygon
+                shapes.append((record_id, row[location_col], row[wkt_col]))
+                continue
+
+            if not lat_min <= lat < lat_max or not lon_min <= lon < lon_max:
+                # Point-type location outside of the tile (matched by bounds)
+                continue
+
+            cell = (min(int((lon - lon_min) / cell_lon), cells - 1),
+                    min(int((lat_max - lat) / cell_lat), cells - 1),
+                    )
+            cluster = clusters.get(cell)
+            if cluster is None:
+                clusters[cell] = [(record_id, lat, lon)]
+            else:
+                cluster.append((record_id, lat, lon))
+
+        # Look up the feature properties
+        if shapes or clusters:
+            record_ids = {item[0] for item in shapes}
+            for cluster in clusters.values():
+                if not threshold or len(cluster) < threshold:
+                    record_ids.update(item[0] for item in cluster)
+            properties = cls.properties(resource,
+                                        record_ids,
+                                        attr_fields = attr_fields,
+                                        style_layer = style_layer,
+                                        markers = markers,
+                                        )
+        else:
+            properties = {}
+        def feature_properties(record_id):
+            props = dict(properties.get(record_id) or {})
+            props["id"] = record_id
+            return dumps(props, separators=JSONSEPARATORS)
+
+        features = []
+        for record_id, location_id, wkt in shapes:
+            geometry = GIS.simplify(wkt,
+                                    tolerance = tolerance,
+                                    output = "geojson",
+                                    precision = precision,
+                                    )
+            if geometry:
+                # Same geometry in all tiles of this zoom level, so the
+                # client keeps only the first one it loads
+                feature_id = "%s-%s" % (record_id, location_id)
+                features.append(SHAPE % (feature_id, geometry, feature_properties(record_id)))
+
+        for cluster in clusters.values():
+            if threshold and len(cluster) >= threshold:
+                count = len(cluster)
+                lat = sum(item[1] for item in cluster) / count
+                lon = sum(item[2] for item in cluster) / count
+                geometry = POINT % (precision, lon, precision, lat)
+                props = dumps({"cluster": True, "count": count},
+                              separators = JSONSEPARATORS,
+                              )
+                features.append(FEATURE % (geometry, props))
+            else:
+                for record_id, lat, lon in cluster:
+                    geometry = POINT % (precision, lon, precision, lat)
+                    features.append(FEATURE % (geometry, feature_properties(record_id)))
+
+        return '{"type":"FeatureCollection","features":[%s]}' % ",".join(features)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def properties(resource, record_ids, attr_fields=None, style_layer=None, markers=False):
+        """
+            Looks up the properties of the features within a tile that
+            the map client needs for popups and styling, as in the GeoJSON
+            export of the layer (see GIS.get_location_data)
+
+            Args:
+                resource: the CRUDResource (filtered by tile)
+                record_ids: the IDs of the records shown as individual
+                            features (rather than clusters)
+                attr_fields: selectors of the attributes to include
+                style_layer: the layer_id to include individual styles for
+                markers: include per-feature markers
+
+            Returns:
+                dict {record_id: {property: value}}
+        """
+
+        properties = {}
+        def get_properties(record_id):
+            props = properties.get(record_id)
+            if props is None:
+                props = properties[record_id] = {}
+            return props
+
+        if attr_fields:
+            attributes = GIS.get_feature_attributes(resource, attr_fields)
+            for record_id, attr in attributes.items():
+                if record_id in record_ids:
+                    get_properties(record_id).update(attr)
+
+        if markers or style_layer:
+            s3db = current.s3db
+            tablename = resource.tablename
+            pkey = resource._id.name
+
+            marker_fn = s3db.get_config(tablename, "marker_fn") if markers else None
+            if marker_fn:
+                # Add a per-feature Marker
+                download_url = "/%s/static/img/markers" % current.request.application
+                for record in resource:
+                    if record[pkey] not in record_ids:
+                        continue
+                    m = marker_fn(record)
+                    if m:
+                        props = get_properties(record[pkey])
+                        props["marker_url"] = "%s/%s" % (download_url, m["image"])
+                        props["marker_height"] = m["height"]
+                        props["marker_width"] = m["width"]
+
+            if style_layer:
+                # Add a per-feature Style
+                stable = s3db.gis_style
+                query = (stable.deleted == False) & \
+                        (stable.layer_id == style_layer) & \
+                        (stable.record_id.belongs(record_ids))
+                rows = current.db(query).select(stable.record_id,
+                                                stable.style,
+                                                )
+                for row in rows:
+                    get_properties(row.record_id)["style"] = row.style
+
+        return properties
+
+    # -------------------------------------------------------------------------
+    # Tile Cache
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def cache_root():
+        """
+            Returns the root directory of the tile cache
+        """
+
+        return os.path.join(current.request.folder, "cache", "tiles")
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def cache_path(cls, resource, params, z, x, y):
+        """
+            Returns the cache path for a tile
+
+            Args:
+                resource: the CRUDResource (before filtering by tile)
+                params: tuple of further encoding parameters
+                z: the zoom level
+                x: the tile column
+                y: the tile row
+
+            Returns:
+                the file path, <root>/<tablename>/<variant>/<stamp>/<z>/<x>/<y>.geojson
+
+            Note:
+                Must be called before encoding the tile, so that the stamp
+                reflects the data the tile has been encoded from
+        """
+
+        table = resource.table
+
+        # Location updates (after commit)
+        generation = cls.generations.get()[0]
+
+        # Last update of the table (deletions also update modified_on)
+        if "modified_on" in table.fields and resource.tablename != "gis_location":
+            mtime = table.modified_on.max()
+            row = current.db(table._id > 0).select(mtime).first()
+            modified_on = str(row[mtime]) if row else None
+        else:
+            modified_on = None
+
+        # Filters and access rules
+        query = str(resource.get_query())
+        filters = sorted(resource.rfilter.serialize_url().items())
+
+        md5 = lambda v: hashlib.md5(json.dumps(v, default=str).encode("utf-8")).hexdigest()
+
+        return os.path.join(cls.cache_root(),
+                            resource.tablename,
+                            md5([query, filters, params]),
+                            md5([generation, modified_on]),
+                            str(z),
+                            str(x),
+                            "%s.geojson" % y,
+                            )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def cache_store(cls, path, output):
+        """
+            Writes a tile to the cache, and removes the tiles superseded
+            by the stamp of the path when it is first written to
+
+            Args:
+                path: the file path (see cache_path)
+                output: the tile contents
+        """
+
+        # The directory for the stamp, <stamp>/<z>/<x>/<y>.geojson
+        stamp = path
+        for _ in range(3):
+            stamp = os.path.dirname(stamp)
+        new_stamp = not os.path.isdir(stamp)
+
+        temp = "%s.%s" % (path, uuid4().hex)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp, "w") as tile:
+                tile.write(output)
+            # Atomic, so that concurrent requests never read partial tiles
+            os.replace(temp, path)
+        except (IOError, OSError) as e:
+            current.log.error("Could not write tile cache: %s" % e)
+            return
+
+        if new_stamp:
+            # Remove the tiles for previous stamps of the same variant
+            variant = os.path.dirname(stamp)
+            current_stamp = os.path.basename(stamp)
+            try:
+                stamps = os.listdir(variant)
+            except OSError:
+                return
+            for name in stamps:
+                if name != current_stamp and "." not in name:
+                    cls.remove(os.path.join(variant, name))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, tablename=None):
+        """
+            Removes cached tiles, e.g. after location updates
+
+            Args:
+                tablename: remove only the tiles of this table
+
+            Note:
+                Tiles encoded from the previous state by concurrent requests
+                while the current transaction is pending would be cached
+                under the current stamp, so the stamp is changed again after
+                the transaction has ended (generation of all tables)
+        """
+
+        cls.generations.invalidate()
+
+        root = cls.cache_root()
+        cls.remove(os.path.join(root, tablename) if tablename else root)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def remove(path):
+        """
+            Removes a directory tree from the tile cache
+
+            Args:
+                path: the path of the directory
+        """
+
+        if os.path.isdir(path):
+            # Move away first, so that no requests write into a
+            # partially removed tree
+            temp = "%s.%s" % (path, uuid4().hex)
+            try:
+                os.rename(path, temp)
+            except OSError:
+                return
+            shutil.rmtree(temp, ignore_errors=True)
+
+# END =========================================================================
@@ -29,6 +29,8 @@ __all__ = ("DataModel",
            )
 
 import sys
+import threading
+import time
 
 from gluon import current, IS_EMPTY_OR, TAG
 from gluon.storage import Storage
@@ -36,7 +38,7 @@ from gluon.tools import callback
 
 from s3dal import Table, Field, original_tablename
 
-from ..tools import IS_ONE_OF
+from ..tools import IS_ONE_OF, RepresentCache, SearchIndex
 from ..ui import S3ScriptItem
 
 from .dynamic import DynamicTableModel, DYNAMIC_PREFIX
@@ -55,6 +57,13 @@ class DataModel:
     LOAD = "eden_model_load"
     DELETED = "deleted"
 
+    # Process-wide index of model names per prefix (see names_index)
+    INDEX = {}
+
+    # Process-wide model loading profile (see profile)
+    PROFILE = {}
+    PROFILE_LOCK = threading.Lock()
+
     def __init__(self, module=None):
 
         self.cache = (current.cache.ram, 60)
@@ -91,6 +100,9 @@ class DataModel:
         if module is not None:
             if self.__loaded():
                 return
+            profile = current.deployment_settings.get_base_model_profile()
+            if profile:
+                start = self.__profile_start()
             self.__lock()
             try:
                 env = self.mandatory()
@@ -116,6 +128,8 @@ class DataModel:
                 response.s3.update(env)
             self.__loaded(True)
             self.__unlock()
+            if profile:
+                self.__profile_end(start)
 
     # -------------------------------------------------------------------------
     def __loaded(self, loaded=None):
@@ -156,6 +170,102 @@ class DataModel:
             if not response[LOCK]:
                 del response[LOCK]
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def __profile_start():
+        """
+            Start profiling a model load
+
+            Returns:
+                the start time
+        """
+
+        s3 = current.response.s3
+        stack = s3.model_profile_stack
+        if stack is None:
+            stack = s3.model_profile_stack = []
+
+        # Time spent loading nested models
+        stack.append(0.0)
+
+        return time.perf_counter()
+
+    # -------------------------------------------------------------------------
+    def __profile_end(self, start):
+        """
+            Finish profiling a model load, record and log the load time
+
+            Args:
+                start: the start time
+        """
+
+        duration = time.perf_counter() - start
+
+        s3 = current.response.s3
+        stack = s3.model_profile_stack
+
+        # Exclusive of nested model loads
+        exclusive = duration - stack.pop()
+        if stack:
+            stack[-1] += duration
+
+        name = self.__class__.__name__
+
+        # Per-request profile
+        loads = s3.model_profile
+        if loads is None:
+            loads = s3.model_profile = []
+        loads.append((name, duration, exclusive))
+
+        # Process-wide profile
+        with self.PROFILE_LOCK:
+            stats = self.PROFILE.get(name)
+            if stats is None:
+                stats = self.PROFILE[name] = [0, 0.0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] += exclusive
+            stats[3] = max(stats[3], exclusive)
+
+        current.log.debug("Model %s loaded in %.2f ms (%.2f ms excl. nested models)" % \
+                          (name, duration * 1000, exclusive * 1000))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def profile(cls, reset=False):
+        """
+            Get the process-wide model loading profile (requires
+            settings.base.model_profile)
+
+            Args:
+                reset: reset the profile after reading
+
+            Returns:
+                list of dicts {"model": the DataModel class name,
+                               "loads": number of loads,
+                               "total": total load time (ms),
+                               "exclusive": total load time exclusive of
+                                            nested model loads (ms),
+                               "max": maximum exclusive load time (ms),
+                               },
+                ordered by exclusive load time, descending
+        """
+
+        with cls.PROFILE_LOCK:
+            output = [{"model": name,
+                       "loads": stats[0],
+                       "total": stats[1] * 1000,
+                       "exclusive": stats[2] * 1000,
+                       "max": stats[3] * 1000,
+                       }
+                      for name, stats in cls.PROFILE.items()
+                      ]
+            if reset:
+                cls.PROFILE.clear()
+
+        output.sort(key=lambda item: item["exclusive"], reverse=True)
+        return output
+
     # -------------------------------------------------------------------------
     def __getattr__(self, name):
         """ Model auto-loader """
@@ -297,23 +407,16 @@ class DataModel:
             except AttributeError:
                 pass
         else:
-            modules = s3db.module_map.get(prefix, "")
-            for module in modules:
-                names = module.__all__
-                s3models = module.__dict__
+            for module, names, models in s3db.names_index(prefix):
                 if not db_only and tablename in names:
                     # A name defined at module level (e.g. a class)
                     s3db.classes[tablename] = module
-                    found = s3models[tablename]
+                    found = module.__dict__[tablename]
                 else:
                     # A name defined in a DataModel
-                    for n in names:
-                        model = s3models[n]
-                        if hasattr(model, "_edenmodel") and \
-                           hasattr(model, "names") and \
-                           tablename in model.names:
-                            model(prefix)
-                            break
+                    n = models.get(tablename)
+                    if n:
+                        module.__dict__[n](prefix)
 
         if found:
             return found
@@ -364,22 +467,53 @@ class DataModel:
             except AttributeError:
                 pass
         else:
-            modules = s3db.module_map.get(prefix, "")
-            for module in modules:
-                names = module.__all__
-                if name in names:
+            for _, names, models in s3db.names_index(prefix):
+                if name in names or name in models:
                     found = True
                     break
+
+        return found
+
+    # -------------------------------------------------------------------------
+    def names_index(self, prefix):
+        """
+            Get the index of names defined by the modules for a prefix;
+            the index is built once per process (and rebuilt only if the
+            modules get reloaded)
+
+            Args:
+                prefix: the module prefix
+
+            Returns:
+                list of tuples (module, names, models), in module order,
+                    - names: the set of names exported by the module
+                    - models: dict {tablename: DataModel class name} of
+                              all tables defined in the module
+        """
+
+        modules = self.module_map.get(prefix)
+        if not modules:
+            return ()
+
+        key = tuple(id(module) for module in modules)
+
+        entry = self.INDEX.get(prefix)
+        if entry is None or entry[0] != key:
+            index = []
+            for module in modules:
+                names = module.__all__
                 s3models = module.__dict__
+                models = {}
                 for n in names:
                     model = s3models[n]
-                    if hasattr(model, "_edenmodel") and \
-                       hasattr(model, "names") and \
-                        name in model.names:
-                        found = True
-                        break
+                    if hasattr(model, "_edenmodel") and hasattr(model, "names"):
+                        for tablename in model.names:
+                            if tablename not in models:
+                                models[tablename] = n
+                index.append((module, set(names), models))
+            entry = self.INDEX[prefix] = (key, index)
 
-        return found
+        return entry[1]
 
     # -------------------------------------------------------------------------
     @classmethod
@@ -466,6 +600,26 @@ class DataModel:
         else:
             if meta:
                 fields = fields + MetaFields()
+            callbacks = []
+            if RepresentCache.enabled(tablename):
+                # Invalidate cached representations upon updates
+                callbacks.append(RepresentCache.attach)
+            if SearchIndex.enabled(tablename):
+                # Maintain the search index upon inserts/updates/deletes
+                callbacks.append(SearchIndex.attach)
+            from ..filters import FilterOptionsCache
+            if FilterOptionsCache.enabled(tablename):
+                # Invalidate cached filter options upon inserts/updates/deletes
+                # (only attaches if the table is involved in cached lookups)
+                callbacks.append(FilterOptionsCache.attach)
+            if callbacks:
+                on_define = args.get("on_define")
+                def attach(table):
+                    for cb in callbacks:
+                        cb(table)
+                    if on_define:
+                        on_define(table)
+                args["on_define"] = attach
             table = db.define_table(tablename, *fields, **args)
         return table
 
@@ -42,7 +42,10 @@ import os
 import re
 import string
 import sys
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 from lxml import etree
 from urllib import request as urllib2
@@ -53,6 +56,8 @@ from urllib.parse import urlencode
 from gluon import current, redirect, IS_IN_SET
 from gluon.html import *
 
+from s3dal import S3DAL
+
 from ..methods import BasicCRUD
 from ..tools import IS_ONE_OF, get_crud_string, s3_decode_iso_datetime, \
                     s3_str
@@ -444,13 +449,26 @@ class S3Msg:
             Args:
                 contact_method: the output channel (see pr_contact.method)
 
+            Notes:
+                - pending messages are processed in batches (see
+                  settings.msg.outbox_batch_size), looking up the
+                  recipients' contacts and committing the message
+                  statuses once per batch
+                - messages to groups, organisations etc. are expanded
+                  into outbox entries for the individual members, which
+                  are then processed in the same run
+                - SMS via Web API gateways are sent in parallel threads
+                  (see settings.msg.sms_api_workers/sms_api_rate_limit)
+
             TODO contact_method = "ALL"
         """
 
         db = current.db
         s3db = current.s3db
+        settings = current.deployment_settings
 
         lookup_org = False
+        org_branches = False
         channels = {}
         outgoing_sms_handler = None
         channel_id = None
@@ -480,7 +498,7 @@ class S3Msg:
                 channel_id = row["msg_sms_outbound_gateway.channel_id"]
             else:
                 lookup_org = True
-                org_branches = current.deployment_settings.get_org_branches()
+                org_branches = settings.get_org_branches()
                 if org_branches:
                     org_parents = s3db.org_parents
                 for row in rows:
@@ -489,95 +507,36 @@ class S3Msg:
                          "channel_id": row["msg_sms_outbound_gateway.channel_id"],
                          }
 
-        def dispatch_to_pe_id(pe_id,
-                              subject,
-                              message,
-                              outbox_id,
-                              message_id,
-                              attachments = [],
-                              organisation_id = None,
-                              contact_method = contact_method,
-                              channel_id = channel_id,
-                              from_address = None,
-                              outgoing_sms_handler = outgoing_sms_handler,
-                              lookup_org = lookup_org,
-                              channels = channels):
+        def get_channel(organisation_id):
             """
-                Helper method to send messages by pe_id
+                Helper method to determine the SMS channel for a message
 
                 Args:
-                    pe_id: the pe_id
-                    subject: the message subject
-                    message: the message body
-                    outbox_id: the outbox record ID
-                    message_id: the message_id
-                    organisation_id: the organisation_id (for SMS)
-                    contact_method: the contact method
+                    organisation_id: the organisation_id of the message
+
+                Returns:
+                    tuple (outgoing_sms_handler, channel_id), or None
+                    if there is no suitable channel
             """
 
-            # Get the recipient's contact info
-            table = s3db.pr_contact
-            query = (table.pe_id == pe_id) & \
-                    (table.contact_method == contact_method) & \
-                    (table.deleted == False)
-            contact_info = db(query).select(table.value,
-                                            orderby = table.priority,
-                                            limitby = (0, 1)
-                                            ).first()
-            # Send the message
-            if contact_info:
-                address = contact_info.value
-                if contact_method == "EMAIL":
-                    return self.send_email(address,
-                                           subject,
-                                           message,
-                                           sender = from_address,
-                                           attachments = attachments,
-                                           )
-
-                elif contact_method == "SMS":
-                    if lookup_org:
-                        channel = channels.get(organisation_id)
-                        if not channel and \
-                            org_branches:
-                            orgs = org_parents(organisation_id)
-                            for org in orgs:
-                                channel = channels.get(org)
-                                if channel:
-                                    break
-                        if not channel:
-                            # Look for an unrestricted channel
-                            channel = channels.get(None)
-                        if not channel:
-                            # We can't send this message as there is no unrestricted channel & none which matches this Org
-                            return False
-                        outgoing_sms_handler = channel["outgoing_sms_handler"]
-                        channel_id = channel["channel_id"]
-
-                    if outgoing_sms_handler == "msg_sms_webapi_channel":
-                        return self.send_sms_via_api(address,
-                                                     message,
-                                                     message_id,
-                                                     channel_id)
-
-                    elif outgoing_sms_handler == "msg_sms_smtp_channel":
-                        return self.send_sms_via_smtp(address,
-                                                      message,
-                                                      channel_id)
-
-                    elif outgoing_sms_handler == "msg_sms_modem_channel":
-                        return self.send_sms_via_modem(address,
-                                                       message,
-                                                       channel_id)
-
-                    elif outgoing_sms_handler == "msg_sms_tropo_channel":
-                        # NB This does not mean the message is sent
-                        return self.send_sms_via_tropo(outbox_id,
-                                                       message_id,
-                                                       address,
-                                                       message,
-                                                       channel_id)
-            return False
+            if not lookup_org:
+                return outgoing_sms_handler, channel_id
+
+            channel = channels.get(organisation_id)
+            if not channel and org_branches:
+                orgs = org_parents(organisation_id)
+                for org in orgs:
+                    channel = channels.get(org)
+                    if channel:
+                        break
+            if not channel:
+                # Look for an unrestricted channel
+                channel = channels.get(None)
+            if not channel:
+                # We can't send this message as there is no unrestricted channel & none which matches this Org
+                return None
+
+            return channel["outgoing_sms_handler"], channel["channel_id"]
 
         outbox = s3db.msg_outbox
 
@@ -609,11 +568,10 @@ class S3Msg:
             # @ToDo
             raise NotImplementedError
 
-        rows = db(query).select(*fields,
-                                left = left,
-                                orderby = ~outbox.retries)
+        rows = db(query).select(outbox.id, orderby=~outbox.retries)
         if not rows:
             return
+        pending = [row.id for row in rows]
 
         htable = s3db.table("hrm_human_resource")
         otable = s3db.org_organisation
@@ -623,54 +581,55 @@ class S3Msg:
         ftable = s3db.pr_forum
         fmtable = db.pr_forum_membership
 
-        # Left joins for multi-recipient lookups
-        gleft = [mtable.on((mtable.group_id == gtable.id) & \
-                           (mtable.person_id != None) & \
-                           (mtable.deleted == False)),
-                 ptable.on((ptable.id == mtable.person_id) & \
-                           (ptable.deleted == False))
-                 ]
-        fleft = [fmtable.on((fmtable.forum_id == ftable.id) & \
-                           (fmtable.person_id != None) & \
-                           (fmtable.deleted == False)),
-                 ptable.on((ptable.id == fmtable.person_id) & \
-                           (ptable.deleted == False))
-                 ]
+        # Left joins for multi-recipient lookups, by entity type
+        expand = {"pr_group": (gtable,
+                               [mtable.on((mtable.group_id == gtable.id) & \
+                                          (mtable.person_id != None) & \
+                                          (mtable.deleted == False)),
+                                ptable.on((ptable.id == mtable.person_id) & \
+                                          (ptable.deleted == False))
+                                ]),
+                  "pr_forum": (ftable,
+                               [fmtable.on((fmtable.forum_id == ftable.id) & \
+                                           (fmtable.person_id != None) & \
+                                           (fmtable.deleted == False)),
+                                ptable.on((ptable.id == fmtable.person_id) & \
+                                          (ptable.deleted == False))
+                                ]),
+                  }
 
         if htable:
-            oleft = [htable.on((htable.organisation_id == otable.id) & \
-                               (htable.person_id != None) & \
-                               (htable.deleted == False)),
-                     ptable.on((ptable.id == htable.person_id) & \
-                               (ptable.deleted == False)),
-                     ]
+            expand["org_organisation"] = (otable,
+                     [htable.on((htable.organisation_id == otable.id) & \
+                                (htable.person_id != None) & \
+                                (htable.deleted == False)),
+                      ptable.on((ptable.id == htable.person_id) & \
+                                (ptable.deleted == False)),
+                      ])
 
             etable = s3db.hrm_training_event
             ttable = s3db.hrm_training
-            tleft = [ttable.on((ttable.training_event_id == etable.id) & \
-                               (ttable.person_id != None) & \
-                               (ttable.deleted == False)),
-                     ptable.on((ptable.id == ttable.person_id) & \
-                               (ptable.deleted == False)),
-                     ]
+            expand["hrm_training_event"] = (etable,
+                     [ttable.on((ttable.training_event_id == etable.id) & \
+                                (ttable.person_id != None) & \
+                                (ttable.deleted == False)),
+                      ptable.on((ptable.id == ttable.person_id) & \
+                                (ptable.deleted == False)),
+                      ])
 
             atable = s3db.table("deploy_alert")
             if atable:
                 ltable = db.deploy_alert_recipient
-                aleft = [ltable.on(ltable.alert_id == atable.id),
-                         htable.on((htable.id == ltable.human_resource_id) & \
-                                   (htable.person_id != None) & \
-                                   (htable.deleted == False)),
-                         ptable.on((ptable.id == htable.person_id) & \
-                                   (ptable.deleted == False))
-                         ]
-
-        # chainrun: used to fire process_outbox again,
-        # when messages are sent to groups or organisations
-        chainrun = False
-
-        # Set a default for non-SMS
-        organisation_id = None
+                expand["deploy_alert"] = (atable,
+                     [ltable.on(ltable.alert_id == atable.id),
+                      htable.on((htable.id == ltable.human_resource_id) & \
+                                (htable.person_id != None) & \
+                                (htable.deleted == False)),
+                      ptable.on((ptable.id == htable.person_id) & \
+                                (ptable.deleted == False))
+                      ])
+
+        ctable = s3db.pr_contact
         attachment_table = s3db.msg_attachment
         document_table = s3db.doc_document
         file_field = document_table.file
@@ -680,157 +639,226 @@ class S3Msg:
             retrieve_file_properties = file_field.retrieve_file_properties
         mail_attachment = current.mail.Attachment
 
-        for row in rows:
-            attachments = []
-            status = True
-            message_id = row.msg_outbox.message_id
+        # Thread pool for Web API SMS gateways
+        executor = throttle = None
+        sms_apis = {}
+        if contact_method == "SMS":
+            workers = settings.get_msg_sms_api_workers()
+            executor = ThreadPoolExecutor(max_workers = max(1, workers or 1))
+            throttle = ChannelThrottle(settings.get_msg_sms_api_rate_limit())
+
+        def dispatch(row, address, files):
+            """
+                Helper method to send a message to a person
+
+                Args:
+                    row: the outbox Row (with message details)
+                    address: the contact address of the recipient
+                    files: the attachment files, dict {message_id: [file]}
+
+                Returns:
+                    True|False for success, or tuple (url, Future) if
+                    the message is being sent through a Web API gateway
+            """
+
+            item = row["msg_outbox"]
+            message_id = item.message_id
 
             if contact_method == "EMAIL":
-                subject = row["msg_email.subject"] or ""
-                message = row["msg_email.body"] or ""
-                from_address = row["msg_email.from_address"] or ""
-                query = (attachment_table.message_id == message_id) & \
-                        (attachment_table.deleted == False) & \
-                        (attachment_table.document_id == document_table.id) & \
-                        (document_table.deleted == False)
-                arows = db(query).select(file_field)
-                for arow in arows:
-                    file = arow.file
+                attachments = []
+                for file in files.get(message_id, ()):
                     prop = retrieve_file_properties(file)
                     _file_path = os.path.join(prop["path"], file)
                     attachments.append(mail_attachment(_file_path))
+                return self.send_email(address,
+                                       row["msg_email.subject"] or "",
+                                       row["msg_email.body"] or "",
+                                       sender = row["msg_email.from_address"] or "",
+                                       attachments = attachments,
+                                       )
+
+            message = row["msg_sms.body"] or ""
+            organisation_id = row["msg_sms.organisation_id"] if lookup_org else None
+            channel = get_channel(organisation_id)
+            if not channel:
+                return False
+            outgoing_sms_handler, channel_id = channel
 
-            elif contact_method == "SMS":
-                subject = None
-                message = row["msg_sms.body"] or ""
-                from_address = None
-                if lookup_org:
-                    organisation_id = row["msg_sms.organisation_id"]
-
-            else:
-                # @ToDo
-                continue
+            if outgoing_sms_handler == "msg_sms_webapi_channel":
+                if channel_id in sms_apis:
+                    sms_api = sms_apis[channel_id]
+                else:
+                    sms_api = sms_apis[channel_id] = self.get_sms_api(channel_id)
+                if not sms_api:
+                    return False
+                request = self.sms_api_request(sms_api, address, message, channel_id)
+                if not request:
+                    return False
+                return sms_api.url, executor.submit(self.sms_api_post,
+                                                    request,
+                                                    throttle,
+                                                    channel_id,
+                                                    )
 
-            entity_type = row["pr_pentity"].instance_type
-            if not entity_type:
-                current.log.warning("s3msg", "Entity type unknown")
-                continue
+            elif outgoing_sms_handler == "msg_sms_smtp_channel":
+                return self.send_sms_via_smtp(address, message, channel_id)
 
-            row = row["msg_outbox"]
-            pe_id = row.pe_id
-            message_id = row.message_id
+            elif outgoing_sms_handler == "msg_sms_modem_channel":
+                return self.send_sms_via_modem(address, message, channel_id)
 
-            if entity_type == "pr_person":
-                # Send the message to this person
-                try:
-                    status = dispatch_to_pe_id(pe_id,
-                                               subject,
-                                               message,
-                                               row.id,
+            elif outgoing_sms_handler == "msg_sms_tropo_channel":
+                # NB This does not mean the message is sent
+                return self.send_sms_via_tropo(item.id,
                                                message_id,
-                                               organisation_id = organisation_id,
-                                               from_address = from_address,
-                                               attachments = attachments,
-                                               )
-                except:
-                    status = False
-
-            elif entity_type == "pr_group":
-                # Re-queue the message for each member in the group
-                gquery = (gtable.pe_id == pe_id)
-                recipients = db(gquery).select(ptable.pe_id, left=gleft)
-                pe_ids = set(r.pe_id for r in recipients)
-                pe_ids.discard(None)
-                if pe_ids:
-                    for pe_id in pe_ids:
-                        outbox.insert(message_id = message_id,
-                                      pe_id = pe_id,
-                                      contact_method = contact_method,
-                                      system_generated = True)
-                    chainrun = True
-                status = True
-
-            elif entity_type == "pr_forum":
-                # Re-queue the message for each member in the group
-                fquery = (ftable.pe_id == pe_id)
-                recipients = db(fquery).select(ptable.pe_id, left=fleft)
-                pe_ids = set(r.pe_id for r in recipients)
-                pe_ids.discard(None)
-                if pe_ids:
-                    for pe_id in pe_ids:
-                        outbox.insert(message_id = message_id,
-                                      pe_id = pe_id,
-                                      contact_method = contact_method,
-                                      system_generated = True)
-                    chainrun = True
-                status = True
-
-            elif htable and entity_type == "org_organisation":
-                # Re-queue the message for each HR in the organisation
-                oquery = (otable.pe_id == pe_id)
-                recipients = db(oquery).select(ptable.pe_id, left=oleft)
-                pe_ids = set(r.pe_id for r in recipients)
-                pe_ids.discard(None)
-                if pe_ids:
-                    for pe_id in pe_ids:
-                        outbox.insert(message_id = message_id,
-                                      pe_id = pe_id,
-                                      contact_method = contact_method,
-                                      system_generated = True)
-                    chainrun = True
-                status = True
-
-            elif entity_type == "hrm_training_event":
-                # Re-queue the message for each participant
-                equery = (etable.pe_id == pe_id)
-                recipients = db(equery).select(ptable.pe_id, left=tleft)
-                pe_ids = set(r.pe_id for r in recipients)
-                pe_ids.discard(None)
-                if pe_ids:
-                    for pe_id in pe_ids:
-                        outbox.insert(message_id = message_id,
-                                      pe_id = pe_id,
-                                      contact_method = contact_method,
-                                      system_generated = True)
-                    chainrun = True
-                status = True
-
-            elif atable and entity_type == "deploy_alert":
-                # Re-queue the message for each HR in the group
-                aquery = (atable.pe_id == pe_id)
-                recipients = db(aquery).select(ptable.pe_id, left=aleft)
-                pe_ids = set(r.pe_id for r in recipients)
-                pe_ids.discard(None)
-                if pe_ids:
-                    for pe_id in pe_ids:
-                        outbox.insert(message_id = message_id,
-                                      pe_id = pe_id,
-                                      contact_method = contact_method,
-                                      system_generated = True)
-                    chainrun = True
-                status = True
+                                               address,
+                                               message,
+                                               channel_id)
+            return False
 
-            else:
-                # Unsupported entity type
-                row.update_record(status = 4) # Invalid
-                db.commit()
-                continue
+        batch_size = settings.get_msg_outbox_batch_size()
 
-            if status:
-                row.update_record(status = 2) # Sent
-                db.commit()
-            else:
-                if row.retries > 0:
-                    row.update_record(retries = row.retries - 1)
-                    db.commit()
-                elif row.retries is not None:
-                    row.update_record(status = 5) # Failed
+        try:
+            while pending:
+                batch, pending = pending[:batch_size], pending[batch_size:]
 
-        if chainrun:
-            self.process_outbox(contact_method)
+                rows = db(query & outbox.id.belongs(batch)).select(*fields,
+                                                                   left = left,
+                                                                   orderby = ~outbox.retries,
+                                                                   )
+                sent, failed, invalid = [], [], []
+
+                # Sort messages by recipient entity type
+                persons, groups = [], {}
+                for row in rows:
+                    entity_type = row["pr_pentity"].instance_type
+                    if not entity_type:
+                        current.log.warning("s3msg", "Entity type unknown")
+                    elif entity_type == "pr_person":
+                        persons.append(row)
+                    elif entity_type in expand:
+                        if entity_type in groups:
+                            groups[entity_type].append(row["msg_outbox"])
+                        else:
+                            groups[entity_type] = [row["msg_outbox"]]
+                    else:
+                        # Unsupported entity type
+                        invalid.append(row["msg_outbox"].id)
+
+                # Re-queue messages to groups, organisations etc. for each member
+                records = []
+                for entity_type, items in groups.items():
+                    table, join = expand[entity_type]
+                    pe_ids = list(set(item.pe_id for item in items))
+                    members = db(table.pe_id.belongs(pe_ids)).select(table.pe_id,
+                                                                     ptable.pe_id,
+                                                                     left = join,
+                                                                     )
+                    recipients = {}
+                    for member in members:
+                        pe_id = member[ptable.pe_id]
+                        if not pe_id:
+                            continue
+                        group_pe_id = member[table.pe_id]
+                        if group_pe_id in recipients:
+                            recipients[group_pe_id].add(pe_id)
+                        else:
+                            recipients[group_pe_id] = {pe_id}
+                    for item in items:
+                        for pe_id in recipients.get(item.pe_id, ()):
+                            records.append({"message_id": item.message_id,
+                                            "pe_id": pe_id,
+                                            "contact_method": contact_method,
+                                            "system_generated": True,
+                                            })
+                        sent.append(item.id)
+                if records:
+                    pending.extend(S3DAL.bulk_insert(outbox, records))
+
+                # Look up the recipients' contact info
+                contacts = {}
+                if persons:
+                    pe_ids = list(set(row["msg_outbox"].pe_id for row in persons))
+                    cquery = (ctable.pe_id.belongs(pe_ids)) & \
+                             (ctable.contact_method == contact_method) & \
+                             (ctable.deleted == False)
+                    crows = db(cquery).select(ctable.pe_id,
+                                              ctable.value,
+                                              orderby = ctable.priority,
+                                              )
+                    for crow in crows:
+                        if crow.pe_id not in contacts:
+                            contacts[crow.pe_id] = crow.value
+
+                # Look up the attachments
+                files = {}
+                if persons and contact_method == "EMAIL":
+                    message_ids = list(set(row["msg_outbox"].message_id for row in persons))
+                    aquery = (attachment_table.message_id.belongs(message_ids)) & \
+                             (attachment_table.deleted == False) & \
+                             (attachment_table.document_id == document_table.id) & \
+                             (document_table.deleted == False)
+                    arows = db(aquery).select(attachment_table.message_id,
+                                              file_field,
+                                              )
+                    for arow in arows:
+                        message_id = arow.msg_attachment.message_id
+                        file = arow.doc_document.file
+                        if message_id in files:
+                            files[message_id].append(file)
+                        else:
+                            files[message_id] = [file]
+
+                # Send the messages
+                queued = []
+                for row in persons:
+                    item = row["msg_outbox"]
+                    address = contacts.get(item.pe_id)
+                    try:
+                        status = dispatch(row, address, files) if address else False
+                    except:
+                        status = False
+                    if isinstance(status, tuple):
+                        # Request pending in worker thread
+                        queued.append((item,) + status)
+                    elif status:
+                        sent.append(item.id)
+                    else:
+                        failed.append(item)
+
+                # Collect the results from the worker threads
+                for item, url, future in queued:
+                    try:
+                        output = future.result()
+                    except HTTPError as e:
+                        current.log.error("SMS message send failed: %s" % e)
+                        status = False
+                    except:
+                        status = False
+                    else:
+                        status = self.sms_api_response(url, output, item.message_id)
+                    if status:
+                        sent.append(item.id)
+                    else:
+                        failed.append(item)
+
+                # Update the message statuses
+                if sent:
+                    db(outbox.id.belongs(sent)).update(status = 2) # Sent
+                if invalid:
+                    db(outbox.id.belongs(invalid)).update(status = 4) # Invalid
+                retry = [item.id for item in failed
+                         if item.retries is not None and item.retries > 0]
+                if retry:
+                    db(outbox.id.belongs(retry)).update(retries = outbox.retries - 1)
+                expired = [item.id for item in failed
+                           if item.retries is not None and item.retries <= 0]
+                if expired:
+                    db(outbox.id.belongs(expired)).update(status = 5) # Failed
+                db.commit()
+        finally:
+            if executor:
+                executor.shutdown()
 
-    # -------------------------------------------------------------------------
-    # Google Cloud Messaging Push
     # -------------------------------------------------------------------------
     def gcm_push(self, title=None, uri=None, message=None, registration_ids=None, channel_id=None):
         """
@@ -1113,19 +1141,63 @@ class S3Msg:
             Function to send SMS via Web API
         """
 
+        # Get Configuration
+        sms_api = self.get_sms_api(channel_id)
+        if not sms_api:
+            return False
+
+        request = self.sms_api_request(sms_api, mobile, text, channel_id)
+        if not request:
+            return False
+
+        try:
+            output = self.sms_api_post(request)
+        except HTTPError as e:
+            current.log.error("SMS message send failed: %s" % e)
+            return False
+
+        return self.sms_api_response(sms_api.url, output, message_id)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_sms_api(channel_id=None):
+        """
+            Get the configuration of a Web API SMS channel
+
+            Args:
+                channel_id: the channel ID, None for the first
+                            enabled channel
+
+            Returns:
+                the msg_sms_webapi_channel Row, or None
+        """
+
         db = current.db
-        s3db = current.s3db
-        table = s3db.msg_sms_webapi_channel
+        table = current.s3db.msg_sms_webapi_channel
 
-        # Get Configuration
         if channel_id:
-            sms_api = db(table.channel_id == channel_id).select(limitby=(0, 1)
-                                                                ).first()
+            query = (table.channel_id == channel_id)
         else:
             # @ToDo: Check for Organisation-specific Gateway
-            sms_api = db(table.enabled == True).select(limitby=(0, 1)).first()
-        if not sms_api:
-            return False
+            query = (table.enabled == True)
+
+        return db(query).select(limitby=(0, 1)).first()
+
+    # -------------------------------------------------------------------------
+    def sms_api_request(self, sms_api, mobile, text="", channel_id=None):
+        """
+            Prepare the HTTP request to send an SMS via Web API
+
+            Args:
+                sms_api: the channel configuration (msg_sms_webapi_channel Row)
+                mobile: the recipient phone number
+                text: the message text
+                channel_id: the channel ID
+
+            Returns:
+                tuple (urllib Request, POST data), or None if the message
+                can not be sent through this channel
+        """
 
         post_data = {}
 
@@ -1149,49 +1221,87 @@ class S3Msg:
         post_data[sms_api.to_variable] = str(mobile)
 
         url = sms_api.url
-        clickatell = "clickatell" in url
-        if clickatell:
+        if "clickatell" in url:
             text_len = len(text)
             if text_len > 480:
                 current.log.error("Clickatell messages cannot exceed 480 chars")
-                return False
+                return None
             elif text_len > 320:
                 post_data["concat"] = 3
             elif text_len > 160:
                 post_data["concat"] = 2
 
         request = urllib2.Request(url)
-        query = urlencode(post_data)
+        query = urlencode(post_data).encode("utf-8")
         if sms_api.username and sms_api.password:
             # e.g. Mobile Commons
             cred = ("%s:%s" % (sms_api.username, sms_api.password)).encode("utf-8")
             base64string = base64.b64encode(cred).replace(b"\n", b"")
             request.add_header("Authorization", "Basic %s" % base64string.decode("utf-8"))
-        try:
-            result = urlopen(request, query)
-        except HTTPError as e:
-            current.log.error("SMS message send failed: %s" % e)
-            return False
-        else:
-            # Parse result
-            output = result.read()
-            if clickatell:
-                if output.startswith("ERR"):
-                    current.log.error("Clickatell message send failed: %s" % output)
-                    return False
-                elif message_id and output.startswith("ID"):
-                    # Store ID from Clickatell to be able to followup
-                    remote_id = output[4:]
-                    db(s3db.msg_sms.message_id == message_id).update(remote_id=remote_id)
-            elif "mcommons" in url:
-                # http://www.mobilecommons.com/mobile-commons-api/rest/#errors
-                # Good = <response success="true"></response>
-                # Bad = <response success="false"><errror id="id" message="message"></response>
-                if "error" in output:
-                    current.log.error("Mobile Commons message send failed: %s" % output)
-                    return False
 
-            return True
+        return request, query
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def sms_api_post(request, throttle=None, channel_id=None):
+        """
+            Send a prepared Web API request; does not access the
+            database or current, so can run in a worker thread
+
+            Args:
+                request: tuple (urllib Request, POST data), as returned
+                         from sms_api_request
+                throttle: a ChannelThrottle to limit the sending rate
+                channel_id: the channel ID (for throttling)
+
+            Returns:
+                the response body (str)
+
+            Raises:
+                HTTPError if the request failed
+        """
+
+        if throttle:
+            throttle.wait(channel_id)
+
+        request, data = request
+        result = urlopen(request, data)
+
+        return s3_str(result.read())
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def sms_api_response(url, output, message_id=None):
+        """
+            Parse the response of a Web API SMS gateway
+
+            Args:
+                url: the gateway URL
+                output: the response body
+                message_id: the message ID
+
+            Returns:
+                True if the message was sent, otherwise False
+        """
+
+        if "clickatell" in url:
+            if output.startswith("ERR"):
+                current.log.error("Clickatell message send failed: %s" % output)
+                return False
+            elif message_id and output.startswith("ID"):
+                # Store ID from Clickatell to be able to followup
+                remote_id = output[4:]
+                table = current.s3db.msg_sms
+                current.db(table.message_id == message_id).update(remote_id=remote_id)
+        elif "mcommons" in url:
+            # http://www.mobilecommons.com/mobile-commons-api/rest/#errors
+            # Good = <response success="true"></response>
+            # Bad = <response success="false"><errror id="id" message="message"></response>
+            if "error" in output:
+                current.log.error("Mobile Commons message send failed: %s" % output)
+                return False
+
+        return True
 
     # -------------------------------------------------------------------------
     def send_sms_via_modem(self, mobile, text="", channel_id=None):
@@ -2454,4 +2564,43 @@ class S3Compose(BasicCRUD):
 
         return form
 
+# =============================================================================
+class ChannelThrottle:
+    """
+        Thread-safe rate limiter for outgoing messages, allocating
+        send slots per channel at a fixed interval
+    """
+
+    def __init__(self, rate):
+        """
+            Args:
+                rate: maximum number of messages per second per channel,
+                      None or 0 for no limit
+        """
+
+        self.interval = 1.0 / rate if rate else 0
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    def wait(self, channel_id):
+        """
+            Block until the next send slot for a channel is due
+
+            Args:
+                channel_id: the channel ID
+        """
+
+        interval = self.interval
+        if not interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.slots.get(channel_id, now))
+            self.slots[channel_id] = slot + interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
 # END =========================================================================
@@ -25,9 +25,11 @@
     OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import datetime
 import json
 
-from itertools import chain
+from itertools import chain, groupby
+from operator import attrgetter, itemgetter
 
 from gluon import current
 from gluon.html import TAG
@@ -45,6 +47,17 @@ ogetattr = object.__getattribute__
 class ResourceData:
     """ Class representing data in a resource """
 
+    # Maximum estimated number of joined rows per record when combining
+    # joined tables into a single query, and default estimate for
+    # multi-valued joins
+    MAX_FANOUT = 4
+    DEFAULT_FANOUT = 4
+
+    # Field types suitable for keyset pagination
+    SEEK_TYPES = ("id", "integer", "bigint", "double",
+                  "string", "date", "datetime", "time",
+                  )
+
     def __init__(self,
                  resource,
                  fields,
@@ -60,7 +73,8 @@ class ResourceData:
                  as_rows = False,
                  represent = False,
                  show_links = True,
-                 raw_data = False
+                 raw_data = False,
+                 seek = None,
                  ):
         """
             Constructor, extracts (and represents) data from a resource
@@ -80,6 +94,12 @@ class ResourceData:
                 as_rows: return the rows (don't extract/represent)
                 represent: render field value representations
                 raw_data: include raw data in the result
+                seek: the sort key of the last record of the previous
+                      page (as returned in self.seek), to extract the
+                      next page by keyset pagination rather than offset;
+                      any other true value (e.g. True) to extract the
+                      page by offset, but return the sort key of its
+                      last record (e.g. for the first page)
 
             Notes:
                 - as_rows / groupby prevent automatic splitting of
@@ -87,6 +107,10 @@ class ResourceData:
                 - with groupby, only the groupby fields will be returned
                   (i.e. fields will be ignored), because aggregates are
                   not supported (yet)
+                - keyset pagination requires all orderby fields to be
+                  non-nullable fields in the master table, and can not
+                  be used with virtual/extra filters or getids; otherwise,
+                  the seek parameter is ignored (=falls back to offset)
         """
 
         db = current.db
@@ -189,6 +213,33 @@ class ResourceData:
         # Extra filters
         efilter = rfilter.get_extra_filters()
 
+        # Keyset pagination (seek method)
+        self.seek = None
+        seek_keys = seek_query = seek_total = None
+        if seek and limit and \
+           not (groupby or as_rows or getids or vfilter or efilter):
+            seek_keys = self.seek_keys(orderby)
+        if seek_keys:
+            # Use the primary key as tie-breaker (=unique sort key)
+            if not any(str(f) == pkey for f in orderby_fields or []):
+                orderby = (orderby or []) + [table._id]
+                orderby_aggr = (orderby_aggr or []) + [table._id]
+                orderby_fields = (orderby_fields or []) + [table._id]
+
+            seek_query = self.seek_query(seek_keys, seek)
+            if seek_query is not None:
+                if count:
+                    # Count all matching records, not just those after
+                    # the seek key
+                    seek_total = self.filter_query(query,
+                                                   join = filter_ijoins,
+                                                   left = filter_ljoins,
+                                                   )[0]
+                    count = False
+                master_query = query = query & seek_query
+                start = 0
+        keyset = seek_query is not None
+
         # Is this a paginated request?
         pagination = limit is not None or start
 
@@ -218,7 +269,7 @@ class ResourceData:
         ids = page = totalrows = None
         if fq:
             # Execute the filter query
-            if bigtable and not vfilter:
+            if (bigtable or keyset) and not vfilter:
                 limitby = resource.limitby(start=start, limit=limit)
             else:
                 limitby = None
@@ -249,7 +300,7 @@ class ResourceData:
                 if pagination and (efilter or vfilter):
                     master_ids = ids
                 else:
-                    if bigtable:
+                    if bigtable or keyset:
                         master_ids = page = ids
                     else:
                         limitby = resource.limitby(start=start, limit=limit)
@@ -282,7 +333,7 @@ class ResourceData:
                     # so we can not limit the master query
                     limitby = None
 
-        elif pagination and not (efilter or vfilter or count or getids):
+        elif pagination and (keyset or not (efilter or vfilter or count or getids)):
 
             limitby = resource.limitby(start=start, limit=limit)
 
@@ -470,6 +521,8 @@ class ResourceData:
                 totalrows = len(ids)
 
         # Build the result
+        if seek_total is not None:
+            totalrows = seek_total
         self.rfields = dfields
         self.numrows = 0 if totalrows is None else totalrows
         self.ids = ids
@@ -502,8 +555,8 @@ class ResourceData:
             joined_fields = self.joined_fields(dfields, qfields)
             joined_query = table._id.belongs(page)
 
-            for jtablename, jfields in joined_fields.items():
-                records = self.joined_query(jtablename,
+            for jtablenames, jfields in self.joined_plan(joined_fields):
+                records = self.joined_query(jtablenames,
                                             joined_query,
                                             jfields,
                                             records,
@@ -549,6 +602,10 @@ class ResourceData:
 
             self.rows = [results[record_id] for record_id in page]
 
+            # Sort key of the last record, for keyset pagination
+            if seek_keys and page:
+                self.seek = self.seek_token(seek_keys, page[-1])
+
         if rname:
             # Restore referee name
             db._referee_name = rname
@@ -728,6 +785,157 @@ class ResourceData:
 
         return expr, aggr, fields, tables
 
+    # -------------------------------------------------------------------------
+    def seek_keys(self, orderby):
+        """
+            Determine the sort key for keyset pagination
+
+            Args:
+                orderby: the resolved orderby expression (list)
+
+            Returns:
+                list of tuples (Field, ascending), with the primary key
+                as last item, or None if the orderby is not suitable
+                for keyset pagination (=fall back to offset pagination)
+        """
+
+        table = self.table
+        tablename = table._tablename
+        pkey = str(table._id)
+
+        INVERT = S3DAL().INVERT
+
+        keys = []
+        for item in orderby or []:
+            if isinstance(item, Field):
+                field, ascending = item, True
+            elif type(item) is Expression and item.op == INVERT and \
+                 isinstance(item.first, Field):
+                field, ascending = item.first, False
+            else:
+                # Aggregate or other expression
+                return None
+
+            fname = str(field)
+            if fname == pkey:
+                # Primary key is unique, subsequent keys are irrelevant
+                keys.append((field, ascending))
+                return keys
+
+            # Comparison does not work for NULL values, and fields in
+            # joined tables can have multiple values per record
+            if field.tablename != tablename or not field.notnull or \
+               field.type not in self.SEEK_TYPES:
+                return None
+
+            keys.append((field, ascending))
+
+        keys.append((table._id, True))
+        return keys
+
+    # -------------------------------------------------------------------------
+    def seek_query(self, keys, seek):
+        """
+            Construct a query for the records following the seek key
+
+            Args:
+                keys: the sort key (as returned from seek_keys)
+                seek: the sort key values of the last record of the
+                      previous page, as JSON string (see seek_token)
+
+            Returns:
+                Query, or None if the seek key is invalid
+        """
+
+        try:
+            values = json.loads(seek) if isinstance(seek, str) else seek
+        except ValueError:
+            return None
+        if not isinstance(values, list) or len(values) != len(keys):
+            return None
+
+        query = equal = None
+        for (field, ascending), value in zip(keys, values):
+            try:
+                value = self.seek_value(field, value)
+            except (ValueError, TypeError):
+                return None
+
+            subquery = (field > value) if ascending else (field < value)
+            if equal is not None:
+                subquery = equal & subquery
+            query = subquery if query is None else query | subquery
+
+            equality = field == value
+            equal = equality if equal is None else equal & equality
+
+        return query
+
+    # -------------------------------------------------------------------------
+    def seek_token(self, keys, record_id):
+        """
+            Look up the sort key values of a record, for keyset pagination
+
+            Args:
+                keys: the sort key (as returned from seek_keys)
+                record_id: the record ID
+
+            Returns:
+                the sort key values as JSON string
+        """
+
+        fields = [field for field, _ in keys]
+
+        table = self.table
+        row = current.db(table._id == record_id).select(*fields,
+                                                        limitby = (0, 1),
+                                                        ).first()
+        if not row:
+            return None
+
+        values = []
+        for field in fields:
+            value = row[field]
+            if hasattr(value, "isoformat"):
+                value = value.isoformat()
+            values.append(value)
+
+        return json.dumps(values)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def seek_value(field, value):
+        """
+            Convert a JSON-decoded sort key value into the field type
+
+            Args:
+                field: the Field
+                value: the JSON-decoded value
+
+            Returns:
+                the converted value
+
+            Raises:
+                ValueError|TypeError for invalid values
+        """
+
+        ftype = field.type
+        if ftype in ("id", "integer", "bigint") or ftype[:9] == "reference":
+            value = int(value)
+        elif ftype == "double":
+            value = float(value)
+        elif ftype == "boolean":
+            value = bool(value)
+        elif ftype == "date":
+            value = datetime.date.fromisoformat(value)
+        elif ftype == "datetime":
+            value = datetime.datetime.fromisoformat(value)
+        elif ftype == "time":
+            value = datetime.time.fromisoformat(value)
+        elif not isinstance(value, str):
+            raise TypeError("invalid seek value")
+        return value
+
     # -------------------------------------------------------------------------
     def filter_query(self,
                      query,
@@ -988,16 +1196,94 @@ class ResourceData:
 
         return fields
 
+    # -------------------------------------------------------------------------
+    def joined_plan(self, joined_fields):
+        """
+            Plan the queries to extract fields in joined tables (i.e. those
+            which haven't been retrieved in the master query)
+
+            Joins of which the estimated fan-out (rows per master record)
+            does not exceed MAX_FANOUT are combined into a single query,
+            thus saving round trips for single-valued joins (e.g. foreign
+            keys, which are typical for list fields), while multi-valued
+            joins are kept in separate queries to prevent the combinatorial
+            growth of the joined result.
+
+            Args:
+                joined_fields: the fields in joined tables, as returned
+                               from joined_fields()
+
+            Returns:
+                list of tuples (tablenames, fields), to pass to
+                joined_query()
+        """
+
+        groups = []
+
+        for tablename, fields in joined_fields.items():
+            fanout = self.fanout(tablename, fields["_left"])
+            for group in groups:
+                if group[0] * fanout <= self.MAX_FANOUT:
+                    group[0] *= fanout
+                    group[1].append(tablename)
+                    group[2].append(fields)
+                    break
+            else:
+                groups.append([fanout, [tablename], [fields]])
+
+        plan = []
+        for _, tablenames, group_fields in groups:
+            if len(tablenames) == 1:
+                fields = group_fields[0]
+            else:
+                # Merge the fields and joins of all tables
+                fields = {}
+                left = S3Joins(self.resource.table)
+                for item in group_fields:
+                    for colname, field in item.items():
+                        if colname == "_left":
+                            left.extend(field)
+                        else:
+                            fields[colname] = field
+                fields["_left"] = left
+            plan.append((tablenames, fields))
+
+        return plan
+
+    # -------------------------------------------------------------------------
+    def fanout(self, tablename, joins):
+        """
+            Estimate the fan-out (number of joined rows per master record)
+            of the joins for a table
+
+            Args:
+                tablename: the name of the joined table
+                joins: the joins required for the table (S3Joins)
+
+            Returns:
+                the estimated fan-out: 1 if all joins are single-valued
+                (i.e. join the table by its primary key or another unique
+                key), otherwise DEFAULT_FANOUT
+        """
+
+        tablenames = joins.tables | {tablename}
+        if joins.single_valued(tablenames):
+            return 1
+        return self.DEFAULT_FANOUT
+
     # -------------------------------------------------------------------------
     def joined_query(self, tablename, query, fields, records, represent=False):
         """
-            Extract additional fields from a joined table: if there are
+            Extract additional fields from joined tables: if there are
             fields in joined tables which haven't been extracted in the
-            master query, then we perform a separate query for each joined
-            table (this is faster than building a multi-table-join)
+            master query, then we perform separate queries for them, each
+            for either a single joined table or a combination of tables
+            as determined by joined_plan (this is faster than building a
+            multi-table-join in the master query)
 
             Args:
-                tablename: name of the joined table
+                tablename: name of the joined table, or a list of names
+                           of joined tables to extract in a single query
                 query: the Query
                 fields: the fields to extract
                 records: the output dict to update, structure:
@@ -1016,12 +1302,17 @@ class ResourceData:
         table = self.resource.table
         pkey = str(table._id)
 
-        # Get the extra fields for subtable
-        sresource = s3db.resource(tablename)
-        efields, ejoins, l, d = sresource.resolve_selectors([])
-
-        # Get all left joins for subtable
-        tnames = ljoins.extend(l) + list(fields["_left"].tables)
+        tablenames = [tablename] if isinstance(tablename, str) else tablename
+
+        # Get all left joins for subtables
+        tnames = list(fields["_left"].tables)
+        efields = []
+        for tn in tablenames:
+            # Get the extra fields for subtable
+            sresource = s3db.resource(tn)
+            e, ejoins, l, d = sresource.resolve_selectors([])
+            efields.extend(e)
+            tnames.extend(ljoins.extend(l))
         sjoins = ljoins.as_list(tablenames = tnames,
                                 aqueries = self.aqueries,
                                 )
@@ -1085,33 +1376,48 @@ class ResourceData:
         if records is None:
             records = {}
 
-        def get(key):
-            t, f = key.split(".", 1)
-            if join:
-                def getter(row):
-                    return ogetattr(ogetattr(row, t), f)
-            else:
-                def getter(row):
-                    return ogetattr(row, f)
-            return getter
+        # Get all values of a row as tuple (pkey, value, value, ...)
+        paths = [key if join else key.split(".", 1)[1]
+                 for key in chain([pkey], columns)]
+        if len(paths) > 1:
+            getrow = attrgetter(*paths)
+        else:
+            getkey = attrgetter(paths[0])
+            getrow = lambda row: (getkey(row),)
 
-        getkey = get(pkey)
-        getval = [get(c) for c in columns]
+        def tolerant(row):
+            # Fallback for rows with missing columns
+            values = []
+            for idx, path in enumerate(paths):
+                try:
+                    value = attrgetter(path)(row)
+                except AttributeError:
+                    if not idx:
+                        raise
+                    current.log.warning("Warning CRUDResource.extract: column %s not in row" % columns[idx - 1])
+                    value = None
+                values.append(value)
+            return tuple(values)
+
+        def data():
+            for row in rows:
+                try:
+                    yield getrow(row)
+                except AttributeError:
+                    yield tolerant(row)
 
-        from itertools import groupby
-        for k, g in groupby(rows, key=getkey):
-            group = list(g)
+        column_data = [(idx, col, field_data[col])
+                       for idx, col in enumerate(columns, 1)]
+
+        for k, group in groupby(data(), key=itemgetter(0)):
+            group = list(group)
             record = records.get(k, {})
-            for idx, col in enumerate(columns):
-                fvalues, frecords, joined, list_type, virtual, json_type = field_data[col]
+            for idx, col, fdata in column_data:
+                fvalues, frecords, joined, list_type, virtual, json_type = fdata
                 values = record.get(col, {})
                 lazy = False
                 for row in group:
-                    try:
-                        value = getval[idx](row)
-                    except AttributeError:
-                        current.log.warning("Warning CRUDResource.extract: column %s not in row" % col)
-                        value = None
+                    value = row[idx]
                     if lazy or callable(value):
                         # Lazy virtual field
                         value = value()
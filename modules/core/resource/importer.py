@@ -46,7 +46,7 @@ from gluon import current, IS_EMPTY_OR
 from gluon.storage import Storage
 from gluon.tools import callback
 
-from s3dal import Field, filter_fields
+from s3dal import Field, S3DAL, filter_fields
 
 from ..tools import s3_format_datetime, s3_get_foreign_key, \
                     s3_has_foreign_key, s3_str, s3_utc
@@ -81,9 +81,56 @@ class XMLImporter:
                 args: parameters to pass to the transformation stylesheet
         """
 
-        xml = current.xml
         tree = None
 
+        chunks = cls.parse_chunks(tablename,
+                                  source,
+                                  source_type = source_type,
+                                  stylesheet = stylesheet,
+                                  extra_data = extra_data,
+                                  **args)
+        for root in chunks:
+            if tree is None:
+                tree = root
+            else:
+                tree.extend(list(root))
+
+        return tree
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def parse_chunks(cls,
+                     tablename,
+                     source,
+                     source_type = "xml",
+                     stylesheet = None,
+                     extra_data = None,
+                     chunk_size = None,
+                     **args):
+        """
+            Generator to parse a data source for import, converting it
+            into S3XML element trees chunk by chunk, so that only one
+            chunk of the source (and its transformation) needs to be in
+            memory at a time.
+
+            Args:
+                tablename: the name of the target table
+                source: the data source (see parse_source)
+                str source_type: the source type (xml|json|csv|xls|xlsx)
+                stylesheet: the transformation stylesheet
+                extra_data: for CSV imports, dict of extra columns to add
+                            to each row
+                chunk_size: number of rows per chunk for CSV and XLSX
+                            sources (other source types are always parsed
+                            as a whole), None to parse all rows at once
+                args: parameters to pass to the transformation stylesheet
+
+            Yields:
+                the root elements of the S3XML trees
+        """
+
+        xml = current.xml
+
         if not isinstance(source, (list, tuple)):
             source = [source]
 
@@ -95,42 +142,47 @@ class XMLImporter:
                 name, s = None, item
 
             if isinstance(s, etree._ElementTree):
-                t = s
+                trees = [s]
             elif source_type == "json":
                 if isinstance(s, str):
-                    t = xml.json2tree(StringIO(s))
+                    trees = [xml.json2tree(StringIO(s))]
                 else:
-                    t = xml.json2tree(s)
+                    trees = [xml.json2tree(s)]
             elif source_type == "csv":
-                t = xml.csv2tree(s, resourcename=name, extra_data=extra_data)
+                trees = xml.csv2trees(s,
+                                      resourcename = name,
+                                      extra_data = extra_data,
+                                      chunk_size = chunk_size,
+                                      )
             elif source_type == "xls":
-                t = xml.xls2tree(s, resourcename=name, extra_data=extra_data)
+                trees = [xml.xls2tree(s, resourcename=name, extra_data=extra_data)]
             elif source_type == "xlsx":
-                t = xml.xlsx2tree(s, resourcename=name, extra_data=extra_data)
+                trees = xml.xlsx2trees(s,
+                                       resourcename = name,
+                                       extra_data = extra_data,
+                                       chunk_size = chunk_size,
+                                       )
             else:
-                t = xml.parse(s)
-
-            if not t:
-                raise SyntaxError(xml.error if xml.error else current.ERROR.BAD_SOURCE)
-
-            if stylesheet is not None:
-                prefix, name = tablename.split("_", 1)
-                args.update(domain = xml.domain,
-                            base_url = current.response.s3.base_url,
-                            prefix = prefix,
-                            name = name,
-                            utcnow = s3_format_datetime(),
-                            )
-                t = xml.transform(t, stylesheet, **args)
-                if not t:
-                    raise SyntaxError(xml.error)
+                trees = [xml.parse(s)]
 
-            if not tree:
-                tree = t.getroot()
-            else:
-                tree.extend(list(t.getroot()))
+            for t in trees:
 
-        return tree
+                if not t:
+                    raise SyntaxError(xml.error if xml.error else current.ERROR.BAD_SOURCE)
+
+                if stylesheet is not None:
+                    prefix, name = tablename.split("_", 1)
+                    args.update(domain = xml.domain,
+                                base_url = current.response.s3.base_url,
+                                prefix = prefix,
+                                name = name,
+                                utcnow = s3_format_datetime(),
+                                )
+                    t = xml.transform(t, stylesheet, **args)
+                    if not t:
+                        raise SyntaxError(xml.error)
+
+                yield t.getroot()
 
     # -------------------------------------------------------------------------
     @classmethod
@@ -146,13 +198,17 @@ class XMLImporter:
                     select_items = None,
                     strategy = None,
                     sync_policy = None,
+                    bulk = False,
+                    onaccept = True,
                     ):
         """
             Import data from an S3XML element tree.
 
             Args:
                 tablename: the name of the target table
-                tree: the S3XML element tree (ElementTree)
+                tree: the S3XML element tree (ElementTree), or an iterable
+                      of element trees to add to the job chunk by chunk
+                      (see parse_chunks)
                 files: file attachments referenced by the tree (dict)
                 record_id: the target record ID
                 list components: list of importable components
@@ -166,6 +222,8 @@ class XMLImporter:
                                    (list of import item record IDs)
                 strategy: list of allowed import methods
                 sync_policy: the synchronization policy (SyncPolicy)
+                bulk: use bulk mode (see ImportJob)
+                onaccept: run the onaccept-callbacks for imported records
         """
 
         db = current.db
@@ -178,40 +236,67 @@ class XMLImporter:
             return ImportResult(False, current.ERROR.BAD_RESOURCE)
 
         if tree is not None:
-            # Run import_prep callback
+
+            if isinstance(tree, (etree._Element, etree._ElementTree)):
+                chunks = [tree]
+            else:
+                chunks = tree
+
+            import_job = None
             import_prep = s3.import_prep
-            if import_prep:
-                if not isinstance(tree, etree._ElementTree):
-                    tree = etree.ElementTree(tree)
-                callback(import_prep, tree, tablename=tablename)
 
-            # Select matching elements from tree
-            elements = cls.matching_elements(tree, tablename, record_id=record_id)
-            if not elements:
+            # Release the source elements of parsed items in chunked
+            # imports, unless the job is to be stored (trial import)
+            release = commit and chunks is tree
+
+            error = None
+            s3.bulk = True
+            for chunk in chunks:
+
+                # Run import_prep callback
+                if import_prep:
+                    if not isinstance(chunk, etree._ElementTree):
+                        chunk = etree.ElementTree(chunk)
+                    callback(import_prep, chunk, tablename=tablename)
+
+                # Select matching elements from tree
+                elements = cls.matching_elements(chunk, tablename, record_id=record_id)
+                if not elements:
+                    continue
+
+                if import_job is None:
+                    # Create import job
+                    import_job = ImportJob(table,
+                                           tree = chunk,
+                                           files = files,
+                                           strategy = strategy,
+                                           sync_policy = sync_policy,
+                                           bulk = bulk,
+                                           onaccept = onaccept,
+                                           )
+                else:
+                    # Continue with the next chunk
+                    import_job.set_tree(chunk)
+
+                # Add import items for matching elements
+                add_item = import_job.add_item
+                for element in elements:
+                    success = add_item(element = element,
+                                       components = components,
+                                       )
+                    if not success:
+                        error = import_job.error
+                    if release:
+                        import_job.release_elements()
+
+            if import_job is None:
                 # Nothing to import
                 # - this is only an error if an update of a specific record
                 #   was expected
+                s3.bulk = False
                 error = current.ERROR.NO_MATCH if record_id else None
                 return ImportResult(not record_id, error)
 
-            # Create import job
-            import_job = ImportJob(table,
-                                   tree = tree,
-                                   files = files,
-                                   strategy = strategy,
-                                   sync_policy = sync_policy,
-                                   )
-
-            # Add import items for matching elements
-            error = None
-            s3.bulk = True
-            add_item = import_job.add_item
-            for element in elements:
-                success = add_item(element = element,
-                                   components = components,
-                                   )
-                if not success:
-                    error = import_job.error
             if error and not ignore_errors:
                 s3.bulk = False
                 return ImportResult(False, error, job=import_job)
@@ -227,6 +312,8 @@ class XMLImporter:
                                        job_id = job_id,
                                        strategy = strategy,
                                        sync_policy = sync_policy,
+                                       bulk = bulk,
+                                       onaccept = onaccept,
                                        )
             except SyntaxError:
                 return ImportResult(False, current.ERROR.BAD_SOURCE)
@@ -434,6 +521,9 @@ class ImportJob():
         Class to import an element tree into the database
     """
 
+    # Maximum number of records per query/statement in bulk mode
+    BATCH_SIZE = 500
+
     def __init__(self,
                  table,
                  tree = None,
@@ -441,6 +531,8 @@ class ImportJob():
                  job_id = None,
                  strategy = None,
                  sync_policy = None,
+                 bulk = False,
+                 onaccept = True,
                  ):
         """
             Args:
@@ -449,6 +541,16 @@ class ImportJob():
                 job_id: restore job from database (record ID or job_id)
                 strategy: the import strategy
                 sync_policy: the synchronization policy
+                bulk: bulk mode, i.e.
+                      - look up existing records by UID with one query
+                        per table and batch
+                      - run the standard deduplicator (S3Duplicate) with
+                        one query per table and batch
+                      - insert new records which are not referenced by
+                        other items with multi-row inserts
+                      - set record owners/realms and run onaccept for
+                        all records after the job has been written
+                onaccept: run the onaccept-callbacks for imported records
         """
 
         self.error = None # the last error
@@ -466,6 +568,7 @@ class ImportJob():
 
         self.elements = Storage()
         self.items = Storage()
+        self.parsed = [] # item_ids added since the last release_elements
         self.references = []
 
         self.count = 0 # total number of records imported
@@ -477,6 +580,16 @@ class ImportJob():
 
         self.log = None
 
+        # Bulk mode
+        self.bulk = bulk
+        self.onaccept = onaccept
+
+        self.uids = {}          # {tablename: {uid: Row}}
+        self.duplicates = {}    # {item_id: duplicate_id}
+        self.referenced = set() # item_ids of referenced items
+        self.pending = {}       # {tablename: [(item, data)]}
+        self.deferred = []      # [(item, method, enforce_realm_update)]
+
         # Import strategy
         if strategy is None:
             METHOD = ImportItem.METHOD
@@ -526,6 +639,65 @@ class ImportJob():
             self.job_id = uuid.uuid4() # unique ID for this job
             self.second_pass = False
 
+    # -------------------------------------------------------------------------
+    def set_tree(self, tree):
+        """
+            Switch to another element tree, to continue adding items from
+            the next chunk of a chunked import; items of previous chunks
+            remain accessible for reference resolution through the directory
+
+            Args:
+                tree: the element tree
+        """
+
+        self.tree = tree
+
+        # Reset the lookup maps for the tree
+        self._uidmap = None
+        self.uids = {}
+
+    # -------------------------------------------------------------------------
+    def release_elements(self):
+        """
+            Release the references to the source elements of all items
+            added since the last call, so that previous chunks of a chunked
+            import can be garbage-collected while the job is being built;
+            the items remain resolvable as references through the directory
+            (by their item IDs)
+
+            Notes:
+                - a job without source elements can no longer be stored,
+                  so this must not be used for trial imports
+                - errors found during commit can no longer be marked in
+                  the source elements, and hence do not appear in the
+                  error tree (errors during parsing still do, since the
+                  failing elements are copied into the error tree)
+        """
+
+        elements = self.elements
+        items = self.items
+
+        for item_id in self.parsed:
+            item = items[item_id]
+
+            element = item.element
+            if element is None:
+                continue
+            elements.pop(element, None)
+            item.element = None
+
+            for reference in item.references:
+                entry = reference.entry
+                if entry:
+                    entry.element = None
+                relement = reference.element
+                if relement is not None:
+                    # Retain a detached copy of the <reference> element,
+                    # to report errors of the referenced item
+                    reference.element = deepcopy(relement)
+
+        self.parsed = []
+
     # -------------------------------------------------------------------------
     @property
     def uidmap(self):
@@ -562,6 +734,180 @@ class ImportJob():
 
         return uidmap
 
+    # -------------------------------------------------------------------------
+    def get_mandatory_fields(self, table):
+        """
+            Get the mandatory fields of a table, i.e. fields without
+            default that do not accept empty values
+
+            Args:
+                table: the Table
+
+            Returns:
+                list of field names
+        """
+
+        tablename = table._tablename
+
+        mfields = self.mandatory_fields
+        mandatory = mfields[tablename]
+
+        if mandatory is None:
+            mandatory = []
+            for field in table:
+                if field.default is not None:
+                    continue
+                requires = field.requires
+                if requires:
+                    if not isinstance(requires, (list, tuple)):
+                        requires = [requires]
+                    if isinstance(requires[0], IS_EMPTY_OR):
+                        continue
+                    error = field.validate("")[1]
+                    if error:
+                        mandatory.append(field.name)
+            mfields[tablename] = mandatory
+
+        return mandatory
+
+    # -------------------------------------------------------------------------
+    def uid_lookup(self, table, uids):
+        """
+            Look up existing records by UID (bulk mode); the first lookup
+            for a table retrieves the records for all UIDs of that table
+            in the import tree, with one query per batch
+
+            Args:
+                table: the Table
+                uids: the UIDs to look up (already converted with
+                      S3XML.import_uid)
+
+            Returns:
+                a dict {uid: Row} with the records found
+        """
+
+        xml = current.xml
+        UID = xml.UID
+
+        if UID not in table.fields:
+            return {}
+
+        tablename = table._tablename
+        index = self.uids.get(tablename)
+        if index is None:
+            index = self.uids[tablename] = {}
+
+            # Collect all UIDs for this table from the tree
+            lookup = set()
+            tree = self.tree
+            if tree is not None:
+                lookup.update(uid for name, uid in self.uidmap[UID]
+                                  if name == tablename)
+                root = tree if isinstance(tree, etree._Element) else tree.getroot()
+                RESOURCE = xml.ATTRIBUTE.resource
+                for reference in root.iter(xml.TAG.reference):
+                    name = reference.get(RESOURCE)
+                    if name and name != tablename:
+                        continue
+                    value = reference.get(UID)
+                    if not value:
+                        continue
+                    if value[0] == "[":
+                        try:
+                            lookup.update(json.loads(value))
+                        except (TypeError, ValueError):
+                            continue
+                    else:
+                        lookup.add(value)
+            import_uid = xml.import_uid
+            lookup = set(import_uid(uid) for uid in lookup if uid)
+        else:
+            lookup = set()
+
+        lookup.update(uid for uid in uids if uid and uid not in index)
+        if lookup:
+            from ..resource import CRUDResource
+            pkeys = [fn for fn in table.fields if table[fn].unique]
+            fields = CRUDResource.import_fields(table,
+                                                pkeys,
+                                                mandatory = self.get_mandatory_fields(table),
+                                                )
+            lookup = list(lookup)
+            size = self.BATCH_SIZE
+            for i in range(0, len(lookup), size):
+                batch = lookup[i:i + size]
+                for uid in batch:
+                    index[uid] = None
+                rows = current.db(table[UID].belongs(batch)).select(*fields)
+                for row in rows:
+                    index[row[UID]] = row
+
+        return {uid: index[uid] for uid in uids if index.get(uid)}
+
+    # -------------------------------------------------------------------------
+    def original(self, table, element, mandatory=None):
+        """
+            Find the original DB record for an element; in bulk mode,
+            elements which can only be matched by their UID are looked
+            up from the UID index
+
+            Args:
+                table: the Table
+                element: the element
+                mandatory: the mandatory fields of the table
+
+            Returns:
+                the original Row, or None if not found
+        """
+
+        from ..resource import CRUDResource
+
+        xml = current.xml
+        UID = xml.UID
+
+        if self.bulk and UID in table.fields:
+            uid = element.get(UID)
+            if uid and not self._unique_values(table, element):
+                uid = xml.import_uid(uid)
+                return self.uid_lookup(table, [uid]).get(uid)
+
+        return CRUDResource.original(table, element, mandatory=mandatory)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _unique_values(table, element):
+        """
+            Check whether an element has values for any unique fields
+            other than the UID (see CRUDResource.original)
+
+            Args:
+                table: the Table
+                element: the element
+
+            Returns:
+                boolean
+        """
+
+        xml = current.xml
+        UID = xml.UID
+        VALUE = xml.ATTRIBUTE["value"]
+        ATTRIBUTES_TO_FIELDS = xml.ATTRIBUTES_TO_FIELDS
+
+        xexpr = "%s[@%s='%%s']" % (xml.TAG["data"], xml.ATTRIBUTE["field"])
+        for fn in table.fields:
+            if fn == UID or not table[fn].unique:
+                continue
+            if fn in ATTRIBUTES_TO_FIELDS:
+                if element.get(fn):
+                    return True
+            else:
+                child = element.xpath(xexpr % fn)
+                if child:
+                    child = child[0]
+                    if child.get(VALUE, xml.xml_decode(child.text)):
+                        return True
+        return False
+
     # -------------------------------------------------------------------------
     def add_item(self,
                  element = None,
@@ -600,6 +946,7 @@ class ImportJob():
         # Update lookup lists
         item_id = item.item_id
         self.items[item_id] = item
+        self.parsed.append(item_id)
         if element is not None:
             self.elements[element] = item_id
 
@@ -919,7 +1266,11 @@ class ImportJob():
 
             # Create a UID<->ID map
             id_map = {}
-            if attr == UID and uids:
+            if attr == UID and uids and self.bulk:
+                rows = self.uid_lookup(ktable, [import_uid(uid) for uid in uids])
+                for uid, row in rows.items():
+                    id_map[uid] = row[ktable._id.name]
+            elif attr == UID and uids:
                 if len(uids) == 1:
                     uid = import_uid(uids[0])
                     query = (ktable[UID] == uid)
@@ -1087,23 +1438,42 @@ class ImportJob():
         skipped = []
         tablename = self.table._tablename
 
+        if self.bulk:
+            # Items referenced by other items must be written immediately
+            referenced = self.referenced
+            for item in items.values():
+                for reference in item.references:
+                    entry = reference.entry
+                    if entry and entry.item_id:
+                        referenced.add(entry.item_id)
+            if not self.second_pass:
+                self.find_duplicates(import_list)
+
         self.log = log_items
         failed = False
+        logged = set()
         for item_id in import_list:
             item = items[item_id]
-            error = None
 
             if item.accepted is not False:
-                logged = False
                 success = item.commit(ignore_errors=ignore_errors)
             else:
                 # Field validation failed
-                logged = True
+                logged.add(item_id)
                 success = ignore_errors
 
             if not success:
                 failed = True
 
+        if self.bulk:
+            # Write pending inserts, then post-process all items
+            if not self.flush() and not ignore_errors:
+                failed = True
+            self.postprocess()
+
+        for item_id in import_list:
+            item = items[item_id]
+
             error = item.error
             if error:
                 current.log.error(error)
@@ -1112,7 +1482,7 @@ class ImportJob():
                 if element is not None:
                     if not element.get(ATTRIBUTE.error, False):
                         element.set(ATTRIBUTE.error, s3_str(error))
-                    if not logged:
+                    if item_id not in logged:
                         self.error_tree.append(deepcopy(element))
                 if item.tablename == tablename:
                     errors += 1
@@ -1143,6 +1513,215 @@ class ImportJob():
         self.skipped = skipped
         return True
 
+    # -------------------------------------------------------------------------
+    def find_duplicates(self, import_list):
+        """
+            Find duplicates for the items of all tables which use the
+            standard deduplicator (S3Duplicate), with one query per table
+            and batch rather than one query per item (bulk mode)
+
+            Args:
+                import_list: the ordered list of items (UIDs) to import
+        """
+
+        UID = current.xml.UID
+        synchronise_uuids = current.response.s3.synchronise_uuids
+        get_config = current.s3db.get_config
+
+        # Group the items by table
+        items = self.items
+        tables = {}
+        for item_id in import_list:
+            item = items[item_id]
+            if item.table is None or item.data is None:
+                continue
+            tablename = item.tablename
+            if tablename in tables:
+                tables[tablename].append(item)
+            else:
+                tables[tablename] = [item]
+
+        duplicates = self.duplicates
+        for tablename, titems in tables.items():
+
+            deduplicate = get_config(tablename, "deduplicate")
+            if not isinstance(deduplicate, S3Duplicate):
+                continue
+
+            # Items that will run the deduplicator
+            candidates = [item for item in titems
+                          if not item.id and
+                             item.original is None and
+                             item.accepted is not False and
+                             (UID not in item.data or synchronise_uuids)
+                          ]
+            if candidates:
+                duplicates.update(deduplicate.find_all(candidates, titems))
+
+    # -------------------------------------------------------------------------
+    def defer_insert(self, item, data):
+        """
+            Schedule a new record for a multi-row insert (bulk mode)
+
+            Args:
+                item: the ImportItem
+                data: the record data
+
+            Returns:
+                True if the insert has been scheduled, False if the record
+                must be inserted immediately (i.e. if it is referenced by
+                other items)
+        """
+
+        if not self.bulk or \
+           item.item_id in self.referenced or item.components or item.update:
+            return False
+
+        pending = self.pending
+        tablename = item.tablename
+        if tablename in pending:
+            pending[tablename].append((item, data))
+        else:
+            pending[tablename] = [(item, data)]
+
+        if len(pending[tablename]) >= self.BATCH_SIZE:
+            return self.flush(tablename)
+        return True
+
+    # -------------------------------------------------------------------------
+    def flush(self, tablename=None):
+        """
+            Write pending inserts (bulk mode)
+
+            Args:
+                tablename: write only the pending inserts for this table
+
+            Returns:
+                True if successful, False if the inserts failed (the
+                error is set in the items)
+        """
+
+        pending = self.pending
+        if tablename:
+            tablenames = [tablename] if tablename in pending else []
+        else:
+            tablenames = list(pending.keys())
+
+        CREATE = ImportItem.METHOD.CREATE
+
+        success = True
+        for tn in tablenames:
+            entries = pending.pop(tn)
+            table = entries[0][0].table
+
+            # Failing records are rolled back and reported individually,
+            # all other records are inserted nevertheless
+            errors = {}
+            try:
+                ids = S3DAL.bulk_insert(table,
+                                        [data for _, data in entries],
+                                        batch_size = self.BATCH_SIZE,
+                                        errors = errors,
+                                        )
+            except Exception:
+                # Failure outside of the inserts (e.g. connection lost)
+                error = sys.exc_info()[1]
+                ids = [None] * len(entries)
+                errors = dict.fromkeys(range(len(entries)), error)
+
+            for index, ((item, _), record_id) in enumerate(zip(entries, ids)):
+                if index in errors:
+                    item.error = errors[index]
+                    item.skip = True
+                    item.committed = False
+                    success = False
+                elif record_id:
+                    item.id = record_id
+                    item.postprocess(CREATE)
+                else:
+                    # Rejected by a _before_insert callback
+                    item.committed = False
+
+        return success
+
+    # -------------------------------------------------------------------------
+    def postprocess(self):
+        """
+            Set record owners and realms for all committed items (with
+            one query per table and batch), then run the onaccept-callbacks
+            in commit order (bulk mode)
+        """
+
+        deferred = self.deferred
+        self.deferred = []
+        if not deferred:
+            return
+
+        auth = current.auth
+        db = current.db
+        s3db = current.s3db
+
+        METHOD = ImportItem.METHOD
+        MTIME = current.xml.MTIME
+
+        # Collect the records per table
+        owners = {}
+        realms = {}
+        for item, method, enforce_realm_update in deferred:
+            tablename = item.tablename
+            if method == METHOD.CREATE:
+                records = owners
+            elif enforce_realm_update or \
+                 s3db.get_config(item.table, "update_realm"):
+                records = realms
+            else:
+                continue
+            if tablename in records:
+                records[tablename][1].append(item.id)
+            else:
+                records[tablename] = (item.table, [item.id])
+
+        # Prevent that record post-processing breaks time-delayed
+        # synchronization by implicitly updating "modified_on"
+        suspended = {}
+        for item, _, _ in deferred:
+            table = item.table
+            tablename = item.tablename
+            if tablename not in suspended and MTIME in table.fields:
+                modified_on = table[MTIME]
+                suspended[tablename] = (modified_on, modified_on.update)
+                modified_on.update = None
+
+        # Set record owners
+        ownership_fields = ("owned_by_user", "owned_by_group", "realm_entity")
+        entity_fields = ("pe_id", "organisation_id", "site_id", "group_id", "person_id")
+        size = self.BATCH_SIZE
+        for table, record_ids in owners.values():
+            fields = [table[fn] for fn in ownership_fields if fn in table.fields]
+            if not fields:
+                continue
+            fields.extend(table[fn] for fn in entity_fields if fn in table.fields)
+            for i in range(0, len(record_ids), size):
+                query = table._id.belongs(record_ids[i:i + size])
+                rows = db(query).select(table._id, *fields)
+                for row in rows:
+                    auth.s3_set_record_owner(table, row)
+
+        # Update realms
+        for table, record_ids in realms.values():
+            for i in range(0, len(record_ids), size):
+                query = table._id.belongs(record_ids[i:i + size])
+                auth.set_realm_entity(table, query, force_update=True)
+
+        # Run onaccept
+        if self.onaccept:
+            for item, method, _ in deferred:
+                item.run_onaccept(method)
+
+        # Restore modified_on.update
+        for modified_on, modified_on_update in suspended.values():
+            modified_on.update = modified_on_update
+
     # -------------------------------------------------------------------------
     def store(self):
         """
@@ -1336,6 +1915,7 @@ class ImportItem:
 
         self.onvalidation = None
         self.onaccept = None
+        self.form = None
 
         # Item import status flags
         self.accepted = None
@@ -1398,10 +1978,10 @@ class ImportItem:
 
         from ..resource import CRUDResource
         if original is None:
-            original = CRUDResource.original(table,
-                                             element,
-                                             mandatory = self._mandatory_fields(),
-                                             )
+            original = self.job.original(table,
+                                         element,
+                                         mandatory = self._mandatory_fields(),
+                                         )
         elif isinstance(original, str) and UID in table.fields:
             # Single-component update in add-item => load the original now
             query = (table[UID] == original)
@@ -1525,7 +2105,12 @@ class ImportItem:
                 # Use the resource's deduplicator to identify the original
                 resolve = current.s3db.get_config(self.tablename, "deduplicate")
                 if data and resolve:
-                    resolve(self)
+                    duplicates = self.job.duplicates
+                    if self.item_id in duplicates:
+                        # Pre-resolved by the job (bulk mode)
+                        resolve.update_item(self, duplicates[self.item_id])
+                    else:
+                        resolve(self)
 
             if self.id and self.method in (UPDATE, DELETE, MERGE):
                 # Retrieve the original
@@ -1693,7 +2278,8 @@ class ImportItem:
                     errors.append("%s: reference import(s) failed" %
                                   ", ".join(failed_references))
                 self.error = "; ".join(errors)
-                self.element.set(ERROR, self.error)
+                if self.element is not None:
+                    self.element.set(ERROR, self.error)
                 self.accepted = False
                 return False
 
@@ -1724,6 +2310,9 @@ class ImportItem:
         if form.errors:
             element = self.element
             for k in form.errors:
+                if element is None:
+                    # Source element released (chunked import)
+                    break
                 e = element.findall("data[@field='%s']" % k)
                 if not e:
                     e = element.findall("reference[@field='%s']" % k)
@@ -1803,7 +2392,8 @@ class ImportItem:
             if parent is not None:
                 parent.error = VALIDATION_ERROR
                 element = parent.element
-                if not element.get(ATTRIBUTE.error, False):
+                if element is not None and \
+                   not element.get(ATTRIBUTE.error, False):
                     element.set(ATTRIBUTE.error, s3_str(parent.error))
 
             return ignore_errors
@@ -2010,6 +2600,11 @@ class ImportItem:
                 if MCI in table.fields:
                     data[MCI] = self.mci
 
+                # Schedule for multi-row insert if possible (bulk mode)
+                if job.defer_insert(self, dict(data)):
+                    self.committed = True
+                    return True
+
                 # Insert the new record
                 try:
                     success = table.insert(**dict(data))
@@ -2105,54 +2700,7 @@ class ImportItem:
 
         # Audit + onaccept on successful commits
         if self.committed:
-
-            # Create a pseudo-form for callbacks
-            form = Storage()
-            form.method = method
-            form.table = table
-            form.vars = self.data
-            prefix, name = tablename.split("_", 1)
-            if self.id:
-                form.vars.id = self.id
-
-            # Audit
-            current.audit(method, prefix, name,
-                          form = form,
-                          record = self.id,
-                          representation = "xml",
-                          )
-
-            # Prevent that record post-processing breaks time-delayed
-            # synchronization by implicitly updating "modified_on"
-            if MTIME in table.fields:
-                modified_on = table[MTIME]
-                modified_on_update = modified_on.update
-                modified_on.update = None
-            else:
-                modified_on_update = None
-
-            # Update super entity links
-            s3db.update_super(table, form.vars)
-            if method == CREATE:
-                # Set record owner
-                current.auth.s3_set_record_owner(table, self.id)
-            elif method == UPDATE:
-                # Update realm
-                update_realm = enforce_realm_update or \
-                               s3db.get_config(table, "update_realm")
-                if update_realm:
-                    current.auth.set_realm_entity(table, self.id,
-                                                  force_update = True,
-                                                  )
-            # Onaccept
-            key = "%s_onaccept" % method
-            onaccept = current.deployment_settings.get_import_callback(tablename, key)
-            if onaccept:
-                callback(onaccept, form, tablename=tablename)
-
-            # Restore modified_on.update
-            if modified_on_update is not None:
-                modified_on.update = modified_on_update
+            self.postprocess(method, enforce_realm_update=enforce_realm_update)
 
         # Update referencing items
         if self.update and self.id:
@@ -2186,6 +2734,97 @@ class ImportItem:
 
         return True
 
+    # -------------------------------------------------------------------------
+    def postprocess(self, method, enforce_realm_update=False):
+        """
+            Post-process a committed item: audit, update super entity
+            links, set record owner/realm and run onaccept-callbacks
+
+            Args:
+                method: the import method (CREATE|UPDATE)
+                enforce_realm_update: always update the realm entity
+
+            Note:
+                In bulk mode, record owner/realm and onaccept are deferred
+                until all items of the job have been written (see
+                ImportJob.postprocess)
+        """
+
+        s3db = current.s3db
+
+        table = self.table
+        tablename = self.tablename
+
+        # Create a pseudo-form for callbacks
+        form = Storage()
+        form.method = method
+        form.table = table
+        form.vars = self.data
+        prefix, name = tablename.split("_", 1)
+        if self.id:
+            form.vars.id = self.id
+        self.form = form
+
+        # Audit
+        current.audit(method, prefix, name,
+                      form = form,
+                      record = self.id,
+                      representation = "xml",
+                      )
+
+        # Prevent that record post-processing breaks time-delayed
+        # synchronization by implicitly updating "modified_on"
+        MTIME = current.xml.MTIME
+        if MTIME in table.fields:
+            modified_on = table[MTIME]
+            modified_on_update = modified_on.update
+            modified_on.update = None
+        else:
+            modified_on_update = None
+
+        # Update super entity links
+        s3db.update_super(table, form.vars)
+
+        job = self.job
+        if job.bulk:
+            job.deferred.append((self, method, enforce_realm_update))
+        else:
+            METHOD = self.METHOD
+            if method == METHOD.CREATE:
+                # Set record owner
+                current.auth.s3_set_record_owner(table, self.id)
+            elif method == METHOD.UPDATE:
+                # Update realm
+                update_realm = enforce_realm_update or \
+                               s3db.get_config(table, "update_realm")
+                if update_realm:
+                    current.auth.set_realm_entity(table, self.id,
+                                                  force_update = True,
+                                                  )
+            # Onaccept
+            if job.onaccept:
+                self.run_onaccept(method)
+
+        # Restore modified_on.update
+        if modified_on_update is not None:
+            modified_on.update = modified_on_update
+
+    # -------------------------------------------------------------------------
+    def run_onaccept(self, method):
+        """
+            Run the import onaccept-callback for this item
+
+            Args:
+                method: the import method (CREATE|UPDATE)
+        """
+
+        tablename = self.tablename
+
+        key = "%s_onaccept" % method
+        onaccept = current.deployment_settings.get_import_callback(tablename, key)
+        if onaccept:
+            callback(onaccept, self.form, tablename=tablename)
+
     # -------------------------------------------------------------------------
     def _dynamic_defaults(self, data):
         """
@@ -2206,32 +2845,7 @@ class ImportItem:
     # -------------------------------------------------------------------------
     def _mandatory_fields(self):
 
-        job = self.job
-
-        mandatory = None
-        tablename = self.tablename
-
-        mfields = job.mandatory_fields
-        if tablename in mfields:
-            mandatory = mfields[tablename]
-
-        if mandatory is None:
-            mandatory = []
-            for field in self.table:
-                if field.default is not None:
-                    continue
-                requires = field.requires
-                if requires:
-                    if not isinstance(requires, (list, tuple)):
-                        requires = [requires]
-                    if isinstance(requires[0], IS_EMPTY_OR):
-                        continue
-                    error = field.validate("")[1]
-                    if error:
-                        mandatory.append(field.name)
-            mfields[tablename] = mandatory
-
-        return mandatory
+        return self.job.get_mandatory_fields(self.table)
 
     # -------------------------------------------------------------------------
     def _resolve_references(self):
@@ -2829,9 +3443,27 @@ class S3Duplicate:
                                              limitby = (0, 1)
                                              ).first()
 
-        if duplicate:
+        self.update_item(item, duplicate[table._id] if duplicate else None)
+
+        # For uses outside of imports:
+        return duplicate
+
+    # -------------------------------------------------------------------------
+    def update_item(self, item, duplicate_id):
+        """
+            Update the import item with the result of the duplicate check
+
+            Args:
+                item: the import item
+                duplicate_id: the record ID of the duplicate, or None
+                              if no match was found
+        """
+
+        data = item.data
+
+        if duplicate_id:
             # Match found: Update import item
-            item.id = duplicate[table._id]
+            item.id = duplicate_id
             if not data.deleted:
                 item.method = item.METHOD.UPDATE
             if self.noupdate:
@@ -2846,8 +3478,148 @@ class S3Duplicate:
                 if item.element is not None:
                     item.element.set(current.xml.ATTRIBUTE["error"], error)
 
-        # For uses outside of imports:
-        return duplicate
+    # -------------------------------------------------------------------------
+    def find_all(self, items, others=None):
+        """
+            Find the duplicates for multiple import items of the same
+            table at once, with one query per batch of items (bulk import)
+
+            Args:
+                items: the import items to check
+                others: all import items of the table in the same job,
+                        to detect items which could match each other
+
+            Returns:
+                dict {item_id: duplicate_id or None} for all items which
+                could be checked; other items must be checked one by one
+                when they are committed
+        """
+
+        if not items:
+            return {}
+        table = items[0].table
+
+        primary = sorted(self.primary)
+        secondary = sorted(self.secondary)
+
+        # Only string and integer fields can be matched in memory
+        fields = primary + secondary
+        for fname in fields:
+            if fname not in table.fields:
+                return {}
+            ftype = str(table[fname].type)
+            if ftype not in ("string", "text", "integer", "bigint") and \
+               ftype[:10] != "reference ":
+                return {}
+
+        # Match fields must not be set by references during commit
+        if others is None:
+            others = items
+        for item in others:
+            for reference in item.references:
+                if reference.field in self.primary or \
+                   reference.field in self.secondary:
+                    return {}
+
+        ignore_case = self.ignore_case
+        def normalize(field, value):
+            # Normalize a value for in-memory matching, returns
+            # NotImplemented if the value cannot be matched in memory
+            ftype = str(field.type)
+            if value is None:
+                return value
+            if ftype in ("string", "text"):
+                if not isinstance(value, str):
+                    return NotImplemented
+                if ignore_case:
+                    if not value.isascii():
+                        # DB lower() may not match str.lower()
+                        return NotImplemented
+                    value = value.lower()
+            elif isinstance(value, bool) or not isinstance(value, int):
+                return NotImplemented
+            return value
+
+        def key(data):
+            return tuple(normalize(table[fn], data.get(fn)) for fn in primary)
+
+        # Items whose primary key occurs more than once in the job
+        # could match each other, so they must be checked one by one
+        keys = {}
+        for item in others:
+            for data in (item.data, item.original):
+                if data is None:
+                    continue
+                k = key(data)
+                keys[k] = keys.get(k, 0) + 1
+
+        # Collect the items that can be matched in memory
+        checks = []
+        for item in items:
+            data = item.data
+            k = key(data)
+            if NotImplemented in k or keys.get(k, 0) > 1:
+                continue
+            values = {}
+            for fname in secondary:
+                value = data.get(fname)
+                if value:
+                    value = normalize(table[fname], value)
+                    if value is NotImplemented:
+                        break
+                    values[fname] = value
+            else:
+                checks.append((item, k, values))
+        if not checks:
+            return {}
+
+        # Look up the candidates, by the first primary field
+        db = current.db
+        field = table[primary[0]]
+        lower = ignore_case and str(field.type) in ("string", "text")
+        expr = field.lower() if lower else field
+
+        query = None
+        if self.ignore_deleted and "deleted" in table.fields:
+            query = (table.deleted == False)
+
+        pkey = table._id
+        selected = [pkey] + [table[fn] for fn in fields]
+
+        candidates = {}
+        lookup = list(set(k[0] for _, k, _ in checks))
+        size = ImportJob.BATCH_SIZE
+        for i in range(0, len(lookup), size):
+            batch = lookup[i:i + size]
+            q = expr.belongs([v for v in batch if v is not None])
+            if None in batch:
+                q |= (field == None)
+            if query is not None:
+                q &= query
+            rows = db(q).select(*selected, orderby=pkey)
+            for row in rows:
+                k = key(row)
+                if NotImplemented in k:
+                    continue
+                if k in candidates:
+                    candidates[k].append(row)
+                else:
+                    candidates[k] = [row]
+
+        # Match the items
+        duplicates = {}
+        for item, k, values in checks:
+            duplicate_id = None
+            for row in candidates.get(k, ()):
+                for fname, value in values.items():
+                    if normalize(table[fname], row[fname]) != value:
+                        break
+                else:
+                    duplicate_id = row[pkey]
+                    break
+            duplicates[item.item_id] = duplicate_id
+
+        return duplicates
 
     # -------------------------------------------------------------------------
     def match(self, field, value):
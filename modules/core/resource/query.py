@@ -46,9 +46,10 @@ from urllib import parse as urlparse
 from gluon import current, IS_EMPTY_OR, IS_IN_SET
 from gluon.storage import Storage
 
-from s3dal import Field, Row
+from s3dal import Field, Row, S3DAL
 
-from ..tools import S3RepresentLazy, S3TypeConverter, s3_get_foreign_key, s3_str
+from ..tools import S3RepresentLazy, S3TypeConverter, SearchIndex, \
+                     s3_get_foreign_key, s3_str
 
 ogetattr = object.__getattribute__
 
@@ -1203,6 +1204,55 @@ class S3Joins:
         except RuntimeError:
             return list(joins_dict.values())
 
+    # -------------------------------------------------------------------------
+    def single_valued(self, tablenames=None):
+        """
+            Check whether the joins in this collection are single-valued,
+            i.e. join each table by its primary key or another unique key,
+            so that they can not produce more than one row per master record
+
+            Args:
+                tablenames: the names of the tables to check, defaults to
+                            all tables in the collection
+
+            Returns:
+                boolean
+        """
+
+        adapter = S3DAL()
+        AND, EQ = adapter.AND, adapter.EQ
+
+        def single(join):
+            # Check whether the join matches a unique key of the joined table
+            ktable = join.first
+            ktablename = ktable._tablename
+            queries = [join.second]
+            while queries:
+                q = queries.pop()
+                op = getattr(q, "op", None)
+                if op == AND:
+                    queries.extend((q.first, q.second))
+                elif op == EQ:
+                    for a, b in ((q.first, q.second), (q.second, q.first)):
+                        if isinstance(a, Field) and isinstance(b, Field) and \
+                           a.tablename == ktablename and \
+                           b.tablename != ktablename and \
+                           (a.type == "id" or a.unique):
+                            return True
+            return False
+
+        joins = self.joins
+        if tablenames is None:
+            tablenames = self.tables
+
+        for tablename in tablenames:
+            if tablename not in joins:
+                continue
+            if not all(single(join) for join in joins[tablename]):
+                return False
+
+        return True
+
     # -------------------------------------------------------------------------
     @classmethod
     def sort(cls, joins):
@@ -1507,9 +1557,10 @@ class S3ResourceQuery:
                 return None
             elif not rfield.field:
                 return False
-            lfield = l.expr(rfield.field)
+            field = rfield.field
+            lfield = l.expr(field)
         elif isinstance(l, Field):
-            lfield = l
+            field = lfield = l
         else:
             return None # not a field at all
         if isinstance(r, S3FieldSelector):
@@ -1562,7 +1613,13 @@ class S3ResourceQuery:
                 # => treat as 0 to prevent crash in SQL expansion
                 rfield = 0
 
-        query = query_bare(op, lfield, rfield)
+        query = None
+        if op == self.LIKE and isinstance(rfield, str) and \
+           current.deployment_settings.get_database_search_index():
+            # Use the search index if available for this field
+            query = SearchIndex.like(field, rfield)
+        if query is None:
+            query = query_bare(op, lfield, rfield)
         if invert and query is not None:
             query = ~query
         return query
@@ -389,6 +389,49 @@ class CRUDResource:
 
         self.rfilter.set_extra_filters(filters)
 
+    # -------------------------------------------------------------------------
+    def subset(self, f):
+        """
+            Get a new resource for a subset of the records of this
+            resource, with the same filters extended by another query,
+            e.g. to process the records in batches without altering
+            the filter of this resource
+
+            Args:
+                f: a Query or a S3ResourceQuery instance
+
+            Returns:
+                a new CRUDResource
+
+            Note:
+                Only for master resources, component filters are not
+                carried over to the subset
+        """
+
+        rfilter = self.rfilter
+        if rfilter is None:
+            rfilter = self.build_query()
+
+        subset = CRUDResource(self,
+                              include_deleted = self.include_deleted,
+                              approved = self._approved,
+                              unapproved = self._unapproved,
+                              extra_filters = rfilter.efilters,
+                              )
+
+        sfilter = subset.rfilter
+        sfilter.mquery = rfilter.mquery
+        sfilter.ijoins.update(rfilter.ijoins)
+        sfilter.ljoins.update(rfilter.ljoins)
+        sfilter.distinct = rfilter.distinct
+        for query in rfilter.queries + rfilter.filters:
+            sfilter.add_filter(query)
+        if f is not None:
+            sfilter.add_filter(f)
+        subset.vars = self.vars
+
+        return subset
+
     # -------------------------------------------------------------------------
     def get_query(self):
         """
@@ -463,6 +506,7 @@ class CRUDResource:
                represent = False,
                show_links = True,
                raw_data = False,
+               seek = None,
                ):
         """
             Extract data from this resource
@@ -481,6 +525,8 @@ class CRUDResource:
                 as_rows: return the rows (don't extract)
                 represent: render field value representations
                 raw_data: include raw data in the result
+                seek: the sort key of the last record of the previous page,
+                      for keyset pagination (see ResourceData)
         """
 
         data = ResourceData(self,
@@ -498,6 +544,7 @@ class CRUDResource:
                             represent = represent,
                             show_links = show_links,
                             raw_data = raw_data,
+                            seek = seek,
                             )
         if as_rows:
             return data.rows
@@ -869,6 +916,7 @@ class CRUDResource:
                   orderby = None,
                   distinct = False,
                   list_id = None,
+                  seek = None,
                   ):
         """
             Generate a data table of this resource
@@ -881,6 +929,8 @@ class CRUDResource:
                 orderby: orderby for DB query
                 distinct: distinct-flag for DB query
                 list_id: the datatable ID
+                seek: the sort key of the last record of the previous page,
+                      for keyset pagination (see ResourceData)
 
             Returns:
                 tuple (DataTable, numrows), where numrows represents
@@ -915,6 +965,7 @@ class CRUDResource:
                            count = True,
                            getids = False,
                            represent = True,
+                           seek = seek,
                            )
 
         rows = data.rows
@@ -925,6 +976,7 @@ class CRUDResource:
         # Generate the data table
         rfields = data.rfields
         dt = DataTable(rfields, rows, list_id, orderby=orderby)
+        dt.seek = data.seek
 
         return dt, data.numrows
 
@@ -938,6 +990,7 @@ class CRUDResource:
                  distinct = False,
                  list_id = None,
                  layout = None,
+                 seek = None,
                  ):
         """
             Generate a data list of this resource
@@ -951,6 +1004,8 @@ class CRUDResource:
                 distinct: distinct-flag for DB query
                 list_id: the list identifier
                 layout: custom renderer function (see S3DataList.render)
+                seek: the sort key of the last record of the previous page,
+                      for keyset pagination (see ResourceData)
 
             Returns:
                 tuple (S3DataList, numrows, ids), where numrows represents
@@ -981,6 +1036,7 @@ class CRUDResource:
                            getids = False,
                            raw_data = True,
                            represent = True,
+                           seek = seek,
                            )
 
         # Generate the data list
@@ -1476,6 +1532,7 @@ class CRUDResource:
                    location_data = None,
                    map_data = None,
                    target = None,
+                   as_stream = False,
                    **args):
         """
             Export this resource as S3XML
@@ -1513,6 +1570,9 @@ class CRUDResource:
                                looked-up in bulk ready for xml.gis_encode()
                 map_data: dictionary of options which can be read by the map
                 target: alias of component targetted (or None to target master resource)
+                as_stream: return a generator producing the output in chunks
+                           of bytes, building the tree in batches (not with
+                           stylesheet, slicing, target or as_tree)
                 args: dict of arguments to pass to the XSLT stylesheet
         """
 
@@ -1534,6 +1594,23 @@ class CRUDResource:
                                map_data = map_data,
                                )
 
+        if as_stream and xmlformat is None and not as_tree and not target and \
+           start is None and limit is None and not filters and not map_data:
+            return rtree.stream(msince = msince,
+                                fields = fields,
+                                references = references,
+                                mcomponents = mcomponents,
+                                dereference = dereference,
+                                maxdepth = maxdepth,
+                                rcomponents = rcomponents,
+                                mdata = mdata,
+                                maxbounds = maxbounds,
+                                as_json = as_json,
+                                pretty_print = pretty_print,
+                                batch_size = current.deployment_settings \
+                                                    .get_xml_stream_batch_size(),
+                                )
+
         tree = rtree.build(start = start,
                            limit = limit,
                            msince = msince,
@@ -1590,6 +1667,9 @@ class CRUDResource:
                    select_items = None,
                    strategy = None,
                    sync_policy = None,
+                   bulk = False,
+                   onaccept = True,
+                   chunk_size = None,
                    **args):
         """
             Import data
@@ -1608,6 +1688,16 @@ class CRUDResource:
                 select_items: items of the previous import job to select
                 strategy: allowed import methods
                 SyncPolicy sync_policy: the synchronization policy
+                bulk: use bulk mode (batched duplicate checks and inserts,
+                      deferred post-processing)
+                onaccept: run the onaccept-callbacks for imported records
+                chunk_size: read, transform and add CSV/XLSX sources to the
+                            import job in chunks of this number of rows,
+                            to limit memory use with large sources (only
+                            suitable if rows do not reference records
+                            which are defined in later rows of the source);
+                            when committing, the source elements are released
+                            as soon as the rows have been parsed
                 args: arguments for the transformation stylesheet
         """
 
@@ -1623,7 +1713,15 @@ class CRUDResource:
 
         from .importer import XMLImporter
         tree = None
-        if source:
+        if source and chunk_size:
+            tree = XMLImporter.parse_chunks(tablename,
+                                            source,
+                                            source_type = source_type,
+                                            stylesheet = stylesheet,
+                                            extra_data = extra_data,
+                                            chunk_size = chunk_size,
+                                            **args)
+        elif source:
             tree = XMLImporter.parse_source(tablename,
                                             source,
                                             source_type = source_type,
@@ -1646,6 +1744,8 @@ class CRUDResource:
                                        select_items = select_items,
                                        strategy = strategy,
                                        sync_policy = sync_policy,
+                                       bulk = bulk,
+                                       onaccept = onaccept,
                                        )
 
     # -------------------------------------------------------------------------
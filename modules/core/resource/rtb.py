@@ -29,6 +29,8 @@ __all__ = ("S3ResourceTree",
            )
 
 import json
+
+from io import BytesIO
 from lxml import etree
 
 from gluon import current
@@ -36,7 +38,8 @@ from gluon.storage import Storage
 
 from s3dal import original_tablename
 
-from ..tools import s3_get_foreign_key, s3_str, S3Represent, S3RepresentLazy
+from ..tools import JSONSEPARATORS, s3_get_foreign_key, s3_str, S3Represent, \
+                     S3RepresentLazy
 
 from .query import FS, S3URLQuery
 from .resource import DEFAULT, MAXDEPTH
@@ -137,10 +140,8 @@ class S3ResourceTree:
             mcomponents = []
 
         xml = current.xml
-        s3db = current.s3db
 
         # Use lazy representations
-        lazy = []
         current.auth_user_represent = S3Represent(lookup = "auth_user",
                                                   fields = ["email"],
                                                   )
@@ -170,9 +171,310 @@ class S3ResourceTree:
             self.masters.extend(masters)
             self.nodes.extend(nodes)
 
+        # Export dependencies
+        self.export_dependencies(maxdepth if dereference else 0,
+                                 fields = fields,
+                                 references = references,
+                                 rcomponents = rcomponents,
+                                 sync_filters = sync_filters,
+                                 xmlformat = xmlformat,
+                                 mdata = mdata,
+                                 target = target,
+                                 )
+
+        # Create root element
+        root = etree.Element(xml.TAG.root)
+
+        # Add map data to root element
+        map_data = self.map_data
+        if map_data:
+            # Gets loaded before re-dumping, so no need to compact
+            # or avoid double-encoding
+            # NB Ensure we don't double-encode unicode!
+            #root.set("map", json.dumps(map_data, separators=JSONSEPARATORS,
+            #                           ensure_ascii=False))
+            root.set("map", json.dumps(map_data))
+
+        # Render all master nodes
+        self.render(root, self.masters)
+
+        # Complete the tree
+        tree = xml.tree(None,
+                        root = root,
+                        domain = xml.domain,
+                        url = self.base_url,
+                        results = results,
+                        start = start,
+                        limit = limit,
+                        maxbounds = maxbounds,
+                        )
+
+        # Store number of results in resource
+        resource.results = results
+
+        return tree
+
+    # -------------------------------------------------------------------------
+    def stream(self,
+               msince = None,
+               fields = None,
+               references = None,
+               mcomponents = DEFAULT,
+               dereference = True,
+               maxdepth = MAXDEPTH,
+               rcomponents = None,
+               mdata = False,
+               maxbounds = False,
+               as_json = False,
+               pretty_print = False,
+               batch_size = 500,
+               ):
+        """
+            Generator to export the resource as S3XML (or native S3JSON)
+            incrementally, building and serializing the tree in batches of
+            master records (ordered by record ID) rather than all at once,
+            so that memory use does not grow with the size of the export
+
+            Args:
+                msince: export only records which have been modified
+                        after this datetime
+                fields: data fields to include (default: all)
+                references: foreign keys to include (default: all)
+                mcomponents: components of the master resource to
+                             include (list of aliases), empty list
+                             for all available components
+                dereference: include referenced resources
+                maxdepth: maximum depth for reference exports
+                rcomponents: components of referenced resources to
+                             include (list of "tablename:alias")
+                mdata: mobile data export
+                       (=>reduced field set, lookup-only option)
+                maxbounds: include lat/lon boundaries in the top
+                           level element (off by default)
+                as_json: produce S3JSON rather than S3XML
+                pretty_print: insert newlines/indentation in the
+                              output (XML only)
+                batch_size: number of master records per batch
+
+            Yields:
+                the output as chunks of bytes
+
+            Note:
+                - does not support slicing, component targets or XSLT
+                - master records referenced by records of an earlier batch
+                  are only resolved by identity there, and exported (with
+                  their components) in their own batch
+                - referenced records of other tables are exported only
+                  once, but in S3JSON they are collected in memory until
+                  all master records have been written (as they can only
+                  be appended after the master record list)
+        """
+
+        if mcomponents is DEFAULT:
+            mcomponents = []
+
+        xml = current.xml
+        s3db = current.s3db
+
+        # Use lazy representations
+        current.auth_user_represent = S3Represent(lookup = "auth_user",
+                                                  fields = ["email"],
+                                                  )
+
+        # Nodes are rendered and released batch-wise
+        self.masters = []
+        self.nodes = None
+        self.pending_dependencies = {}
+
+        resource = self.resource
+        table = resource.table
+        tablename = original_tablename(table)
+        pkey = table._id
+
+        # Apply MCI and msince filters, so they count towards the results
+        MCI, MTIME = xml.MCI, xml.MTIME
+        if xml.filter_mci and MCI in table.fields:
+            resource.add_filter(FS(MCI) >= 0)
+        if msince and MTIME in table.fields:
+            resource.add_filter(FS(MTIME) >= msince)
+
+        results = resource.count()
+        resource.results = results
+
+        # Root element attributes
+        root = xml.tree(None,
+                        domain = xml.domain,
+                        url = self.base_url,
+                        results = results,
+                        maxbounds = maxbounds,
+                        ).getroot()
+        root.set(xml.ATTRIBUTE.success, json.dumps(bool(results)))
+
         depth = maxdepth if dereference else 0
+        exported = self.exported
+
+        def batches():
+            # Generate batches of master record IDs, keyset-paginated
+            last_id = 0
+            while True:
+                rows = resource.subset(pkey > last_id).select([pkey.name],
+                                                              limit = batch_size,
+                                                              orderby = pkey,
+                                                              virtual = False,
+                                                              as_rows = True,
+                                                              )
+                if not rows:
+                    break
+                ids = [row[pkey] for row in rows]
+                last_id = ids[-1]
+                yield ids
+                if len(ids) < batch_size:
+                    break
+
+        def defer(loadmap):
+            # Master records referenced by records of an earlier batch
+            # are only resolved by identity, and exported as masters in
+            # their own batch (with their components)
+            ids = loadmap.get(tablename)
+            if not ids:
+                return None
+            rows = resource.subset(pkey.belongs(ids)).select([pkey.name],
+                                                             limit = None,
+                                                             virtual = False,
+                                                             as_rows = True,
+                                                             )
+            return {tablename: {row[pkey] for row in rows}}
+
+        def export_batch(ids):
+            # Export a batch of master records, and render them
+            # into a new (unattached) root element
+            broot = etree.Element(xml.TAG.root)
+
+            self.masters = []
+            self.pending_dependencies = {}
+
+            bresource = s3db.resource(resource.tablename,
+                                      id = ids,
+                                      include_deleted = resource.include_deleted,
+                                      )
+            masters = self.export_resource(bresource,
+                                           start = 0,
+                                           limit = len(ids),
+                                           fields = fields,
+                                           references = references,
+                                           components = mcomponents,
+                                           msince = msince,
+                                           mdata = mdata,
+                                           location_data = self.location_data,
+                                           )[0]
+            self.masters.extend(masters)
+
+            identities = self.export_dependencies(depth,
+                                                  fields = fields,
+                                                  references = references,
+                                                  rcomponents = rcomponents,
+                                                  mdata = mdata,
+                                                  defer = defer,
+                                                  )
+            self.render(broot, self.masters, release=True)
+
+            # Forget records which have only been resolved by identity,
+            # so they can still be exported fully in a later batch
+            for key in identities:
+                exported.pop(key, None)
+            self.masters = []
+
+            return broot
+
+        if as_json:
+            # Stream the master records list, collect all others
+            rkey = "%s_%s" % (xml.PREFIX.resource, resource.tablename)
+            others = {}
+
+            yield b"{%s:[" % json.dumps(rkey).encode("utf-8")
+            first = True
+            for ids in batches():
+                items = xml.tree2json(export_batch(ids), native=True, as_dict=True)
+                for key, value in items.items():
+                    if key == rkey:
+                        chunk = ",".join(json.dumps(item, separators=JSONSEPARATORS)
+                                         for item in value)
+                        if chunk:
+                            yield (chunk if first else ",%s" % chunk).encode("utf-8")
+                            first = False
+                    elif key in others:
+                        others[key].extend(value)
+                    else:
+                        others[key] = value
+            yield b"]"
+
+            # Referenced records, then root attributes
+            tail = list(others.items())
+            tail.extend((xml.PREFIX.attribute + k, v) for k, v in root.attrib.items())
+            for key, value in tail:
+                yield (",%s:%s" % (json.dumps(key),
+                                   json.dumps(value, separators=JSONSEPARATORS),
+                                   )).encode("utf-8")
+            yield b"}"
+
+        else:
+            buf = BytesIO()
+            with etree.xmlfile(buf, encoding="utf-8") as xf:
+                xf.write_declaration()
+                with xf.element(root.tag, dict(root.attrib)):
+                    for ids in batches():
+                        for element in export_batch(ids):
+                            xf.write(element, pretty_print=pretty_print)
+                        xf.flush()
+                        yield buf.getvalue()
+                        buf.seek(0)
+                        buf.truncate()
+            yield buf.getvalue()
+
+    # -------------------------------------------------------------------------
+    def export_dependencies(self,
+                            depth,
+                            fields = None,
+                            references = None,
+                            rcomponents = None,
+                            sync_filters = None,
+                            xmlformat = None,
+                            mdata = False,
+                            target = None,
+                            defer = None,
+                            ):
+        """
+            Export all pending dependencies (referenced records), and
+            resolve the identities of those beyond the maximum depth
+
+            Args:
+                depth: maximum depth for reference exports
+
+                fields: data fields to include (default: all)
+                references: foreign keys to include (default: all)
+                rcomponents: components of referenced resources to
+                             include (list of "tablename:alias")
+                sync_filters: additional URL filters (Sync), as dict
+                              {tablename: {url_var: string}}
+                xmlformat: pre-parsed XSLT stylesheet wrapper
+                mdata: mobile data export
+                       (=>reduced field set, lookup-only option)
+                target: alias of component targeted
+                        (or None to target master resource)
+                defer: function to determine dependencies that shall only
+                       be resolved by identity (e.g. because they will be
+                       exported later anyway), function(loadmap) returning
+                       a dict {tablename: {record_ids}}
+
+            Returns:
+                set of keys (tablename, id) of records which have only been
+                added to the exported-map by identity (not exported)
+        """
+
+        s3db = current.s3db
+
+        deferred = {}
 
-        # Export dependencies
         dependencies = self.pending_dependencies
         while dependencies and depth:
 
@@ -180,6 +482,18 @@ class S3ResourceTree:
 
             loadmap = self.generate_loadmap(dependencies)
 
+            if defer:
+                for tn, ids in (defer(loadmap) or {}).items():
+                    if not ids:
+                        continue
+                    remaining = loadmap.get(tn)
+                    if remaining:
+                        loadmap[tn] = set(remaining) - ids
+                    if tn in deferred:
+                        deferred[tn] |= ids
+                    else:
+                        deferred[tn] = set(ids)
+
             for rtablename, ids in loadmap.items():
 
                 rresource = s3db.resource(rtablename, id=list(ids))
@@ -199,32 +513,53 @@ class S3ResourceTree:
                                                       )
                 if masters:
                     self.masters.extend(masters)
-                    self.nodes.extend(nodes)
+                    if self.nodes is not None:
+                        self.nodes.extend(nodes)
 
             dependencies = self.pending_dependencies
             depth -= 1
 
+        # Add deferred dependencies to the remaining dependencies
+        for tn, ids in deferred.items():
+            if tn in dependencies:
+                dependencies[tn] = set(dependencies[tn]) | ids
+            else:
+                dependencies[tn] = ids
+
         # Export identities of remaining dependencies, so references
         # can be resolved
+        identities = set()
         if dependencies:
+            exported = self.exported
+            for tablename, record_ids in dependencies.items():
+                identities.update((tablename, record_id)
+                                  for record_id in record_ids
+                                  if (tablename, record_id) not in exported
+                                  )
             self.export_identities(dependencies)
 
-        # Create root element
-        root = etree.Element(xml.TAG.root)
+        return identities
 
-        # Add map data to root element
-        map_data = self.map_data
-        if map_data:
-            # Gets loaded before re-dumping, so no need to compact
-            # or avoid double-encoding
-            # NB Ensure we don't double-encode unicode!
-            #root.set("map", json.dumps(map_data, separators=JSONSEPARATORS,
-            #                           ensure_ascii=False))
-            root.set("map", json.dumps(map_data))
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def render(root, masters, release=False):
+        """
+            Render the elements for master nodes, and append them to
+            the root element
+
+            Args:
+                root: the root element
+                masters: list of master nodes
+                release: release the caches of lazy representation
+                         methods after rendering
+        """
+
+        xml = current.xml
 
         # Render all master nodes
+        lazy = []
         location_references = []
-        for node in self.masters:
+        for node in masters:
             lref = node.add_element_to(root, lazy=lazy)
             if lref:
                 location_references.extend(lref)
@@ -235,24 +570,19 @@ class S3ResourceTree:
 
         # Render all pending lazy representations
         if lazy:
+            renderers = set()
             for renderer, element, attr, f in lazy:
                 renderer.render_node(element, attr, f)
-
-        # Complete the tree
-        tree = xml.tree(None,
-                        root = root,
-                        domain = xml.domain,
-                        url = self.base_url,
-                        results = results,
-                        start = start,
-                        limit = limit,
-                        maxbounds = maxbounds,
-                        )
-
-        # Store number of results in resource
-        resource.results = results
-
-        return tree
+                renderers.add(renderer)
+
+            if release:
+                # Release representation caches, so that memory does
+                # not grow with the number of batches
+                for renderer in renderers:
+                    if isinstance(renderer, S3Represent) and \
+                       renderer.options is None and renderer.setup:
+                        renderer.theset = {}
+                        renderer.rows = {}
 
     # -------------------------------------------------------------------------
     def export_resource(self,
@@ -37,7 +37,7 @@ from urllib.parse import quote as urllib_quote
 
 from gluon import current
 
-from ...resource import SyncPolicy
+from ...resource import FS, S3URLQuery, SyncPolicy
 from ...tools import s3_encode_iso_datetime, JSONERRORS
 
 from ..base import S3SyncBaseAdapter, S3SyncDataArchive
@@ -168,6 +168,12 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 tuple (error, mtime), with error=None if successful,
                 else error=message, and mtime=modification timestamp
                 of the youngest record sent
+
+            Note:
+                with settings.sync.page_size, the data are requested
+                page by page, and the cursor of the last imported page
+                stored in the task (pull_cursor), so that an interrupted
+                pull can be resumed from there
         """
 
         xml = current.xml
@@ -211,7 +217,35 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 else:
                     use_archived = True
 
-        if response is None:
+        # Sync Policy
+        if onconflict:
+            onconflict_callback = lambda item: onconflict(item,
+                                                          repository,
+                                                          resource,
+                                                          )
+        else:
+            onconflict_callback = None
+        sync_policy = SyncPolicy(onupdate = task.update_policy,
+                                 onconflict = task.conflict_policy,
+                                 resolve = onconflict_callback,
+                                 last_sync = last_pull,
+                                 )
+
+        count = 0
+        mtime = None
+        message = ""
+
+        if response is not None:
+
+            # Import the data from the archive
+            action = "import"
+            result, message, output, count, mtime = self._import(resource,
+                                                                 response,
+                                                                 task,
+                                                                 sync_policy,
+                                                                 )
+
+        else:
 
             debug("S3Sync: pull %s from %s" % (resource_name, repository.url))
 
@@ -235,145 +269,82 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                         urlfilter = "[%s]%s=%s" % (prefix, k, urllib_quote(value))
                         url += "&%s" % urlfilter
 
-            debug("...pull from URL %s" % url)
-
-            # Execute the request
-            remote = False
-            action = "fetch"
-            response = None
-            output = None
-
-            opener = self._http_opener(url)
-            try:
-                f = opener.open(url)
-
-            except HTTPError as e:
-                result = log.ERROR
-                remote = True # Peer error
-                code = e.code
-                message = e.read()
-                try:
-                    # Sahana-Eden would send a JSON message,
-                    # try to extract the actual error message:
-                    message_json = json.loads(message)
-                except JSONERRORS:
-                    pass
-                else:
-                    message = message_json.get("message", message)
-                # Prefix as peer error and strip XML markup from the message
-                # @todo: better method to do this?
-                message = "<message>%s</message>" % message
-                try:
-                    markup = etree.XML(message)
-                    message = markup.xpath(".//text()")
-                    if message:
-                        message = " ".join(message)
-                    else:
-                        message = ""
-                except etree.XMLSyntaxError:
-                    pass
-                output = xml.json_message(False, code, message, tree=None)
-
-            except URLError as e:
-                # URL Error (network error)
-                result = log.ERROR
-                remote = True
-                message = "Peer repository unavailable (%s)" % e.reason
-                output = xml.json_message(False, 400, message)
-
-            except:
-                result = log.FATAL
-                message = sys.exc_info()[1]
-                output = xml.json_message(False, 400, message)
-
-            else:
-                result = log.SUCCESS
-                response = f
-
-        # Process the response
-        mtime = None
-        if response:
-            message = ""
-            action = "import"
-
-            # Sync Policy
-            if onconflict:
-                onconflict_callback = lambda item: onconflict(item,
-                                                              repository,
-                                                              resource,
-                                                              )
+            # Request the data in pages, resume after the last imported page
+            # - peers which do not support paging ignore the page_size
+            #   and send all data at once (=without cursor)
+            page_size = current.deployment_settings.get_sync_page_size()
+            if page_size:
+                url += "&page_size=%s" % page_size
+                cursor = task.pull_cursor
             else:
-                onconflict_callback = None
-            sync_policy = SyncPolicy(onupdate = task.update_policy,
-                                     onconflict = task.conflict_policy,
-                                     resolve = onconflict_callback,
-                                     last_sync = last_pull,
-                                     )
-
-            # Import the data
-            count = 0
-            try:
-                import_result = resource.import_xml(response,
-                                                    ignore_errors = True,
-                                                    strategy = task.strategy,
-                                                    sync_policy = sync_policy,
-                                                    )
-                count = import_result.count
-
-            except IOError as e:
-                result = log.FATAL
-                message = "%s" % e
-                output = xml.json_message(False, 400, message)
-
-            except:
-                # If we end up here, an uncaught error during import
-                # has occured which indicates a code defect! We log it
-                # and continue here, however - in order to maintain a
-                # valid sync status, so that developers can restart
-                # the process more easily after fixing the defect.
-                result = log.FATAL
-                message = "Uncaught Exception During Import: %s" % \
-                          traceback.format_exc()
-                output = xml.json_message(False, 500, sys.exc_info()[1])
-
-            mtime = import_result.mtime
-
-            # Log all validation errors
-            if import_result.error_tree is not None:
-                result = log.WARNING
-                message = "%s" % import_result.error
-                for element in import_result.error_tree.findall("resource"):
-                    for field in element.findall("data[@error]"):
-                        error_msg = field.get("error", None)
-                        if error_msg:
-                            msg = "(UID: %s) %s.%s=%s: %s" % \
-                                   (element.get("uuid", None),
-                                    element.get("name", None),
-                                    field.get("field", None),
-                                    field.get("value", field.text),
-                                    field.get("error", None))
-                            message = "%s, %s" % (message, msg)
+                cursor = None
+
+            warnings = []
+            while True:
+
+                page_url = url
+                if cursor:
+                    page_url += "&page_cursor=%s" % urllib_quote(cursor)
+                debug("...pull from URL %s" % page_url)
+
+                # Execute the request
+                action = "fetch"
+                response, result, remote, message, output = self._fetch(page_url)
+                if response is None:
+                    break
+
+                tree = xml.parse(response)
+                if tree is None:
+                    result = log.ERROR
+                    remote = True
+                    message = "Invalid data received from peer (%s)" % xml.error
+                    output = xml.json_message(False, 400, message)
+                    break
+
+                # Import the data
+                action = "import"
+                result, message, output, page_count, page_mtime = \
+                    self._import(resource, tree, task, sync_policy)
+                if output is not None:
+                    break
+                if message:
+                    warnings.append(message)
+
+                count += page_count
+                if page_mtime and (mtime is None or page_mtime > mtime):
+                    mtime = page_mtime
+
+                if not page_size:
+                    break
+
+                # Record the high-water mark
+                cursor = tree.getroot().get("cursor")
+                current.db(current.s3db.sync_task.id == task.id).update(
+                                            pull_cursor = cursor,
+                                            )
+                current.db.commit()
+                if not cursor:
+                    break
 
-            # Check for failure
-            if not import_result.success:
-                result = log.FATAL
-                if not message:
-                    message = "%s" % import_result.error
-                output = xml.json_message(False, 400, message)
+            if output is not None:
+                # Do not advance last_pull (resume from pull_cursor)
                 mtime = None
+            elif warnings:
+                result = log.WARNING
+                message = ", ".join(warnings)
 
-            # ...or report success
-            elif not message:
-                if not count:
-                    message = "No data to import (already up-to-date)"
+        # Report success
+        if response is not None and output is None and not message:
+            if not count:
+                message = "No data to import (already up-to-date)"
+            else:
+                message = "Data imported successfully (%s records%%s)" % count
+                if use_archived:
+                    message = message % ", from archive"
                 else:
-                    message = "Data imported successfully (%s records%%s)" % count
-                    if use_archived:
-                        message = message % ", from archive"
-                    else:
-                        message = message % ""
+                    message = message % ""
 
-        elif result == log.SUCCESS:
+        elif response is None and result == log.SUCCESS:
             # No data received from peer
             result = log.ERROR
             remote = True
@@ -406,6 +377,12 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 tuple (error, mtime), with error=None if successful,
                 else error=message, and mtime=modification timestamp
                 of the youngest record sent
+
+            Note:
+                with settings.sync.page_size, the data are sent page
+                by page, and the cursor of the last page accepted by the
+                peer stored in the task (push_cursor), so that an
+                interrupted push can be resumed from there
         """
 
         xml = current.xml
@@ -444,66 +421,111 @@ class S3SyncAdapter(S3SyncBaseAdapter):
             # Default
             components = None
 
-        # Define the resource
-        resource = current.s3db.resource(resource_name,
-                                         components = components,
-                                         include_deleted = True,
-                                         )
-
         # Apply sync filters for this task
         filters = current.sync.get_filters(task.id)
 
-        # Export the resource as S3XML
-        data = resource.export_xml(filters = filters,
-                                   msince = last_push,
-                                   )
-        count = resource.results or 0
-        mtime = resource.muntil
+        # Send the data in pages, resume after the last page sent
+        page_size = current.deployment_settings.get_sync_page_size()
+        cursor = task.push_cursor if page_size else None
 
-        # Transmit the data via HTTP
         remote = False
         output = None
         log = repository.log
-        if data and count:
-            # Execute the request
-            opener = self._http_opener(url,
-                                       headers = [("Content-Type", "text/xml"),
-                                                  ],
-                                       )
-            try:
-                opener.open(url, data)
-            except HTTPError as e:
-                result = log.FATAL
-                remote = True # Peer error
-                code = e.code
-                message = e.read()
+
+        total = 0
+        mtime = None
+        while True:
+
+            # Define the resource
+            resource = current.s3db.resource(resource_name,
+                                             components = components,
+                                             include_deleted = True,
+                                             )
+
+            if page_size:
                 try:
-                    # Sahana-Eden sends a JSON message,
-                    # try to extract the actual error message:
-                    message_json = json.loads(message)
-                except JSONERRORS:
-                    pass
-                else:
-                    message = message_json.get("message", message)
-                output = xml.json_message(False, code, message)
-            except URLError as e:
-                # URL Error (network error)
-                result = log.ERROR
-                remote = True
-                message = "Peer repository unavailable (%s)" % e.reason
-                output = xml.json_message(False, 400, message)
-            except:
-                result = log.FATAL
-                code = 400
-                message = sys.exc_info()[1]
-                output = xml.json_message(False, code, message)
+                    next_cursor, page_mtime = self._select_page(resource,
+                                                               page_size,
+                                                               cursor = cursor,
+                                                               msince = last_push,
+                                                               filters = filters,
+                                                               )
+                except ValueError:
+                    # Invalid cursor => restart from the beginning
+                    cursor = None
+                    continue
             else:
+                next_cursor = page_mtime = None
+
+            # Export the resource as S3XML
+            data = resource.export_xml(filters = filters,
+                                       msince = last_push,
+                                       )
+            count = resource.results or 0
+            if not page_size:
+                page_mtime = resource.muntil
+
+            # Transmit the data via HTTP
+            if data and count:
+                # Execute the request
+                opener = self._http_opener(url,
+                                           headers = [("Content-Type", "text/xml"),
+                                                      ],
+                                           )
+                try:
+                    opener.open(url, data)
+                except HTTPError as e:
+                    result = log.FATAL
+                    remote = True # Peer error
+                    code = e.code
+                    message = e.read()
+                    try:
+                        # Sahana-Eden sends a JSON message,
+                        # try to extract the actual error message:
+                        message_json = json.loads(message)
+                    except JSONERRORS:
+                        pass
+                    else:
+                        message = message_json.get("message", message)
+                    output = xml.json_message(False, code, message)
+                except URLError as e:
+                    # URL Error (network error)
+                    result = log.ERROR
+                    remote = True
+                    message = "Peer repository unavailable (%s)" % e.reason
+                    output = xml.json_message(False, 400, message)
+                except:
+                    result = log.FATAL
+                    code = 400
+                    message = sys.exc_info()[1]
+                    output = xml.json_message(False, code, message)
+                if output is not None:
+                    break
+                total += count
+
+            if page_mtime and (mtime is None or page_mtime > mtime):
+                mtime = page_mtime
+
+            if not page_size:
+                break
+
+            # Record the high-water mark
+            cursor = next_cursor
+            current.db(current.s3db.sync_task.id == task.id).update(
+                                        push_cursor = cursor,
+                                        )
+            current.db.commit()
+            if not cursor:
+                break
+
+        if output is None:
+            if total:
                 result = log.SUCCESS
-                message = "data sent successfully (%s records)" % count
-        else:
-            # No data to send
-            result = log.WARNING
-            message = "No data to send"
+                message = "data sent successfully (%s records)" % total
+            else:
+                # No data to send
+                result = log.WARNING
+                message = "No data to send"
 
         # Log the operation
         log.write(repository_id = repository.id,
@@ -530,6 +552,8 @@ class S3SyncAdapter(S3SyncBaseAdapter):
              filters = None,
              mixed = False,
              pretty_print = False,
+             page_size = None,
+             page_cursor = None,
              ):
         """
             Respond to an incoming pull from the peer repository
@@ -542,6 +566,9 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 filters: URL filters for record extraction
                 mixed: negotiate resource with peer (disregard resource)
                 pretty_print: make the output human-readable
+                page_size: send the data in pages of this size (overrides
+                           start/limit)
+                page_cursor: the cursor of the previous page
 
             Returns:
                 a dict {status, remote, message, response}, with:
@@ -549,6 +576,11 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                     - remote....whether the error was remote (or local)
                     - message...the log message
                     - response..the response to send to the peer
+
+            Note:
+                in paged mode, the cursor for the next page is returned
+                in the cursor-attribute of the root element, no cursor
+                means that this is the last page
         """
 
         if not resource or mixed:
@@ -558,13 +590,38 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                     "response": current.xml.json_message(False, 400, msg),
                     }
 
+        # Select the page
+        cursor = None
+        if page_size:
+            try:
+                cursor = self._select_page(resource,
+                                          page_size,
+                                          cursor = page_cursor,
+                                          msince = msince,
+                                          filters = filters,
+                                          )[0]
+            except ValueError:
+                msg = "Invalid page cursor"
+                return {"status": self.log.FATAL,
+                        "remote": True,
+                        "message": msg,
+                        "response": current.xml.json_message(False, 400, msg),
+                        }
+            start = limit = None
+
         # Export the data as S3XML
         output = resource.export_xml(start = start,
                                      limit = limit,
                                      filters = filters,
                                      msince = msince,
                                      pretty_print = pretty_print,
+                                     as_tree = bool(page_size),
                                      )
+        if page_size:
+            if cursor:
+                output.getroot().set("cursor", cursor)
+            output = current.xml.tostring(output, pretty_print=pretty_print)
+
         count = resource.results
         msg = "Data sent to peer (%s records)" % count
 
@@ -698,6 +755,237 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 "response": import_result.json_message(),
                 }
 
+    # -------------------------------------------------------------------------
+    def _fetch(self, url):
+        """
+            Fetch data from the peer repository
+
+            Args:
+                url: the URL
+
+            Returns:
+                tuple (response, result, remote, message, output), with
+                response=None if the request failed
+        """
+
+        xml = current.xml
+        log = self.repository.log
+
+        response = None
+        remote = False
+        message = ""
+        output = None
+
+        opener = self._http_opener(url)
+        try:
+            f = opener.open(url)
+
+        except HTTPError as e:
+            result = log.ERROR
+            remote = True # Peer error
+            code = e.code
+            message = e.read()
+            try:
+                # Sahana-Eden would send a JSON message,
+                # try to extract the actual error message:
+                message_json = json.loads(message)
+            except JSONERRORS:
+                pass
+            else:
+                message = message_json.get("message", message)
+            # Prefix as peer error and strip XML markup from the message
+            # @todo: better method to do this?
+            message = "<message>%s</message>" % message
+            try:
+                markup = etree.XML(message)
+                message = markup.xpath(".//text()")
+                if message:
+                    message = " ".join(message)
+                else:
+                    message = ""
+            except etree.XMLSyntaxError:
+                pass
+            output = xml.json_message(False, code, message, tree=None)
+
+        except URLError as e:
+            # URL Error (network error)
+            result = log.ERROR
+            remote = True
+            message = "Peer repository unavailable (%s)" % e.reason
+            output = xml.json_message(False, 400, message)
+
+        except:
+            result = log.FATAL
+            message = sys.exc_info()[1]
+            output = xml.json_message(False, 400, message)
+
+        else:
+            result = log.SUCCESS
+            response = f
+
+        return response, result, remote, message, output
+
+    # -------------------------------------------------------------------------
+    def _import(self, resource, source, task, sync_policy):
+        """
+            Import data received from the peer repository
+
+            Args:
+                resource: the target resource
+                source: the data (file-like object or ElementTree)
+                task: the synchronization task (sync_task Row)
+                sync_policy: the SyncPolicy
+
+            Returns:
+                tuple (result, message, output, count, mtime), with
+                output=None if the import was successful, and mtime=
+                modification timestamp of the youngest record imported
+        """
+
+        xml = current.xml
+        log = self.repository.log
+
+        result = log.SUCCESS
+        message = ""
+        output = None
+
+        try:
+            import_result = resource.import_xml(source,
+                                                ignore_errors = True,
+                                                strategy = task.strategy,
+                                                sync_policy = sync_policy,
+                                                )
+        except IOError as e:
+            message = "%s" % e
+            return log.FATAL, message, xml.json_message(False, 400, message), 0, None
+
+        except:
+            # If we end up here, an uncaught error during import
+            # has occured which indicates a code defect! We log it
+            # and continue here, however - in order to maintain a
+            # valid sync status, so that developers can restart
+            # the process more easily after fixing the defect.
+            message = "Uncaught Exception During Import: %s" % \
+                      traceback.format_exc()
+            output = xml.json_message(False, 500, sys.exc_info()[1])
+            return log.FATAL, message, output, 0, None
+
+        count = import_result.count
+        mtime = import_result.mtime
+
+        # Log all validation errors
+        if import_result.error_tree is not None:
+            result = log.WARNING
+            message = "%s" % import_result.error
+            for element in import_result.error_tree.findall("resource"):
+                for field in element.findall("data[@error]"):
+                    error_msg = field.get("error", None)
+                    if error_msg:
+                        msg = "(UID: %s) %s.%s=%s: %s" % \
+                               (element.get("uuid", None),
+                                element.get("name", None),
+                                field.get("field", None),
+                                field.get("value", field.text),
+                                field.get("error", None))
+                        message = "%s, %s" % (message, msg)
+
+        # Check for failure
+        if not import_result.success:
+            result = log.FATAL
+            if not message:
+                message = "%s" % import_result.error
+            output = xml.json_message(False, 400, message)
+            mtime = None
+
+        return result, message, output, count, mtime
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _select_page(resource, page_size, cursor=None, msince=None, filters=None):
+        """
+            Restrict a resource to the next page of master records for
+            a paged synchronization, using the (modified_on, id) keyset
+
+            Args:
+                resource: the CRUDResource
+                page_size: the maximum number of master records per page
+                cursor: the cursor of the previous page (JSON string
+                        [modified_on, id] of its last record)
+                msince: minimum modification date/time for records to send
+                filters: URL filters for record extraction
+
+            Returns:
+                tuple (cursor, mtime), with cursor=the cursor of this page
+                if there are more records after it (otherwise None), and
+                mtime=modification timestamp of the youngest record
+
+            Raises:
+                ValueError for invalid cursors
+        """
+
+        table = resource.table
+        tablename = resource.tablename
+
+        MTIME = current.xml.MTIME
+        if MTIME not in table.fields:
+            # Can not page by modification date/time
+            return None, None
+        mtime_field = table[MTIME]
+
+        # NB records without modification date/time can not be paged
+        #    (and would be excluded by any msince filter anyway)
+        if msince:
+            resource.add_filter(FS(MTIME) >= msince)
+        else:
+            resource.add_filter(mtime_field != None)
+
+        # Sync filters
+        if filters and tablename in filters:
+            parsed_filters = S3URLQuery.parse(resource, filters[tablename])
+            for queries in parsed_filters.values():
+                for query in queries:
+                    resource.add_filter(query)
+
+        # Records after the cursor
+        if cursor:
+            try:
+                last_mtime, last_id = json.loads(cursor)
+                last_mtime = datetime.datetime.fromisoformat(last_mtime)
+                last_id = int(last_id)
+            except (TypeError, ValueError):
+                raise ValueError("Invalid page cursor: %s" % cursor)
+            resource.add_filter((mtime_field > last_mtime) | \
+                                ((mtime_field == last_mtime) & \
+                                 (table._id > last_id)))
+
+        # Look up the keys of this page (+1 to find out if there are more)
+        rows = resource.select([table._id.name, MTIME],
+                               limit = page_size + 1,
+                               orderby = [mtime_field, table._id],
+                               virtual = False,
+                               as_rows = True,
+                               )
+        keys = []
+        seen = set()
+        for row in rows:
+            record_id = row[table._id]
+            if record_id not in seen:
+                seen.add(record_id)
+                keys.append((row[mtime_field], record_id))
+        more = len(keys) > page_size
+        keys = keys[:page_size]
+
+        # Restrict the resource to this page
+        resource.add_filter(table._id.belongs([record_id for _, record_id in keys]))
+
+        if not keys:
+            return None, None
+
+        last_mtime, last_id = keys[-1]
+        cursor = json.dumps([last_mtime.isoformat(), last_id]) if more else None
+
+        return cursor, last_mtime
+
     # -------------------------------------------------------------------------
     def _get_archive(self, dataset_id):
         """
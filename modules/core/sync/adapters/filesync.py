@@ -362,7 +362,9 @@ class S3SyncAdapter(S3SyncBaseAdapter):
              msince=None,
              filters=None,
              mixed=False,
-             pretty_print=False):
+             pretty_print=False,
+             page_size=None,
+             page_cursor=None):
         """
             Respond to an incoming pull from the peer repository
 
@@ -374,6 +376,8 @@ class S3SyncAdapter(S3SyncBaseAdapter):
                 filters: URL filters for record extraction
                 mixed: negotiate resource with peer (disregard resource)
                 pretty_print: make the output human-readable
+                page_size: send the data in pages of this size
+                page_cursor: the cursor of the previous page
 
             Returns:
                 a dict {status, remote, message, response}, with:
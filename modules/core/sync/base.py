@@ -256,6 +256,22 @@ class S3Sync(CRUDMethod):
         if msince is not None:
             msince = s3_parse_datetime(msince)
 
+        # Paging parameters
+        page_size = vars_get("page_size", None)
+        if page_size is not None:
+            try:
+                page_size = int(page_size)
+            except ValueError:
+                page_size = None
+        if page_size is not None:
+            # Limit to the page size configured for this repository
+            max_page_size = current.deployment_settings.get_sync_page_size()
+            if page_size < 1:
+                page_size = None
+            elif max_page_size and page_size > max_page_size:
+                page_size = max_page_size
+        page_cursor = vars_get("page_cursor", None)
+
         # Sync filters from peer
         filters = {}
         for k, v in get_vars.items():
@@ -288,6 +304,8 @@ class S3Sync(CRUDMethod):
                                     msince = msince,
                                     filters = filters,
                                     mixed = mixed,
+                                    page_size = page_size,
+                                    page_cursor = page_cursor,
                                     )
         except NotImplementedError:
             r.error(405, "Synchronization method not supported for repository")
@@ -1126,6 +1144,8 @@ class S3SyncBaseAdapter:
              filters=None,
              mixed=False,
              pretty_print=False,
+             page_size=None,
+             page_cursor=None,
              ):
         """
             Respond to an incoming pull from the peer repository
@@ -1138,6 +1158,8 @@ class S3SyncBaseAdapter:
                 filters: URL filters for record extraction
                 mixed: negotiate resource with peer (disregard resource)
                 pretty_print: make the output human-readable
+                page_size: send the data in pages of this size
+                page_cursor: the cursor of the previous page
 
             Returns:
                 a dict {status, remote, message, response}, with:
@@ -1,10 +1,12 @@
 from .bi import *
 from .calendar import *
 from .convert import *
+from .generations import *
 from .hierarchy import *
 from .includes import *
 from .multipath import *
 from .represent import *
+from .searchindex import *
 from .tasks import *
 from .timeseries import *
 from .tracking import *
@@ -41,10 +41,43 @@ from gluon import current
 from gluon.storage import Storage
 from gluon.tools import fetch
 
+from .convert import s3_str
+from .utils import s3_get_foreign_key
 from .validators import IS_JSONS3, JSONERRORS
 
 EMPTYLINE = [None, None, None, None, None]
 
+# =============================================================================
+def import_worker(task):
+    """
+        Runs a CSV import task in a worker process (forked from the
+        process running BulkImporter.perform_parallel)
+
+        Args:
+            task: the task (tuple)
+
+        Returns:
+            tuple (errors, timings), see BulkImporter.perform_task
+    """
+
+    # Must not take connections from the pool inherited from the
+    # parent process, as they are still in use there
+    current.db._adapter.pool_size = 0
+
+    importer = BulkImporter()
+    errors = importer.perform_task(task)
+
+    # Errors are passed back to the parent process, so must be
+    # picklable (e.g. no lazyT)
+    messages = []
+    for error in errors:
+        if isinstance(error, (list, tuple)):
+            messages.append("\n".join(s3_str(e) for e in error))
+        else:
+            messages.append(s3_str(error))
+
+    return messages, importer.timings
+
 # =============================================================================
 class BulkImporter:
     """
@@ -58,6 +91,9 @@ class BulkImporter:
 
         self._handlers = None
 
+        # Durations of performed tasks, [(label, seconds)]
+        self.timings = []
+
     # -------------------------------------------------------------------------
     # Task Runner
     #
@@ -101,51 +137,293 @@ class BulkImporter:
                 a list of error messages (empty list if there were no errors)
         """
 
+        tasks = self.parse_task_config(path)
+
+        workers = current.deployment_settings.get_base_import_workers()
+        if workers > 1 and self.parallel_capable():
+            return self.perform_parallel(tasks, workers)
+
         errors = []
-        db = current.db
+        for task in tasks:
+            errors.extend(self.perform_task(task))
 
-        for task in self.parse_task_config(path):
-            task_type = task[0]
-            if not task_type:
-                errors.append(task[1])
-                continue
+        return errors
 
-            start = datetime.datetime.now()
+    # -------------------------------------------------------------------------
+    def perform_task(self, task):
+        """
+            Runs a single import task, and commits it if successful
 
-            if task_type == 1:
-                error = self.import_csv(*(task[1:6]))
-                if isinstance(error, list):
-                    errors.extend(error)
-                elif error:
-                    errors.append(error)
-                else:
-                    db.commit()
-                csv_name = os.path.split(task[3])[1]
-                msg = "%s imported (%%s sec)" % csv_name
-
-            elif task_type == 2:
-                handler = self.handlers.get(task[1])
-                if not handler:
-                    errors.append("Invalid task type %s" % task[1])
+            Args:
+                task: the task (tuple), as returned from parse_task_line
+
+            Returns:
+                a list of error messages (empty list if there were no errors)
+        """
+
+        task_type = task[0]
+        if not task_type:
+            return [task[1]]
+        if task_type == 3:
+            # Parallel stage marker, irrelevant for sequential imports
+            return []
+
+        errors = []
+        start = datetime.datetime.now()
+
+        if task_type == 1:
+            error = self.import_csv(*(task[1:6]))
+            label = os.path.split(task[3])[1]
+            msg = "%s imported (%%s sec)" % label
+
+        else:
+            handler = self.handlers.get(task[1])
+            if not handler:
+                return ["Invalid task type %s" % task[1]]
+            try:
+                error = handler(*task[2:])
+            except TypeError as e:
+                error = str(e)
+            label = task[1]
+            msg = "%s completed (%%s sec)" % label
+
+        if isinstance(error, list):
+            errors.extend(error)
+        elif error:
+            errors.append(error)
+        else:
+            current.db.commit()
+
+        duration = (datetime.datetime.now() - start).total_seconds()
+        self.timings.append((label, duration))
+        current.log.debug(msg % '{:.2f}'.format(duration))
+
+        return errors
+
+    # -------------------------------------------------------------------------
+    # Parallel Task Runner
+    #
+    @staticmethod
+    def parallel_capable():
+        """
+            Checks whether import tasks can be run in parallel worker
+            processes in this environment, i.e. worker processes can be
+            forked (inheriting the environment), and the database accepts
+            concurrent writers
+
+            Returns:
+                boolean
+        """
+
+        import multiprocessing
+        if "fork" not in multiprocessing.get_all_start_methods():
+            return False
+
+        return current.db._adapter.dbengine != "sqlite"
+
+    # -------------------------------------------------------------------------
+    def perform_parallel(self, tasks, workers):
+        """
+            Runs import tasks using a pool of worker processes; CSV imports
+            in a parallel stage are run concurrently where they do not
+            depend on each other (see task_dependencies), all other tasks
+            are run in the main process, in order, once all previous tasks
+            are complete
+
+            Args:
+                tasks: the list of tasks
+                workers: the maximum number of worker processes
+
+            Returns:
+                a list of error messages (empty list if there were no errors)
+
+            Note:
+                A parallel stage must be declared explicitly in the task
+                configuration, with a "*,parallel" line; it comprises all
+                subsequent CSV imports up to the next handler task
+        """
+
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        errors = []
+
+        # Worker processes are started on demand
+        executor = ProcessPoolExecutor(max_workers = workers,
+                                       mp_context = multiprocessing.get_context("fork"),
+                                       )
+        try:
+            stage = []
+            parallel = False
+            for task in tasks:
+                task_type = task[0]
+                if task_type == 1 and parallel:
+                    stage.append(task)
                     continue
-                try:
-                    error = handler(*task[2:])
-                except TypeError as e:
-                    errors.append(str(e))
-                else:
-                    if isinstance(error, list):
-                        errors.extend(error)
-                    elif error:
-                        errors.append(error)
-                    else:
-                        db.commit()
-                msg = "%s completed (%%s sec)" % task[1]
 
-            duration = datetime.datetime.now() - start
-            current.log.debug(msg % '{:.2f}'.format(duration.total_seconds()))
+                # Any other task requires all previous tasks to be complete
+                if stage:
+                    errors.extend(self.perform_stage(stage, executor))
+                    stage = []
+
+                if task_type == 3:
+                    # Start of a parallel stage
+                    parallel = True
+                    continue
+                if task_type == 2:
+                    # Handler tasks end the parallel stage
+                    parallel = False
+                errors.extend(self.perform_task(task))
+
+            if stage:
+                errors.extend(self.perform_stage(stage, executor))
+        finally:
+            executor.shutdown(wait=True)
 
         return errors
 
+    # -------------------------------------------------------------------------
+    def perform_stage(self, tasks, executor):
+        """
+            Runs a series of CSV import tasks concurrently, respecting
+            their dependencies
+
+            Args:
+                tasks: the list of tasks
+                executor: the ProcessPoolExecutor
+
+            Returns:
+                a list of error messages
+        """
+
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        if len(tasks) == 1:
+            return self.perform_task(tasks[0])
+
+        dependencies = self.task_dependencies(tasks)
+
+        # Commit all previous work, so that worker processes can see it
+        current.db.commit()
+
+        errors = {}
+        running = {}
+        done = set()
+        waiting = list(range(len(tasks)))
+        while waiting or running:
+
+            # Submit all tasks whose dependencies are complete
+            for index in list(waiting):
+                if dependencies[index] <= done:
+                    waiting.remove(index)
+                    future = executor.submit(import_worker, tasks[index])
+                    running[future] = index
+
+            complete = wait(list(running), return_when=FIRST_COMPLETED)[0]
+            for future in complete:
+                index = running.pop(future)
+                done.add(index)
+                try:
+                    task_errors, timings = future.result()
+                except Exception as e:
+                    task_errors, timings = [str(e)], []
+                errors[index] = task_errors
+                self.timings.extend(timings)
+
+        # Report errors in task order
+        return [error for index in sorted(errors) for error in errors[index]]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def task_dependencies(cls, tasks):
+        """
+            Determines the dependencies between CSV import tasks: a task
+            depends on any previous task that targets any table which it
+            targets itself, references, or has components in (and any
+            table referenced by those components)
+
+            Args:
+                tasks: the list of CSV import tasks
+
+            Returns:
+                a dict {index: set of indexes of tasks it depends on}
+
+            Note:
+                The dependencies are derived from the table structure
+                only, i.e. they do not cover tables written to by
+                onaccept/onvalidation callbacks (e.g. an update of
+                a shared parent record), or by stylesheets creating
+                records in unrelated tables; such imports must not be
+                placed in the same parallel stage
+        """
+
+        scopes = []
+        dependencies = {}
+        for index, task in enumerate(tasks):
+            tablename = "%s_%s" % (task[1], task[2])
+            scope = cls.table_scope(tablename)
+            dependencies[index] = {i for i, other in enumerate(scopes)
+                                   if scope & other
+                                   }
+            scopes.append(scope)
+
+        return dependencies
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def table_scope(tablename):
+        """
+            Determines the tables an import into a table may write to or
+            read from (excluding super-entities and meta-field references,
+            which are shared by virtually all tables)
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                a set of table names
+        """
+
+        from ..model import META_FIELD_NAMES
+
+        s3db = current.s3db
+
+        def references(table):
+            tablenames = set()
+            for fieldname in table.fields:
+                if fieldname in META_FIELD_NAMES:
+                    continue
+                ktablename = s3_get_foreign_key(table[fieldname])[0]
+                if not ktablename:
+                    continue
+                ktable = s3db.table(ktablename)
+                if ktable is not None and "instance_type" in ktable.fields:
+                    # Super-entity
+                    continue
+                tablenames.add(ktablename)
+            return tablenames
+
+        scope = {tablename}
+
+        table = s3db.table(tablename)
+        if table is None:
+            return scope
+        scope |= references(table)
+
+        components = s3db.get_components(table)
+        for alias in components:
+            component = components[alias]
+            ctable = component.table
+            if "instance_type" in ctable.fields:
+                continue
+            scope.add(component.tablename)
+            scope |= references(ctable)
+            linktable = component.linktable
+            if linktable is not None:
+                scope.add(linktable._tablename)
+
+        return scope
+
     # -------------------------------------------------------------------------
     # Task Config Parser
     #
@@ -186,6 +464,7 @@ class BulkImporter:
 
             Returns:
                 - the task as tuple (type, *params)
+                - (3,) to start a parallel stage
                 - (None, error) if the line is invalid
         """
 
@@ -194,6 +473,9 @@ class BulkImporter:
         if line and line[0] == "*":
             # Import using BulkImporter handler (*,handler,filename,args)
             handler, filename = (line + EMPTYLINE)[1:3]
+            if handler == "parallel":
+                # Start of a parallel stage (*,parallel)
+                return (3,)
             if not handler or filename is None:
                 return (None, "Missing argument(s) in task %s (line ignored)" % str(line))
 
@@ -234,7 +516,16 @@ class BulkImporter:
     # Import Handlers
     #
     @classmethod
-    def import_csv(cls, prefix, name, csv_path, xslt_path, extra_data=None):
+    def import_csv(cls,
+                   prefix,
+                   name,
+                   csv_path,
+                   xslt_path,
+                   extra_data = None,
+                   bulk = None,
+                   onaccept = True,
+                   chunk_size = None,
+                   ):
         """
             Imports CSV data, using S3CSV transformation stylesheet
 
@@ -246,6 +537,12 @@ class BulkImporter:
                 xslt_path: the path to the transformation stylesheet, a local
                            file system path, or a http/https URL
                 extra_data: extra data to add to the CSV (as JSON string)
+                bulk: use bulk import mode, defaults to the
+                      base.import_bulk deployment setting
+                onaccept: run the onaccept-callbacks for imported records
+                chunk_size: read and import the CSV in chunks of this number
+                            of rows, defaults to the base.import_chunk_size
+                            deployment setting
 
             Returns:
                 error message(s) on failure, otherwise None
@@ -253,6 +550,12 @@ class BulkImporter:
 
         current.auth.ignore_min_password_length()
 
+        settings = current.deployment_settings
+        if bulk is None:
+            bulk = settings.get_base_import_bulk()
+        if chunk_size is None:
+            chunk_size = settings.get_base_import_chunk_size()
+
         s3db = current.s3db
 
         # Customise and instantiate the resource
@@ -297,6 +600,9 @@ class BulkImporter:
                                              source_type = "csv",
                                              stylesheet = xslt_path,
                                              extra_data = extra_data,
+                                             bulk = bulk,
+                                             onaccept = onaccept,
+                                             chunk_size = chunk_size,
                                              )
         except IOError as e:
             return str(e)
@@ -0,0 +1,218 @@
+"""
+    Cache Generations
+
+    Copyright: 2024 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("CacheGenerations",
+           "after_transaction",
+           )
+
+import sys
+import threading
+
+from collections import OrderedDict
+
+from gluon import current
+
+# =============================================================================
+def after_transaction(callback, key=None):
+    """
+        Register a callback to run at the end of the current database
+        transaction, i.e. after commit or rollback
+
+        Args:
+            callback: the callback, a function without parameters
+            key: a key to register the callback under, so that it runs
+                 only once per transaction even if registered repeatedly
+
+        Note:
+            If there is no database connection, the callback is run
+            immediately
+    """
+
+    db = getattr(current, "db", None)
+    adapter = getattr(db, "_adapter", None) if db else None
+    if adapter is None:
+        callback()
+        return
+
+    pending = getattr(adapter, "_after_transaction", None)
+    if pending is None:
+        pending = adapter._after_transaction = OrderedDict()
+
+        # Both explicit and end-of-request commits/rollbacks go through
+        # these adapter methods, so wrap them on the adapter instance
+        def wrap(method):
+            def end_transaction(*args, **kwargs):
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    callbacks = list(pending.values())
+                    pending.clear()
+                    for cb in callbacks:
+                        try:
+                            cb()
+                        except Exception:
+                            current.log.error(sys.exc_info()[1])
+            return end_transaction
+
+        adapter.commit = wrap(adapter.commit)
+        adapter.rollback = wrap(adapter.rollback)
+
+    pending[key if key is not None else object()] = callback
+
+# =============================================================================
+class CacheGenerations:
+    """
+        Generation counters for process-wide caches that must be
+        invalidated when the underlying database records change
+
+        - the generation is a tuple (shared, local), where the shared
+          counter is kept in the disk cache (if enabled) to propagate
+          invalidations across worker processes
+        - invalidate() bumps the local counter immediately, and again
+          after the end of the transaction - together with the shared
+          counter, once per key and transaction
+        - cache users must capture the generation *before* reading the
+          data, and store cache entries with that generation, so that
+          entries built from data read while another transaction was
+          still pending (or was rolled back) are discarded
+    """
+
+    def __init__(self, name, shared=None):
+        """
+            Args:
+                name: the cache name, used for the disk cache keys
+                shared: function returning True if invalidations shall
+                        be propagated across processes (disk cache)
+        """
+
+        self.name = name
+        self.shared = shared
+
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    # -------------------------------------------------------------------------
+    def is_shared(self):
+        """
+            Check whether invalidations are propagated across processes
+
+            Returns:
+                boolean
+        """
+
+        shared = self.shared
+        return bool(shared()) if callable(shared) else bool(shared)
+
+    # -------------------------------------------------------------------------
+    def cache_key(self, key):
+        """
+            The disk cache key for the shared counter
+
+            Args:
+                key: the generation key
+
+            Returns:
+                the disk cache key (str)
+        """
+
+        return "%s_%s" % (self.name, key) if key is not None else self.name
+
+    # -------------------------------------------------------------------------
+    def get(self, key=None):
+        """
+            Get the current generation
+
+            Args:
+                key: the generation key (e.g. a table name)
+
+            Returns:
+                the generation, tuple (shared, local)
+        """
+
+        if self.is_shared():
+            shared = current.cache.disk(self.cache_key(key),
+                                        lambda: 0,
+                                        time_expire = None,
+                                        )
+        else:
+            shared = 0
+
+        return (shared, self.counters.get(key, 0))
+
+    # -------------------------------------------------------------------------
+    def bump(self, key=None):
+        """
+            Bump the local counter
+
+            Args:
+                key: the generation key
+        """
+
+        with self.lock:
+            counters = self.counters
+            counters[key] = counters.get(key, 0) + 1
+
+    # -------------------------------------------------------------------------
+    def invalidate(self, key=None):
+        """
+            Invalidate all cache entries of a generation key; to be
+            called when the underlying data are written
+
+            Args:
+                key: the generation key
+        """
+
+        # Prevent caching of data read inside the current transaction
+        self.bump(key)
+
+        def invalidate():
+            self.bump(key)
+            if self.is_shared():
+                current.cache.disk.increment(self.cache_key(key))
+
+        after_transaction(invalidate, key=(id(self), key))
+
+    # -------------------------------------------------------------------------
+    def attach(self, table, key=None, insert=True):
+        """
+            Attach callbacks to a table to invalidate a generation key
+            whenever records are written
+
+            Args:
+                table: the Table
+                key: the generation key
+                insert: also invalidate when records are inserted
+        """
+
+        invalidate = self.invalidate
+
+        if insert:
+            table._after_insert.append(lambda fields, record_id: invalidate(key))
+        table._after_update.append(lambda s, fields: invalidate(key))
+        table._after_delete.append(lambda s: invalidate(key))
+
+# END =========================================================================
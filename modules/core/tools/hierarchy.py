@@ -26,17 +26,336 @@
 """
 
 __all__ = ("S3Hierarchy",
+           "HierarchyCache",
            )
 
+import threading
+
+from array import array
+
 from gluon import current, LI, UL
 from gluon.storage import Storage
 from gluon.tools import callback
 
 from .represent import S3Represent
 from .convert import s3_str
+from .generations import CacheGenerations
 
 DEFAULT = lambda: None
 
+# =============================================================================
+class HierarchyStore:
+    """
+        Compact read-only representation of the nodes of a stored
+        hierarchy, to be shared across requests (see HierarchyCache)
+
+        - parent IDs and categories per node in arrays, indexed by the
+          position of the node
+        - child IDs in a flat array, with per-node offsets (CSR layout)
+    """
+
+    __slots__ = ("index", "parents", "categories", "offsets", "children")
+
+    def __init__(self, nodes):
+        """
+            Args:
+                nodes: the nodes as stored in s3_hierarchy, a dict
+                       {node_id: {"p": parent_id, "c": category,
+                                  "s": [child_id, ...]}}
+        """
+
+        index = {}
+        parents = array("q")
+        categories = []
+        offsets = array("q", [0])
+        children = array("q")
+
+        for position, (node_id, item) in enumerate(nodes.items()):
+            index[int(node_id)] = position
+            parents.append(item["p"] or 0)
+            categories.append(item["c"])
+            if item["s"]:
+                children.extend(item["s"])
+            offsets.append(len(children))
+
+        self.index = index
+        self.parents = parents
+        self.categories = categories
+        self.offsets = offsets
+        self.children = children
+
+    # -------------------------------------------------------------------------
+    def __len__(self):
+
+        return len(self.index)
+
+    # -------------------------------------------------------------------------
+    def __contains__(self, node_id):
+
+        return node_id in self.index
+
+    # -------------------------------------------------------------------------
+    def keys(self):
+        """ The IDs of all nodes """
+
+        return self.index.keys()
+
+    # -------------------------------------------------------------------------
+    def node(self, node_id):
+        """
+            Get a node as dict
+
+            Args:
+                node_id: the node ID
+
+            Returns:
+                a new dict {"p": parent_id, "c": category, "s": set of
+                child IDs}, or None if the node does not exist
+        """
+
+        position = self.index.get(node_id)
+        if position is None:
+            return None
+
+        offsets = self.offsets
+        start, end = offsets[position], offsets[position + 1]
+
+        return {"p": self.parents[position] or None,
+                "c": self.categories[position],
+                "s": set(self.children[start:end]),
+                }
+
+# =============================================================================
+class HierarchyNodes(dict):
+    """
+        The nodes dict of a hierarchy, can be backed by a (shared)
+        HierarchyStore from which nodes are copied on first access,
+        so that changes (and labels) only ever affect this dict
+    """
+
+    def __init__(self):
+
+        super().__init__()
+
+        self.store = None
+        self.removed = set()
+
+    # -------------------------------------------------------------------------
+    def attach(self, store):
+        """
+            Replace all nodes with the nodes from a store
+
+            Args:
+                store: the HierarchyStore
+        """
+
+        dict.clear(self)
+        self.store = store
+        self.removed = set()
+
+    # -------------------------------------------------------------------------
+    def fetch(self, node_id):
+        """
+            Copy a node from the store
+
+            Args:
+                node_id: the node ID
+
+            Returns:
+                the node dict, or None if not found in the store
+        """
+
+        store = self.store
+        if store is None or node_id in self.removed:
+            return None
+
+        node = store.node(node_id)
+        if node is not None:
+            dict.__setitem__(self, node_id, node)
+        return node
+
+    # -------------------------------------------------------------------------
+    def materialize(self):
+        """ Copy all remaining nodes from the store, and detach it """
+
+        store = self.store
+        if store is None:
+            return
+
+        removed = self.removed
+        for node_id in store.keys():
+            if node_id not in removed and not dict.__contains__(self, node_id):
+                dict.__setitem__(self, node_id, store.node(node_id))
+
+        self.store = None
+        self.removed = set()
+
+    # -------------------------------------------------------------------------
+    def __missing__(self, node_id):
+
+        node = self.fetch(node_id)
+        if node is None:
+            raise KeyError(node_id)
+        return node
+
+    def __contains__(self, node_id):
+
+        if dict.__contains__(self, node_id):
+            return True
+        store = self.store
+        return store is not None and \
+               node_id not in self.removed and node_id in store
+
+    def get(self, node_id, default=None):
+
+        if dict.__contains__(self, node_id):
+            return dict.__getitem__(self, node_id)
+        node = self.fetch(node_id)
+        return default if node is None else node
+
+    def __setitem__(self, node_id, node):
+
+        self.removed.discard(node_id)
+        dict.__setitem__(self, node_id, node)
+
+    def __delitem__(self, node_id):
+
+        if node_id not in self:
+            raise KeyError(node_id)
+        dict.pop(self, node_id, None)
+        if self.store is not None:
+            self.removed.add(node_id)
+
+    def clear(self):
+
+        dict.clear(self)
+        self.store = None
+        self.removed = set()
+
+    # -------------------------------------------------------------------------
+    # Iteration requires all nodes
+    #
+    def __iter__(self):
+        self.materialize()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.materialize()
+        return dict.__len__(self)
+
+    def __bool__(self):
+        return self.__len__() > 0
+
+    def keys(self):
+        self.materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self.materialize()
+        return dict.values(self)
+
+    def items(self):
+        self.materialize()
+        return dict.items(self)
+
+# =============================================================================
+class HierarchyCache:
+    """
+        Process-wide cache for stored hierarchies, to avoid re-loading
+        and decoding the complete hierarchy for every request
+
+        - entries are keyed by tablename, and stamped with the record ID
+          and version of the s3_hierarchy record they have been loaded
+          from, so that updates by other processes are detected
+        - S3Hierarchy.dirty bumps the generation for the table, which
+          invalidates the entry in this process immediately, and again
+          after the end of the transaction (see CacheGenerations)
+    """
+
+    lock = threading.RLock()
+
+    entries = {}
+    generations = CacheGenerations("hierarchy_cache")
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def generation(cls, tablename):
+        """
+            Get the current cache generation for a table; to be captured
+            before loading the hierarchy from the database
+
+            Args:
+                tablename: the tablename
+
+            Returns:
+                the generation
+        """
+
+        return cls.generations.get(tablename)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get(cls, tablename, stamp, generation):
+        """
+            Look up a stored hierarchy
+
+            Args:
+                tablename: the tablename
+                stamp: the current stamp of the s3_hierarchy record
+                generation: the current generation
+
+            Returns:
+                the HierarchyStore, or None if not found or outdated
+        """
+
+        if not current.deployment_settings.get_base_hierarchy_cache():
+            return None
+
+        with cls.lock:
+            entry = cls.entries.get(tablename)
+            if entry is not None:
+                entry_generation, entry_stamp, store = entry
+                if entry_generation == generation and entry_stamp == stamp:
+                    return store
+                del cls.entries[tablename]
+        return None
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def store(cls, tablename, stamp, store, generation):
+        """
+            Add a stored hierarchy to the cache
+
+            Args:
+                tablename: the tablename
+                stamp: the stamp of the s3_hierarchy record
+                store: the HierarchyStore
+                generation: the generation captured before loading
+        """
+
+        if not current.deployment_settings.get_base_hierarchy_cache():
+            return
+
+        with cls.lock:
+            cls.entries[tablename] = (generation, stamp, store)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, tablename=None):
+        """
+            Invalidate cached hierarchies
+
+            Args:
+                tablename: the tablename, None for all tables
+        """
+
+        with cls.lock:
+            tablenames = [tablename] if tablename else list(cls.entries)
+            for tn in tablenames:
+                cls.entries.pop(tn, None)
+        for tn in tablenames:
+            cls.generations.invalidate(tn)
+
 # =============================================================================
 class S3Hierarchy:
     """ Class representing an object hierarchy """
@@ -209,14 +528,14 @@ class S3Hierarchy:
                 self.__theset = hierarchy["nodes"]
                 self.__flags = hierarchy["flags"]
             else:
-                self.__theset = dict()
+                self.__theset = HierarchyNodes()
                 self.__flags = dict()
                 self.load()
                 hierarchy = {"nodes": self.__theset,
                              "flags": self.__flags}
                 hierarchies[tablename] = hierarchy
         else:
-            self.__theset = dict()
+            self.__theset = HierarchyNodes()
             self.__flags = dict()
         return
 
@@ -258,21 +577,26 @@ class S3Hierarchy:
             self.__status(dirty=True)
             return
 
+        db = current.db
         htable = current.s3db.s3_hierarchy
+        generation = HierarchyCache.generation(tablename)
         query = (htable.tablename == tablename)
-        row = current.db(query).select(htable.dirty,
-                                       htable.hierarchy,
-                                       limitby = (0, 1)
-                                       ).first()
+        row = db(query).select(htable.id,
+                               htable.dirty,
+                               htable.version,
+                               limitby = (0, 1)
+                               ).first()
         if row and not row.dirty:
-            data = row.hierarchy
-            theset = self.__theset
-            theset.clear()
-            for node_id, item in data["nodes"].items():
-                theset[int(node_id)] = {"p": item["p"],
-                                        "c": item["c"],
-                                        "s": set(item["s"]) \
-                                             if item["s"] else set()}
+            # Use the cached hierarchy if it is still current
+            stamp = (row.id, row.version)
+            store = HierarchyCache.get(tablename, stamp, generation)
+            if store is None:
+                data = db(htable.id == row.id).select(htable.hierarchy,
+                                                      limitby = (0, 1)
+                                                      ).first().hierarchy
+                store = HierarchyStore(data["nodes"])
+                HierarchyCache.store(tablename, stamp, store, generation)
+            self.__theset.attach(store)
             self.__status(dirty = False,
                           dbupdate = None,
                           dbstatus = True)
@@ -310,15 +634,17 @@ class S3Hierarchy:
                 }
 
         # Get current entry
+        db = current.db
         htable = current.s3db.s3_hierarchy
         query = (htable.tablename == tablename)
-        row = current.db(query).select(htable.id,
-                                       limitby = (0, 1)
-                                       ).first()
+        row = db(query).select(htable.id,
+                               limitby = (0, 1)
+                               ).first()
 
         if row:
-            # Update record
-            row.update_record(**data)
+            # Update record, increment the version
+            data["version"] = htable.version.coalesce(0) + 1
+            db(htable.id == row.id).update(**data)
         else:
             # Create new record
             htable.insert(**data)
@@ -346,13 +672,15 @@ class S3Hierarchy:
         if not config:
             return
 
+        HierarchyCache.invalidate(tablename)
+
         hierarchies = current.model["hierarchies"]
         if tablename in hierarchies:
             hierarchy = hierarchies[tablename]
             flags = hierarchy["flags"]
         else:
             flags = {}
-            hierarchies[tablename] = {"nodes": dict(),
+            hierarchies[tablename] = {"nodes": HierarchyNodes(),
                                       "flags": flags}
         flags["dirty"] = True
 
@@ -366,7 +694,10 @@ class S3Hierarchy:
             if not row:
                 htable.insert(tablename=tablename, dirty=True)
             elif not row.dirty:
-                row.update_record(dirty=True)
+                version = htable.version.coalesce(0) + 1
+                current.db(htable.id == row.id).update(dirty = True,
+                                                       version = version,
+                                                       )
             flags["dbstatus"] = False
         return
 
@@ -26,6 +26,7 @@
 """
 
 __all__ = ("BooleanRepresent",
+           "RepresentCache",
            "S3Represent",
            "S3RepresentLazy",
            "S3PriorityRepresent",
@@ -55,7 +56,9 @@ __all__ = ("BooleanRepresent",
 import os
 import re
 import sys
+import threading
 
+from collections import OrderedDict
 from itertools import chain
 
 from gluon import current, A, DIV, I, IMG, IS_URL, SPAN, TAG, URL, XML
@@ -63,6 +66,7 @@ from gluon.storage import Storage
 from gluon.languages import lazyT
 
 from .convert import s3_str
+from .generations import CacheGenerations
 from .utils import MarkupStripper, luminance
 
 URLSCHEMA = re.compile(r"((?:(())(www\.([^/?#\s]*))|((http(s)?|ftp):)"
@@ -101,7 +105,8 @@ class S3Represent:
                  default = None,
                  none = None,
                  color = None,
-                 field_sep = " "
+                 field_sep = " ",
+                 cache = None,
                  ):
         """
             Args:
@@ -126,6 +131,9 @@ class S3Represent:
                 color: field for color-code in lookup table, activates
                        color-coded representation
                 field_sep: separator to use to join fields
+                cache: use the process-wide RepresentCache for lookups,
+                       None to use the deployment setting for the lookup
+                       table (settings.base.represent_cache)
         """
 
         self.tablename = lookup
@@ -143,6 +151,7 @@ class S3Represent:
         self.none = none
         self.color = color
         self.field_sep = field_sep
+        self.cache = cache
         self.setup = False
         self.theset = None
         self.queries = 0
@@ -151,6 +160,8 @@ class S3Represent:
 
         self.rows = {}
 
+        self.ckey = None
+
         self.clabels = None
         self.slabels = None
         self.htemplate = None
@@ -524,8 +535,70 @@ class S3Represent:
         else:
             self.htemplate = "%s > %s"
 
+        # Process-wide representation cache
+        if self.table is not None:
+            cache = self.cache
+            if cache is None:
+                cache = RepresentCache.enabled(self.tablename)
+            if cache and self.show_link and \
+               type(self).link is not S3Represent.link:
+                # Custom links may require the looked-up rows
+                cache = False
+            if cache:
+                self.ckey = self._cache_key()
+
         self.setup = True
 
+    # -------------------------------------------------------------------------
+    def _cache_key(self):
+        """
+            Generate a key for this representer's configuration, to look
+            up representations in the process-wide cache
+
+            Returns:
+                a tuple, or None if the configuration can not be
+                expressed as a key (=representations not cacheable)
+        """
+
+        if self.custom_lookup:
+            # Custom lookups may read other tables than the lookup
+            # table, whose changes would not invalidate the cache
+            return None
+
+        skip = ("table", "theset", "rows", "lazy", "queries", "setup",
+                "cache", "ckey", "slabels", "clabels", "custom_lookup",
+                "default", "none", "linkto", "show_link", "lazy_show_link",
+                "__code__", "__defaults__",
+                )
+        simple = (str, int, float, bool, type(None))
+
+        cls = type(self)
+        key = ["%s.%s" % (cls.__module__, cls.__qualname__),
+               current.T.accepted_language,
+               ]
+
+        for name, value in sorted(self.__dict__.items()):
+            if name in skip:
+                continue
+            if isinstance(value, lazyT):
+                value = value.m
+            elif isinstance(value, (tuple, list)):
+                if not all(isinstance(v, simple) for v in value):
+                    return None
+                value = tuple(value)
+            elif callable(value):
+                func = getattr(value, "__func__", value)
+                code = getattr(func, "__code__", None)
+                if code is None or getattr(func, "__closure__", None):
+                    # Can not tell apart different instances
+                    return None
+                value = (code.co_filename, code.co_firstlineno, func.__qualname__)
+            elif not isinstance(value, simple):
+                return None
+            key.append((name, value))
+
+        return tuple(key)
+
     # -------------------------------------------------------------------------
     def _lookup(self, values, rows=None):
         """
@@ -563,6 +636,22 @@ class S3Represent:
         if table is None or not lookup:
             return items
 
+        # Check the process-wide cache
+        ckey = self.ckey
+        if ckey:
+            tablename = self.tablename
+            generation = RepresentCache.generation(tablename)
+            cached = RepresentCache.get(tablename,
+                                        ckey,
+                                        list(lookup.keys()),
+                                        generation = generation,
+                                        )
+            for k, v in cached.items():
+                del lookup[k]
+                items[keys.get(k, k)] = theset[k] = v
+            if not lookup:
+                return items
+
         if table and self.hierarchy:
             # Does the lookup table have a hierarchy?
             from ..tools import S3Hierarchy
@@ -640,6 +729,14 @@ class S3Represent:
                     lookup.pop(k, None)
                     items[keys.get(k, k)] = theset[k] = represent_row(row)
 
+            # Add the new representations to the process-wide cache
+            if ckey:
+                RepresentCache.store(tablename,
+                                     ckey,
+                                     {k: theset[k] for k in rows if k in theset},
+                                     generation,
+                                     )
+
         # Anything left gets set to default
         if lookup:
             for k in lookup:
@@ -684,6 +781,232 @@ class S3Represent:
         theset[value] = result
         return result
 
+# =============================================================================
+class RepresentCache:
+    """
+        Process-wide cache for foreign key representations, to share
+        S3Represent lookup results across requests
+
+        - entries are keyed by (representer config, language, value),
+          where the representer config is derived from the S3Represent
+          instance (class, lookup table, key, fields, labels...)
+        - number of entries is limited (least-recently-used eviction)
+        - entries for a lookup table are invalidated whenever records
+          in that table are updated or deleted (via DAL callbacks that
+          are attached when the table is defined), and again after the
+          end of the writing transaction (see CacheGenerations)
+        - with settings.base.represent_cache_shared, invalidations are
+          propagated across worker processes through the disk cache
+
+        Note:
+            Caching must be enabled per lookup table in deployment
+            settings, e.g.:
+
+                settings.base.represent_cache = ("org_organisation",
+                                                 "gis_location",
+                                                 )
+    """
+
+    lock = threading.RLock()
+
+    entries = OrderedDict()
+    generations = CacheGenerations("represent_cache",
+                                   shared = lambda: current.deployment_settings \
+                                                           .get_base_represent_cache_shared(),
+                                   )
+
+    hits = {}
+    misses = {}
+    evictions = 0
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def enabled(tablename):
+        """
+            Check whether representation caching is enabled for a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                boolean
+        """
+
+        setting = current.deployment_settings.get_base_represent_cache()
+        if isinstance(setting, (tuple, list, set)):
+            return tablename in setting
+        return bool(setting)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def generation(cls, tablename):
+        """
+            Get the current cache generation for a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                the generation
+
+            Note:
+                Callers must capture the generation before looking up the
+                representations in the database, and store them with it
+        """
+
+        return cls.generations.get(tablename)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get(cls, tablename, ckey, values, generation=None):
+        """
+            Look up cached representations
+
+            Args:
+                tablename: the lookup table name
+                ckey: the representer config key
+                values: the values to look up
+                generation: the current generation (if already known)
+
+            Returns:
+                dict {value: representation} for all values found in
+                the cache
+        """
+
+        if generation is None:
+            generation = cls.generation(tablename)
+
+        found = {}
+
+        with cls.lock:
+            entries = cls.entries
+            for value in values:
+                key = (ckey, value)
+                entry = entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] != generation:
+                    # Outdated
+                    del entries[key]
+                    continue
+                entries.move_to_end(key)
+                found[value] = entry[1]
+
+            hits = len(found)
+            cls.hits[tablename] = cls.hits.get(tablename, 0) + hits
+            cls.misses[tablename] = cls.misses.get(tablename, 0) + \
+                                    len(values) - hits
+        return found
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def store(cls, tablename, ckey, items, generation):
+        """
+            Add representations to the cache
+
+            Args:
+                tablename: the lookup table name
+                ckey: the representer config key
+                items: dict {value: representation}
+                generation: the generation captured before the lookup
+
+            Note:
+                Only text representations are cached, any markup
+                (e.g. color-coded representations) is skipped
+        """
+
+        maxsize = current.deployment_settings.get_base_represent_cache_size()
+
+        with cls.lock:
+            entries = cls.entries
+            for value, label in items.items():
+                if isinstance(label, lazyT):
+                    label = s3_str(label)
+                elif not isinstance(label, str):
+                    continue
+                key = (ckey, value)
+                entries[key] = (generation, label)
+                entries.move_to_end(key)
+
+            # LRU eviction
+            excess = len(entries) - maxsize
+            if excess > 0:
+                popitem = entries.popitem
+                for _ in range(excess):
+                    popitem(last=False)
+                cls.evictions += excess
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, tablename):
+        """
+            Invalidate all cached representations from a lookup table,
+            both immediately and after the end of the current transaction
+
+            Args:
+                tablename: the table name
+        """
+
+        cls.generations.invalidate(tablename)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def clear(cls):
+        """
+            Remove all entries from the cache, and reset the counters
+        """
+
+        with cls.lock:
+            cls.entries.clear()
+            cls.hits.clear()
+            cls.misses.clear()
+            cls.evictions = 0
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def attach(cls, table):
+        """
+            Attach invalidation callbacks to a lookup table; to be called
+            when the table is defined (on_define)
+
+            Args:
+                table: the Table
+        """
+
+        # Inserts do not affect cached representations, but updates
+        # and (soft-)deletions do
+        cls.generations.attach(table, table._tablename, insert=False)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def stats(cls, tablename=None):
+        """
+            Cache statistics, for performance monitoring
+
+            Args:
+                tablename: limit hit/miss counters to this table
+
+            Returns:
+                dict {"hits": number of cache hits,
+                      "misses": number of cache misses,
+                      "size": current number of entries,
+                      "evictions": number of LRU evictions,
+                      }
+        """
+
+        with cls.lock:
+            if tablename:
+                hits = cls.hits.get(tablename, 0)
+                misses = cls.misses.get(tablename, 0)
+            else:
+                hits = sum(cls.hits.values())
+                misses = sum(cls.misses.values())
+            return {"hits": hits,
+                    "misses": misses,
+                    "size": len(cls.entries),
+                    "evictions": cls.evictions,
+                    }
+
 # =============================================================================
 class S3RepresentLazy:
     """
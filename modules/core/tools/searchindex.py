@@ -0,0 +1,472 @@
+"""
+    Accent-insensitive Text Search Index
+
+    Copyright: 2024 (c) Sahana Software Foundation
+
+    Permission is hereby granted, free of charge, to any person
+    obtaining a copy of this software and associated documentation
+    files (the "Software"), to deal in the Software without
+    restriction, including without limitation the rights to use,
+    copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the
+    Software is furnished to do so, subject to the following
+    conditions:
+
+    The above copyright notice and this permission notice shall be
+    included in all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+    EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+    OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+    NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+    HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+    WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+    OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+__all__ = ("SearchIndex",
+           )
+
+import unicodedata
+
+from gluon import current
+
+from s3dal import Field, original_tablename
+
+from .convert import s3_str
+
+# =============================================================================
+class SearchIndex:
+    """
+        Index of normalized (unaccented, case-folded) text field values,
+        to run accent-insensitive LIKE searches without having to scan
+        (and REGEXP-match) the original table
+
+        - the index is a shadow table holding one normalized value per
+          record and indexed field, maintained by DAL callbacks that
+          are attached when the indexed table is defined
+        - LIKE-queries for indexed fields are translated into sub-selects
+          from the index table
+        - the index table itself is indexed for substring searches with
+          a trigram index (pg_trgm) on PostgreSQL, and an FTS5 trigram
+          table on SQLite (where available)
+
+        Note:
+            Fields to index must be configured in deployment settings, e.g.:
+
+                settings.database.search_index = {
+                    "pr_person": ("first_name", "middle_name", "last_name"),
+                    "org_organisation": ("name", "acronym"),
+                    }
+
+            The database indexes are created during the first run; when
+            enabling the search index for an existing database, run
+            SearchIndex.create_indexes() and SearchIndex.rebuild() once.
+    """
+
+    TABLENAME = "s3_search_index"
+    FTS_TABLENAME = "s3_search_index_fts"
+
+    # Characters without decomposition (for NFKD)
+    SPECIAL = str.maketrans({"ø": "o", "Ø": "O",
+                             "đ": "d", "Đ": "D",
+                             "ð": "d", "Ð": "D",
+                             "ł": "l", "Ł": "L",
+                             "æ": "ae", "Æ": "AE",
+                             "œ": "oe", "Œ": "OE",
+                             "ı": "i",
+                             })
+
+    # Whether the FTS table exists (SQLite only, checked once per process)
+    fts = None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def fields(tablename):
+        """
+            Get the indexed fields for a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                tuple of field names
+        """
+
+        setting = current.deployment_settings.get_database_search_index()
+        return tuple(setting.get(tablename, ())) if setting else ()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def enabled(cls, tablename):
+        """
+            Check whether a table has indexed fields
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                boolean
+        """
+
+        return bool(cls.fields(tablename))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def normalize(cls, text):
+        """
+            Normalize a text for indexing or search, i.e. remove diacritics
+            and fold case
+
+            Args:
+                text: the text
+
+            Returns:
+                the normalized text (str)
+        """
+
+        text = unicodedata.normalize("NFKD", s3_str(text))
+        text = "".join(c for c in text if not unicodedata.combining(c))
+
+        return text.translate(cls.SPECIAL).casefold()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def table(cls):
+        """
+            Get the index table, define it if necessary
+
+            Returns:
+                Table
+        """
+
+        db = current.db
+
+        tablename = cls.TABLENAME
+        if tablename not in db:
+            db.define_table(tablename,
+                            Field("tablename", length=64),
+                            Field("record_id", "integer"),
+                            Field("fieldname", length=64),
+                            Field("value", "text"),
+                            migrate = current.deployment_settings.get_base_migrate(),
+                            )
+        return db[tablename]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def like(cls, field, value):
+        """
+            Construct a LIKE query using the search index
+
+            Args:
+                field: the Field
+                value: the search string, can contain wildcards (%, _)
+
+            Returns:
+                a Query, or None if the field is not indexed
+        """
+
+        table = field.table
+        tablename = original_tablename(table)
+        if field.name not in cls.fields(tablename):
+            return None
+
+        pattern = cls.normalize(value)
+
+        itable = cls.table()
+        query = (itable.tablename == tablename) & \
+                (itable.fieldname == field.name)
+
+        db = current.db
+        if cls.has_fts():
+            # Match against the FTS table
+            sql = "SELECT rowid FROM %s WHERE value LIKE %s;" % \
+                  (cls.FTS_TABLENAME, db._adapter.represent(pattern, "string"))
+            query &= itable.id.belongs(sql)
+        else:
+            query &= itable.value.like(pattern)
+
+        return table._id.belongs(db(query)._select(itable.record_id))
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def has_fts(cls):
+        """
+            Check whether the FTS table exists (SQLite)
+
+            Returns:
+                boolean
+        """
+
+        fts = cls.fts
+        if fts is None:
+            if current.deployment_settings.get_database_type() == "sqlite":
+                db = current.db
+                rows = db.executesql("SELECT name FROM sqlite_master "
+                                     "WHERE type='table' AND name='%s';" % cls.FTS_TABLENAME)
+                fts = bool(rows)
+            else:
+                fts = False
+            cls.fts = fts
+
+        return fts
+
+    # -------------------------------------------------------------------------
+    # Index maintenance
+    # -------------------------------------------------------------------------
+    @classmethod
+    def attach(cls, table):
+        """
+            Attach index maintenance callbacks to a table; to be called
+            when the table is defined (on_define)
+
+            Args:
+                table: the Table
+        """
+
+        tablename = original_tablename(table)
+        fieldnames = [fn for fn in cls.fields(tablename) if fn in table.fields]
+        if not fieldnames:
+            return
+
+        def after_insert(fields, record_id):
+            values = {fn: fields.get(fn) for fn in fieldnames}
+            cls.update(tablename, [record_id], values)
+
+        def before_update(dbset, fields):
+            # Remember the affected records (the set may no longer match
+            # them after the update)
+            if any(fn in fields for fn in fieldnames):
+                rows = dbset.select(table._id)
+                dbset._search_index_ids = [row[table._id.name] for row in rows]
+            # Must not return True (would cancel the update)
+            return False
+
+        def after_update(dbset, fields):
+            record_ids = getattr(dbset, "_search_index_ids", None)
+            if record_ids:
+                del dbset._search_index_ids
+                cls.reindex(table, record_ids, fieldnames)
+
+        def before_delete(dbset):
+            rows = dbset.select(table._id)
+            cls.remove(tablename, [row[table._id.name] for row in rows])
+            return False
+
+        table._after_insert.append(after_insert)
+        table._before_update.append(before_update)
+        table._after_update.append(after_update)
+        table._before_delete.append(before_delete)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def update(cls, tablename, record_ids, values):
+        """
+            Update the index entries for records
+
+            Args:
+                tablename: the table name
+                record_ids: the record IDs
+                values: dict {fieldname: value} (same for all records)
+        """
+
+        if not record_ids:
+            return
+
+        itable = cls.table()
+        query = (itable.tablename == tablename) & \
+                (itable.record_id.belongs(record_ids)) & \
+                (itable.fieldname.belongs(list(values)))
+        current.db(query).delete()
+
+        normalize = cls.normalize
+        items = [{"tablename": tablename,
+                  "record_id": record_id,
+                  "fieldname": fieldname,
+                  "value": normalize(value),
+                  }
+                 for record_id in record_ids
+                 for fieldname, value in values.items()
+                 if value not in (None, "")
+                 ]
+        if items:
+            itable.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def reindex(cls, table, record_ids, fieldnames):
+        """
+            Update the index entries for records from their current values
+
+            Args:
+                table: the Table
+                record_ids: the record IDs
+                fieldnames: the names of the indexed fields
+        """
+
+        tablename = original_tablename(table)
+
+        itable = cls.table()
+        query = (itable.tablename == tablename) & \
+                (itable.record_id.belongs(record_ids)) & \
+                (itable.fieldname.belongs(fieldnames))
+
+        db = current.db
+        db(query).delete()
+
+        pkey = table._id
+        fields = [table[fn] for fn in fieldnames]
+        rows = db(pkey.belongs(record_ids)).select(pkey, *fields)
+
+        normalize = cls.normalize
+        items = [{"tablename": tablename,
+                  "record_id": row[pkey.name],
+                  "fieldname": fieldname,
+                  "value": normalize(row[fieldname]),
+                  }
+                 for row in rows
+                 for fieldname in fieldnames
+                 if row[fieldname] not in (None, "")
+                 ]
+        if items:
+            itable.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def remove(cls, tablename, record_ids):
+        """
+            Remove all index entries for records
+
+            Args:
+                tablename: the table name
+                record_ids: the record IDs
+        """
+
+        if not record_ids:
+            return
+
+        itable = cls.table()
+        query = (itable.tablename == tablename) & \
+                (itable.record_id.belongs(record_ids))
+        current.db(query).delete()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def rebuild(cls, tablename=None, batch_size=1000):
+        """
+            Rebuild the index for existing records
+
+            Args:
+                tablename: the table name, None for all configured tables
+                batch_size: number of records to process at a time
+        """
+
+        if tablename:
+            tablenames = [tablename]
+        else:
+            tablenames = list(current.deployment_settings.get_database_search_index() or ())
+
+        db = current.db
+        s3db = current.s3db
+
+        itable = cls.table()
+        for tn in tablenames:
+            table = s3db.table(tn)
+            if not table:
+                continue
+            fieldnames = [fn for fn in cls.fields(tn) if fn in table.fields]
+
+            db(itable.tablename == tn).delete()
+
+            pkey = table._id
+            last_id = 0
+            while True:
+                rows = db(pkey > last_id).select(pkey,
+                                                 orderby = pkey,
+                                                 limitby = (0, batch_size),
+                                                 )
+                if not rows:
+                    break
+                record_ids = [row[pkey.name] for row in rows]
+                cls.reindex(table, record_ids, fieldnames)
+                last_id = record_ids[-1]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def create_indexes(cls):
+        """
+            Create the database indexes for the search index table, for
+            substring searches (to be run once, e.g. during first run)
+        """
+
+        dbtype = current.deployment_settings.get_database_type()
+
+        db = current.db
+        executesql = db.executesql
+
+        tablename = cls.table()._tablename
+        names = {"table": tablename,
+                 "fts": cls.FTS_TABLENAME,
+                 }
+
+        # Index for record lookups (index maintenance)
+        if dbtype in ("postgres", "sqlite"):
+            executesql("CREATE INDEX IF NOT EXISTS %(table)s_record_idx "
+                       "ON %(table)s (tablename, record_id);" % names)
+        else:
+            executesql("CREATE INDEX %(table)s_record_idx "
+                       "ON %(table)s (tablename, record_id);" % names)
+
+        if dbtype == "postgres":
+            # Trigram index (requires pg_trgm extension)
+            executesql("SAVEPOINT search_index;")
+            try:
+                executesql("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                executesql("CREATE INDEX IF NOT EXISTS %(table)s_value_trgm "
+                           "ON %(table)s USING GIN (value gin_trgm_ops);" % names)
+            except Exception as e:
+                executesql("ROLLBACK TO SAVEPOINT search_index;")
+                current.log.warning("Search index: trigram index not available (%s), "
+                                    "using prefix index instead" % e)
+                executesql("CREATE INDEX IF NOT EXISTS %(table)s_value_idx "
+                           "ON %(table)s (tablename, fieldname, value text_pattern_ops);" % names)
+            else:
+                executesql("RELEASE SAVEPOINT search_index;")
+
+        elif dbtype == "sqlite":
+            # FTS5 trigram table (requires SQLite 3.34+ with FTS5)
+            try:
+                executesql("CREATE VIRTUAL TABLE IF NOT EXISTS %(fts)s USING fts5"
+                           "(value, content='%(table)s', content_rowid='id', "
+                           "tokenize='trigram');" % names)
+            except Exception as e:
+                current.log.warning("Search index: FTS5 not available (%s)" % e)
+                executesql("CREATE INDEX IF NOT EXISTS %(table)s_value_idx "
+                           "ON %(table)s (tablename, fieldname, value);" % names)
+                cls.fts = False
+            else:
+                # Keep the FTS table in sync
+                executesql("CREATE TRIGGER IF NOT EXISTS %(table)s_ai "
+                           "AFTER INSERT ON %(table)s BEGIN "
+                           "INSERT INTO %(fts)s(rowid, value) VALUES (new.id, new.value); "
+                           "END;" % names)
+                executesql("CREATE TRIGGER IF NOT EXISTS %(table)s_ad "
+                           "AFTER DELETE ON %(table)s BEGIN "
+                           "INSERT INTO %(fts)s(%(fts)s, rowid, value) VALUES ('delete', old.id, old.value); "
+                           "END;" % names)
+                executesql("CREATE TRIGGER IF NOT EXISTS %(table)s_au "
+                           "AFTER UPDATE ON %(table)s BEGIN "
+                           "INSERT INTO %(fts)s(%(fts)s, rowid, value) VALUES ('delete', old.id, old.value); "
+                           "INSERT INTO %(fts)s(rowid, value) VALUES (new.id, new.value); "
+                           "END;" % names)
+                # Index existing entries
+                executesql("INSERT INTO %(fts)s(%(fts)s) VALUES ('rebuild');" % names)
+                cls.fts = True
+
+        else:
+            executesql("CREATE INDEX %(table)s_value_idx "
+                       "ON %(table)s (tablename, fieldname, value(128));" % names)
+
+# END =========================================================================
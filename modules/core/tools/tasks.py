@@ -41,6 +41,10 @@ __all__ = ("S3Task",)
 
 import datetime
 import json
+import os
+import stat
+import threading
+import uuid
 
 from gluon import current, IS_EMPTY_OR, IS_INT_IN_RANGE
 from gluon.storage import Storage
@@ -54,6 +58,14 @@ class S3Task:
 
     TASK_TABLENAME = "scheduler_task"
 
+    # Process-wide local task pool (see LocalTaskPool)
+    local_pool = None
+    local_pool_lock = threading.Lock()
+
+    # Process-wide cache for the scheduler liveness check
+    ALIVE_TTL = 30
+    alive = None
+
     # -------------------------------------------------------------------------
     def __init__(self):
 
@@ -248,6 +260,18 @@ class S3Task:
                 vars: The list of named vars to send to the function
                 timeout: The length of time available for the task to complete
                             - default 300s (5 mins)
+
+            Returns:
+                - the task ID (int for scheduler tasks, str for local tasks)
+                - None if the task was run synchronously
+                - False if the task is not defined
+
+            Note:
+                With settings.base.local_task_workers, tasks can be run in
+                a local process pool of the application server instead - if
+                they are configured in settings.base.local_tasks, or if no
+                scheduler worker is alive; local tasks start only after the
+                current request has committed its transaction
         """
 
         if args is None:
@@ -274,17 +298,29 @@ class S3Task:
             current.log.error(msg)
             raise
 
+        # Add the current user to the vars
+        try:
+            vars["user_id"] = current.auth.user.id
+        except AttributeError:
+            pass
+
+        alive = self._is_alive()
+
+        # Run in local task pool if configured
+        pool = self.get_local_pool()
+        if pool and (task in current.deployment_settings.get_base_local_tasks() or not alive):
+            task_id = pool.submit(task, tasks[task], args, vars, timeout=timeout)
+            if task_id:
+                return task_id
+            current.log.warning("Local task queue full, cannot run %s locally" % task)
+
         # Run synchronously if scheduler not running
-        if not self._is_alive():
+        if not alive:
+            vars.pop("user_id", None)
             tasks[task](*args, **vars)
             return None # No task ID in this case
 
         # Queue the task (async)
-        try:
-            # Add the current user to the vars
-            vars["user_id"] = current.auth.user.id
-        except AttributeError:
-            pass
         queued = self.scheduler.queue_task(task,
                                            pargs = args,
                                            pvars = vars,
@@ -456,10 +492,15 @@ class S3Task:
         #else:
         #    return False
 
+        # Use cached status if recent enough
+        now = datetime.datetime.now()
+        alive = S3Task.alive
+        if alive and (now - alive[0]).total_seconds() < S3Task.ALIVE_TTL:
+            return alive[1]
+
         db = current.db
         table = db.scheduler_worker
 
-        now = datetime.datetime.now()
         offset = datetime.timedelta(minutes = 1)
 
         query = (table.last_heartbeat > (now - offset))
@@ -469,7 +510,123 @@ class S3Task:
                                         cache = cache,
                                         ).first()
 
-        return True if worker_alive else False
+        worker_alive = True if worker_alive else False
+        S3Task.alive = (now, worker_alive)
+
+        return worker_alive
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def get_local_pool(cls):
+        """
+            Get the local task pool of this process
+
+            Returns:
+                the LocalTaskPool instance, or None if not configured
+                or not available (scheduler worker or CLI)
+        """
+
+        request = current.request
+        if request.is_scheduler or request.is_shell:
+            return None
+
+        pool = cls.local_pool
+        if pool is None:
+            settings = current.deployment_settings
+            workers = settings.get_base_local_task_workers()
+            if not workers:
+                return None
+            with cls.local_pool_lock:
+                pool = cls.local_pool
+                if pool is None:
+                    try:
+                        pool = LocalTaskPool(workers,
+                                             settings.get_base_local_task_queue(),
+                                             )
+                    except ValueError:
+                        # Fork not available on this platform
+                        pool = False
+                    cls.local_pool = pool
+
+        return pool or None
+
+    # -------------------------------------------------------------------------
+    def status(self, task_id):
+        """
+            Get the status of an asynchronous task
+
+            Args:
+                task_id: the task ID as returned from run_async
+
+            Returns:
+                Storage with task_id, task, user_id, status, result, error,
+                start_time and stop_time; or None if the task is unknown
+        """
+
+        if isinstance(task_id, str) and task_id.startswith("local-"):
+            pool = self.get_local_pool()
+            return pool.status(task_id) if pool else None
+
+        db = current.db
+        ttable = db.scheduler_task
+        rtable = db.scheduler_run
+
+        left = rtable.on(rtable.task_id == ttable.id)
+        row = db(ttable.id == task_id).select(ttable.id,
+                                              ttable.function_name,
+                                              ttable.status,
+                                              ttable.vars,
+                                              rtable.status,
+                                              rtable.start_time,
+                                              rtable.stop_time,
+                                              rtable.run_result,
+                                              rtable.traceback,
+                                              left = left,
+                                              orderby = ~rtable.id,
+                                              limitby = (0, 1),
+                                              ).first()
+        if not row:
+            return None
+
+        task, run = row.scheduler_task, row.scheduler_run
+        try:
+            user_id = json.loads(task.vars).get("user_id")
+        except (TypeError, ValueError, AttributeError):
+            user_id = None
+        try:
+            result = json.loads(run.run_result) if run.run_result else None
+        except ValueError:
+            result = run.run_result
+
+        return Storage(task_id = task.id,
+                       task = task.function_name,
+                       user_id = user_id,
+                       status = task.status,
+                       result = result,
+                       error = run.traceback,
+                       start_time = run.start_time,
+                       stop_time = run.stop_time,
+                       )
+
+    # -------------------------------------------------------------------------
+    def cancel(self, task_id):
+        """
+            Cancel an asynchronous task
+
+            Args:
+                task_id: the task ID as returned from run_async
+
+            Returns:
+                True if the task was cancelled, otherwise False
+        """
+
+        if isinstance(task_id, str) and task_id.startswith("local-"):
+            pool = self.get_local_pool()
+            return pool.cancel(task_id) if pool else False
+
+        if self.scheduler:
+            return bool(self.scheduler.stop_task(task_id))
+        return False
 
     # -------------------------------------------------------------------------
     @staticmethod
@@ -491,4 +648,397 @@ class S3Task:
         if task:
             task.update_record(status = "QUEUED")
 
+# =============================================================================
+class LocalTaskPool:
+    """
+        Pool of worker processes, forked from the application server, to
+        run short background tasks without the scheduler
+
+        - each task runs in its own process, inheriting the environment
+          of the request which has submitted it, but with its own DB
+          connection
+        - the process waits until the submitting request has committed
+          its transaction (cancels if it never does), then until one of
+          the worker slots is free (bounded concurrency)
+        - the number of queued (waiting) processes is limited, too
+    """
+
+    # Final task statuses
+    FINAL = ("COMPLETED", "FAILED", "TIMEOUT", "CANCELLED")
+
+    # Seconds to retain final task statuses
+    RETAIN = 3600
+
+    def __init__(self, workers, queue_size):
+        """
+            Args:
+                workers: the maximum number of tasks to run concurrently
+                queue_size: the maximum number of tasks waiting for a
+                            free worker slot
+        """
+
+        import multiprocessing
+
+        self.context = context = multiprocessing.get_context("fork")
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.slots = context.BoundedSemaphore(workers)
+
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    def submit(self, task, function, args, vars, timeout=300):
+        """
+            Submit a task to the pool; must be called from within a request
+
+            Args:
+                task: the task name
+                function: the task function
+                args: the list of unnamed args to send to the function
+                vars: the dict of named vars to send to the function
+                timeout: the time available for the task to complete,
+                         as well as for the request to commit (seconds)
+
+            Returns:
+                the task ID (str), or None if the queue is full
+        """
+
+        context = self.context
+
+        with self.lock:
+            self.update()
+
+            active = sum(1 for t in self.tasks.values() if t.status not in self.FINAL)
+            if active >= self.workers + self.queue_size:
+                return None
+
+            task_id = "local-%s" % uuid.uuid4().hex
+            release, go = context.Pipe(duplex=False)
+            messages, report = context.Pipe(duplex=False)
+
+            # Parent ends the task process must not hold on to
+            inherited = [go, messages]
+            inherited.extend(current.response.s3.local_tasks_pending or [])
+
+            process = context.Process(target = self.execute,
+                                      args = (function,
+                                              args,
+                                              vars,
+                                              timeout,
+                                              release,
+                                              report,
+                                              self.slots,
+                                              self.client_sockets(),
+                                              inherited,
+                                              ),
+                                      daemon = True,
+                                      )
+            process.start()
+
+            # Close the child ends in this process
+            release.close()
+            report.close()
+
+            self.tasks[task_id] = Storage(task_id = task_id,
+                                          task = task,
+                                          user_id = vars.get("user_id"),
+                                          status = "QUEUED",
+                                          result = None,
+                                          error = None,
+                                          start_time = datetime.datetime.utcnow(),
+                                          stop_time = None,
+                                          process = process,
+                                          messages = messages,
+                                          )
+
+        # Release the task once the request has committed, or cancel
+        # it if the request rolls back
+        response = current.response
+        pending = response.s3.local_tasks_pending
+        if pending is None:
+            pending = response.s3.local_tasks_pending = []
+            custom_commit = response.custom_commit
+            custom_rollback = response._custom_rollback
+            failed = []
+
+            def commit(adapter):
+                # Called for every DB instance, then once with None
+                # after all instances have been committed and closed
+                if adapter is not None:
+                    try:
+                        if custom_commit:
+                            custom_commit(adapter)
+                        else:
+                            adapter.commit()
+                    except Exception:
+                        failed.append(adapter)
+                        raise
+                else:
+                    try:
+                        if custom_commit:
+                            custom_commit(None)
+                    finally:
+                        self.release(pending, not failed)
+
+            def rollback():
+                try:
+                    if custom_rollback:
+                        custom_rollback()
+                    else:
+                        from pydal.base import BaseAdapter
+                        BaseAdapter.close_all_instances("rollback")
+                finally:
+                    self.release(pending, False)
+
+            response.custom_commit = commit
+            response._custom_rollback = rollback
+        pending.append(go)
+
+        return task_id
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def release(pending, committed):
+        """
+            Signal the end of the submitting request's transaction to
+            the waiting task processes
+
+            Args:
+                pending: the list of connections to send the signal to
+                committed: whether the request has committed (otherwise
+                           the tasks are cancelled)
+        """
+
+        while pending:
+            go = pending.pop()
+            try:
+                go.send(committed)
+            except OSError:
+                # Task process has already ended
+                pass
+            finally:
+                go.close()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def client_sockets():
+        """
+            Get the file descriptors of the client connection of the
+            current request, as far as the WSGI server exposes them
+
+            Returns:
+                list of file descriptors
+        """
+
+        env = current.request.env
+        fds = set()
+
+        # wsgi.input of Rocket (web2py), gunicorn's raw socket
+        for key in ("wsgi_input", "gunicorn_socket"):
+            fileno = getattr(env.get(key), "fileno", None)
+            if callable(fileno):
+                try:
+                    fds.add(fileno())
+                except (OSError, ValueError, AttributeError):
+                    pass
+
+        # uWSGI
+        try:
+            import uwsgi
+        except ImportError:
+            pass
+        else:
+            try:
+                fds.add(uwsgi.connection_fd())
+            except Exception:
+                pass
+
+        return [fd for fd in fds if isinstance(fd, int) and fd > 2]
+
+    # -------------------------------------------------------------------------
+    def status(self, task_id):
+        """
+            Get the current status of a task
+
+            Args:
+                task_id: the task ID
+
+            Returns:
+                Storage with task_id, task, user_id, status, result, error,
+                start_time and stop_time; or None if the task is unknown
+        """
+
+        with self.lock:
+            self.update()
+            task = self.tasks.get(task_id)
+
+        if task is None:
+            return None
+
+        return Storage((k, v) for k, v in task.items() if k not in ("process", "messages"))
+
+    # -------------------------------------------------------------------------
+    def cancel(self, task_id):
+        """
+            Cancel a task that is waiting or running
+
+            Args:
+                task_id: the task ID
+
+            Returns:
+                True if the task was cancelled, False if it was not found
+                or has already ended
+        """
+
+        with self.lock:
+            self.update()
+            task = self.tasks.get(task_id)
+            if task is None or task.status in self.FINAL:
+                return False
+
+            # SIGTERM is handled by the task process (to release its slot)
+            task.process.terminate()
+            task.status = "CANCELLED"
+            task.stop_time = datetime.datetime.utcnow()
+            task.messages.close()
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def update(self):
+        """
+            Collect status messages from task processes, and discard
+            final statuses after the retention period; caller must hold
+            the lock
+        """
+
+        now = datetime.datetime.utcnow()
+        expired = now - datetime.timedelta(seconds=self.RETAIN)
+
+        tasks = self.tasks
+        for task_id, task in list(tasks.items()):
+
+            if task.status in self.FINAL:
+                if task.stop_time < expired:
+                    del tasks[task_id]
+                continue
+
+            messages = task.messages
+            try:
+                while messages.poll():
+                    status, data = messages.recv()
+                    task.status = status
+                    if status == "COMPLETED":
+                        task.result = data
+                    elif status != "RUNNING":
+                        task.error = data
+            except (EOFError, OSError):
+                pass
+
+            if task.status not in self.FINAL and not task.process.is_alive():
+                # Process ended without final status
+                task.status = "FAILED"
+                task.error = "Task process ended unexpectedly (exit code %s)" % \
+                             task.process.exitcode
+
+            if task.status in self.FINAL:
+                task.stop_time = now
+                messages.close()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def execute(function, args, vars, timeout, release, report, slots,
+                sockets=None, inherited=None):
+        """
+            Run a task (in the task process)
+
+            Args:
+                function: the task function
+                args: the list of unnamed args
+                vars: the dict of named vars
+                timeout: the time available for the task to complete
+                release: the connection to receive the release signal
+                report: the connection to report status and result
+                slots: the semaphore limiting concurrent tasks
+                sockets: file descriptors of the client connection of
+                         the submitting request
+                inherited: connections of the parent process to close
+                           in the task process (so that the task process
+                           sees when the parent closes them)
+        """
+
+        import signal
+
+        class Terminated(Exception):
+            pass
+
+        def terminate(signum, frame):
+            raise Terminated("CANCELLED" if signum == signal.SIGTERM else "TIMEOUT")
+
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGALRM, terminate)
+
+        # Release the client connection of the submitting request, so
+        # that the client does not wait for the task to end; the fd is
+        # replaced by /dev/null rather than closed, so that its number
+        # cannot be reused while the inherited socket object still
+        # refers to it. All other inherited fds (e.g. DB connections of
+        # the parent process) are left alone: the task process opens
+        # its own DB connection, and exits without closing them
+        if sockets:
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in sockets:
+                try:
+                    if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                        os.dup2(devnull, fd)
+                except OSError:
+                    continue
+            os.close(devnull)
+
+        if inherited:
+            for connection in inherited:
+                connection.close()
+
+        # Must not take connections from the inherited pool,
+        # as they are still in use by the parent process
+        db = current.db
+        db._adapter.pool_size = 0
+
+        try:
+            # Wait for the submitting request to commit; the request
+            # closing its end without signal means it did not commit
+            committed = False
+            if release.poll(timeout):
+                try:
+                    committed = release.recv()
+                except EOFError:
+                    pass
+            if committed is not True:
+                report.send(("CANCELLED", "Request did not commit"))
+                return
+
+            with slots:
+                report.send(("RUNNING", None))
+                signal.alarm(timeout)
+                try:
+                    result = function(*args, **vars)
+                    db.commit()
+                finally:
+                    signal.alarm(0)
+            try:
+                result = json.loads(json.dumps(result))
+            except (TypeError, ValueError):
+                result = str(result)
+            report.send(("COMPLETED", result))
+
+        except Terminated as e:
+            db.rollback()
+            report.send((str(e), None))
+        except Exception:
+            db.rollback()
+            import traceback
+            report.send(("FAILED", traceback.format_exc()))
+
 # END =========================================================================
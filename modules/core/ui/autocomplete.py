@@ -845,23 +845,28 @@ def search_ac(r, **attr):
 
     resource.add_filter(query)
 
-    output = None
+    max_results = None
     if filter == "~":
         MAX_SEARCH_RESULTS = current.deployment_settings.get_search_max_results()
-        if (not limit or limit > MAX_SEARCH_RESULTS) and \
-           resource.count() > MAX_SEARCH_RESULTS:
-            output = [
-                {"label": str(current.T("There are more than %(max)s results, please input more characters.") % \
-                    {"max": MAX_SEARCH_RESULTS})
-                 }
-                ]
-
-    if output is None:
-        rows = resource.select(fields,
-                               start=0,
-                               limit=limit,
-                               orderby=field,
-                               as_rows=True)
+        if not limit or limit > MAX_SEARCH_RESULTS:
+            # Select one more than the maximum to detect too many
+            # results, rather than counting all matches separately
+            max_results = MAX_SEARCH_RESULTS
+            limit = max_results + 1
+
+    rows = resource.select(fields,
+                           start=0,
+                           limit=limit,
+                           orderby=field,
+                           as_rows=True)
+
+    if max_results is not None and len(rows) > max_results:
+        output = [
+            {"label": str(current.T("There are more than %(max)s results, please input more characters.") % \
+                {"max": max_results})
+             }
+            ]
+    else:
         output = []
         append = output.append
         for row in rows:
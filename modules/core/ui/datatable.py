@@ -80,6 +80,9 @@ class DataTable:
         self._orderby = orderby
         self.dt_ordering = None
 
+        # Sort key of the last row, for keyset pagination
+        self.seek = None
+
     # -------------------------------------------------------------------------
     @property
     def orderby(self):
@@ -625,6 +628,8 @@ class DataTable:
                   "data": data_array,
                   "draw": draw,
                   }
+        if self.seek:
+            output["seek"] = self.seek
 
         if stringify:
             output = jsons(output)
@@ -28,6 +28,13 @@
 __all__ = ("S3Config",
            )
 
+import builtins
+import dis
+import functools
+import inspect
+import threading
+import types
+
 from collections import OrderedDict
 
 from gluon import current, URL
@@ -148,68 +155,79 @@ class S3Config(Storage):
              "zh-tw": ["unifont", "unifont"],
              }
 
+    # Process-wide getter profile (see profile)
+    PROFILE = {}
+    PROFILE_LOCK = threading.Lock()
+
+    # Instrumentations of getters in this process (see freeze)
+    INSTRUMENTED = set()
+    INSTRUMENT_LOCK = threading.Lock()
+
     def __init__(self):
 
         super().__init__()
 
-        self.act = Storage()
-        self.asset = Storage()
-        self.auth = Storage()
+        self.act = SettingsSection(self)
+        self.asset = SettingsSection(self)
+        self.auth = SettingsSection(self)
         self.auth.email_domains = []
-        self.base = Storage()
+        self.base = SettingsSection(self)
         # Allow templates to append rather than replace
         self.base.prepopulate = ["default/base"]
         self.base.prepopulate_demo = ["default/users"]
-        self.cap = Storage()
-        self.cms = Storage()
-        self.cr = Storage()
-        self.custom = Storage()
-        self.database = Storage()
-        self.deploy = Storage()
-        self.disease = Storage()
-        self.doc = Storage()
-        self.dvr = Storage()
-        self.edu = Storage()
-        self.event = Storage()
-        self.fin = Storage()
+        self.cap = SettingsSection(self)
+        self.cms = SettingsSection(self)
+        self.cr = SettingsSection(self)
+        self.custom = SettingsSection(self)
+        self.database = SettingsSection(self)
+        self.deploy = SettingsSection(self)
+        self.disease = SettingsSection(self)
+        self.doc = SettingsSection(self)
+        self.dvr = SettingsSection(self)
+        self.edu = SettingsSection(self)
+        self.event = SettingsSection(self)
+        self.fin = SettingsSection(self)
         # Allow templates to append rather than replace
         self.fin.currencies = {}
-        self.fire = Storage()
+        self.fire = SettingsSection(self)
         # @ToDo: Move to self.ui
-        self.frontpage = Storage()
-        self.gis = Storage()
+        self.frontpage = SettingsSection(self)
+        self.gis = SettingsSection(self)
         # Allow templates to append rather than replace
         self.gis.countries = []
-        self.hms = Storage()
-        self.hrm = Storage()
-        self.inv = Storage()
-        self.irs = Storage()
-        self.L10n = Storage()
+        self.hms = SettingsSection(self)
+        self.hrm = SettingsSection(self)
+        self.inv = SettingsSection(self)
+        self.irs = SettingsSection(self)
+        self.L10n = SettingsSection(self)
         # Allow templates to append rather than replace
         self.L10n.languages = {"en": "English"}
-        self.log = Storage()
-        self.mail = Storage()
-        self.med = Storage()
-        self.member = Storage()
-        self.mobile = Storage()
-        self.msg = Storage()
-        self.org = Storage()
-        self.pr = Storage()
-        self.proc = Storage()
-        self.project = Storage()
-        self.req = Storage()
-        self.search = Storage()
-        self.security = Storage()
-        self.supply = Storage()
-        self.sync = Storage()
-        self.tasks = Storage()
-        self.transport = Storage()
-        self.ui = Storage()
-        self.xforms = Storage()
+        self.log = SettingsSection(self)
+        self.mail = SettingsSection(self)
+        self.med = SettingsSection(self)
+        self.member = SettingsSection(self)
+        self.mobile = SettingsSection(self)
+        self.msg = SettingsSection(self)
+        self.org = SettingsSection(self)
+        self.pr = SettingsSection(self)
+        self.proc = SettingsSection(self)
+        self.project = SettingsSection(self)
+        self.req = SettingsSection(self)
+        self.search = SettingsSection(self)
+        self.security = SettingsSection(self)
+        self.supply = SettingsSection(self)
+        self.sync = SettingsSection(self)
+        self.tasks = SettingsSection(self)
+        self.transport = SettingsSection(self)
+        self.ui = SettingsSection(self)
+        self.xforms = SettingsSection(self)
 
         # Lazy property
         self._db_params = None
 
+        # Snapshot of getter results (see freeze)
+        self.__dict__["_snapshot"] = None
+
         self._debug = None
         self._lazy_unwrapped = []
 
@@ -292,6 +310,305 @@ class S3Config(Storage):
                 s3.debug = False
                 track_changes(False)
 
+    # -------------------------------------------------------------------------
+    # Settings snapshot and getter profile
+    #
+    def __setitem__(self, key, value):
+
+        dict.__setitem__(self, key, value)
+        self.clear_snapshot()
+
+    __setattr__ = __setitem__
+
+    def __delitem__(self, key):
+
+        dict.__delitem__(self, key)
+        self.clear_snapshot()
+
+    __delattr__ = __delitem__
+
+    # -------------------------------------------------------------------------
+    def freeze(self):
+        """
+            Take a snapshot of the deployment settings, to be called after
+            the template config has run:
+
+            - with settings.base.settings_snapshot, results of getters that
+              are pure functions of the settings (i.e. which do not depend
+              on the request, the user or lazy settings) and more expensive
+              than a single lookup are memoized, so that repeated calls
+              reduce to a single dict lookup
+
+            - with settings.base.settings_profile, all calls of getters are
+              counted (see profile)
+
+            The snapshot is filled on first read of each getter, and gets
+            discarded whenever a setting is changed (e.g. in customise_*
+            hooks). In-place changes of mutable setting values (e.g. of
+            dicts or lists) are not detected, hence only immutable results
+            are memoized.
+        """
+
+        snapshot = self.get_base_settings_snapshot()
+        profile = self.get_base_settings_profile()
+
+        if snapshot or profile:
+            self.__instrument(snapshot, profile)
+        if snapshot:
+            self.__dict__["_snapshot"] = {}
+
+        return self
+
+    # -------------------------------------------------------------------------
+    def clear_snapshot(self):
+        """
+            Discard the snapshot of getter results (called automatically
+            when a setting is changed)
+        """
+
+        snapshot = self._snapshot
+        if snapshot:
+            snapshot.clear()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def profile(cls, reset=False):
+        """
+            Get the process-wide getter profile (requires
+            settings.base.settings_profile); the getter calls of the
+            current request are available in response.s3.settings_profile
+
+            @param reset: reset the profile after reading
+
+            @returns: list of dicts {"getter": the name of the getter,
+                                     "calls": total number of calls,
+                                     "requests": number of requests calling
+                                                 the getter,
+                                     "average": average number of calls
+                                                per request,
+                                     "max": maximum number of calls in a
+                                            single request,
+                                     },
+                      ordered by total number of calls, descending
+        """
+
+        with cls.PROFILE_LOCK:
+            output = [{"getter": name,
+                       "calls": stats[0],
+                       "requests": stats[1],
+                       "average": stats[0] / stats[1],
+                       "max": stats[2],
+                       }
+                      for name, stats in cls.PROFILE.items()
+                      ]
+            if reset:
+                cls.PROFILE.clear()
+
+        output.sort(key=lambda item: item["calls"], reverse=True)
+        return output
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def __instrument(cls, snapshot, profile):
+        """
+            Wrap the getters of this class for snapshot and/or profile
+            (once per process)
+
+            @param snapshot: memoize the results of pure getters
+            @param profile: count the calls of all getters
+        """
+
+        with cls.INSTRUMENT_LOCK:
+
+            instrumented = cls.INSTRUMENTED
+
+            getters = {name: attr for name, attr in cls.__dict__.items()
+                       if name.startswith("get_") and
+                          isinstance(attr, types.FunctionType)
+                       }
+
+            if snapshot and "snapshot" not in instrumented:
+                for name in cls.__snapshot_getters():
+                    setattr(cls, name, cls.__memoize(name, getters[name]))
+                instrumented.add("snapshot")
+
+            if profile and "profile" not in instrumented:
+                for name in getters:
+                    # Wrap around the memoizing getter, if any
+                    setattr(cls, name, cls.__count(name, cls.__dict__[name]))
+                instrumented.add("profile")
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def __snapshot_getters(cls):
+        """
+            Find the getters which can be memoized, i.e. which take no
+            parameters, only read (other) settings and constants, and
+            involve more than a single lookup
+
+            @returns: list of getter names
+        """
+
+        attributes = cls.__dict__
+
+        def function(name):
+            # The function of a getter or (private) helper method
+            attr = attributes.get(name)
+            if isinstance(attr, (staticmethod, classmethod)):
+                attr = attr.__func__
+            if isinstance(attr, types.FunctionType) and \
+               name.startswith(("get_", "_")) and \
+               not name.startswith(("__", "_S3Config__")):
+                return attr
+            return None
+
+        safe_globals = set(dir(builtins)) | {"FORMSTYLES", "OrderedDict"}
+
+        results = {}
+
+        def analyse(name):
+            """
+                Analyse a getter or helper method
+
+                @param name: the method name
+
+                @returns: tuple (pure, trivial)
+            """
+
+            if name in results:
+                return results[name]
+            # Assume impure while analysing (recursion)
+            results[name] = (False, False)
+
+            code = function(name).__code__
+
+            calls = 0
+            codes = [code]
+            while codes:
+                code = codes.pop()
+                nested = [c for c in code.co_consts if inspect.iscode(c)]
+                if nested:
+                    # Lambdas, comprehensions etc.
+                    calls += 1
+                    codes.extend(nested)
+
+                for instruction in dis.get_instructions(code):
+                    opname, argval = instruction.opname, instruction.argval
+                    if opname.startswith("CALL"):
+                        calls += 1
+                    elif opname in ("LOAD_GLOBAL", "LOAD_NAME"):
+                        if argval not in safe_globals:
+                            return False, False
+                    elif opname in ("LOAD_ATTR", "LOAD_METHOD"):
+                        if argval not in attributes:
+                            # Subset of settings, or method of a value
+                            continue
+                        attr = attributes[argval]
+                        if function(argval):
+                            if not analyse(argval)[0]:
+                                return False, False
+                        elif callable(attr) or \
+                             isinstance(attr, (property, staticmethod, classmethod)):
+                            return False, False
+                    elif opname.startswith(("IMPORT",
+                                            "STORE_ATTR",
+                                            "STORE_SUBSCR",
+                                            "STORE_GLOBAL",
+                                            "DELETE",
+                                            )):
+                        return False, False
+
+            results[name] = result = (True, calls < 2)
+            return result
+
+        getters = []
+        for name, attr in attributes.items():
+            if not name.startswith("get_") or \
+               not isinstance(attr, types.FunctionType):
+                continue
+            code = attr.__code__
+            if code.co_argcount == 1 and not code.co_kwonlyargcount and \
+               not code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS):
+                is_pure, trivial = analyse(name)
+                # Trivial getters (single lookup) are as fast as the snapshot
+                if is_pure and not trivial:
+                    getters.append(name)
+
+        return getters
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def __memoize(name, getter):
+        """
+            Wrap a getter so that it reads its result from the snapshot
+
+            @param name: the getter name
+            @param getter: the getter
+
+            @returns: the wrapped getter
+        """
+
+        @functools.wraps(getter)
+        def memoized(self):
+            snapshot = self._snapshot
+            if snapshot is None:
+                return getter(self)
+            try:
+                return snapshot[name]
+            except KeyError:
+                value = getter(self)
+                if value is None or \
+                   isinstance(value, (bool, int, float, str, tuple, frozenset,
+                                      types.FunctionType,
+                                      )):
+                    snapshot[name] = value
+                return value
+
+        return memoized
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def __count(cls, name, getter):
+        """
+            Wrap a getter so that its calls are counted in the getter profile
+
+            @param name: the getter name
+            @param getter: the getter
+
+            @returns: the wrapped getter
+        """
+
+        lock = cls.PROFILE_LOCK
+        profile = cls.PROFILE
+
+        @functools.wraps(getter)
+        def counted(self, *args, **kwargs):
+
+            # Per-request profile
+            response = getattr(current, "response", None)
+            s3 = response.s3 if response else None
+            if s3 is not None:
+                calls = s3.settings_profile
+                if calls is None:
+                    calls = s3.settings_profile = {}
+                count = calls[name] = calls.get(name, 0) + 1
+            else:
+                count = 1
+
+            # Process-wide profile
+            with lock:
+                stats = profile.get(name)
+                if stats is None:
+                    stats = profile[name] = [0, 0, 0]
+                stats[0] += 1
+                if count == 1:
+                    stats[1] += 1
+                stats[2] = max(stats[2], count)
+
+            return getter(self, *args, **kwargs)
+
+        return counted
+
     # -------------------------------------------------------------------------
     # Template
     def get_template(self):
@@ -1053,6 +1370,27 @@ class S3Config(Storage):
         """
         return self.security.get("strict_ownership", True)
 
+    def get_security_acl_cache(self):
+        """
+            Cache compiled ACLs across requests (process-wide), to
+            speed up permission checks with many roles and realms
+        """
+        return self.security.get("acl_cache", False)
+
+    def get_security_acl_cache_size(self):
+        """
+            Maximum number of entries in the ACL cache
+        """
+        return self.security.get("acl_cache_size", 10000)
+
+    def get_security_acl_cache_shared(self):
+        """
+            Propagate ACL cache invalidations across worker processes
+            (through the disk cache), must be used when running multiple
+            worker processes
+        """
+        return self.security.get("acl_cache_shared", False)
+
     def get_security_map(self):
         return self.security.get("map", False)
 
@@ -1088,6 +1426,28 @@ class S3Config(Storage):
         """
         return self.base.get("models")
 
+    def get_base_settings_snapshot(self):
+        """
+            Memoize the results of (pure) settings getters after the
+            template config has run (see S3Config.freeze)
+        """
+        return self.base.get("settings_snapshot", False)
+
+    def get_base_settings_profile(self):
+        """
+            Count the calls of settings getters, per request and
+            process-wide (see S3Config.profile)
+        """
+        return self.base.get("settings_profile", False)
+
+    def get_base_model_profile(self):
+        """
+            Profile the loading of data models, i.e. log the load time of
+            each DataModel (debug level), and record process-wide load
+            statistics (see DataModel.profile)
+        """
+        return self.base.get("model_profile", False)
+
     def get_base_rest_controllers(self):
         """
             Re-routed RESTful CRUD controllers
@@ -1119,6 +1479,74 @@ class S3Config(Storage):
         """
         return self.base.get("import_handlers")
 
+    def get_base_hierarchy_cache(self):
+        """
+            Keep stored hierarchies (S3Hierarchy) in memory across
+            requests, rather than re-loading them for every request
+        """
+        return self.base.get("hierarchy_cache", True)
+
+    def get_base_xslt_cache(self):
+        """
+            Keep compiled XSLT stylesheets for imports/exports in memory,
+            re-compiled when the stylesheet file is modified (turn off
+            when developing stylesheets that import other stylesheets)
+        """
+        return self.base.get("xslt_cache", True)
+
+    def get_base_import_bulk(self):
+        """
+            Use bulk mode for CSV imports in prepop (batched duplicate
+            checks and inserts, deferred record owner/realm updates)
+        """
+        return self.base.get("import_bulk", False)
+
+    def get_base_import_workers(self):
+        """
+            Number of worker processes to run independent CSV imports
+            of prepop concurrently (not with SQLite), 1 to run all
+            imports in sequence
+            - only applies to imports in stages declared as parallel
+              in tasks.cfg (*,parallel), see BulkImporter.perform_parallel
+        """
+        return self.base.get("import_workers", 1)
+
+    def get_base_import_chunk_size(self):
+        """
+            Number of rows per chunk to read, transform and add CSV/XLSX
+            sources to the import job in prepop and spreadsheet imports,
+            to limit memory use with large sources; None to process each
+            source as a whole
+            - rows must not reference records defined in later rows of
+              the same source
+        """
+        return self.base.get("import_chunk_size")
+
+    def get_base_local_task_workers(self):
+        """
+            Number of worker processes of the application server to run
+            asynchronous tasks locally (e.g. if no scheduler worker is
+            running), 0 to disable local task execution
+        """
+        return self.base.get("local_task_workers", 0)
+
+    def get_base_local_task_queue(self):
+        """
+            Maximum number of local tasks waiting for a free worker
+            process, further tasks are run by the scheduler (or
+            synchronously, if no scheduler worker is alive)
+        """
+        return self.base.get("local_task_queue", 10)
+
+    def get_base_local_tasks(self):
+        """
+            Names of (short) tasks to always run in the local task pool
+            rather than by the scheduler, e.g. ["gis_update_location_tree",
+            "org_site_check"]
+            - requires settings.base.local_task_workers
+        """
+        return self.base.get("local_tasks", ())
+
     def get_base_public_url(self):
         """
             The public URL for the site
@@ -1149,6 +1577,29 @@ class S3Config(Storage):
       """
         return self.base.get("bigtable", False)
 
+    def get_base_represent_cache(self):
+        """
+            Use a process-wide cache for foreign key representations
+            (S3Represent), to reduce lookups across requests
+            - True to enable for all lookup tables, or a list|tuple
+              of table names to enable for particular lookup tables
+        """
+        return self.base.get("represent_cache", False)
+
+    def get_base_represent_cache_size(self):
+        """
+            Maximum number of entries in the representation cache
+        """
+        return self.base.get("represent_cache_size", 50000)
+
+    def get_base_represent_cache_shared(self):
+        """
+            Propagate invalidation of the representation cache across
+            worker processes (via the disk cache), should be enabled if
+            the server runs multiple processes
+        """
+        return self.base.get("represent_cache_shared", False)
+
     def get_base_cdn(self):
         """
             Should we use CDNs (Content Distribution Networks) to serve some common CSS/JS?
@@ -1216,6 +1667,21 @@ class S3Config(Storage):
         """
         return self.base.get("xml_formats")
 
+    def get_xml_stream_threshold(self):
+        """
+            Number of records above which S3XML/S3JSON exports (without
+            XSLT transformation) build and write the tree in batches
+            (streaming mode, bounded memory, but records ordered by ID)
+            - None to disable streaming mode
+        """
+        return self.base.get("xml_stream_threshold", None)
+
+    def get_xml_stream_batch_size(self):
+        """
+            Number of master records per batch in streaming S3XML exports
+        """
+        return self.base.get("xml_stream_batch_size", 500)
+
 
     def get_import_callback(self, tablename, callback):
         """
@@ -1344,6 +1810,16 @@ class S3Config(Storage):
             airegex = False
         return airegex
 
+    def get_database_search_index(self):
+        """
+            Fields to maintain an accent-insensitive search index for,
+            which is then used for all LIKE-searches in these fields
+            (e.g. text filters and autocompletes) instead of AIRegex
+            - a dict {tablename: (fieldname, ...)}
+            - see core.tools.searchindex for details
+        """
+        return self.database.get("search_index", {})
+
     # -------------------------------------------------------------------------
     # Activity settings
     #
@@ -1669,6 +2145,34 @@ class S3Config(Storage):
         """
         return self.gis.get("max_features", 2000)
 
+    def get_gis_feature_tiles(self):
+        """
+            Load Feature Layers per tile (as clustered GeoJSON) rather
+            than all features at once (requires the OpenLayers 6 client)
+        """
+        return self.gis.get("feature_tiles", False)
+
+    def get_gis_feature_tiles_cache(self):
+        """
+            Cache Feature Layer tiles on disk
+        """
+        return self.gis.get("feature_tiles_cache", True)
+
+    def get_gis_geojson_bulk(self):
+        """
+            Export Feature Layers as GeoJSON directly from bulk lookups
+            of locations, attributes, markers and styles, rather than via
+            S3XML and the geojson/export.xsl transformation
+        """
+        return self.gis.get("geojson_bulk", False)
+
+    def get_gis_max_features_bulk(self):
+        """
+            The maximum number of features to return in a Map Layer
+            when exported via the GeoJSON bulk export (gis.geojson_bulk)
+        """
+        return self.gis.get("max_features_bulk", 20000)
+
     def get_gis_legend(self):
         """
             Should we display a Legend on the Map?
@@ -2153,6 +2657,21 @@ class S3Config(Storage):
         """
         return self.base.get("xls_title_row", False)
 
+    def get_xls_stream_threshold(self):
+        """
+            Number of records above which XLSX exports use streaming
+            mode (batched extraction and write-only workbook, constant
+            memory, but records ordered by ID)
+            - None to disable streaming mode
+        """
+        return self.base.get("xls_stream_threshold", None)
+
+    def get_xls_stream_batch_size(self):
+        """
+            Number of records per batch in streaming XLSX exports
+        """
+        return self.base.get("xls_stream_batch_size", 1000)
+
     # -------------------------------------------------------------------------
     # UI Settings
     #
@@ -2575,6 +3094,25 @@ class S3Config(Storage):
         """
         return self.ui.get("report_timeout", 10000)
 
+    def get_ui_report_columnar(self):
+        """
+            Use the columnar (NumPy-based) engine to compute pivot tables
+                - True to always use it, or
+                - a number of records from which on to use it
+            Falls back to the standard engine if NumPy is not installed
+        """
+        return self.ui.get("report_columnar", False)
+
+    def get_ui_report_pushdown(self):
+        """
+            Compute pivot tables with a single GROUP BY query where the
+            axes and facts are plain (non-virtual, single-valued) fields,
+            rather than aggregating all records in Python
+                - pivot tables with cell explore (drill-down) still
+                  extract the record keys, with a separate query
+        """
+        return self.ui.get("report_pushdown", False)
+
     def get_ui_use_button_icons(self):
         """
             Use icons on action buttons (requires corresponding CSS)
@@ -2773,6 +3311,27 @@ class S3Config(Storage):
 
         return self.msg.get("send_postprocess")
 
+    def get_msg_outbox_batch_size(self):
+        """
+            Number of outbox entries to process per batch, i.e. to
+            look up contacts for and commit the status of at once
+        """
+        return self.msg.get("outbox_batch_size", 500)
+
+    def get_msg_sms_api_workers(self):
+        """
+            Number of worker threads to send SMS through Web API
+            gateways in parallel (1 to send sequentially)
+        """
+        return self.msg.get("sms_api_workers", 4)
+
+    def get_msg_sms_api_rate_limit(self):
+        """
+            Maximum number of SMS per second to send through each
+            Web API gateway, None for no limit
+        """
+        return self.msg.get("sms_api_rate_limit")
+
     # -------------------------------------------------------------------------
     # Mail settings
     def get_mail_server(self):
@@ -2868,6 +3427,30 @@ class S3Config(Storage):
         """ Enable the filter manager widget """
         return self.search.get("filter_manager", True)
 
+    def get_search_filter_options_cache(self):
+        """
+            Use a process-wide cache for looked-up options of option filters,
+            to reduce lookups across requests
+            - True to enable for all tables, or a list|tuple of table names
+              to enable for filter forms of particular resources
+        """
+        return self.search.get("filter_options_cache", False)
+
+    def get_search_filter_options_cache_ttl(self):
+        """
+            Time (in seconds) for which cached filter options remain valid
+            (unless invalidated by updates before)
+        """
+        return self.search.get("filter_options_cache_ttl", 300)
+
+    def get_search_filter_options_cache_shared(self):
+        """
+            Propagate invalidation of the filter options cache across
+            worker processes (via the disk cache), should be enabled if
+            the server runs multiple processes
+        """
+        return self.search.get("filter_options_cache_shared", False)
+
     def get_search_filter_manager_allow_delete(self):
         """ Allow deletion of saved filters """
         return self.search.get("filter_manager_allow_delete", True)
@@ -2909,6 +3492,16 @@ class S3Config(Storage):
 
         return self.sync.get("data_repository", False)
 
+    def get_sync_page_size(self):
+        """
+            Maximum number of records per request when synchronizing
+            with Sahana Eden peers (records are then sent in pages, and
+            an interrupted synchronization resumes after the last page
+            transmitted); None to transmit all records at once
+        """
+
+        return self.sync.get("page_size", 1000)
+
     # =========================================================================
     # Modules
 
@@ -4973,6 +5566,17 @@ class S3Config(Storage):
     # -------------------------------------------------------------------------
     # Persons
     #
+    def get_pr_ancestor_closure(self):
+        """
+            Look up ancestors/descendants in the OU hierarchy (e.g. for
+            realm expansion) from the pr_ancestor closure table rather
+            than by recursive queries
+                - for existing databases, run the script
+                  static/scripts/tools/pr_rebuild_ancestors.py once
+                  before enabling this
+        """
+        return self.pr.get("ancestor_closure", False)
+
     def get_pr_generate_pe_label(self):
         """
             Autogenerate PE labels for all persons
@@ -5794,4 +6398,61 @@ class S3Config(Storage):
                 self._lazy_unwrapped.append(_key)
         return setting
 
+# =============================================================================
+class SettingsSection(Storage):
+    """
+        A subset of deployment settings (e.g. settings.base), which
+        discards the settings snapshot when modified (see S3Config.freeze)
+    """
+
+    def __init__(self, config=None, *args, **kwargs):
+        """
+            @param config: the S3Config instance this subset belongs to
+        """
+
+        super().__init__(*args, **kwargs)
+        self.__dict__["_config"] = config
+
+    # -------------------------------------------------------------------------
+    def changed(self):
+        """
+            Discard the settings snapshot after modification
+        """
+
+        config = self._config
+        if config is not None:
+            config.clear_snapshot()
+
+    # -------------------------------------------------------------------------
+    def __setitem__(self, key, value):
+
+        dict.__setitem__(self, key, value)
+        self.changed()
+
+    __setattr__ = __setitem__
+
+    def __delitem__(self, key):
+
+        dict.__delitem__(self, key)
+        self.changed()
+
+    __delattr__ = __delitem__
+
+    def update(self, *args, **kwargs):
+
+        dict.update(self, *args, **kwargs)
+        self.changed()
+
+    def setdefault(self, key, default=None):
+
+        value = dict.setdefault(self, key, default)
+        self.changed()
+        return value
+
+    def pop(self, *args):
+
+        value = dict.pop(self, *args)
+        self.changed()
+        return value
+
 # END =========================================================================
@@ -69,7 +69,9 @@ class S3DAL:
             # PyDAL <= 16.03
             self.INVERT = adapter.INVERT
             self.COMMA = adapter.COMMA
+            self.AND = adapter.AND
             self.OR = adapter.OR
+            self.EQ = adapter.EQ
             self.CONTAINS = adapter.CONTAINS
             self.AGGREGATE = adapter.AGGREGATE
 
@@ -77,7 +79,9 @@ class S3DAL:
             # current PyDAL
             self.INVERT = dialect.invert
             self.COMMA = dialect.comma
+            self.AND = dialect._and
             self.OR = dialect._or
+            self.EQ = dialect.eq
             self.CONTAINS = dialect.contains
             self.AGGREGATE = dialect.aggregate
 
@@ -117,6 +121,227 @@ class S3DAL:
                                       table._filter_fields(record, id=allow_id))
             return cls._filter_fields(table, record, allow_id=allow_id, writable_only=writable_only)
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def bulk_insert(table, records, batch_size=500, errors=None):
+        """
+            Insert multiple records into a table, using multi-row INSERT
+            statements where the database supports it (PostgreSQL), and
+            single-row inserts otherwise
+
+            @param table: the Table
+            @param records: the records to insert, list of dicts
+            @param batch_size: the maximum number of rows per statement
+            @param errors: a dict to collect errors {index: exception};
+                           if given, failing records are skipped rather
+                           than raising the exception, and all other
+                           records are inserted nevertheless
+
+            @returns: list of the new record IDs, in the order of records
+                      (None for failed records, 0 for records rejected
+                      by a _before_insert callback)
+
+            @note: the record IDs for multi-row inserts are allocated from
+                   the sequence of the table before inserting, so they do
+                   not depend on the order in which the database processes
+                   the rows
+            @note: _before_insert and _after_insert callbacks of the table
+                   are run for each record, like with table.insert
+            @note: with errors, every statement on PostgreSQL runs in a
+                   savepoint, so that a failed batch can be rolled back
+                   and retried record by record, to isolate the failing
+                   records
+        """
+
+        db = current.db
+        adapter = db._adapter
+        postgres = adapter.dbengine == "postgres"
+
+        ids = [None] * len(records)
+
+        def attempt(function, *args):
+            # Run function in a savepoint, roll back if it fails
+            if not postgres:
+                return function(*args)
+            db.executesql("SAVEPOINT bulk_insert;")
+            try:
+                function(*args)
+            except Exception:
+                db.executesql("ROLLBACK TO SAVEPOINT bulk_insert;")
+                raise
+            db.executesql("RELEASE SAVEPOINT bulk_insert;")
+
+        def insert(index):
+            ids[index] = table.insert(**records[index])
+
+        def insert_each(indexes):
+            for index in indexes:
+                if errors is None:
+                    insert(index)
+                else:
+                    try:
+                        attempt(insert, index)
+                    except Exception as e:
+                        errors[index] = e
+
+        # Multi-row inserts require a sequence to allocate the record IDs
+        sequence = None
+        if postgres and len(records) > 1 and \
+           hasattr(table, "_fields_and_values_for_insert"):
+            sql = "SELECT pg_get_serial_sequence('%s','%s');" % \
+                  (table._rname, table._id.name)
+            sequence = db.executesql(sql)[0][0]
+        if not sequence:
+            insert_each(range(len(records)))
+            return ids
+
+        # Group the records by field set (defaults and computed fields
+        # can produce different field sets)
+        groups = {}
+        empty = []
+        before_insert = table._before_insert
+        for index, record in enumerate(records):
+            row = table._fields_and_values_for_insert(record)
+            values = row.op_values() if hasattr(row, "op_values") else row
+            if not values:
+                empty.append(index)
+                continue
+            if any(f(row) for f in before_insert):
+                ids[index] = 0
+                continue
+            key = tuple(field.name for field, _ in values)
+            if key in groups:
+                groups[key].append((index, row, values))
+            else:
+                groups[key] = [(index, row, values)]
+
+        expand = adapter.expand
+        pkey = table._id._rname
+        after_insert = table._after_insert
+
+        def insert_batch(batch):
+            sql = "SELECT nextval('%s') FROM generate_series(1,%s);" % \
+                  (sequence, len(batch))
+            new_ids = [row[0] for row in db.executesql(sql)]
+
+            fnames = ",".join(field._rname for field, _ in batch[0][2])
+            values = ",".join("(%s,%s)" % (record_id,
+                                           ",".join(expand(value, field.type)
+                                                    for field, value in values))
+                              for record_id, (_, _, values) in zip(new_ids, batch))
+            db.executesql("INSERT INTO %s(%s,%s) VALUES %s;" % \
+                          (table._rname, pkey, fnames, values))
+
+            for record_id, (_, row, _) in zip(new_ids, batch):
+                for f in after_insert:
+                    f(row, record_id)
+
+            for record_id, (index, _, _) in zip(new_ids, batch):
+                ids[index] = record_id
+
+        for group in groups.values():
+            for i in range(0, len(group), batch_size):
+                batch = group[i:i + batch_size]
+                if errors is None:
+                    insert_batch(batch)
+                    continue
+                try:
+                    attempt(insert_batch, batch)
+                except Exception:
+                    # Retry record by record to isolate the failing records
+                    insert_each(index for index, _, _ in batch)
+
+        insert_each(empty)
+
+        return ids
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def bulk_update(table, updates, batch_size=500):
+        """
+            Update multiple records with individual values, using one
+            UPDATE statement per batch of records (setting each column
+            to a CASE expression over the record ID)
+
+            @param table: the Table
+            @param updates: the updates, dict {record_id: {fieldname: value}}
+            @param batch_size: the maximum number of records per statement
+
+            @returns: the number of updated records
+
+            @note: records are grouped by the set of updated fields
+                   (including fields with update-defaults and computed
+                   fields, like with dbset.update), so that all records
+                   in a statement update the same columns
+            @note: _before_update callbacks of the table are run for each
+                   record (with a Set of just that record and its values)
+                   before any statement is executed; records vetoed by a
+                   callback are skipped. _after_update callbacks are run
+                   for each record after the statement for its batch.
+        """
+
+        db = current.db
+        expand = db._adapter.expand
+
+        pkey = table._id
+        before_update = table._before_update
+        after_update = table._after_update
+
+        # Group the records by field set
+        groups = {}
+        for record_id, fields in updates.items():
+            if not fields:
+                continue
+            record_id = int(record_id)
+            row = table._fields_and_values_for_update(fields)
+            if before_update:
+                dbset = db(pkey == record_id)
+                if any(f(dbset, row) for f in before_update):
+                    continue
+            values = row.op_values() if hasattr(row, "op_values") else row
+            values = {field.name: value for field, value in values}
+            key = tuple(sorted(values))
+            if key in groups:
+                groups[key].append((record_id, row, values))
+            else:
+                groups[key] = [(record_id, row, values)]
+
+        def update_batch(fieldnames, batch):
+            # The ELSE-branch refers to the column itself, so that the
+            # CASE expression has the column type (PostgreSQL would
+            # otherwise type string literals and NULLs as text)
+            columns = []
+            for fieldname in fieldnames:
+                field = table[fieldname]
+                column = field._rname
+                cases = " ".join("WHEN %s THEN %s" % \
+                                 (record_id, expand(values[fieldname], field.type))
+                                 for record_id, _, values in batch)
+                columns.append("%s=CASE %s %s ELSE %s END" % \
+                               (column, pkey._rname, cases, column))
+
+            db.executesql("UPDATE %s SET %s WHERE %s IN (%s);" % \
+                          (table._rname,
+                           ",".join(columns),
+                           pkey._rname,
+                           ",".join(str(record_id) for record_id, _, _ in batch),
+                           ))
+
+            if after_update:
+                for record_id, row, _ in batch:
+                    dbset = db(pkey == record_id)
+                    for f in after_update:
+                        f(dbset, row)
+
+            return len(batch)
+
+        updated = 0
+        for fieldnames, group in groups.items():
+            for i in range(0, len(group), batch_size):
+                updated += update_batch(fieldnames, group[i:i + batch_size])
+
+        return updated
+
 # =============================================================================
 original_tablename = S3DAL.original_tablename
 filter_fields = S3DAL.filter_fields
@@ -369,6 +369,7 @@ class GISLocationModel(DataModel):
                        list_fields = list_fields,
                        list_orderby = "gis_location.name",
                        onaccept = self.gis_location_onaccept,
+                       ondelete = self.gis_location_ondelete,
                        onvalidation = self.gis_location_onvalidation,
                        )
 
@@ -455,6 +456,9 @@ class GISLocationModel(DataModel):
         form_vars_get = form.vars.get
         location_id = form_vars_get("id")
 
+        # Remove cached map tiles
+        FeatureTiles.invalidate()
+
         if form_vars_get("path") and current.response.s3.bulk:
             # Don't import path from foreign sources as IDs won't match
             db = current.db
@@ -464,13 +468,32 @@ class GISLocationModel(DataModel):
            not auth.rollback:
             # Update the Path (async if-possible)
             # (skip during prepop)
-            feature = json.dumps({"id": location_id,
-                                  "level": form_vars_get("level", False),
-                                  })
+            feature = {"id": location_id,
+                       "level": form_vars_get("level", False),
+                       }
+            if getattr(form, "record", None):
+                # Existing location: if it has children, then their
+                # paths and Lx may need updating too
+                table = current.s3db.gis_location
+                query = (table.parent == location_id) & \
+                        (table.deleted == False)
+                if current.db(query).select(table.id, limitby=(0, 1)).first():
+                    feature["subtree"] = True
+            feature = json.dumps(feature)
             current.s3task.run_async("gis_update_location_tree",
                                      args = [feature],
                                      )
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def gis_location_ondelete(row):
+        """
+            On Delete for GIS Locations
+        """
+
+        # Remove cached map tiles
+        FeatureTiles.invalidate()
+
     # -------------------------------------------------------------------------
     @staticmethod
     def gis_location_onvalidation(form):
@@ -93,6 +93,8 @@ __all__ = (# PR Base Entities
            "pr_descendants",
            "pr_rebuild_path",
            "pr_role_rebuild_path",
+           "pr_update_ancestors",
+           "pr_rebuild_ancestors",
 
            # Helper for ImageLibrary
            "pr_image_modify",
@@ -120,7 +122,7 @@ from gluon.storage import Storage
 from gluon.sqlhtml import RadioWidget
 
 from ..core import *
-from s3dal import Field, Row
+from s3dal import Field, Row, S3DAL
 from core.ui.layouts import PopupLink
 
 OU = 1 # role type which indicates hierarchy, see role_types
@@ -132,6 +134,7 @@ class PRPersonEntityModel(DataModel):
 
     names = ("pr_pentity",
              "pr_affiliation",
+             "pr_ancestor",
              "pr_person_user",
              "pr_role",
              "pr_role_types",
@@ -368,6 +371,7 @@ class PRPersonEntityModel(DataModel):
 
         # Resource configuration
         configure(tablename,
+                  onaccept = self.pr_role_onaccept,
                   onvalidation = self.pr_role_onvalidation,
                   )
 
@@ -422,6 +426,19 @@ class PRPersonEntityModel(DataModel):
                   ondelete = self.pr_affiliation_ondelete,
                   )
 
+        # ---------------------------------------------------------------------
+        # Ancestors (closure of the OU hierarchy, for fast lookups)
+        # - maintained by pr_update_ancestors, not to be edited manually
+        #
+        tablename = "pr_ancestor"
+        define_table(tablename,
+                     Field("ancestor_id", "integer"),
+                     Field("pe_id", "integer"),
+                     # Shortest distance between ancestor and pe_id
+                     Field("depth", "integer"),
+                     meta = False,
+                     )
+
         # ---------------------------------------------------------------------
         # Pass names back to global scope (s3.*)
         #
@@ -626,6 +643,31 @@ class PRPersonEntityModel(DataModel):
                     form_vars["path"] = None
                 current.s3db.pr_role_rebuild_path(role_id, clear=True)
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def pr_role_onaccept(form):
+        """
+            Update the ancestors of the affiliates (the role type or
+            the parent entity of the role may have changed)
+
+            Args:
+                form: the CRUD form
+        """
+
+        try:
+            role_id = form.vars.id
+        except AttributeError:
+            return
+        if not role_id:
+            return
+
+        atable = current.s3db.pr_affiliation
+        query = (atable.role_id == role_id) & \
+                (atable.deleted != True)
+        rows = current.db(query).select(atable.pe_id)
+        if rows:
+            pr_update_ancestors({row.pe_id for row in rows})
+
     # -------------------------------------------------------------------------
     @staticmethod
     def pr_pentity_onaccept(form):
@@ -8410,6 +8452,9 @@ def pr_get_ancestors(pe_id):
             a list of PE IDs
     """
 
+    if current.deployment_settings.get_pr_ancestor_closure():
+        return pr_ancestors([pe_id])[pe_id]
+
     s3db = current.s3db
     atable = s3db.pr_affiliation
     rtable = s3db.pr_role
@@ -8546,6 +8591,19 @@ def pr_ancestors(entities):
         return {}
     ancestors = {pe_id: [] for pe_id in entities}
 
+    if current.deployment_settings.get_pr_ancestor_closure():
+        # Look up from closure
+        ctable = current.s3db.pr_ancestor
+        query = (ctable.pe_id.belongs(list(ancestors))) & \
+                (ctable.ancestor_id != ctable.pe_id)
+        rows = current.db(query).select(ctable.pe_id,
+                                        ctable.ancestor_id,
+                                        orderby = ~ctable.depth,
+                                        )
+        for row in rows:
+            ancestors[row.pe_id].append(row.ancestor_id)
+        return ancestors
+
     s3db = current.s3db
     atable = s3db.pr_affiliation
     rtable = s3db.pr_role
@@ -8602,6 +8660,27 @@ def pr_descendants(pe_ids, skip=None, root=True):
 
     s3db = current.s3db
     etable = s3db.pr_pentity
+
+    if root and current.deployment_settings.get_pr_ancestor_closure():
+        # Look up from closure
+        ctable = s3db.pr_ancestor
+        query = (ctable.ancestor_id.belongs(pe_ids)) & \
+                (ctable.pe_id != ctable.ancestor_id) & \
+                (etable.pe_id == ctable.pe_id) & \
+                (etable.instance_type != "pr_person")
+        rows = current.db(query).select(ctable.ancestor_id,
+                                        ctable.pe_id,
+                                        orderby = ctable.depth,
+                                        )
+        result = {}
+        for row in rows:
+            ancestor_id = row.ancestor_id
+            if ancestor_id in result:
+                result[ancestor_id].append(row.pe_id)
+            else:
+                result[ancestor_id] = [row.pe_id]
+        return result
+
     rtable = s3db.pr_role
     atable = s3db.pr_affiliation
 
@@ -8675,6 +8754,19 @@ def pr_get_descendants(pe_ids, entity_types=None, skip=None, ids=True):
     db = current.db
     s3db = current.s3db
     etable = s3db.pr_pentity
+
+    if ids and skip is None and \
+       current.deployment_settings.get_pr_ancestor_closure():
+        # Look up from closure
+        ctable = s3db.pr_ancestor
+        query = (ctable.ancestor_id.belongs(pe_ids))
+        if entity_types is not None:
+            if not isinstance(entity_types, (set, tuple, list)):
+                entity_types = [entity_types]
+            query &= (etable.pe_id == ctable.pe_id) & \
+                     (etable.instance_type.belongs(entity_types))
+        rows = db(query).select(ctable.pe_id, distinct=True)
+        return [row.pe_id for row in rows]
     rtable = db.pr_role
     atable = db.pr_affiliation
 
@@ -8753,6 +8845,9 @@ def pr_rebuild_path(pe_id, clear=False):
         if role.path is None:
             pr_role_rebuild_path(role, clear=clear)
 
+    # Update the ancestor closure
+    pr_update_ancestors(pe_id)
+
 # =============================================================================
 def pr_role_rebuild_path(role_id, skip=None, clear=False):
     """
@@ -8822,6 +8917,177 @@ def pr_role_rebuild_path(role_id, skip=None, clear=False):
 
     return path
 
+# =============================================================================
+# OU Ancestor Closure
+# =============================================================================
+def pr_ou_parents(pe_ids=None):
+    """
+        Look up the parent entities of person entities in the OU hierarchy
+
+        Args:
+            pe_ids: the person entity IDs, None for all entities
+
+        Returns:
+            a dict {pe_id: set of parent PE IDs}
+    """
+
+    s3db = current.s3db
+    atable = s3db.pr_affiliation
+    rtable = s3db.pr_role
+
+    query = (atable.deleted != True) & \
+            (atable.role_id == rtable.id) & \
+            (rtable.deleted != True) & \
+            (rtable.role_type == OU)
+    if pe_ids is not None:
+        query &= (atable.pe_id.belongs(pe_ids))
+
+    rows = current.db(query).select(atable.pe_id,
+                                    rtable.pe_id,
+                                    distinct = True,
+                                    )
+    parents = {}
+    for row in rows:
+        child, parent = row.pr_affiliation.pe_id, row.pr_role.pe_id
+        if not child or not parent:
+            continue
+        if child in parents:
+            parents[child].add(parent)
+        else:
+            parents[child] = {parent}
+
+    return parents
+
+# -----------------------------------------------------------------------------
+def pr_ou_closure(pe_ids, parents, known=None):
+    """
+        Compute the ancestors of person entities in the OU hierarchy
+
+        Args:
+            pe_ids: the person entity IDs
+            parents: the parents of all entities to traverse,
+                     dict {pe_id: set of parent PE IDs}
+            known: the (current) ancestors of entities for which the
+                   traversal can stop, dict {pe_id: {ancestor: depth}}
+
+        Returns:
+            a dict {pe_id: {ancestor: depth}} for pe_ids
+    """
+
+    if known is None:
+        known = {}
+
+    closure = {}
+    for pe_id in pe_ids:
+
+        ancestors = {}
+        visited = {pe_id}
+        level = [pe_id]
+        depth = 0
+
+        # Breadth-first search, so that ancestors get the shortest depth
+        while level:
+            depth += 1
+            next_level = []
+            for node in level:
+                for parent in parents.get(node, ()):
+                    if parent not in ancestors or ancestors[parent] > depth:
+                        ancestors[parent] = depth
+                    if parent in known:
+                        # Use the known ancestors of the parent
+                        for ancestor, offset in known[parent].items():
+                            d = depth + offset
+                            if ancestor not in ancestors or ancestors[ancestor] > d:
+                                ancestors[ancestor] = d
+                    elif parent not in visited:
+                        visited.add(parent)
+                        next_level.append(parent)
+            level = next_level
+
+        ancestors.pop(pe_id, None)
+        closure[pe_id] = ancestors
+
+    return closure
+
+# -----------------------------------------------------------------------------
+def pr_write_ancestors(closure):
+    """
+        Write ancestors to the closure table
+
+        Args:
+            closure: the ancestors, dict {pe_id: {ancestor: depth}}
+    """
+
+    records = [{"ancestor_id": ancestor_id, "pe_id": pe_id, "depth": depth}
+               for pe_id, ancestors in closure.items()
+               for ancestor_id, depth in ancestors.items()
+               ]
+    if records:
+        S3DAL.bulk_insert(current.s3db.pr_ancestor, records)
+
+# -----------------------------------------------------------------------------
+def pr_update_ancestors(pe_id):
+    """
+        Update the ancestor closure (pr_ancestor) for a person entity and
+        all its descendants, to be called whenever the OU affiliations of
+        the person entity have changed
+
+        Args:
+            pe_id: the person entity ID, or a set of PE IDs
+    """
+
+    if not pe_id:
+        return
+    pe_ids = set(pe_id) if isinstance(pe_id, (set, list, tuple)) else {pe_id}
+
+    db = current.db
+    ctable = current.s3db.pr_ancestor
+
+    # The descendants are affected too
+    query = (ctable.ancestor_id.belongs(pe_ids))
+    rows = db(query).select(ctable.pe_id, distinct=True)
+    affected = pe_ids | {row.pe_id for row in rows}
+
+    # Look up the current parents of all affected entities
+    parents = pr_ou_parents(affected)
+
+    # The ancestors of all other parents are not affected
+    others = set()
+    for node_ids in parents.values():
+        others |= node_ids
+    others -= affected
+    known = {pe_id: {} for pe_id in others}
+    if others:
+        query = (ctable.pe_id.belongs(others))
+        rows = db(query).select(ctable.pe_id,
+                                ctable.ancestor_id,
+                                ctable.depth,
+                                )
+        for row in rows:
+            known[row.pe_id][row.ancestor_id] = row.depth
+
+    # Replace the ancestors of all affected entities
+    closure = pr_ou_closure(affected, parents, known=known)
+    db(ctable.pe_id.belongs(affected)).delete()
+    pr_write_ancestors(closure)
+
+# -----------------------------------------------------------------------------
+def pr_rebuild_ancestors():
+    """
+        Rebuild the entire ancestor closure (pr_ancestor) from the
+        affiliations, e.g. to populate it for an existing database
+        (see static/scripts/tools/pr_rebuild_ancestors.py)
+    """
+
+    db = current.db
+    ctable = current.s3db.pr_ancestor
+
+    parents = pr_ou_parents()
+    closure = pr_ou_closure(parents.keys(), parents)
+
+    db(ctable.id > 0).delete()
+    pr_write_ancestors(closure)
+
 # -----------------------------------------------------------------------------
 def pr_image_modify(image_file,
                     image_name,
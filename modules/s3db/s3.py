@@ -57,6 +57,10 @@ class S3HierarchyModel(DataModel):
                                 default = False,
                                 ),
                           Field("hierarchy", "json"),
+                          # Incremented with every change of the hierarchy
+                          Field("version", "integer",
+                                default = 0,
+                                ),
                           *MetaFields.timestamps(),
                           meta = False,
                           )
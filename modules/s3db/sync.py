@@ -1066,6 +1066,15 @@ class SyncTaskModel(DataModel):
                            writable = False,
                            represent = datetime_represent,
                            ),
+                     # Paging cursors of interrupted pull/push
+                     Field("pull_cursor",
+                           readable = False,
+                           writable = False,
+                           ),
+                     Field("push_cursor",
+                           readable = False,
+                           writable = False,
+                           ),
                      Field("mode", "integer",
                            default = 3,
                            label = T("Mode"),
@@ -1271,7 +1280,7 @@ class SyncTaskModel(DataModel):
     @staticmethod
     def sync_resource_filter_onaccept(form):
         """
-            Reset last_push when adding/changing a filter
+            Reset last_push (and push_cursor) when adding/changing a filter
         """
 
         db = current.db
@@ -1307,7 +1316,9 @@ class SyncTaskModel(DataModel):
             else:
                 task_id = row.task_id
             if task_id:
-                db(ttable.id == task_id).update(last_push=None)
+                db(ttable.id == task_id).update(last_push = None,
+                                                push_cursor = None,
+                                                )
 
 # =============================================================================
 class SyncScheduleModel(DataModel):
@@ -193,6 +193,9 @@ settings.auth.hmac_key = "akeytochange"
 #settings.search.max_results = 200
 # Maximum number of features for a Map Layer
 #settings.gis.max_features = 1000
+# Export Map Layers as GeoJSON from bulk lookups (allows a higher maximum)
+#settings.gis.geojson_bulk = True
+#settings.gis.max_features_bulk = 20000
 
 # CAP Settings
 # Change for different authority and organisations
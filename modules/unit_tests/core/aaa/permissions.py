@@ -8,7 +8,7 @@ import re
 
 from gluon import *
 from gluon.storage import Storage
-from core import S3Permission, MetaFields
+from core import ACLCache, S3Permission, MetaFields
 
 from unit_tests import run_suite
 
@@ -279,6 +279,196 @@ class ACLManagementTests(unittest.TestCase):
                 del table[acl_id]
             auth.s3_delete_role(group_id)
 
+# =============================================================================
+class ACLCacheTests(unittest.TestCase):
+    """ Test cross-request caching of compiled ACLs """
+
+    def setUp(self):
+
+        settings = current.deployment_settings
+
+        # Stash settings
+        self.policy = settings.get_security_policy()
+        self.acl_cache = settings.get_security_acl_cache()
+
+        settings.security.policy = 5
+        settings.security.acl_cache = True
+
+        auth = current.auth
+        auth.permission = S3Permission(auth)
+
+        ACLCache.clear()
+
+    def tearDown(self):
+
+        settings = current.deployment_settings
+
+        # Restore settings
+        settings.security.policy = self.policy
+        settings.security.acl_cache = self.acl_cache
+
+        ACLCache.clear()
+
+        # Restore permissions service
+        auth = current.auth
+        auth.permission = S3Permission(auth)
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testCacheHit(self):
+        """ Test that compiled ACLs are reused for the same roles/realms """
+
+        auth = current.auth
+        permission = auth.permission
+
+        group_id = auth.s3_create_role("Test Role", uid="TEST")
+        try:
+            permission.update_acl(group_id,
+                                  c = "pr",
+                                  f = "person",
+                                  uacl = permission.READ,
+                                  oacl = permission.READ,
+                                  )
+            realms = {group_id: None}
+
+            acls = permission.applicable_acls(permission.READ,
+                                              realms = realms,
+                                              c = "pr",
+                                              f = "person",
+                                              )
+            stats = ACLCache.stats()
+            self.assertEqual(stats["hits"], 0)
+            self.assertEqual(stats["misses"], 1)
+
+            cached = permission.applicable_acls(permission.READ,
+                                                realms = realms,
+                                                c = "pr",
+                                                f = "person",
+                                                )
+            self.assertEqual(cached, acls)
+            stats = ACLCache.stats()
+            self.assertEqual(stats["hits"], 1)
+            self.assertEqual(stats["misses"], 1)
+            self.assertEqual(stats["ratio"], 0.5)
+
+            # Different realms => different entry
+            permission.applicable_acls(permission.READ,
+                                       realms = {group_id: [1]},
+                                       c = "pr",
+                                       f = "person",
+                                       )
+            self.assertEqual(ACLCache.stats()["misses"], 2)
+        finally:
+            auth.s3_delete_role(group_id)
+
+    # -------------------------------------------------------------------------
+    def testInvalidate(self):
+        """ Test that updating an ACL invalidates the cache """
+
+        auth = current.auth
+        permission = auth.permission
+
+        group_id = auth.s3_create_role("Test Role", uid="TEST")
+        try:
+            permission.update_acl(group_id,
+                                  c = "pr",
+                                  f = "person",
+                                  uacl = permission.READ,
+                                  oacl = permission.READ,
+                                  )
+            realms = {group_id: None}
+
+            acls = permission.applicable_acls(permission.UPDATE,
+                                              realms = realms,
+                                              c = "pr",
+                                              f = "person",
+                                              )
+            self.assertEqual(acls, {})
+
+            permission.update_acl(group_id,
+                                  c = "pr",
+                                  f = "person",
+                                  uacl = permission.READ,
+                                  oacl = permission.READ | permission.UPDATE,
+                                  )
+            acls = permission.applicable_acls(permission.UPDATE,
+                                              realms = realms,
+                                              c = "pr",
+                                              f = "person",
+                                              )
+            self.assertEqual(list(acls.keys()), ["ANY"])
+            self.assertEqual(ACLCache.stats()["hits"], 0)
+        finally:
+            auth.s3_delete_role(group_id)
+
+    # -------------------------------------------------------------------------
+    def testRevoke(self):
+        """ Test that a revoked ACL is no longer applied by the next request """
+
+        auth = current.auth
+        permission = auth.permission
+
+        group_id = auth.s3_create_role("Test Role", uid="TEST")
+        try:
+            permission.update_acl(group_id,
+                                  c = "pr",
+                                  f = "person",
+                                  uacl = permission.READ,
+                                  oacl = permission.READ | permission.UPDATE,
+                                  )
+            realms = {group_id: None}
+
+            acls = permission.applicable_acls(permission.UPDATE,
+                                              realms = realms,
+                                              c = "pr",
+                                              f = "person",
+                                              )
+            self.assertEqual(list(acls.keys()), ["ANY"])
+
+            # Revoke the ACL
+            permission.delete_acl(group_id, c="pr", f="person")
+
+            acls = permission.applicable_acls(permission.UPDATE,
+                                              realms = realms,
+                                              c = "pr",
+                                              f = "person",
+                                              )
+            self.assertEqual(acls, {})
+        finally:
+            auth.s3_delete_role(group_id)
+
+    # -------------------------------------------------------------------------
+    def testConcurrentRevoke(self):
+        """
+            Test that ACLs compiled while a revoking transaction is
+            pending are not retained after its commit or rollback
+        """
+
+        assertEqual = self.assertEqual
+        db = current.db
+
+        key = ("test",)
+
+        for end_transaction in (db.commit, db.rollback):
+
+            # Other request captures the generation and compiles the ACLs
+            generation = ACLCache.current_generation()
+
+            # ACL gets revoked in the meantime
+            ACLCache.invalidate()
+
+            # Compiled ACLs (from outdated permissions) must not be used
+            ACLCache.store(key, "outdated", generation)
+            assertEqual(ACLCache.get(key), None)
+
+            # ACLs compiled inside the revoking transaction are discarded
+            # when the transaction ends (regardless whether committed or not)
+            ACLCache.store(key, "pending", ACLCache.current_generation())
+            assertEqual(ACLCache.get(key), "pending")
+            end_transaction()
+            assertEqual(ACLCache.get(key), None)
+
 # =============================================================================
 class HasPermissionTests(unittest.TestCase):
     """ Test permission check method """
@@ -1445,6 +1635,7 @@ if __name__ == "__main__":
     run_suite(
         PermissionFailureTests,
         ACLManagementTests,
+        ACLCacheTests,
         HasPermissionTests,
         AccessibleQueryTests,
         )
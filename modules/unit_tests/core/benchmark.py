@@ -57,6 +57,23 @@ def info(msg):
 #@unittest.skip("Comment or remove this line in modules/unit_tests/eden/benchmark.py to activate this test")
 class S3PerformanceTests(unittest.TestCase):
 
+    def setUp(self):
+
+        from core import DataModel
+
+        # Remember the models loaded in the current request
+        self.loaded = current.response.get(DataModel.LOAD)
+
+    def tearDown(self):
+
+        from core import DataModel
+
+        response = current.response
+        if self.loaded is None:
+            response.pop(DataModel.LOAD, None)
+        else:
+            response[DataModel.LOAD] = self.loaded
+
     def testDBSelect(self):
         """ DAL query peak performance """
 
@@ -131,6 +148,71 @@ class S3PerformanceTests(unittest.TestCase):
             info("DataModel.__getitem__(non-table) = %s µs" % mlt)
             self.assertTrue(mlt<10)
 
+    def testDataModelLoad(self):
+
+        from core import DataModel
+
+        s3db = current.s3db
+        response = current.response
+        settings = current.deployment_settings
+
+        info("")
+        prefixes = ("org", "pr", "hrm")
+
+        def load():
+            # Forget loaded models, so they are loaded again like in a
+            # new request (except for the table definitions themselves)
+            response[DataModel.LOAD] = []
+            for prefix in prefixes:
+                s3db.load(prefix)
+
+        def scan(prefix):
+            # Baseline: rebuild the names index for every lookup, which
+            # costs about the same as the module scan it replaced
+            DataModel.INDEX.pop(prefix, None)
+            return DataModel.names_index(s3db, prefix)
+
+        # Baseline load
+        load()
+        s3db.names_index = scan
+        try:
+            baseline = timeit.Timer(load).timeit(number=20) * 50
+        finally:
+            del s3db.names_index
+        info("DataModel.load(%s), baseline = %s ms" % (", ".join(prefixes), baseline))
+
+        load()
+        mlt = timeit.Timer(load).timeit(number=20) * 50
+        info("DataModel.load(%s) = %s ms (%.2fx baseline)" % \
+             (", ".join(prefixes), mlt, mlt / baseline if baseline else 0))
+
+        # Breakdown by model
+        profile = settings.base.get("model_profile")
+        settings.base.model_profile = True
+        DataModel.profile(reset=True)
+        try:
+            load()
+        finally:
+            settings.base.model_profile = profile
+        for item in DataModel.profile(reset=True)[:5]:
+            info("  %(model)s = %(exclusive)s ms" % item)
+
+        # Baseline lookup of unknown names
+        s3db.names_index = scan
+        try:
+            x = lambda: s3db.has("org_nonexistent")
+            baseline = timeit.Timer(x).timeit(number=10000) * 100
+        finally:
+            del s3db.names_index
+        info("DataModel.has(unknown), baseline = %s µs" % baseline)
+
+        x = lambda: s3db.has("org_nonexistent")
+        mlt = timeit.Timer(x).timeit(number=10000) * 100
+        info("DataModel.has(unknown) = %s µs (%.2fx baseline)" % \
+             (mlt, mlt / baseline if baseline else 0))
+        self.assertTrue(mlt<10)
+        self.assertTrue(mlt<baseline)
+
     def testDataModelConfigure(self):
 
         s3db = current.s3db
@@ -284,6 +366,32 @@ class S3PerformanceTests(unittest.TestCase):
 
         current.auth.override = False
 
+    def testResourceSelect(self):
+        """ CRUDResource.select with fields in multiple joined tables """
+
+        s3db = current.s3db
+
+        info("")
+        resource = s3db.resource("pr_person")
+        list_fields = ["id",
+                       "first_name",
+                       "last_name",
+                       "person_details.occupation",
+                       "contact.value",
+                       "address.location_id",
+                       "human_resource.organisation_id",
+                       "human_resource.job_title_id",
+                       ]
+        n = resource.count()
+        if n:
+            limit = min(n, 50)
+            x = lambda: resource.select(list_fields,
+                                        limit = limit,
+                                        represent = True,
+                                        )
+            mlt = timeit.Timer(x).timeit(number = 10) * 100 / limit
+            info("CRUDResource.select (joined tables) = %s ms/record (=%s rec/sec)" % (mlt, int(1000/mlt)))
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -0,0 +1,165 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/filters/options.py
+
+import unittest
+
+from gluon import *
+from core import *
+
+from unit_tests import run_suite
+
+# =============================================================================
+class OptionsFilterLookupTests(unittest.TestCase):
+    """ Tests for combined and cached lookups of filter options """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        org_ids = [otable.insert(name="Options Filter Test Org %s" % i)
+                   for i in range(3)
+                   ]
+
+        ttable = s3db.org_office_type
+        type_ids = [ttable.insert(name="Options Filter Test Type %s" % i)
+                    for i in range(3)
+                    ]
+
+        ftable = s3db.org_office
+        for org_id, type_id in ((0, 1), (0, 2), (2, 2)):
+            ftable.insert(name = "Options Filter Test Office",
+                          organisation_id = org_ids[org_id],
+                          office_type_id = type_ids[type_id],
+                          )
+
+        self.org_ids = org_ids
+        self.type_ids = type_ids
+
+        current.response.s3.filter_options = None
+        FilterOptionsCache.clear()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        FilterOptionsCache.clear()
+        current.response.s3.filter_options = None
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def resource(self):
+        """ Helper to get the filtered resource """
+
+        return current.s3db.resource("org_office",
+                                     filter = FS("name") == "Options Filter Test Office",
+                                     )
+
+    # -------------------------------------------------------------------------
+    def testPrefetch(self):
+        """ Test combined lookup of options for multiple filter widgets """
+
+        assertEqual = self.assertEqual
+
+        org_ids, type_ids = self.org_ids, self.type_ids
+
+        widgets = [OptionsFilter("organisation_id"),
+                   OptionsFilter("office_type_id"),
+                   ]
+        selectors = ("organisation_id", "office_type_id")
+        resource = self.resource()
+
+        # Individual lookups
+        expected = []
+        for widget, selector in zip(widgets, selectors):
+            current.response.s3.filter_options = None
+            rfield = S3ResourceField(resource, selector)
+            expected.append(set(widget._lookup_options(resource, rfield)))
+        assertEqual(expected[0], {org_ids[0], org_ids[2]})
+        assertEqual(expected[1], {type_ids[1], type_ids[2]})
+
+        # Combined lookup
+        current.response.s3.filter_options = None
+        OptionsFilter.prefetch(resource, widgets)
+        assertEqual(len(current.response.s3.filter_options), 2)
+
+        # Widgets use the prefetched options
+        for widget, selector, opt_keys in zip(widgets, selectors, expected):
+            rfield = S3ResourceField(resource, selector)
+            lookup = widget._reverse_lookup(resource, rfield)
+            cache_key = widget._cache_key(resource, *lookup)
+            assertEqual(set(current.response.s3.filter_options[cache_key]), opt_keys)
+            assertEqual(set(widget._lookup_options(resource, rfield)), opt_keys)
+
+    # -------------------------------------------------------------------------
+    def testCache(self):
+        """ Test caching and invalidation of option sets """
+
+        assertEqual = self.assertEqual
+
+        settings = current.deployment_settings
+        setting = settings.search.get("filter_options_cache")
+        settings.search.filter_options_cache = True
+
+        try:
+            widget = OptionsFilter("organisation_id")
+            resource = self.resource()
+            rfield = S3ResourceField(resource, "organisation_id")
+
+            lookup = widget._reverse_lookup(resource, rfield)
+            cache_key = widget._cache_key(resource, *lookup)
+
+            expected = {self.org_ids[0], self.org_ids[2]}
+            assertEqual(set(widget._lookup_options(resource, rfield)), expected)
+
+            # Option set is cached
+            cached = FilterOptionsCache.get(cache_key)
+            assertEqual(set(cached), expected)
+
+            # Update of an involved table invalidates the cache
+            FilterOptionsCache.invalidate("org_office")
+            assertEqual(FilterOptionsCache.get(cache_key), None)
+
+            # Involved tables are monitored for writes
+            assertEqual(FilterOptionsCache.is_monitored("org_office"), True)
+            assertEqual(FilterOptionsCache.is_monitored("org_facility"), False)
+
+            # Option sets looked up while another transaction writes
+            # to an involved table are not retained
+            generations = {"org_office": FilterOptionsCache.generation("org_office")}
+            FilterOptionsCache.invalidate("org_office")
+            FilterOptionsCache.store(cache_key, generations, [1])
+            assertEqual(FilterOptionsCache.get(cache_key), None)
+
+            # ...nor are those looked up inside the writing transaction,
+            # once it has ended
+            generations = {"org_office": FilterOptionsCache.generation("org_office")}
+            FilterOptionsCache.store(cache_key, generations, [1])
+            assertEqual(FilterOptionsCache.get(cache_key), [1])
+            current.db.rollback()
+            assertEqual(FilterOptionsCache.get(cache_key), None)
+
+            # Outdated entries expire
+            generations = {"org_office": FilterOptionsCache.generation("org_office")}
+            FilterOptionsCache.store(cache_key, generations, [1])
+            assertEqual(FilterOptionsCache.get(cache_key), [1])
+            entry = FilterOptionsCache.entries[cache_key]
+            FilterOptionsCache.entries[cache_key] = (0,) + entry[1:]
+            assertEqual(FilterOptionsCache.get(cache_key), None)
+        finally:
+            settings.search.filter_options_cache = setting
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        OptionsFilterLookupTests,
+    )
+
+# END ========================================================================
@@ -1 +1,2 @@
 from .xml import *
+from .xlsx import *
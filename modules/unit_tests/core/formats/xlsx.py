@@ -0,0 +1,138 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/formats/xlsx.py
+#
+import unittest
+
+from gluon import *
+
+from core import FS, MetaFields, XLSXWriter
+
+from unit_tests import run_suite
+
+# =============================================================================
+class XLSXStreamTests(unittest.TestCase):
+    """ Tests for batched XLSX exports (streaming mode) """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        # Define test table
+        db.define_table("xlsx_stream_test",
+                        Field("name"),
+                        Field("value", "integer"),
+                        *MetaFields())
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.xlsx_stream_test.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        self.batch_size = current.deployment_settings.get_xls_stream_batch_size()
+
+        # Create test records
+        table = current.db.xlsx_stream_test
+        for i in range(10):
+            table.insert(name = "Record%s" % i,
+                         value = i,
+                         )
+
+    def tearDown(self):
+
+        current.deployment_settings.base.xls_stream_batch_size = self.batch_size
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def resource():
+        """ Get a filtered resource for the test records """
+
+        return current.s3db.resource("xlsx_stream_test",
+                                     filter = FS("value") > 2,
+                                     )
+
+    # -------------------------------------------------------------------------
+    def testBatches(self):
+        """ Records extracted in multiple batches equal a single batch """
+
+        assertEqual = self.assertEqual
+
+        list_fields = ["id", "name", "value"]
+
+        def extract(batch_size):
+            resource = self.resource()
+            batches = list(XLSXWriter.batches(resource,
+                                              list_fields,
+                                              batch_size = batch_size,
+                                              ))
+            rows = [dict((k, v) for k, v in row.items() if k != "_row")
+                    for data in batches for row in data.rows]
+
+            # Resource filter not altered by the batches
+            assertEqual(resource.count(), 7)
+
+            return len(batches), rows
+
+        numbatches, expected = extract(100)
+        assertEqual(numbatches, 1)
+        assertEqual(len(expected), 7)
+
+        numbatches, rows = extract(3)
+        assertEqual(numbatches, 3)
+        assertEqual(rows, expected)
+
+        # Batch size matching the number of records
+        numbatches, rows = extract(7)
+        assertEqual(numbatches, 1)
+        assertEqual(rows, expected)
+
+    # -------------------------------------------------------------------------
+    def testEncode(self):
+        """ Multi-batch export produces the same spreadsheet as single-batch """
+
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            self.skipTest("OpenPyXL not installed")
+
+        settings = current.deployment_settings
+
+        def export(batch_size):
+            settings.base.xls_stream_batch_size = batch_size
+            output = XLSXWriter.encode_stream(self.resource(),
+                                              list_fields = ["name", "value"],
+                                              title = "Test",
+                                              as_stream = True,
+                                              )
+            wb = load_workbook(output)
+            return [list(ws.values) for ws in wb.worksheets]
+
+        expected = export(100)
+        self.assertEqual(export(2), expected)
+
+        # All matching records exported
+        names = [row[0] for row in expected[0]
+                 if row and str(row[0]).startswith("Record")]
+        self.assertEqual(names, ["Record%s" % i for i in range(3, 10)])
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        XLSXStreamTests,
+    )
+
+# END ========================================================================
@@ -5,6 +5,7 @@
 #
 import json
 import os
+import tempfile
 import unittest
 
 from io import BytesIO, StringIO
@@ -12,7 +13,7 @@ from lxml import etree
 
 from gluon import *
 
-from core import S3Hierarchy, MetaFields, S3Represent, S3RepresentLazy, S3XMLFormat, IS_ONE_OF
+from core import S3Hierarchy, MetaFields, S3Represent, S3RepresentLazy, S3XMLFormat, XSLTCache, IS_ONE_OF
 
 from unit_tests import run_suite
 
@@ -260,6 +261,83 @@ class XMLFormatTests(unittest.TestCase):
         self.assertEqual(len(root), 0)
         self.assertEqual(root.text, "Test")
 
+# =============================================================================
+class XSLTCacheTests(unittest.TestCase):
+    """ Test caching of compiled XSLT stylesheets """
+
+    stylesheet = """<?xml version="1.0"?>
+<xsl:stylesheet
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+
+    <xsl:output method="xml"/>
+
+    <xsl:template match="/">
+        <test>%s</test>
+    </xsl:template>
+</xsl:stylesheet>"""
+
+    def setUp(self):
+
+        settings = current.deployment_settings
+        self.xslt_cache = settings.get_base_xslt_cache()
+        settings.base.xslt_cache = True
+
+        handle, self.path = tempfile.mkstemp(suffix=".xsl")
+        with os.fdopen(handle, "w") as stylesheet:
+            stylesheet.write(self.stylesheet % "Test1")
+
+        xmlstr = """<?xml version="1.0"?><s3xml/>"""
+        self.tree = etree.ElementTree(etree.fromstring(xmlstr))
+
+    def tearDown(self):
+
+        current.deployment_settings.base.xslt_cache = self.xslt_cache
+        XSLTCache.clear()
+
+        os.remove(self.path)
+
+    # -------------------------------------------------------------------------
+    def testReuse(self):
+        """ Test that the compiled stylesheet is reused """
+
+        assertEqual = self.assertEqual
+
+        xml = current.xml
+        path = self.path
+
+        result = xml.transform(self.tree, path)
+        assertEqual(result.getroot().text, "Test1")
+
+        transformer = XSLTCache.lookup(path).transformer
+        self.assertNotEqual(transformer, None)
+
+        result = xml.transform(self.tree, path)
+        assertEqual(result.getroot().text, "Test1")
+        self.assertIs(XSLTCache.lookup(path).transformer, transformer)
+
+        # S3XMLFormat uses the same entry
+        result = S3XMLFormat(path).transform(self.tree)
+        assertEqual(result.getroot().text, "Test1")
+        self.assertIs(XSLTCache.lookup(path).transformer, transformer)
+
+    # -------------------------------------------------------------------------
+    def testModified(self):
+        """ Test that the stylesheet is re-compiled when modified """
+
+        xml = current.xml
+        path = self.path
+
+        result = xml.transform(self.tree, path)
+        self.assertEqual(result.getroot().text, "Test1")
+
+        mtime = os.stat(path).st_mtime
+        with open(path, "w") as stylesheet:
+            stylesheet.write(self.stylesheet % "Test2")
+        os.utime(path, (mtime + 1, mtime + 1))
+
+        result = xml.transform(self.tree, path)
+        self.assertEqual(result.getroot().text, "Test2")
+
 # =============================================================================
 class GetFieldOptionsTests(unittest.TestCase):
     """ Test field options introspection method """
@@ -1089,6 +1167,63 @@ class EntityResolverTests(unittest.TestCase):
         with self.assertRaises(SyntaxError):
             resource.import_xml(BytesIO(self.forbidden.encode("utf-8")))
 
+# =============================================================================
+class CSVChunkingTests(unittest.TestCase):
+    """ Tests for chunked conversion of CSV sources """
+
+    CSV = b"""Name,Comments
+#name,#comments
+Test1,A
+Test2,B
+
+Test3,C
+Test4,D
+Test5,E
+"""
+
+    # -------------------------------------------------------------------------
+    def testChunks(self):
+        """ Rows are split into chunks of the requested size """
+
+        assertEqual = self.assertEqual
+
+        xml = current.xml
+
+        trees = list(xml.csv2trees(BytesIO(self.CSV),
+                                   resourcename = "test",
+                                   extra_data = {"Extra": "X"},
+                                   chunk_size = 2,
+                                   ))
+        assertEqual([len(t.getroot()) for t in trees], [2, 2, 1])
+
+        names = []
+        for tree in trees:
+            root = tree.getroot()
+            assertEqual(root.get("name"), "test")
+            for row in root:
+                cols = {col.get("field"): col for col in row}
+                names.append(cols["Name"].text)
+                # Hashtags and extra data apply to all chunks
+                assertEqual(cols["Name"].get("hashtag"), "#name")
+                assertEqual(cols["Extra"].text, "X")
+        assertEqual(names, ["Test1", "Test2", "Test3", "Test4", "Test5"])
+
+    # -------------------------------------------------------------------------
+    def testNoChunks(self):
+        """ Without chunk size, csv2tree converts all rows at once """
+
+        assertEqual = self.assertEqual
+
+        xml = current.xml
+
+        tree = xml.csv2tree(BytesIO(self.CSV), resourcename="test")
+        assertEqual(len(tree.getroot()), 5)
+
+        # Empty source still produces a tree
+        trees = list(xml.csv2trees(BytesIO(b"Name,Comments\n"), chunk_size=2))
+        assertEqual(len(trees), 1)
+        assertEqual(len(trees[0].getroot()), 0)
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -1096,6 +1231,8 @@ if __name__ == "__main__":
         TreeBuilderTests,
         JSONMessageTests,
         XMLFormatTests,
+        XSLTCacheTests,
+        CSVChunkingTests,
         GetFieldOptionsTests,
         S3JSONParsingTests,
         LookupListRepresentTests,
@@ -5,6 +5,7 @@
 
 import unittest
 import datetime
+import json
 
 from gluon import *
 from gluon.storage import Storage
@@ -362,6 +363,95 @@ class LocationTreeTests(unittest.TestCase):
         # We should have seen all the expected parents.
         self.assertEqual(len(expected_parents), 0)
 
+    # -------------------------------------------------------------------------
+    def testRebuildLocationTree(self):
+        """ Test bulk rebuild of the location tree, and moving a subtree """
+
+        table = self.table
+        db = current.db
+        gis = current.gis
+
+        POLYGON = "POLYGON ((30 10, 40 40, 20 40, 10 20, 30 10))"
+
+        L0_id = table.insert(level = "L0",
+                             name = "s3gis.testRebuild.L0",
+                             lat = 10.0,
+                             lon = -10.0,
+                             )
+        L1a_id = table.insert(level = "L1",
+                              name = "s3gis.testRebuild.L1a",
+                              parent = L0_id,
+                              )
+        L1b_id = table.insert(level = "L1",
+                              name = "s3gis.testRebuild.L1b",
+                              parent = L0_id,
+                              lat = 20.0,
+                              lon = -20.0,
+                              )
+        form = Storage(vars = Storage(level = "L2",
+                                      name = "s3gis.testRebuild.L2",
+                                      parent = L1a_id,
+                                      wkt = POLYGON,
+                                      ),
+                       errors = None,
+                       )
+        gis.wkt_centroid(form)
+        L2_id = table.insert(**form.vars)
+        P_id = table.insert(name = "s3gis.testRebuild.Point",
+                            parent = L2_id,
+                            )
+
+        # Rebuild the subtree of the L0
+        gis.rebuild_location_tree(root=L0_id)
+
+        assertEqual = self.assertEqual
+
+        record = db(table.id == L1a_id).select(*self.fields,
+                                               limitby = (0, 1),
+                                               ).first()
+        assertEqual(record.path, "%s/%s" % (L0_id, L1a_id))
+        assertEqual(record.inherited, True)
+        assertEqual(record.lat, 10.0)
+        assertEqual(record.lon, -10.0)
+        assertEqual(record.lat_min, 10.0)
+        assertEqual(record.wkt, "POINT (-10.0 10.0)")
+        assertEqual(record.L0, "s3gis.testRebuild.L0")
+        assertEqual(record.L1, "s3gis.testRebuild.L1a")
+        if self.spatialdb:
+            self.assertTrue(record.the_geom is not None)
+
+        record = db(table.id == P_id).select(*self.fields,
+                                             limitby = (0, 1),
+                                             ).first()
+        assertEqual(record.path, "%s/%s/%s/%s" % (L0_id, L1a_id, L2_id, P_id))
+        assertEqual(record.inherited, True)
+        self.assertAlmostEqual(record.lat, form.vars.lat, 13)
+        self.assertAlmostEqual(record.lon, form.vars.lon, 13)
+        assertEqual(record.L1, "s3gis.testRebuild.L1a")
+        assertEqual(record.L2, "s3gis.testRebuild.L2")
+        assertEqual(record.L3, None)
+
+        # Move the L2 to the other L1, and rebuild its subtree
+        db(table.id == L2_id).update(parent = L1b_id)
+        gis.rebuild_location_tree(root=L2_id)
+
+        record = db(table.id == L2_id).select(*self.fields,
+                                              limitby = (0, 1),
+                                              ).first()
+        assertEqual(record.path, "%s/%s/%s" % (L0_id, L1b_id, L2_id))
+        assertEqual(record.inherited, False)
+        assertEqual(record.wkt, POLYGON)
+        assertEqual(record.L1, "s3gis.testRebuild.L1b")
+
+        record = db(table.id == P_id).select(*self.fields,
+                                             limitby = (0, 1),
+                                             ).first()
+        assertEqual(record.path, "%s/%s/%s/%s" % (L0_id, L1b_id, L2_id, P_id))
+        assertEqual(record.L1, "s3gis.testRebuild.L1b")
+
+        # Nothing to do when the tree is up-to-date
+        assertEqual(gis.rebuild_location_tree(root=L0_id), 0)
+
     # -------------------------------------------------------------------------
     def _testL0(self, with_level):
         """ Test updating a Country with Polygon """
@@ -818,12 +908,92 @@ class NoGisConfigTests(unittest.TestCase):
         xml = map.xml()
         self.assertTrue("Map cannot display without GIS config!" in s3_str(xml))
 
+# =============================================================================
+class GeoJSONBulkExportTests(unittest.TestCase):
+    """ Tests for the GeoJSON bulk export of feature layers """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        permission = current.auth.permission
+        self.format = permission.format
+        permission.format = "geojson"
+
+        s3db = current.s3db
+
+        ltable = s3db.gis_location
+        otable = s3db.org_organisation
+        ftable = s3db.org_office
+
+        organisation_id = otable.insert(name = "GeoJSON Test Organisation")
+        self.office_ids = []
+        for i in range(3):
+            location_id = ltable.insert(name = "GeoJSON Test Location %s" % i,
+                                        lat = 10.0 + i,
+                                        lon = 20.0 + i,
+                                        )
+            office_id = ftable.insert(name = "GeoJSON Test Office %s" % i,
+                                      organisation_id = organisation_id,
+                                      location_id = location_id,
+                                      )
+            self.office_ids.append(office_id)
+
+    def tearDown(self):
+
+        current.auth.permission.format = self.format
+        current.auth.override = False
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testExportFeatures(self):
+        """ Test bulk export of point features """
+
+        assertEqual = self.assertEqual
+
+        resource = current.s3db.resource("org_office", id=self.office_ids)
+        output = GIS.export_features(resource, attr_fields="name", chunk_size=2)
+        self.assertIsNotNone(output)
+
+        data = json.loads(b"".join(output))
+        assertEqual(data["type"], "FeatureCollection")
+
+        features = data["features"]
+        assertEqual(len(features), 3)
+
+        features = {f["properties"]["id"]: f for f in features}
+        for i, office_id in enumerate(self.office_ids):
+            feature = features[office_id]
+            assertEqual(feature["geometry"]["type"], "Point")
+            assertEqual(feature["geometry"]["coordinates"], [20.0 + i, 10.0 + i])
+            assertEqual(feature["properties"]["name"], "GeoJSON Test Office %s" % i)
+
+    # -------------------------------------------------------------------------
+    def testExportEmpty(self):
+        """ Test bulk export of an empty layer """
+
+        resource = current.s3db.resource("org_office", id=[0])
+        output = GIS.export_features(resource)
+
+        data = json.loads(b"".join(output))
+        self.assertEqual(data, {"type": "FeatureCollection", "features": []})
+
+    # -------------------------------------------------------------------------
+    def testFallback(self):
+        """ Test fallback to XSLT export for special tables """
+
+        resource = current.s3db.resource("gis_location", id=[0])
+        self.assertIsNone(GIS.export_features(resource))
+
 # =============================================================================
 if __name__ == "__main__":
 
     run_suite(
         LocationTreeTests,
         NoGisConfigTests,
+        GeoJSONBulkExportTests,
         )
 
 # END ========================================================================
@@ -1,3 +1,6 @@
 from .anonymize import *
+from .checkpoint import *
 from .crud import *
 from .grouped import *
+from .report import *
+from .tiles import *
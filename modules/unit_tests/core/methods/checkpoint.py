@@ -0,0 +1,294 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/methods/checkpoint.py
+#
+import datetime
+import unittest
+
+from gluon import current, HTTP
+
+from core import CaseEventRules, Checkpoint, CRUDRequest
+
+from unit_tests import run_suite
+
+# =============================================================================
+class CaseEventRulesTests(unittest.TestCase):
+    """ Tests for the in-memory evaluation of case event rules """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        db = current.db
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        organisation_id = otable.insert(name = "Checkpoint Test Organisation")
+
+        ptable = s3db.pr_person
+        self.person_ids = [ptable.insert(first_name = "Checkpoint",
+                                         last_name = "Tester %s" % i,
+                                         )
+                           for i in range(2)
+                           ]
+
+        ttable = s3db.dvr_case_event_type
+        type_ids = {}
+        for code, max_per_day, min_interval, residents_only in \
+            (("MAX", 2, None, False),
+             ("INTERVAL", None, 6.0, False),
+             ("NOCOMBI", None, None, False),
+             ("RESIDENTS", None, None, True),
+             ):
+            type_ids[code] = ttable.insert(organisation_id = organisation_id,
+                                           event_class = "C",
+                                           code = code,
+                                           name = "Checkpoint Test %s" % code,
+                                           max_per_day = max_per_day,
+                                           min_interval = min_interval,
+                                           residents_only = residents_only,
+                                           )
+        self.type_ids = type_ids
+
+        xtable = s3db.dvr_case_event_exclusion
+        xtable.insert(type_id = type_ids["NOCOMBI"],
+                      excluded_by_id = type_ids["MAX"],
+                      )
+
+        rows = db(ttable.organisation_id == organisation_id).select(ttable.id,
+                                                                    ttable.code,
+                                                                    ttable.name,
+                                                                    ttable.min_interval,
+                                                                    ttable.max_per_day,
+                                                                    ttable.residents_only,
+                                                                    )
+        self.event_types = {row.id: row for row in rows}
+
+        self.now = datetime.datetime(2023, 6, 15, 12, 0, 0)
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def register(self, person_id, code, hours_ago):
+        """ Helper to register an event """
+
+        date = self.now - datetime.timedelta(hours=hours_ago)
+        current.s3db.dvr_case_event.insert(person_id = person_id,
+                                           type_id = self.type_ids[code],
+                                           date = date,
+                                           )
+
+    # -------------------------------------------------------------------------
+    def testRules(self):
+        """ Test evaluation of all rules for multiple persons """
+
+        assertEqual = self.assertEqual
+
+        register = self.register
+        person_a, person_b = self.person_ids
+
+        # Person A: MAX twice today, INTERVAL 3 hours ago
+        register(person_a, "MAX", 1)
+        register(person_a, "MAX", 2)
+        register(person_a, "INTERVAL", 3)
+
+        # Person B: MAX once today, INTERVAL yesterday 10 hours ago
+        register(person_b, "MAX", 1)
+        register(person_b, "INTERVAL", 13)
+
+        rules = CaseEventRules(self.event_types, now=self.now)
+        rules.load(self.person_ids)
+
+        type_ids = self.type_ids
+
+        blocked = rules.blocked_events(person_a, serializable=False)
+        assertEqual(set(blocked), {type_ids["MAX"],
+                                   type_ids["INTERVAL"],
+                                   type_ids["NOCOMBI"],
+                                   })
+        # Blocked until next day
+        assertEqual(blocked[type_ids["MAX"]][1], datetime.datetime(2023, 6, 16))
+        # Blocked until interval has passed
+        assertEqual(blocked[type_ids["INTERVAL"]][1], self.now + datetime.timedelta(hours=3))
+
+        blocked = rules.blocked_events(person_b, is_resident=False, serializable=False)
+        assertEqual(set(blocked), {type_ids["NOCOMBI"],
+                                   type_ids["RESIDENTS"],
+                                   })
+        # Residents-only blocks the registration for others too
+        assertEqual(blocked[type_ids["RESIDENTS"]][2], False)
+
+        # Check a single event type
+        blocked = rules.blocked_events(person_a,
+                                       event_type_id = type_ids["MAX"],
+                                       serializable = True,
+                                       )
+        assertEqual(list(blocked.keys()), ["MAX"])
+
+    # -------------------------------------------------------------------------
+    def testLoad(self):
+        """ Test that events are loaded once per person """
+
+        register = self.register
+        person_a, person_b = self.person_ids
+
+        register(person_a, "MAX", 1)
+
+        rules = CaseEventRules(self.event_types, now=self.now)
+        rules.load([person_a])
+        self.assertEqual(len(rules.events[person_a]), 1)
+
+        # Events registered after loading are not seen by this instance
+        register(person_a, "MAX", 0)
+        rules.load([person_a, person_b])
+        self.assertEqual(len(rules.events[person_a]), 1)
+        self.assertEqual(rules.events[person_b], [])
+
+        # Persons not loaded are loaded on demand
+        rules = CaseEventRules(self.event_types, now=self.now)
+        blocked = rules.blocked_events(person_a, serializable=False)
+        self.assertIn(self.type_ids["MAX"], blocked)
+
+# =============================================================================
+class CheckBatchTests(unittest.TestCase):
+    """ Tests for the batch check of ID labels """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.validate_id = settings.get_org_site_presence_validate_id()
+        settings.org.site_presence_validate_id = False
+
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        organisation_id = otable.insert(name = "Checkpoint Batch Test Organisation")
+        self.organisation_id = organisation_id
+
+        # Case status
+        stable = s3db.dvr_case_status
+        status_id = stable.insert(code = "CBTOPEN",
+                                  name = "Checkpoint Batch Test Open",
+                                  is_closed = False,
+                                  )
+
+        # Persons with cases, the last case archived
+        ptable = s3db.pr_person
+        ctable = s3db.dvr_case
+        person_ids = []
+        for i in range(3):
+            person_id = ptable.insert(first_name = "Checkpoint",
+                                      last_name = "Batch Tester %s" % i,
+                                      pe_label = "CBT00%s" % i,
+                                      )
+            ctable.insert(person_id = person_id,
+                          organisation_id = organisation_id,
+                          status_id = status_id,
+                          archived = i == 2,
+                          )
+            person_ids.append(person_id)
+        self.person_ids = person_ids
+
+        # Shelter of the organisation, with the first person as resident
+        shelter = {"name": "Checkpoint Batch Test Shelter",
+                   "organisation_id": organisation_id,
+                   }
+        shtable = s3db.cr_shelter
+        shelter["id"] = shtable.insert(**shelter)
+        s3db.update_super(shtable, shelter)
+
+        rtable = s3db.cr_shelter_registration
+        rtable.insert(shelter_id = shelter["id"],
+                      person_id = person_ids[0],
+                      registration_status = 2,
+                      )
+
+        # Event type for residents only
+        ttable = s3db.dvr_case_event_type
+        ttable.insert(organisation_id = organisation_id,
+                      event_class = "C",
+                      code = "CBTRESIDENTS",
+                      name = "Checkpoint Batch Test Residents",
+                      residents_only = True,
+                      )
+
+        self.r = CRUDRequest(prefix = "pr",
+                             name = "person",
+                             extension = "json",
+                             )
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        settings = current.deployment_settings
+        settings.org.site_presence_validate_id = self.validate_id
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testCheckBatch(self):
+        """ Labels are checked in bulk, results in order of the input """
+
+        assertEqual = self.assertEqual
+
+        labels = ["cbt001", "UNKNOWN", "CBT000", "CBT002"]
+        output = Checkpoint().check_batch(self.r, {"o": self.organisation_id,
+                                                   "l": labels,
+                                                   })
+        results = output["r"]
+        assertEqual(len(results), 4)
+
+        # Found persons, with their actual labels
+        assertEqual([result["l"] for result in results],
+                    ["CBT001", "UNKNOWN", "CBT000", "CBT002"])
+        assertEqual([result["s"] for result in results],
+                    [True, False, True, False])
+
+        # Persons not found (unknown label, or archived case)
+        for result in (results[1], results[3]):
+            self.assertIsNone(result["p"])
+            self.assertIsNotNone(result["a"])
+            self.assertNotIn("i", result)
+
+        # Residents-only event blocked for the non-resident only
+        self.assertIn("CBTRESIDENTS", results[0]["i"])
+        self.assertNotIn("CBTRESIDENTS", results[2]["i"])
+
+        # No labels
+        output = Checkpoint().check_batch(self.r, {"o": self.organisation_id})
+        assertEqual(output, {"r": []})
+
+    # -------------------------------------------------------------------------
+    def testMaxBatchSize(self):
+        """ Number of labels per request is limited """
+
+        labels = ["CBT%s" % i for i in range(Checkpoint.MAX_BATCH_SIZE + 1)]
+        with self.assertRaises(HTTP) as context:
+            Checkpoint().check_batch(self.r, {"o": self.organisation_id,
+                                              "l": labels,
+                                              })
+        self.assertEqual(context.exception.status, 400)
+
+        # Missing organisation
+        with self.assertRaises(HTTP):
+            Checkpoint().check_batch(self.r, {"l": ["CBT000"]})
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        CaseEventRulesTests,
+        CheckBatchTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,303 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/methods/report.py
+#
+import unittest
+
+from gluon import current
+
+from s3dal import Field
+from core import FS, MetaFields, S3PivotTable
+from core.methods.report import S3PivotTableFact
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from unit_tests import run_suite
+
+# =============================================================================
+class PivotTableTestCase(unittest.TestCase):
+    """ Base class for tests comparing pivot table engines """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        current.db.define_table("pivot_test",
+                                Field("category"),
+                                Field("flag", "boolean"),
+                                Field("amount", "integer"),
+                                Field("value", "double"),
+                                *MetaFields())
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.pivot_test.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.columnar = settings.get_ui_report_columnar()
+        self.pushdown = settings.get_ui_report_pushdown()
+
+        # Create test records: category C has no flagged records, some
+        # records have no category, and some have no amount
+        table = current.db.pivot_test
+        for i in range(12):
+            category = ("A", "B", "C", None)[i % 4]
+            table.insert(category = category,
+                         flag = i % 3 == 0 and category != "C",
+                         amount = i if i % 5 else None,
+                         value = i * 1.5,
+                         )
+
+    def tearDown(self):
+
+        ui = current.deployment_settings.ui
+        ui.report_columnar = self.columnar
+        ui.report_pushdown = self.pushdown
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def pivot(facts, columnar=False, pushdown=False, **attr):
+        """
+            Generate a pivot table for the test records
+
+            Args:
+                facts: the facts (URL syntax)
+                columnar: use the columnar engine
+                pushdown: use push-down aggregation
+                attr: additional parameters for S3PivotTable
+
+            Returns:
+                the S3PivotTable
+        """
+
+        ui = current.deployment_settings.ui
+        ui.report_columnar = columnar
+        ui.report_pushdown = pushdown
+
+        resource = current.s3db.resource("pivot_test")
+        return S3PivotTable(resource,
+                            "category",
+                            "flag",
+                            S3PivotTableFact.parse(facts),
+                            **attr)
+
+    # -------------------------------------------------------------------------
+    def assertSamePivotTable(self, pt, expected, records=True):
+        """
+            Assert that two pivot tables have the same axes, aggregates
+            and (optionally) records, in all layers
+
+            Args:
+                pt: the pivot table to check
+                expected: the pivot table with the expected results
+                records: compare the record IDs, too
+        """
+
+        assertEqual = self.assertEqual
+
+        assertEqual(pt.numrows, expected.numrows)
+        assertEqual(pt.numcols, expected.numcols)
+
+        def cells(pt, layer):
+            output = {}
+            for r, row in enumerate(pt.row):
+                for c, col in enumerate(pt.col):
+                    cell = pt.cell[r][c]
+                    output[(row.value, col.value)] = cell[layer]
+            return output
+
+        def keys(pt):
+            output = {}
+            for r, row in enumerate(pt.row):
+                for c, col in enumerate(pt.col):
+                    output[(row.value, col.value)] = sorted(pt.cell[r][c].records)
+            return output
+
+        for fact in expected.facts:
+            layer = fact.layer
+
+            assertEqual(pt.totals[layer], expected.totals[layer])
+
+            rows = dict((row.value, row[layer]) for row in pt.row)
+            assertEqual(rows, dict((row.value, row[layer]) for row in expected.row))
+
+            cols = dict((col.value, col[layer]) for col in pt.col)
+            assertEqual(cols, dict((col.value, col[layer]) for col in expected.col))
+
+            assertEqual(cells(pt, layer), cells(expected, layer))
+
+        if records:
+            assertEqual(keys(pt), keys(expected))
+
+            rows = dict((row.value, sorted(row.records)) for row in pt.row)
+            assertEqual(rows, dict((row.value, sorted(row.records)) for row in expected.row))
+
+            cols = dict((col.value, sorted(col.records)) for col in pt.col)
+            assertEqual(cols, dict((col.value, sorted(col.records)) for col in expected.col))
+
+# =============================================================================
+@unittest.skipIf(numpy is None, "NumPy not installed")
+class PivotTableColumnarTests(PivotTableTestCase):
+    """ Tests for the columnar engine of S3PivotTable """
+
+    # -------------------------------------------------------------------------
+    def testCount(self):
+        """ Counts match the standard engine """
+
+        pt = self.pivot("count(id)", columnar=True)
+        expected = self.pivot("count(id)")
+
+        self.assertEqual(expected.totals[("id", "count")], 12)
+        self.assertSamePivotTable(pt, expected)
+
+    # -------------------------------------------------------------------------
+    def testAggregates(self):
+        """ Numeric aggregates match the standard engine """
+
+        for facts in ("sum(amount)", "avg(value)", "min(amount)", "max(value)"):
+            pt = self.pivot(facts, columnar=True)
+            expected = self.pivot(facts)
+            self.assertSamePivotTable(pt, expected)
+
+    # -------------------------------------------------------------------------
+    def testMultipleLayers(self):
+        """ Multiple layers match the standard engine """
+
+        facts = "count(id),sum(amount),avg(value),min(value),max(amount)"
+
+        pt = self.pivot(facts, columnar=True)
+        expected = self.pivot(facts)
+
+        self.assertEqual(len(expected.facts), 5)
+        self.assertSamePivotTable(pt, expected)
+
+    # -------------------------------------------------------------------------
+    def testEmptyGroups(self):
+        """ Empty axis values and empty cells match the standard engine """
+
+        facts = "count(id),sum(amount),min(amount)"
+
+        pt = self.pivot(facts, columnar=True)
+        expected = self.pivot(facts)
+        self.assertSamePivotTable(pt, expected)
+
+        # Records without category are grouped, too
+        self.assertIn(None, [row.value for row in pt.row])
+
+        # Category C has no flagged records => empty cell
+        layer = ("id", "count")
+        for r, row in enumerate(pt.row):
+            if row.value != "C":
+                continue
+            for c, col in enumerate(pt.col):
+                if col.value is True:
+                    self.assertEqual(pt.cell[r][c][layer], 0)
+                    self.assertEqual(pt.cell[r][c].records, [])
+
+        # No records at all
+        resource = current.s3db.resource("pivot_test",
+                                         filter = FS("category") == "X",
+                                         )
+        ui = current.deployment_settings.ui
+        ui.report_columnar = True
+        pt = S3PivotTable(resource,
+                          "category",
+                          "flag",
+                          S3PivotTableFact.parse(facts),
+                          )
+        self.assertTrue(pt.empty)
+
+# =============================================================================
+class PivotTablePushdownTests(PivotTableTestCase):
+    """ Tests for push-down aggregation in S3PivotTable """
+
+    # -------------------------------------------------------------------------
+    def testCount(self):
+        """ Push-down counts match the standard engine """
+
+        assertEqual = self.assertEqual
+
+        pt = self.pivot("count(id)", pushdown=True)
+        assertEqual(pt.numrecords, 12)
+        assertEqual(len(pt), 12)
+
+        expected = self.pivot("count(id)")
+        self.assertSamePivotTable(pt, expected)
+
+    # -------------------------------------------------------------------------
+    def testAggregates(self):
+        """ Push-down sum/avg/min/max match the standard engine """
+
+        for facts in ("sum(amount)", "avg(value)", "avg(amount)",
+                      "min(amount)", "max(value)"):
+            pt = self.pivot(facts, pushdown=True)
+            self.assertEqual(pt.numrecords, 12)
+
+            expected = self.pivot(facts)
+            self.assertSamePivotTable(pt, expected)
+
+        # Multiple layers
+        facts = "count(id),sum(amount),avg(value),min(value),max(amount)"
+        pt = self.pivot(facts, pushdown=True)
+        expected = self.pivot(facts)
+        self.assertSamePivotTable(pt, expected)
+
+    # -------------------------------------------------------------------------
+    def testExplore(self):
+        """ Push-down retains the records per cell for cell explore """
+
+        assertEqual = self.assertEqual
+
+        pt = self.pivot("sum(amount)", pushdown=True)
+        expected = self.pivot("sum(amount)")
+
+        # Same records per cell, row and column
+        self.assertSamePivotTable(pt, expected)
+        assertEqual(sorted(pt.records), sorted(expected.records))
+
+        # Same contributing records per cell in the JSON output
+        def keys(pt):
+            output = pt.json()
+            rows, cols = output["rows"], output["cols"]
+            return dict(((rows[i][3], cols[j][3]), sorted(cell.get("k", [])))
+                        for i, row in enumerate(output["cells"])
+                        for j, cell in enumerate(row))
+        assertEqual(keys(pt), keys(expected))
+
+        # Records not required without cell explore
+        pt = self.pivot("sum(amount)", pushdown=True, explore=False)
+        assertEqual(pt.records, {})
+        self.assertSamePivotTable(pt, expected, records=False)
+
+    # -------------------------------------------------------------------------
+    def testFallback(self):
+        """ Fallback to the standard engine for list facts """
+
+        pt = self.pivot("list(category)", pushdown=True)
+        self.assertEqual(pt.numrecords, None)
+        self.assertEqual(len(pt.records), 12)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        PivotTableColumnarTests,
+        PivotTablePushdownTests,
+    )
+
+# END ========================================================================
@@ -0,0 +1,189 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/methods/tiles.py
+#
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from gluon import current
+
+from core import FS, FeatureTiles
+
+from unit_tests import run_suite
+
+# =============================================================================
+class FeatureTilesTests(unittest.TestCase):
+    """ Tests for per-tile GeoJSON of feature layers """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        s3db = current.s3db
+
+        ltable = s3db.gis_location
+        otable = s3db.org_organisation
+        ftable = s3db.org_office
+
+        organisation_id = otable.insert(name = "Tile Test Organisation")
+        for i, (lat, lon) in enumerate(((10.0, 20.0),
+                                        (10.0001, 20.0001),
+                                        (-30.0, -60.0),
+                                        )):
+            location_id = ltable.insert(name = "Tile Test Location %s" % i,
+                                        lat = lat,
+                                        lon = lon,
+                                        )
+            ftable.insert(name = "Tile Test Office %s" % i,
+                          organisation_id = organisation_id,
+                          location_id = location_id,
+                          )
+
+    def tearDown(self):
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def encode(self, z, x, y, threshold=2, attr_fields=None):
+        """ Encode a tile for the test offices """
+
+        resource = current.s3db.resource("org_office",
+                                         filter = FS("name").like("Tile Test Office%"),
+                                         )
+        prefix = FeatureTiles.location_prefix(resource)
+        self.assertEqual(prefix, "location_id$")
+
+        output = FeatureTiles.encode(resource, prefix, z, x, y,
+                                     threshold = threshold,
+                                     attr_fields = attr_fields,
+                                     )
+        return json.loads(output)["features"]
+
+    # -------------------------------------------------------------------------
+    def testTileBounds(self):
+        """ Test computation of tile bounds """
+
+        assertAlmostEqual = self.assertAlmostEqual
+
+        lon_min, lat_min, lon_max, lat_max = FeatureTiles.tile_bounds(1, 1, 0)
+        assertAlmostEqual(lon_min, 0.0)
+        assertAlmostEqual(lat_min, 0.0)
+        assertAlmostEqual(lon_max, 180.0)
+        assertAlmostEqual(lat_max, 85.0511287798)
+
+    # -------------------------------------------------------------------------
+    def testClustering(self):
+        """ Test clustering of nearby points within a tile """
+
+        assertEqual = self.assertEqual
+
+        # North-east quadrant: two nearby points clustered
+        features = self.encode(1, 1, 0)
+        assertEqual(len(features), 1)
+        assertEqual(features[0]["properties"], {"cluster": True, "count": 2})
+
+        # Clustering disabled
+        features = self.encode(1, 1, 0, threshold=0)
+        assertEqual(len(features), 2)
+
+        # South-west quadrant: single point
+        features = self.encode(1, 0, 1)
+        assertEqual(len(features), 1)
+        assertEqual(features[0]["geometry"]["type"], "Point")
+        self.assertIn("id", features[0]["properties"])
+
+        # North-west quadrant: empty
+        assertEqual(self.encode(1, 0, 0), [])
+
+    # -------------------------------------------------------------------------
+    def testAttributes(self):
+        """ Test that features carry the attributes for popups and styles """
+
+        assertEqual = self.assertEqual
+
+        features = self.encode(1, 0, 1, attr_fields=["name"])
+        assertEqual(len(features), 1)
+
+        properties = features[0]["properties"]
+        assertEqual(properties["name"], "Tile Test Office 2")
+        self.assertIn("id", properties)
+
+        # Clusters carry no attributes
+        features = self.encode(1, 1, 0, attr_fields=["name"])
+        assertEqual(features[0]["properties"], {"cluster": True, "count": 2})
+
+    # -------------------------------------------------------------------------
+    def testMultiTileGeometries(self):
+        """ Test that polygons are returned in all tiles they intersect """
+
+        assertEqual = self.assertEqual
+
+        s3db = current.s3db
+
+        # Polygon across the prime meridian, centroid in the north-east quadrant
+        location_id = s3db.gis_location.insert(
+                        name = "Tile Test Polygon",
+                        gis_feature_type = 3,
+                        wkt = "POLYGON ((-10 5, 10 5, 10 15, -10 15, -10 5))",
+                        lat = 10.0,
+                        lon = 0.0,
+                        lat_min = 5.0,
+                        lat_max = 15.0,
+                        lon_min = -10.0,
+                        lon_max = 10.0,
+                        )
+        organisation_id = s3db.org_organisation.insert(name="Tile Test Organisation")
+        s3db.org_office.insert(name = "Tile Test Office Polygon",
+                               organisation_id = organisation_id,
+                               location_id = location_id,
+                               )
+
+        polygons = []
+        for x in (0, 1):
+            features = self.encode(1, x, 0, attr_fields=["name"])
+            shapes = [f for f in features if f["geometry"]["type"] == "Polygon"]
+            assertEqual(len(shapes), 1)
+            polygons.append(shapes[0])
+
+        # Same feature ID in both tiles, so that the client drops duplicates
+        assertEqual(polygons[0]["id"], polygons[1]["id"])
+        for polygon in polygons:
+            assertEqual(polygon["properties"]["name"], "Tile Test Office Polygon")
+
+        # Not in tiles outside of its bounds
+        features = self.encode(1, 0, 1)
+        assertEqual([f for f in features if f["geometry"]["type"] == "Polygon"], [])
+
+    # -------------------------------------------------------------------------
+    def testCacheCleanup(self):
+        """ Test removal of tiles superseded by a newer stamp """
+
+        root = tempfile.mkdtemp()
+        try:
+            variant = os.path.join(root, "org_office", "variant")
+            old = os.path.join(variant, "stamp1", "1", "0", "0.geojson")
+            new = os.path.join(variant, "stamp2", "1", "0", "0.geojson")
+
+            FeatureTiles.cache_store(old, "old")
+            self.assertTrue(os.path.exists(old))
+
+            FeatureTiles.cache_store(new, "new")
+            self.assertTrue(os.path.exists(new))
+            self.assertEqual(os.listdir(variant), ["stamp2"])
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        FeatureTilesTests,
+    )
+
+# END ========================================================================
@@ -10,7 +10,7 @@ from gluon import current, IS_EMPTY_OR, IS_FLOAT_IN_RANGE, IS_INT_IN_RANGE, IS_I
 from gluon.languages import lazyT
 from gluon.storage import Storage
 
-from core import MetaFields, DYNAMIC_PREFIX, IS_NOT_ONE_OF, IS_ONE_OF, IS_UTC_DATE, IS_UTC_DATETIME
+from core import DataModel, MetaFields, DYNAMIC_PREFIX, IS_NOT_ONE_OF, IS_ONE_OF, IS_UTC_DATE, IS_UTC_DATETIME
 from core.model.dynamic import DynamicTableModel
 
 from unit_tests import run_suite
@@ -223,11 +223,67 @@ class SuperEntityTests(unittest.TestCase):
         super_record = super_table[se_id]
         self.assertFalse(super_record.deleted)
 
+# =============================================================================
+class ModelLoadingTests(unittest.TestCase):
+    """ Tests for the model names index and model loading profile """
+
+    # -------------------------------------------------------------------------
+    def testNamesIndex(self):
+        """ Test lookup of model names via the names index """
+
+        assertTrue = self.assertTrue
+        assertFalse = self.assertFalse
+
+        s3db = current.s3db
+
+        index = s3db.names_index("org")
+        assertTrue(any("org_organisation" in models for _, _, models in index))
+        assertTrue(any("org_update_affiliations" in names for _, names, _ in index))
+
+        # Index is retained across DataModel instances
+        self.assertIs(DataModel().names_index("org"), index)
+
+        assertTrue(s3db.has("org_organisation"))
+        assertTrue(s3db.has("org_update_affiliations"))
+        assertFalse(s3db.has("org_nonexistent"))
+        assertFalse(s3db.has("nonexistent_table"))
+
+    # -------------------------------------------------------------------------
+    def testProfile(self):
+        """ Test the model loading profile """
+
+        settings = current.deployment_settings
+        response = current.response
+
+        profile = settings.base.get("model_profile")
+        settings.base.model_profile = True
+        DataModel.profile(reset=True)
+
+        loaded = response.get(DataModel.LOAD) or []
+        try:
+            # Load the org models again
+            response[DataModel.LOAD] = []
+            s3db = current.s3db
+            s3db.load("org")
+        finally:
+            settings.base.model_profile = profile
+            response[DataModel.LOAD] = loaded
+
+        stats = {item["model"]: item for item in DataModel.profile(reset=True)}
+        self.assertIn("OrgOrganisationModel", stats)
+
+        item = stats["OrgOrganisationModel"]
+        self.assertEqual(item["loads"], 1)
+        self.assertTrue(item["exclusive"] <= item["total"])
+
+        self.assertEqual(DataModel.profile(), [])
+
 # =============================================================================
 if __name__ == "__main__":
 
     run_suite(
         SuperEntityTests,
+        ModelLoadingTests,
     )
 
 # END ========================================================================
@@ -336,6 +336,46 @@ class OutboxTests(unittest.TestCase):
         out_msg = outbox[outbox_id]
         self.assertEqual(out_msg.status, 5) # Failed
 
+    # -------------------------------------------------------------------------
+    def testProcessEmailInBatches(self):
+        """ Test processing group and person emails across multiple batches """
+
+        s3db = current.s3db
+        settings = current.deployment_settings
+
+        resource = s3db.resource("pr_group", uid=["MsgTestGroup"])
+        group = resource.select(["pe_id"], as_rows=True).first()
+        resource = s3db.resource("pr_person", uid=["MsgTestPerson1"])
+        person = resource.select(["pe_id"], as_rows=True).first()
+
+        self.sent = []
+
+        outbox = s3db.msg_outbox
+        outbox.insert(pe_id = group.pe_id,
+                      message_id = self.message_id)
+        person_id = outbox.insert(pe_id = person.pe_id,
+                                  message_id = self.message_id)
+
+        batch_size = settings.get_msg_outbox_batch_size()
+        settings.msg.outbox_batch_size = 1
+        try:
+            msg = current.msg
+            msg.send_email = self.send_email
+            msg.process_outbox()
+        finally:
+            settings.msg.outbox_batch_size = batch_size
+
+        # Group members are processed in the same run
+        self.assertEqual(len(self.sent), 3)
+        self.assertEqual(self.sent.count("test1@example.com"), 2)
+        self.assertIn("test2@example.com", self.sent)
+
+        # All entries have been marked as sent
+        query = (outbox.message_id == self.message_id) & \
+                (outbox.status != 2)
+        self.assertEqual(current.db(query).count(), 0)
+        self.assertEqual(outbox[person_id].status, 2)
+
     # -------------------------------------------------------------------------
     def send_email(self, recipient, *args, **kwargs):
         """ Dummy send mechanism """
@@ -11,7 +11,7 @@ from gluon import *
 from gluon.storage import Storage
 from lxml import etree
 
-from core import S3Duplicate, ImportItem, ImportJob, MetaFields
+from core import S3Duplicate, ImportItem, ImportJob, MetaFields, XMLImporter
 from core.resource.importer import ObjectReferences
 
 from unit_tests import run_suite
@@ -521,6 +521,55 @@ class DuplicateDetectionTests(unittest.TestCase):
         assertEqual(item.id, None)
         assertEqual(item.method, item.METHOD.CREATE)
 
+    # -------------------------------------------------------------------------
+    def testFindAll(self):
+        """ Test batch duplicate detection """
+
+        assertEqual = self.assertEqual
+        assertNotIn = self.assertNotIn
+
+        deduplicate = S3Duplicate(primary=("name",),
+                                  secondary=("secondary",),
+                                  )
+
+        table = current.db.dedup_test
+        samples = (Storage(name="Test0"),
+                   Storage(name="Test2", secondary="secondaryX"),
+                   Storage(name="test4", secondary="secondaryX"),
+                   Storage(name="Test"),
+                   Storage(name="Test5"),
+                   Storage(name="test5"),
+                   )
+        items = []
+        for data in samples:
+            item = ImportItem(self.job)
+            item.table = table
+            item.data = data
+            items.append(item)
+
+        duplicates = deduplicate.find_all(items)
+        ids = self.ids
+
+        # Primary match
+        assertEqual(duplicates[items[0].item_id], ids["TEST0"])
+        # Primary match + secondary match
+        assertEqual(duplicates[items[1].item_id], ids["TEST2"])
+        # Primary match + secondary mismatch
+        assertEqual(duplicates[items[2].item_id], None)
+        # Primary mismatch
+        assertEqual(duplicates[items[3].item_id], None)
+
+        # Items that could match each other must be checked one by one
+        assertNotIn(items[4].item_id, duplicates)
+        assertNotIn(items[5].item_id, duplicates)
+
+        # Results are applied like with single-item detection
+        item = items[1]
+        item.method = item.METHOD.CREATE
+        deduplicate.update_item(item, duplicates[item.item_id])
+        assertEqual(item.id, ids["TEST2"])
+        assertEqual(item.method, item.METHOD.UPDATE)
+
     # -------------------------------------------------------------------------
     def testExceptions(self):
         """ Test S3Duplicate exceptions for nonexistent fields """
@@ -1169,6 +1218,338 @@ class UIDCollisionHandlingTests(unittest.TestCase):
             assertEqual(row.type1_id, type1_id)
             assertEqual(row.type2_id, type2_id)
 
+# =============================================================================
+class ChunkedImportTests(unittest.TestCase):
+    """ Tests for imports of element trees in chunks """
+
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        # Define tables for test
+        db.define_table("chunk_type",
+                        Field("name"),
+                        *MetaFields())
+        db.define_table("chunk_master",
+                        Field("name"),
+                        Field("type_id", "reference chunk_type"),
+                        *MetaFields())
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+
+        db.chunk_master.drop()
+        db.chunk_type.drop()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+    def tearDown(self):
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testImportChunks(self):
+        """ References to elements of previous chunks are resolved """
+
+        db = current.db
+
+        assertEqual = self.assertEqual
+
+        chunks = ["""
+<s3xml>
+    <resource name="chunk_type" tuid="CHUNKTYPE1">
+        <data field="name">Type 1</data>
+    </resource>
+    <resource name="chunk_master">
+        <data field="name">Master 1</data>
+        <reference field="type_id" resource="chunk_type" tuid="CHUNKTYPE1"/>
+    </resource>
+</s3xml>""", """
+<s3xml>
+    <resource name="chunk_type" tuid="CHUNKTYPE2">
+        <data field="name">Type 2</data>
+    </resource>
+    <resource name="chunk_master">
+        <data field="name">Master 2</data>
+        <reference field="type_id" resource="chunk_type" tuid="CHUNKTYPE1"/>
+    </resource>
+    <resource name="chunk_master">
+        <data field="name">Master 3</data>
+        <reference field="type_id" resource="chunk_type" tuid="CHUNKTYPE2"/>
+    </resource>
+</s3xml>"""]
+
+        trees = (etree.ElementTree(etree.fromstring(c)) for c in chunks)
+        result = XMLImporter.import_tree("chunk_master", trees)
+        assertEqual(result.success, True)
+        assertEqual(result.count, 3)
+
+        ttable = db.chunk_type
+        types = db(ttable.id > 0).select(ttable.id, ttable.name).as_dict(key="name")
+        assertEqual(len(types), 2)
+
+        mtable = db.chunk_master
+        rows = db(mtable.id > 0).select(mtable.name, mtable.type_id)
+        masters = {row.name: row.type_id for row in rows}
+        assertEqual(masters, {"Master 1": types["Type 1"]["id"],
+                              "Master 2": types["Type 1"]["id"],
+                              "Master 3": types["Type 2"]["id"],
+                              })
+
+    # -------------------------------------------------------------------------
+    def testReleaseElements(self):
+        """ Source elements of parsed items are released between chunks """
+
+        db = current.db
+
+        assertEqual = self.assertEqual
+        assertIsNone = self.assertIsNone
+
+        chunks = ["""
+<s3xml>
+    <resource name="chunk_master">
+        <data field="name">Master 1</data>
+        <reference field="type_id" resource="chunk_type" tuid="CHUNKTYPE1"/>
+    </resource>
+    <resource name="chunk_type" tuid="CHUNKTYPE1">
+        <data field="name">Type 1</data>
+    </resource>
+</s3xml>""", """
+<s3xml>
+    <resource name="chunk_master">
+        <data field="name">Master 2</data>
+        <reference field="type_id" resource="chunk_type" tuid="CHUNKTYPE1"/>
+    </resource>
+</s3xml>"""]
+
+        trees = [etree.ElementTree(etree.fromstring(c)) for c in chunks]
+        matching = XMLImporter.matching_elements
+
+        # Add the items of the first chunk, then release the elements
+        job = ImportJob(db.chunk_master, tree=trees[0])
+        for element in matching(trees[0], "chunk_master"):
+            job.add_item(element=element)
+        assertEqual(len(job.items), 2)
+        assertEqual(len(job.parsed), 2)
+
+        job.release_elements()
+        assertEqual(job.parsed, [])
+        assertEqual(len(job.elements), 0)
+        for item in job.items.values():
+            assertIsNone(item.element)
+            for reference in item.references:
+                assertIsNone(reference.entry.element)
+                # Detached copy of the reference element
+                assertIsNone(reference.element.getparent())
+
+        # Reference to an item of the released chunk is still resolved
+        job.set_tree(trees[1])
+        for element in matching(trees[1], "chunk_master"):
+            job.add_item(element=element)
+        assertEqual(len(job.items), 3)
+        job.release_elements()
+
+        self.assertTrue(job.commit())
+
+        ttable = db.chunk_type
+        mtable = db.chunk_master
+        query = (mtable.type_id == ttable.id) & \
+                (ttable.name == "Type 1")
+        rows = db(query).select(mtable.name, orderby=mtable.name)
+        assertEqual([row.name for row in rows], ["Master 1", "Master 2"])
+
+# =============================================================================
+class BulkImportTests(unittest.TestCase):
+    """ Tests for imports in bulk mode """
+
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        # Define tables for test
+        db.define_table("bulk_type",
+                        Field("name"),
+                        *MetaFields())
+        db.define_table("bulk_master",
+                        Field("name"),
+                        Field("code", unique=True),
+                        Field("type_id", "reference bulk_type"),
+                        *MetaFields())
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+
+        db.bulk_master.drop()
+        db.bulk_type.drop()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        # Record inserts and onaccepts
+        self.inserted = inserted = []
+        self.accepted = accepted = []
+
+        table = current.db.bulk_master
+        table._after_insert.append(lambda fields, record_id: inserted.append(record_id))
+        current.s3db.configure("bulk_master",
+                               onaccept = lambda form: accepted.append(form.vars.id),
+                               )
+
+    def tearDown(self):
+
+        current.auth.override = False
+        current.db.rollback()
+
+        current.db.bulk_master._after_insert.pop()
+        current.s3db.clear_config("bulk_master")
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def tree(masters):
+        """
+            Produce an S3XML tree with master records referencing two types
+
+            Args:
+                masters: list of tuples (name, code, type number)
+
+            Returns:
+                the ElementTree
+        """
+
+        resources = ["""
+    <resource name="bulk_type" tuid="BULKTYPE%s">
+        <data field="name">Type %s</data>
+    </resource>""" % (i, i) for i in (1, 2)]
+
+        resources.extend("""
+    <resource name="bulk_master">
+        <data field="name">%s</data>
+        <data field="code">%s</data>
+        <reference field="type_id" resource="bulk_type" tuid="BULKTYPE%s"/>
+    </resource>""" % master for master in masters)
+
+        xmlstr = "<s3xml>%s</s3xml>" % "".join(resources)
+        return etree.ElementTree(etree.fromstring(xmlstr))
+
+    # -------------------------------------------------------------------------
+    def testBulkImport(self):
+        """ Bulk import writes all records, with callbacks and references """
+
+        db = current.db
+
+        assertEqual = self.assertEqual
+
+        masters = [("Master %s" % i, "CODE%s" % i, i % 2 + 1) for i in range(5)]
+
+        tree = self.tree(masters)
+        result = XMLImporter.import_tree("bulk_master", tree, bulk=True)
+        assertEqual(result.success, True)
+        assertEqual(result.count, 5)
+
+        ttable = db.bulk_type
+        types = db(ttable.id > 0).select(ttable.id, ttable.name).as_dict(key="name")
+
+        mtable = db.bulk_master
+        rows = db(mtable.id > 0).select(mtable.id,
+                                        mtable.name,
+                                        mtable.code,
+                                        mtable.type_id,
+                                        orderby = mtable.id,
+                                        )
+        assertEqual([(row.name, row.code, row.type_id) for row in rows],
+                    [(name, code, types["Type %s" % t]["id"]) for name, code, t in masters])
+
+        # Items received the IDs of their records
+        record_ids = [row.id for row in rows]
+        assertEqual(sorted(result.created), record_ids)
+
+        # Insert callbacks and onaccepts were run for every record
+        assertEqual(sorted(self.inserted), record_ids)
+        assertEqual(sorted(self.accepted), record_ids)
+
+    # -------------------------------------------------------------------------
+    def testBulkImportErrors(self):
+        """ Failing records in a bulk insert do not fail other records """
+
+        db = current.db
+
+        assertEqual = self.assertEqual
+
+        masters = [("Master 1", "CODE1", 1),
+                   ("Master 2", "CODE2", 2),
+                   ("Master 3", "CODE2", 1),
+                   ("Master 4", "CODE4", 2),
+                   ]
+
+        tree = self.tree(masters)
+        result = XMLImporter.import_tree("bulk_master",
+                                         tree,
+                                         bulk = True,
+                                         ignore_errors = True,
+                                         )
+        assertEqual(result.failed, 1)
+
+        mtable = db.bulk_master
+        rows = db(mtable.id > 0).select(mtable.id,
+                                        mtable.name,
+                                        orderby = mtable.id,
+                                        )
+        assertEqual([row.name for row in rows], ["Master 1", "Master 2", "Master 4"])
+
+        # Failing item reported
+        failed = result.error_tree.findall("resource[@name='bulk_master']")
+        assertEqual(len(failed), 1)
+
+        # Callbacks only for the records written
+        record_ids = [row.id for row in rows]
+        assertEqual(sorted(self.accepted), record_ids)
+
+    # -------------------------------------------------------------------------
+    def testBulkInsert(self):
+        """ Bulk insert returns the record IDs, and collects errors """
+
+        from s3dal import S3DAL
+
+        db = current.db
+        table = db.bulk_master
+
+        assertEqual = self.assertEqual
+
+        # Reject records by a _before_insert callback
+        table._before_insert.append(lambda fields: fields.get("name") == "Rejected")
+        try:
+            records = [{"name": "Insert 1", "code": "INSERT1"},
+                       {"name": "Insert 2", "code": "INSERT1"},
+                       {"name": "Rejected", "code": "INSERT3"},
+                       {"name": "Insert 4", "code": "INSERT4"},
+                       {"name": "Insert 5"},
+                       ]
+            errors = {}
+            ids = S3DAL.bulk_insert(table, records, batch_size=2, errors=errors)
+        finally:
+            table._before_insert.pop()
+
+        assertEqual(list(errors.keys()), [1])
+        assertEqual(ids[1], None)
+        assertEqual(ids[2], 0)
+
+        rows = db(table.id.belongs([i for i in ids if i])).select(table.id, table.name)
+        names = {row.id: row.name for row in rows}
+        assertEqual([names.get(record_id) for record_id in ids],
+                    ["Insert 1", None, None, "Insert 4", "Insert 5"])
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -1183,6 +1564,8 @@ if __name__ == "__main__":
         ObjectReferencesTests,
         ObjectReferencesImportTests,
         UIDCollisionHandlingTests,
+        ChunkedImportTests,
+        BulkImportTests,
         )
 
 # END ========================================================================
@@ -477,6 +477,128 @@ class ResourceExportTests(unittest.TestCase):
         uuid = child.get("uuid", None)
         assertEqual(uuid, last)
 
+    # -------------------------------------------------------------------------
+    def testExportStream(self):
+        """ Test streaming export (batch-wise tree building) """
+
+        assertEqual = self.assertEqual
+
+        xml = current.xml
+        s3db = current.s3db
+
+        xmlstr = """
+<s3xml>
+    <resource name="org_organisation" uuid="ESORG">
+        <data field="name">TestExportStreamOrganisation</data>
+        <resource name="org_office" uuid="ESO1">
+            <data field="name">TestExportStreamOffice1</data>
+        </resource>
+        <resource name="org_office" uuid="ESO2">
+            <data field="name">TestExportStreamOffice2</data>
+        </resource>
+        <resource name="org_office" uuid="ESO3">
+            <data field="name">TestExportStreamOffice3</data>
+        </resource>
+    </resource>
+</s3xml>"""
+
+        uids = ["ESO1", "ESO2", "ESO3"]
+
+        def uuids(elements, name):
+            return sorted(e.get("uuid") for e in elements if e.get("name") == name)
+
+        try:
+            xmltree = etree.ElementTree(etree.fromstring(xmlstr))
+            resource = s3db.resource("org_organisation")
+            resource.import_xml(xmltree)
+
+            # Export as tree for comparison
+            resource = s3db.resource("org_office", uid=uids)
+            expected = resource.export_xml(as_tree=True).getroot()
+
+            # Stream S3XML, in batches smaller than the number of records
+            resource = s3db.resource("org_office", uid=uids)
+            stream = S3ResourceTree(resource).stream(batch_size=2)
+            root = etree.fromstring(b"".join(stream))
+
+            assertEqual(root.tag, xml.TAG.root)
+            assertEqual(root.get("success"), "true")
+            assertEqual(root.get("results"), "3")
+            assertEqual(uuids(root, "org_office"), uids)
+            assertEqual(uuids(root, "org_office"), uuids(expected, "org_office"))
+
+            # Referenced organisation exported only once
+            assertEqual(uuids(root, "org_organisation"), ["ESORG"])
+
+            # Stream S3JSON
+            resource = s3db.resource("org_office", uid=uids)
+            stream = S3ResourceTree(resource).stream(as_json=True, batch_size=2)
+            data = json.loads(b"".join(stream))
+
+            assertEqual(data["@results"], "3")
+            assertEqual(sorted(item["@uuid"] for item in data["$_org_office"]), uids)
+            assertEqual([item["@uuid"] for item in data["$_org_organisation"]], ["ESORG"])
+        finally:
+            current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testExportStreamReferencedMasters(self):
+        """
+            Test that master records referenced by records of an earlier
+            batch are still exported as masters (with their components)
+        """
+
+        assertEqual = self.assertEqual
+
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        ftable = s3db.org_office
+
+        try:
+            # Referencing record has the lower ID => earlier batch
+            child_id = otable.insert(name="TestExportStreamChild", uuid="ESCHILD")
+            root_id = otable.insert(name="TestExportStreamRoot", uuid="ESROOT")
+            current.db(otable.id == child_id).update(root_organisation=root_id)
+            ftable.insert(name = "TestExportStreamRootOffice",
+                          uuid = "ESROOTOFFICE",
+                          organisation_id = root_id,
+                          )
+
+            uids = ["ESCHILD", "ESROOT"]
+
+            # S3XML
+            resource = s3db.resource("org_organisation", uid=uids)
+            stream = S3ResourceTree(resource).stream(mcomponents=["office"],
+                                                     batch_size=1,
+                                                     )
+            root = etree.fromstring(b"".join(stream))
+
+            orgs = [e for e in root if e.get("name") == "org_organisation"]
+            assertEqual([e.get("uuid") for e in orgs], uids)
+
+            # Reference resolved, component included
+            child, parent = orgs
+            reference = child.find("reference[@field='root_organisation']")
+            assertEqual(reference.get("uuid"), "ESROOT")
+            offices = parent.findall("resource[@name='org_office']")
+            assertEqual([e.get("uuid") for e in offices], ["ESROOTOFFICE"])
+
+            # S3JSON
+            resource = s3db.resource("org_organisation", uid=uids)
+            stream = S3ResourceTree(resource).stream(mcomponents=["office"],
+                                                     as_json=True,
+                                                     batch_size=1,
+                                                     )
+            data = json.loads(b"".join(stream))
+
+            items = data["$_org_organisation"]
+            assertEqual([item["@uuid"] for item in items], uids)
+            assertEqual([item["@uuid"] for item in items[1]["$_org_office"]],
+                        ["ESROOTOFFICE"])
+        finally:
+            current.db.rollback()
+
     # -------------------------------------------------------------------------
     def testExportXMLWithSyncFilters(self):
         """ Test XML Export with Sync Filters """
@@ -2499,6 +2621,88 @@ class ResourceSelectTests(unittest.TestCase):
         # - returns all matching record ids, however
         assertEqual(len(data.ids), numitems)
 
+    # -------------------------------------------------------------------------
+    def testKeysetPagination(self):
+        """ Test keyset pagination (seek method) """
+
+        assertEqual = self.assertEqual
+
+        resource = current.s3db.resource("select_master")
+        names = [item[0] for item in self.test_data]
+
+        # Keyset pagination not used unless requested
+        data = resource.select(["name"],
+                               limit = 4,
+                               count = True,
+                               orderby = "select_master.id",
+                               )
+        assertEqual([row["select_master.name"] for row in data.rows], names[:4])
+        assertEqual(data.seek, None)
+
+        # First page (offset, but requesting the sort key)
+        data = resource.select(["name"],
+                               limit = 4,
+                               count = True,
+                               orderby = "select_master.id",
+                               seek = True,
+                               )
+        assertEqual([row["select_master.name"] for row in data.rows], names[:4])
+        assertEqual(data.numrows, len(names))
+        seek = data.seek
+        self.assertNotEqual(seek, None)
+
+        # Next pages (seek)
+        data = resource.select(["name"],
+                               start = 4,
+                               limit = 4,
+                               count = True,
+                               orderby = "select_master.id",
+                               seek = seek,
+                               )
+        assertEqual([row["select_master.name"] for row in data.rows], names[4:8])
+        assertEqual(data.numrows, len(names))
+
+        data = resource.select(["name"],
+                               start = 8,
+                               limit = 4,
+                               count = True,
+                               orderby = "select_master.id",
+                               seek = data.seek,
+                               )
+        assertEqual([row["select_master.name"] for row in data.rows], names[8:])
+        assertEqual(data.numrows, len(names))
+
+        # Not used with getids (=all matching record IDs required)
+        data = resource.select(["name"],
+                               start = 4,
+                               limit = 4,
+                               getids = True,
+                               orderby = "select_master.id",
+                               seek = seek,
+                               )
+        assertEqual([row["select_master.name"] for row in data.rows], names[4:8])
+        assertEqual(len(data.ids), len(names))
+        assertEqual(data.seek, None)
+
+        # Invalid seek key falls back to offset
+        data = resource.select(["name"],
+                               start = 4,
+                               limit = 4,
+                               orderby = "select_master.id",
+                               seek = "invalid",
+                               )
+        assertEqual([row["select_master.name"] for row in data.rows], names[4:8])
+
+        # Nullable sort field falls back to offset
+        data = resource.select(["name"],
+                               start = 2,
+                               limit = 4,
+                               orderby = "select_master.name",
+                               seek = seek,
+                               )
+        assertEqual(data.seek, None)
+        assertEqual([row["select_master.name"] for row in data.rows], sorted(names)[2:6])
+
 # =============================================================================
 class ResourceLazyVirtualFieldsSupportTests(unittest.TestCase):
     """ Test support for lazy virtual fields """
@@ -12,6 +12,7 @@ from lxml import etree
 from unit_tests import run_suite
 
 from core import S3SyncDataArchive
+from core.sync.adapters.eden import S3SyncAdapter
 
 # =============================================================================
 class ExportMergeTests(unittest.TestCase):
@@ -467,6 +468,71 @@ class DataArchiveTests(unittest.TestCase):
         extracted = archive.extract("test2.xml").read()
         assertEqual(extracted, xmlstr2)
 
+# =============================================================================
+class PagedSyncTests(unittest.TestCase):
+    """ Test paged export of resources for synchronization """
+
+    def setUp(self):
+
+        current.auth.override = True
+
+        self.uids = ["TESTPAGEDSYNCORG%s" % i for i in range(5)]
+
+        xmlstr = "<s3xml>%s</s3xml>" % "".join(
+                    """<resource name="org_organisation" uuid="%s">
+                           <data field="name">%s</data>
+                       </resource>""" % (uid, uid) for uid in self.uids)
+
+        xmltree = etree.ElementTree(etree.fromstring(xmlstr))
+        resource = current.s3db.resource("org_organisation")
+        resource.import_xml(xmltree)
+
+    def tearDown(self):
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testSelectPage(self):
+        """ Test paging through a resource by modified_on/id keyset """
+
+        assertEqual = self.assertEqual
+        assertTrue = self.assertTrue
+
+        s3db = current.s3db
+        select_page = S3SyncAdapter._select_page
+
+        exported = []
+        cursor = None
+        pages = 0
+        while True:
+            resource = s3db.resource("org_organisation", uid=self.uids)
+            cursor, mtime = select_page(resource, 2, cursor=cursor)
+            pages += 1
+
+            tree = resource.export_xml(as_tree=True)
+            uids = [element.get("uuid")
+                    for element in tree.getroot().findall("resource")]
+            assertTrue(len(uids) <= 2)
+            assertTrue(mtime is not None)
+            exported.extend(uids)
+
+            if not cursor:
+                break
+            assertTrue(pages < 5)
+
+        # All records exported exactly once, in 3 pages
+        assertEqual(pages, 3)
+        assertEqual(sorted(exported), sorted(self.uids))
+
+    # -------------------------------------------------------------------------
+    def testSelectPageInvalidCursor(self):
+        """ Test rejection of invalid page cursors """
+
+        resource = current.s3db.resource("org_organisation", uid=self.uids)
+        with self.assertRaises(ValueError):
+            S3SyncAdapter._select_page(resource, 2, cursor="invalid")
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -478,6 +544,7 @@ if __name__ == "__main__":
         ImportMergeWithExistingDuplicate,
         ImportMergeWithoutExistingRecords,
         DataArchiveTests,
+        PagedSyncTests,
         )
 
 # END ========================================================================
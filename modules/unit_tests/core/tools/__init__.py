@@ -1,7 +1,10 @@
+from .bi import *
 from .calendar import *
 from .convert import *
 from .hierarchy import *
 from .represent import *
+from .searchindex import *
+from .tasks import *
 from .timeseries import *
 from .utils import *
 from .validators import *
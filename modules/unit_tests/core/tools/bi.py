@@ -0,0 +1,237 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/tools/bi.py
+#
+import threading
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from gluon import current
+
+from s3dal import Field
+from core import BulkImporter
+from core.tools import bi
+
+from unit_tests import run_suite
+
+# =============================================================================
+class ParallelImportTests(unittest.TestCase):
+    """ Tests for parallel CSV imports in BulkImporter """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        s3db = current.s3db
+
+        s3db.define_table("bi_parent",
+                          Field("name"),
+                          )
+        s3db.define_table("bi_child",
+                          Field("name"),
+                          Field("parent_id", "reference bi_parent"),
+                          )
+        s3db.define_table("bi_other",
+                          Field("name"),
+                          )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.bi_child.drop()
+        db.bi_parent.drop(mode="cascade")
+        db.bi_other.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        db = current.db
+
+        # Prevent perform_stage from committing the test transaction
+        db.commit = lambda: None
+
+        self.import_worker = bi.import_worker
+
+        self.log = []
+        self.lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        del current.db.commit
+
+        bi.import_worker = self.import_worker
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def task(name):
+        """
+            Produce a CSV import task for a test table
+
+            Args:
+                name: the table name without prefix
+
+            Returns:
+                the task tuple
+        """
+
+        return (1, "bi", name, "%s.csv" % name, "%s.xsl" % name, None)
+
+    # -------------------------------------------------------------------------
+    def worker(self, failing=None):
+        """
+            Produce a replacement for import_worker that logs start and
+            end of tasks (runs in threads instead of processes)
+
+            Args:
+                failing: name of a table for which the worker shall fail
+
+            Returns:
+                the worker function
+        """
+
+        log, lock = self.log, self.lock
+
+        def import_worker(task):
+            name = task[2]
+            with lock:
+                log.append(("start", name))
+            time.sleep(0.1)
+            with lock:
+                log.append(("end", name))
+            if name == failing:
+                raise RuntimeError("Import of %s failed" % name)
+            return ["%s imported" % name], [(name, 0.1)]
+
+        return import_worker
+
+    # -------------------------------------------------------------------------
+    def testTableScope(self):
+        """ Table scope includes the target table and its references """
+
+        scope = BulkImporter.table_scope
+
+        self.assertEqual(scope("bi_parent"), {"bi_parent"})
+        self.assertEqual(scope("bi_child"), {"bi_child", "bi_parent"})
+        self.assertEqual(scope("bi_other"), {"bi_other"})
+
+    # -------------------------------------------------------------------------
+    def testTaskDependencies(self):
+        """ Tasks depend on earlier tasks with overlapping scope """
+
+        task = self.task
+        tasks = [task("parent"),
+                 task("other"),
+                 task("child"),
+                 task("other"),
+                 ]
+
+        dependencies = BulkImporter.task_dependencies(tasks)
+        self.assertEqual(dependencies, {0: set(),
+                                        1: set(),
+                                        2: {0},
+                                        3: {1},
+                                        })
+
+    # -------------------------------------------------------------------------
+    def testDependencyOrder(self):
+        """ Dependent tasks start only after their dependencies end """
+
+        task = self.task
+        tasks = [task("parent"),
+                 task("other"),
+                 task("child"),
+                 ]
+
+        bi.import_worker = self.worker()
+        importer = BulkImporter()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            errors = importer.perform_stage(tasks, executor)
+
+        # Messages in task order
+        self.assertEqual(errors, ["parent imported",
+                                  "other imported",
+                                  "child imported",
+                                  ])
+        self.assertEqual(len(importer.timings), 3)
+
+        log = self.log
+        self.assertLess(log.index(("end", "parent")), log.index(("start", "child")))
+
+        # Independent tasks run concurrently
+        self.assertLess(log.index(("start", "other")), log.index(("end", "parent")))
+
+    # -------------------------------------------------------------------------
+    def testWorkerFailure(self):
+        """ Failing worker is reported, other tasks are completed """
+
+        task = self.task
+        tasks = [task("parent"),
+                 task("other"),
+                 task("child"),
+                 ]
+
+        bi.import_worker = self.worker(failing="parent")
+        importer = BulkImporter()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            errors = importer.perform_stage(tasks, executor)
+
+        self.assertEqual(errors, ["Import of parent failed",
+                                  "other imported",
+                                  "child imported",
+                                  ])
+        self.assertIn(("end", "child"), self.log)
+
+    # -------------------------------------------------------------------------
+    def testParallelStages(self):
+        """ Only CSV imports in declared parallel stages run concurrently """
+
+        task = self.task
+
+        tasks = [task("parent"),
+                 (3,),
+                 task("other"),
+                 task("child"),
+                 (2, "handler"),
+                 task("other"),
+                 ]
+
+        performed = []
+
+        class Importer(BulkImporter):
+
+            def perform_task(self, task):
+                performed.append(("task", task[1] if task[0] == 2 else task[2]))
+                return []
+
+            def perform_stage(self, tasks, executor):
+                performed.append(("stage", [t[2] for t in tasks]))
+                return []
+
+        Importer().perform_parallel(tasks, 2)
+        self.assertEqual(performed, [("task", "parent"),
+                                     ("stage", ["other", "child"]),
+                                     ("task", "handler"),
+                                     ("task", "other"),
+                                     ])
+
+        # Parallel stage marker in task configuration
+        self.assertEqual(BulkImporter.parse_task_line("", ["*", "parallel"]), (3,))
+
+        # ...ignored in sequential imports
+        self.assertEqual(BulkImporter().perform_task((3,)), [])
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        ParallelImportTests,
+    )
+
+# END ========================================================================
@@ -166,6 +166,60 @@ class SimpleHierarchyTests(unittest.TestCase):
         assertEqual(len(nodes), len(uids))
         assertTrue(all(node_id in nodes for node_id in uids.values()))
 
+    # -------------------------------------------------------------------------
+    def testHierarchyCache(self):
+        """ Test reuse of stored hierarchies across requests """
+
+        uids = self.uids
+
+        assertEqual = self.assertEqual
+        assertIs = self.assertIs
+
+        settings = current.deployment_settings
+        hierarchy_cache = settings.get_base_hierarchy_cache()
+        settings.base.hierarchy_cache = True
+
+        hierarchies = current.model["hierarchies"]
+        try:
+            # Build and store the hierarchy
+            h = S3Hierarchy("test_hierarchy")
+            expected = h.children(uids["HIERARCHY1"])
+            h.save()
+
+            # Load the stored hierarchy as in a new request
+            hierarchies.pop("test_hierarchy", None)
+            h = S3Hierarchy("test_hierarchy")
+            assertEqual(h.children(uids["HIERARCHY1"]), expected)
+            store = HierarchyCache.entries["test_hierarchy"][2]
+
+            # Load again => reuses the cached hierarchy
+            hierarchies.pop("test_hierarchy", None)
+            h = S3Hierarchy("test_hierarchy")
+            assertEqual(h.children(uids["HIERARCHY1"]), expected)
+            assertEqual(h.path(uids["HIERARCHY1-1-2"]),
+                        [uids["HIERARCHY1"], uids["HIERARCHY1-1"], uids["HIERARCHY1-1-2"]])
+            assertIs(HierarchyCache.entries["test_hierarchy"][2], store)
+
+            # Labels are not written to the cached hierarchy
+            h.label(uids["HIERARCHY1"])
+            assertEqual(store.node(uids["HIERARCHY1"]).get("l"), None)
+
+            # Update by another process => reloads the hierarchy
+            htable = current.s3db.s3_hierarchy
+            query = (htable.tablename == "test_hierarchy")
+            current.db(query).update(version = htable.version + 1)
+            hierarchies.pop("test_hierarchy", None)
+            h = S3Hierarchy("test_hierarchy")
+            assertEqual(h.children(uids["HIERARCHY1"]), expected)
+            self.assertIsNot(HierarchyCache.entries["test_hierarchy"][2], store)
+
+            # Marking the hierarchy as dirty invalidates the cache
+            S3Hierarchy.dirty("test_hierarchy")
+            assertEqual(HierarchyCache.entries.get("test_hierarchy"), None)
+        finally:
+            settings.base.hierarchy_cache = hierarchy_cache
+            hierarchies.pop("test_hierarchy", None)
+
     # -------------------------------------------------------------------------
     def testPreprocessCreateNode(self):
         """ Test preprocessing of a create-node request """
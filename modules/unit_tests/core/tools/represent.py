@@ -1041,6 +1041,123 @@ class ExportLazyFKRepresentationTests(unittest.TestCase):
         except:
             pass
 
+# =============================================================================
+class RepresentCacheTests(unittest.TestCase):
+    """ Tests for the process-wide representation cache """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        otable = current.s3db.org_organisation
+        self.org_id = otable.insert(name="Represent Cache Test Organisation")
+
+        RepresentCache.clear()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        RepresentCache.clear()
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def testCacheLookup(self):
+        """ Test that cached representations are shared across instances """
+
+        assertEqual = self.assertEqual
+
+        org_id = self.org_id
+
+        # First instance performs a lookup
+        r = S3Represent(lookup="org_organisation", cache=True)
+        assertEqual(r(org_id), "Represent Cache Test Organisation")
+        assertEqual(r.queries, 1)
+
+        stats = RepresentCache.stats("org_organisation")
+        assertEqual(stats["hits"], 0)
+        assertEqual(stats["misses"], 1)
+
+        # Second instance with same config uses the cache
+        r = S3Represent(lookup="org_organisation", cache=True)
+        assertEqual(r(org_id), "Represent Cache Test Organisation")
+        assertEqual(r.queries, 0)
+
+        stats = RepresentCache.stats("org_organisation")
+        assertEqual(stats["hits"], 1)
+        assertEqual(stats["misses"], 1)
+
+        # Instance with different config does not
+        r = S3Represent(lookup="org_organisation", fields=["acronym"], cache=True)
+        r(org_id)
+        assertEqual(r.queries, 1)
+
+        # Instance without cache does not
+        r = S3Represent(lookup="org_organisation", cache=False)
+        r(org_id)
+        assertEqual(r.queries, 1)
+
+    # -------------------------------------------------------------------------
+    def testCustomLookup(self):
+        """ Test that representations with custom lookups are not cached """
+
+        class CustomRepresent(S3Represent):
+            def lookup_rows(self, key, values, fields=None):
+                return super().lookup_rows(key, values, fields=fields)
+
+        org_id = self.org_id
+
+        for _ in range(2):
+            r = CustomRepresent(lookup="org_organisation", cache=True)
+            self.assertEqual(r(org_id), "Represent Cache Test Organisation")
+            self.assertIsNone(r.ckey)
+            self.assertEqual(r.queries, 1)
+
+    # -------------------------------------------------------------------------
+    def testInvalidate(self):
+        """ Test invalidation of cached representations """
+
+        assertEqual = self.assertEqual
+
+        org_id = self.org_id
+
+        r = S3Represent(lookup="org_organisation", cache=True)
+        r.bulk([org_id])
+        assertEqual(r.queries, 1)
+
+        current.db(current.s3db.org_organisation.id == org_id).update(name="Renamed")
+        RepresentCache.invalidate("org_organisation")
+
+        r = S3Represent(lookup="org_organisation", cache=True)
+        assertEqual(r(org_id), "Renamed")
+        assertEqual(r.queries, 1)
+
+    # -------------------------------------------------------------------------
+    def testInvalidateAfterTransaction(self):
+        """ Test that lookups concurrent with pending writes are not cached """
+
+        assertEqual = self.assertEqual
+
+        org_id = self.org_id
+        tablename = "org_organisation"
+
+        # Lookup started before another transaction writes the table
+        generation = RepresentCache.generation(tablename)
+        RepresentCache.invalidate(tablename)
+        RepresentCache.store(tablename, "test", {org_id: "Old"}, generation)
+        assertEqual(RepresentCache.get(tablename, "test", [org_id]), {})
+
+        # Lookup inside the writing transaction
+        generation = RepresentCache.generation(tablename)
+        RepresentCache.store(tablename, "test", {org_id: "New"}, generation)
+        assertEqual(RepresentCache.get(tablename, "test", [org_id]), {org_id: "New"})
+
+        # Discarded at the end of the transaction
+        current.db.rollback()
+        assertEqual(RepresentCache.get(tablename, "test", [org_id]), {})
+
 # =============================================================================
 if __name__ == "__main__":
 
@@ -1048,6 +1165,7 @@ if __name__ == "__main__":
         BulkRepresentTests,
         ExtractLazyFKRepresentationTests,
         ExportLazyFKRepresentationTests,
+        RepresentCacheTests,
     )
 
 # END ========================================================================
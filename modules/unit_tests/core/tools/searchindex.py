@@ -0,0 +1,145 @@
+# Eden unit tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/tools/searchindex.py
+#
+import unittest
+
+from gluon import current
+
+from core import *
+
+from unit_tests import run_suite
+
+# =============================================================================
+class SearchIndexTests(unittest.TestCase):
+    """ Tests for the accent-insensitive search index """
+
+    TABLENAME = "search_index_test"
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        settings = current.deployment_settings
+        cls.search_index = settings.database.get("search_index")
+        settings.database.search_index = {cls.TABLENAME: ("name", "comments")}
+
+        db = current.db
+        tablename = cls.TABLENAME
+        if tablename not in db:
+            db.define_table(tablename,
+                            Field("name"),
+                            Field("comments", "text"),
+                            Field("other"),
+                            on_define = SearchIndex.attach,
+                            )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        current.deployment_settings.database.search_index = cls.search_index
+
+        db = current.db
+        db[cls.TABLENAME].drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def lookup(self, fieldname, value):
+        """ Helper to look up record IDs using the search index """
+
+        table = current.db[self.TABLENAME]
+
+        query = SearchIndex.like(table[fieldname], value)
+        rows = current.db(query).select(table.id, orderby=table.id)
+
+        return [row.id for row in rows]
+
+    # -------------------------------------------------------------------------
+    def testNormalize(self):
+        """ Test normalization of search strings """
+
+        assertEqual = self.assertEqual
+
+        normalize = SearchIndex.normalize
+
+        assertEqual(normalize("Ærøskøbing"), "aeroskobing")
+        assertEqual(normalize("Đặng Văn Lâm"), "dang van lam")
+        assertEqual(normalize("STRAẞE"), "strasse")
+        assertEqual(normalize("%Łódź_"), "%lodz_")
+
+    # -------------------------------------------------------------------------
+    def testLike(self):
+        """ Test accent-insensitive LIKE via the search index """
+
+        assertEqual = self.assertEqual
+
+        table = current.db[self.TABLENAME]
+        record_id = table.insert(name="Müller", comments="Überprüft")
+        other_id = table.insert(name="Mueller")
+
+        assertEqual(self.lookup("name", "mull%"), [record_id])
+        assertEqual(self.lookup("name", "MÜ%"), [record_id])
+        assertEqual(self.lookup("name", "%ll%"), [record_id, other_id])
+        assertEqual(self.lookup("comments", "%PRUF%"), [record_id])
+
+        # Not indexed
+        self.assertEqual(SearchIndex.like(table.other, "x%"), None)
+
+    # -------------------------------------------------------------------------
+    def testMaintenance(self):
+        """ Test index maintenance upon update and delete """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        table = db[self.TABLENAME]
+        record_id = table.insert(name="Sørensen")
+        assertEqual(self.lookup("name", "soren%"), [record_id])
+
+        # Update of indexed field
+        db(table.name == "Sørensen").update(name="Jørgensen")
+        assertEqual(self.lookup("name", "soren%"), [])
+        assertEqual(self.lookup("name", "jorgen%"), [record_id])
+
+        # Update of other field
+        db(table.id == record_id).update(other="x")
+        assertEqual(self.lookup("name", "jorgen%"), [record_id])
+
+        # Delete
+        db(table.id == record_id).delete()
+        itable = SearchIndex.table()
+        query = (itable.tablename == self.TABLENAME) & \
+                (itable.record_id == record_id)
+        assertEqual(db(query).count(), 0)
+
+    # -------------------------------------------------------------------------
+    def testRebuild(self):
+        """ Test rebuilding the index """
+
+        db = current.db
+        table = db[self.TABLENAME]
+
+        record_id = table.insert(name="Ångström")
+
+        itable = SearchIndex.table()
+        db(itable.tablename == self.TABLENAME).delete()
+        self.assertEqual(self.lookup("name", "angstrom"), [])
+
+        SearchIndex.rebuild(self.TABLENAME)
+        self.assertEqual(self.lookup("name", "angstrom"), [record_id])
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        SearchIndexTests,
+    )
+
+# END ========================================================================
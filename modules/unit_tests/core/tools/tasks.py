@@ -0,0 +1,369 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/core/tools/tasks.py
+#
+import datetime
+import time
+import unittest
+
+from gluon import current
+
+from core import S3Task
+from core.tools.tasks import LocalTaskPool
+
+from unit_tests import run_suite
+
+# =============================================================================
+def double(x, user_id=None):
+    """ Test task returning a result """
+
+    return {"x": x * 2}
+
+def fail(user_id=None):
+    """ Test task raising an exception """
+
+    raise RuntimeError("Task failed")
+
+def sleep(seconds, user_id=None):
+    """ Test task running for a while """
+
+    time.sleep(seconds)
+
+# =============================================================================
+class LocalTaskPoolTests(unittest.TestCase):
+    """ Tests for LocalTaskPool """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        self.pool = LocalTaskPool(2, 1)
+
+        response = current.response
+        self.custom_commit = response.custom_commit
+        self.custom_rollback = response._custom_rollback
+        self.pending = response.s3.local_tasks_pending
+
+        response.custom_commit = None
+        response._custom_rollback = self.rollback
+        response.s3.local_tasks_pending = None
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        pool = self.pool
+        for task_id in list(pool.tasks):
+            pool.cancel(task_id)
+        for task in pool.tasks.values():
+            task.process.join(5)
+
+        response = current.response
+        response.custom_commit = self.custom_commit
+        response._custom_rollback = self.custom_rollback
+        response.s3.local_tasks_pending = self.pending
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def commit(success=True):
+        """
+            Simulate the end of the current request as web2py does it,
+            i.e. BaseAdapter.close_all_instances(response.custom_commit),
+            but with a dummy DB instance (so without actually committing
+            the test transaction)
+
+            Args:
+                success: whether the commit succeeds
+        """
+
+        from pydal._globals import THREAD_LOCAL
+        from pydal.base import BaseAdapter
+
+        class Adapter:
+            def commit(self):
+                if not success:
+                    raise RuntimeError("Commit failed")
+            def close(self, action):
+                # Like ConnectionPool.close: failed actions are ignored
+                try:
+                    action(self)
+                except Exception:
+                    pass
+
+        class DB:
+            _adapter = Adapter()
+
+        names = ("_pydal_db_instances_", "_pydal_db_instances_zombie_")
+        instances = [getattr(THREAD_LOCAL, name, None) for name in names]
+
+        THREAD_LOCAL._pydal_db_instances_ = {"test": [DB()]}
+        THREAD_LOCAL._pydal_db_instances_zombie_ = {}
+        try:
+            BaseAdapter.close_all_instances(current.response.custom_commit)
+        finally:
+            for name, value in zip(names, instances):
+                if value is None:
+                    delattr(THREAD_LOCAL, name)
+                else:
+                    setattr(THREAD_LOCAL, name, value)
+
+        # Next request
+        response = current.response
+        response.custom_commit = None
+        response.s3.local_tasks_pending = None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def rollback():
+        """
+            Replaces the rollback of the request (so that the test
+            transaction is not rolled back)
+        """
+
+        pass
+
+    # -------------------------------------------------------------------------
+    def wait(self, task_id, statuses, timeout=10):
+        """
+            Wait until a task has reached any of the statuses
+
+            Args:
+                task_id: the task ID
+                statuses: tuple of statuses
+                timeout: the maximum time to wait (seconds)
+
+            Returns:
+                the task status (Storage)
+        """
+
+        end = time.time() + timeout
+        while True:
+            status = self.pool.status(task_id)
+            if status.status in statuses or time.time() > end:
+                return status
+            time.sleep(0.05)
+
+    # -------------------------------------------------------------------------
+    def testComplete(self):
+        """ Task runs after commit, and reports its result """
+
+        assertEqual = self.assertEqual
+
+        pool = self.pool
+
+        task_id = pool.submit("double", double, [3], {"user_id": 1})
+        self.assertTrue(task_id.startswith("local-"))
+
+        # Not released before the request commits
+        time.sleep(0.2)
+        status = pool.status(task_id)
+        assertEqual(status.status, "QUEUED")
+        assertEqual(status.task, "double")
+        assertEqual(status.user_id, 1)
+
+        self.commit()
+
+        status = self.wait(task_id, LocalTaskPool.FINAL)
+        assertEqual(status.status, "COMPLETED")
+        assertEqual(status.result, {"x": 6})
+        self.assertIsNone(status.error)
+        self.assertIsNotNone(status.stop_time)
+
+        # Internals not exposed
+        self.assertNotIn("process", status)
+        self.assertNotIn("messages", status)
+
+        # Unknown task
+        self.assertIsNone(pool.status("local-unknown"))
+
+    # -------------------------------------------------------------------------
+    def testFailure(self):
+        """ Exceptions in the task are reported as failure """
+
+        pool = self.pool
+
+        task_id = pool.submit("fail", fail, [], {})
+        self.commit()
+
+        status = self.wait(task_id, LocalTaskPool.FINAL)
+        self.assertEqual(status.status, "FAILED")
+        self.assertIn("Task failed", status.error)
+        self.assertIsNone(status.result)
+
+    # -------------------------------------------------------------------------
+    def testNoCommit(self):
+        """ Task is cancelled if the request does not commit """
+
+        pool = self.pool
+
+        task_id = pool.submit("double", double, [3], {}, timeout=1)
+
+        status = self.wait(task_id, LocalTaskPool.FINAL)
+        self.assertEqual(status.status, "CANCELLED")
+        self.assertEqual(status.error, "Request did not commit")
+
+    # -------------------------------------------------------------------------
+    def testCommitFailure(self):
+        """ Task is cancelled if the commit fails """
+
+        pool = self.pool
+
+        task_id = pool.submit("double", double, [3], {})
+        self.commit(success=False)
+
+        status = self.wait(task_id, LocalTaskPool.FINAL)
+        self.assertEqual(status.status, "CANCELLED")
+        self.assertEqual(status.error, "Request did not commit")
+
+    # -------------------------------------------------------------------------
+    def testRollback(self):
+        """ Task is cancelled if the request rolls back """
+
+        pool = self.pool
+
+        task_id = pool.submit("double", double, [3], {})
+
+        # Request fails
+        current.response._custom_rollback()
+
+        # Cancelled without waiting for the timeout
+        status = self.wait(task_id, LocalTaskPool.FINAL, timeout=5)
+        self.assertEqual(status.status, "CANCELLED")
+        self.assertEqual(status.error, "Request did not commit")
+
+    # -------------------------------------------------------------------------
+    def testClosed(self):
+        """ Tasks are cancelled if the request ends without signal """
+
+        pool = self.pool
+
+        task_ids = [pool.submit("double", double, [i], {}) for i in range(2)]
+
+        # Request ends without commit (response.do_not_commit),
+        # the response with the pending connections is discarded
+        response = current.response
+        for go in response.s3.local_tasks_pending:
+            go.close()
+        response.custom_commit = None
+        response.s3.local_tasks_pending = None
+
+        # Cancelled without waiting for the timeout
+        for task_id in task_ids:
+            status = self.wait(task_id, LocalTaskPool.FINAL, timeout=5)
+            self.assertEqual(status.status, "CANCELLED")
+            self.assertEqual(status.error, "Request did not commit")
+
+    # -------------------------------------------------------------------------
+    def testTimeout(self):
+        """ Task is terminated after the timeout """
+
+        pool = self.pool
+
+        task_id = pool.submit("sleep", sleep, [10], {}, timeout=1)
+        self.commit()
+
+        status = self.wait(task_id, LocalTaskPool.FINAL)
+        self.assertEqual(status.status, "TIMEOUT")
+
+    # -------------------------------------------------------------------------
+    def testCancel(self):
+        """ Running tasks can be cancelled """
+
+        assertEqual = self.assertEqual
+
+        pool = self.pool
+
+        task_id = pool.submit("sleep", sleep, [10], {})
+        self.commit()
+
+        status = self.wait(task_id, ("RUNNING",))
+        assertEqual(status.status, "RUNNING")
+
+        self.assertTrue(pool.cancel(task_id))
+        status = pool.status(task_id)
+        assertEqual(status.status, "CANCELLED")
+        self.assertIsNotNone(status.stop_time)
+
+        # Process ends
+        process = pool.tasks[task_id].process
+        process.join(5)
+        self.assertFalse(process.is_alive())
+
+        # Cannot cancel again, nor cancel unknown tasks
+        self.assertFalse(pool.cancel(task_id))
+        self.assertFalse(pool.cancel("local-unknown"))
+
+        # Status remains
+        assertEqual(pool.status(task_id).status, "CANCELLED")
+
+    # -------------------------------------------------------------------------
+    def testQueueSize(self):
+        """ Number of active tasks is limited to workers + queue size """
+
+        assertEqual = self.assertEqual
+
+        pool = self.pool
+
+        task_ids = [pool.submit("sleep", sleep, [0.5], {}) for _ in range(3)]
+        self.assertTrue(all(task_ids))
+
+        # Queue full
+        self.assertIsNone(pool.submit("sleep", sleep, [0.5], {}))
+
+        self.commit()
+
+        # Only two tasks running concurrently
+        time.sleep(0.2)
+        statuses = [pool.status(task_id).status for task_id in task_ids]
+        assertEqual(statuses.count("RUNNING"), 2)
+        assertEqual(statuses.count("QUEUED"), 1)
+
+        for task_id in task_ids:
+            status = self.wait(task_id, LocalTaskPool.FINAL)
+            assertEqual(status.status, "COMPLETED")
+
+        # Final tasks no longer count against the queue
+        self.assertIsNotNone(pool.submit("double", double, [1], {}))
+
+# =============================================================================
+class SchedulerAliveTests(unittest.TestCase):
+    """ Tests for the cached scheduler liveness check """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        self.alive = S3Task.alive
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        S3Task.alive = self.alive
+
+    # -------------------------------------------------------------------------
+    def testCache(self):
+        """ Liveness check is cached for ALIVE_TTL seconds """
+
+        now = datetime.datetime.now()
+
+        # Recent status is reused without querying the database
+        S3Task.alive = (now, "cached")
+        self.assertEqual(S3Task._is_alive(), "cached")
+
+        # Expired status is refreshed
+        expired = now - datetime.timedelta(seconds=S3Task.ALIVE_TTL + 1)
+        S3Task.alive = (expired, "cached")
+        alive = S3Task._is_alive()
+        self.assertIn(alive, (True, False))
+
+        timestamp, cached = S3Task.alive
+        self.assertGreaterEqual(timestamp, now)
+        self.assertEqual(cached, alive)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        LocalTaskPoolTests,
+        SchedulerAliveTests,
+    )
+
+# END ========================================================================
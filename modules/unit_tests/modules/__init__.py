@@ -1 +1,2 @@
-
+from .s3cfg import *
+from .s3dal import *
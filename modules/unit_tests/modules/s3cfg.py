@@ -0,0 +1,101 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/modules/s3cfg.py
+
+import unittest
+
+from gluon import current
+
+from s3cfg import S3Config
+
+from unit_tests import run_suite
+
+# =============================================================================
+class SettingsSnapshotTests(unittest.TestCase):
+    """ Tests for the settings snapshot and getter profile """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        settings = S3Config()
+        settings.base.settings_snapshot = True
+        settings.base.settings_profile = True
+
+        self.settings = settings.freeze()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.response.s3.settings_profile = None
+
+    # -------------------------------------------------------------------------
+    def testSnapshot(self):
+        """ Test memoizing of getter results """
+
+        assertEqual = self.assertEqual
+
+        settings = self.settings
+        snapshot = settings._snapshot
+
+        settings.ui.filter_formstyle = "default"
+        formstyle = settings.get_ui_filter_formstyle()
+        assertEqual(snapshot.get("get_ui_filter_formstyle"), formstyle)
+
+        # Trivial getters are not memoized
+        settings.get_ui_confirm()
+        self.assertNotIn("get_ui_confirm", snapshot)
+
+        # Changing a setting discards the snapshot
+        settings.ui.filter_formstyle = "default_inline"
+        self.assertNotIn("get_ui_filter_formstyle", snapshot)
+        formstyle = settings.get_ui_filter_formstyle()
+        assertEqual(formstyle, S3Config._get_formstyle("default_inline"))
+
+        settings.get_database_type()
+        self.assertIn("get_database_type", snapshot)
+        settings.database.update(db_type="postgres")
+        self.assertNotIn("get_database_type", snapshot)
+
+    # -------------------------------------------------------------------------
+    def testNoSnapshot(self):
+        """ Test that getters are not memoized without freeze """
+
+        settings = S3Config()
+        settings.ui.filter_formstyle = "default"
+        settings.get_ui_filter_formstyle()
+
+        self.assertEqual(settings._snapshot, None)
+
+    # -------------------------------------------------------------------------
+    def testProfile(self):
+        """ Test counting of getter calls """
+
+        assertEqual = self.assertEqual
+
+        settings = self.settings
+        current.response.s3.settings_profile = None
+
+        S3Config.profile(reset=True)
+        for _ in range(3):
+            settings.get_ui_confirm()
+            settings.get_ui_filter_formstyle()
+
+        calls = current.response.s3.settings_profile
+        assertEqual(calls["get_ui_confirm"], 3)
+        assertEqual(calls["get_ui_filter_formstyle"], 3)
+
+        profile = {item["getter"]: item for item in S3Config.profile()}
+        stats = profile["get_ui_confirm"]
+        assertEqual(stats["calls"], 3)
+        assertEqual(stats["requests"], 1)
+        assertEqual(stats["max"], 3)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        SettingsSnapshotTests,
+    )
+
+# END ========================================================================
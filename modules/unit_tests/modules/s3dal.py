@@ -0,0 +1,145 @@
+# Eden Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/modules/s3dal.py
+
+import unittest
+
+from gluon import current, Field
+
+from s3dal import S3DAL
+
+from unit_tests import run_suite
+
+# =============================================================================
+class BulkUpdateTests(unittest.TestCase):
+    """ Tests for S3DAL.bulk_update """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        # Define test table
+        db.define_table("s3dal_bulk_update",
+                        Field("name"),
+                        Field("code"),
+                        )
+
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.s3dal_bulk_update.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        table = current.db.s3dal_bulk_update
+
+        self.ids = [table.insert(name = "Update %s" % i,
+                                 code = "UPDATE%s" % i,
+                                 )
+                    for i in range(5)]
+
+    def tearDown(self):
+
+        table = current.db.s3dal_bulk_update
+        table._before_update.clear()
+        table._after_update.clear()
+
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def records(self):
+        """ Get the name and code of the test records, in ID order """
+
+        db = current.db
+        table = db.s3dal_bulk_update
+
+        rows = db(table.id.belongs(self.ids)).select(table.name,
+                                                     table.code,
+                                                     orderby = table.id,
+                                                     )
+        return [(row.name, row.code) for row in rows]
+
+    # -------------------------------------------------------------------------
+    def testBulkUpdate(self):
+        """ Bulk update writes individual values per record """
+
+        assertEqual = self.assertEqual
+
+        table = current.db.s3dal_bulk_update
+        ids = self.ids
+
+        updates = {ids[0]: {"name": "Updated 0"},
+                   ids[1]: {"name": "Updated 1", "code": None},
+                   ids[2]: {"name": "Updated 2"},
+                   ids[3]: {"name": "It's updated"},
+                   ids[4]: {},
+                   }
+        count = S3DAL.bulk_update(table, updates, batch_size=2)
+
+        assertEqual(count, 4)
+        assertEqual(self.records(),
+                    [("Updated 0", "UPDATE0"),
+                     ("Updated 1", None),
+                     ("Updated 2", "UPDATE2"),
+                     ("It's updated", "UPDATE3"),
+                     ("Update 4", "UPDATE4"),
+                     ])
+
+    # -------------------------------------------------------------------------
+    def testCallbacks(self):
+        """ Callbacks run per record, with the values of the record """
+
+        assertEqual = self.assertEqual
+
+        db = current.db
+        table = db.s3dal_bulk_update
+        ids = self.ids
+
+        def record_id(dbset):
+            rows = dbset.select(table.id)
+            assertEqual(len(rows), 1)
+            return rows.first().id
+
+        # Veto the update of the second record
+        before = []
+        def before_update(dbset, fields):
+            before.append((record_id(dbset), fields["name"]))
+            return fields["name"] == "Updated 1"
+
+        after = []
+        def after_update(dbset, fields):
+            after.append((record_id(dbset), fields["name"]))
+
+        table._before_update.append(before_update)
+        table._after_update.append(after_update)
+
+        updates = {ids[i]: {"name": "Updated %s" % i} for i in range(3)}
+        count = S3DAL.bulk_update(table, updates, batch_size=2)
+
+        # Other records in the batch are still updated
+        assertEqual(count, 2)
+        assertEqual(sorted(before), [(ids[i], "Updated %s" % i) for i in range(3)])
+        assertEqual(sorted(after), [(ids[i], "Updated %s" % i) for i in (0, 2)])
+
+        assertEqual(self.records(),
+                    [("Updated 0", "UPDATE0"),
+                     ("Update 1", "UPDATE1"),
+                     ("Updated 2", "UPDATE2"),
+                     ("Update 3", "UPDATE3"),
+                     ("Update 4", "UPDATE4"),
+                     ])
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        BulkUpdateTests,
+    )
+
+# END ========================================================================
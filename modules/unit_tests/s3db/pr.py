@@ -146,6 +146,100 @@ class PRTests(unittest.TestCase):
         current.db.rollback()
         current.auth.override = False
 
+# =============================================================================
+class AncestorClosureTests(unittest.TestCase):
+    """ Tests for the OU ancestor closure """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        s3db = current.s3db
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.ancestor_closure = settings.get_pr_ancestor_closure()
+
+        # Create an organisation hierarchy org1 > org2 > org3
+        otable = s3db.org_organisation
+        pe_ids = []
+        for i in range(3):
+            org = Storage(name="Test Closure Organisation %s" % i)
+            org["id"] = otable.insert(**org)
+            s3db.update_super(otable, org)
+            pe_ids.append(s3db.pr_get_pe_id("org_organisation", org.id))
+        self.pe_ids = pe_ids
+
+        s3db.pr_add_affiliation(pe_ids[0], pe_ids[1], role="Branches")
+        s3db.pr_add_affiliation(pe_ids[1], pe_ids[2], role="Branches")
+
+    def tearDown(self):
+
+        settings = current.deployment_settings
+        settings.pr.ancestor_closure = self.ancestor_closure
+
+        current.db.rollback()
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def lookups(self, closure):
+        """ Look up ancestors and descendants of the test hierarchy """
+
+        current.deployment_settings.pr.ancestor_closure = closure
+
+        s3db = current.s3db
+        org1, org2, org3 = self.pe_ids
+
+        ancestors = s3db.pr_ancestors([org2, org3])
+        return {"ancestors": {k: set(v) for k, v in ancestors.items()},
+                "get_ancestors": set(s3db.pr_get_ancestors(org3)),
+                "descendants": {k: set(v) for k, v in s3db.pr_descendants([org1]).items()},
+                "get_descendants": set(s3db.pr_get_descendants([org1, org2])),
+                }
+
+    # -------------------------------------------------------------------------
+    def testClosure(self):
+        """ Test that closure lookups match the recursive lookups """
+
+        assertEqual = self.assertEqual
+
+        org1, org2, org3 = self.pe_ids
+
+        result = self.lookups(True)
+        assertEqual(result["ancestors"], {org2: {org1}, org3: {org1, org2}})
+        assertEqual(result["get_ancestors"], {org1, org2})
+        assertEqual(result["descendants"], {org1: {org2, org3}})
+        assertEqual(result["get_descendants"], {org2, org3})
+
+        assertEqual(result, self.lookups(False))
+
+        # Check depths
+        ctable = current.s3db.pr_ancestor
+        query = (ctable.pe_id == org3)
+        rows = current.db(query).select(ctable.ancestor_id, ctable.depth)
+        assertEqual({row.ancestor_id: row.depth for row in rows}, {org1: 2, org2: 1})
+
+    # -------------------------------------------------------------------------
+    def testUpdate(self):
+        """ Test that removing an affiliation updates the descendants """
+
+        assertEqual = self.assertEqual
+
+        s3db = current.s3db
+        org1, org2, org3 = self.pe_ids
+
+        s3db.pr_remove_affiliation(org1, org2, role="Branches")
+
+        result = self.lookups(True)
+        assertEqual(result["ancestors"], {org2: set(), org3: {org2}})
+        assertEqual(result["get_descendants"], {org3})
+
+        assertEqual(result, self.lookups(False))
+
+        # Rebuild produces the same closure
+        s3db.pr_rebuild_ancestors()
+        assertEqual(self.lookups(True), result)
+
 # =============================================================================
 class PersonDeduplicateTests(unittest.TestCase):
     """ PR Tests """
@@ -772,6 +866,7 @@ if __name__ == "__main__":
 
     run_suite(
         PRTests,
+        AncestorClosureTests,
         PersonDeduplicateTests,
         ContactValidationTests,
         ContactRepresentationTests,
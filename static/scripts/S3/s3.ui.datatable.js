@@ -554,6 +554,7 @@
                     requestStart  = request.start,
                     drawStart     = request.start,
                     requestLength = request.length,
+                    sameQuery     = !!cacheLastRequest,
                     cached;
 
                 // Determine total and available records
@@ -575,6 +576,7 @@
 
                 if (requestLength == -1) {
                     // Showing all records
+                    sameQuery = false;
                     requestStart = 0;
                     if (availableRecords !== undefined) {
                         requestLength = availableRecords;
@@ -592,6 +594,7 @@
                         // API requested that the cache be cleared
                         cacheCombined.clear();
                         settings.clearCache = false;
+                        sameQuery = false;
                         ajax = true;
 
                     } else if (cacheLastRequest &&
@@ -600,6 +603,7 @@
                                 JSON.stringify(request.search)  !== JSON.stringify(cacheLastRequest.search))) {
                         // Properties changed (ordering, columns, searching)
                         cacheCombined.clear();
+                        sameQuery = false;
                         ajax = true;
 
                     } else {
@@ -616,6 +620,17 @@
 
                 if (ajax) {
                     // Need data from the server
+
+                    // If the next page directly follows the last server
+                    // response, send its sort key so that the server can
+                    // use keyset pagination (faster for deep pages),
+                    // otherwise request the sort key for the next page
+                    var seek = 'true';
+                    if (sameQuery && cacheLastJson && cacheLastJson.seek &&
+                        requestStart == cacheUpper) {
+                        seek = cacheLastJson.seek;
+                    }
+
                     if (requestStart < cacheLower) {
                         requestStart = requestStart - (requestLength * (conf.pages - 1));
                         if (requestStart < 0) {
@@ -667,6 +682,9 @@
                                        'value': requestStart
                                        });
                     }
+                    sendData.push({'name': 'seek',
+                                   'value': seek
+                                   });
                     if (request.search && request.search.value) {
                         sendData.push({'name': 'sSearch',
                                        'value': request.search.value
@@ -22,9 +22,9 @@ function(a,b){var c=this.availableRecords;if(c<0)return null;a<0&&(a=0);if(a>=c)
 this._bulkSelectRestore();a.dataTable({ajax:g,autoWidth:!1,columns:this.columnConfigs,deferRender:!0,destroy:b.destroy,dom:c.dom,lengthMenu:c.lengthMenu,order:c.order,orderFixed:c.group,ordering:!0,pageLength:c.pageLength,pagingType:c.pagingType,processing:f,searchDelay:450,searching:c.searching,serverSide:d,search:{smart:d},language:{aria:{sortAscending:": "+i18n.sortAscending,sortDescending:": "+i18n.sortDescending},paginate:{first:i18n.first,last:i18n.last,next:i18n.next,previous:i18n.previous},
 emptyTable:i18n.emptyTable,info:i18n.info,infoEmpty:i18n.infoEmpty,infoFiltered:i18n.infoFiltered,infoThousands:i18n.infoThousands,lengthMenu:i18n.lengthMenu,loadingRecords:i18n.loadingRecords+"...",processing:i18n.processing+"...",search:i18n.search+":",zeroRecords:i18n.zeroRecords},rowCallback:this._rowCallback(),drawCallback:this._drawCallback(),initComplete:S3.dataTables.initComplete});this._bindEvents()}},_parseConfig:function(){var a=e(this.element),b=e(this.selector+"_configurations");if(b.length){this.tableConfig=
 b=JSON.parse(b.val());b.rowActions.length?b.rowActionsJSON=!0:(b.rowActionsJSON=!1,b.rowActions=S3.dataTables.Actions?S3.dataTables.Actions:[]);var c=[];a=e("thead tr",a).children().length;for(var d=0;d<a;d++)c[d]=null;b.rowActions.length>0&&(c[b.actionCol]={sTitle:" ",bSortable:!1,className:"dt-actions actions"});b.bulkActions&&(a=" ",b.bulkSingle||(a='<div class="bulk-select-options"><input class="bulk-select-all" type="checkbox" title="'+i18n.selectAll+'"></input></div>'),c[b.bulkCol]={sTitle:a,
-bSortable:!1,className:"dt-bulk"});if(b.colWidths){var f;a=b.colWidths;for(f in a)c[f]!=null?c[f].sWidth=a[f]:c[f]={sWidth:a[f]}}this.columnConfigs=c;return b}},_pipeline:function(a){var b=e.extend({cache:{},pages:2,data:null,method:"GET"},a);a=b.cache;var c=a.cacheLastRequest||null,d=a.cacheLastJson||null,f=a.cacheLower;f===w&&(f=-1);var g=new z;d&&f!=-1&&g.store(f,d.data,d.recordsFiltered||d.recordsTotal);var k=this;return function(h,m,p){if(this.hasOwnProperty("nTable")){if(h=p.sAjaxSource)k.ajaxUrl=
-h,p.sAjaxSource=null;c=d=null;f=-1;g.clear();m({})}else{var n=!1,l=h.start,r=h.start,t=h.length,q=h.recordsTotal,u=q;d&&(d.recordsTotal!==w&&(q=d.recordsTotal),u=d.recordsFiltered!==w?d.recordsFiltered:q);k.totalRecords=q;t==-1&&(l=0,u!==w?t=u:n=!0);if(!n)if(q=l+t,p.clearCache)g.clear(),p.clearCache=!1,n=!0;else if(!c||JSON.stringify(h.order)===JSON.stringify(c.order)&&JSON.stringify(h.columns)===JSON.stringify(c.columns)&&JSON.stringify(h.search)===JSON.stringify(c.search)){var v=g.retrieve(l,q-
-l);v===null&&(n=!0)}else g.clear(),n=!0;c=e.extend(!0,{},h);if(n){l<f&&(l-=t*(b.pages-1),l<0&&(l=0));f=l;h.start=l;h.length=t*b.pages;e.isFunction(b.data)?(v=b.data(h))&&e.extend(h,v):e.isPlainObject(b.data)&&e.extend(h,b.data);v=[{name:"draw",value:h.draw},{name:"limit",value:t==-1?"none":h.length}];l!=0&&v.push({name:"start",value:l});h.search&&h.search.value&&(v.push({name:"sSearch",value:h.search.value}),v.push({name:"iColumns",value:h.columns.length}));if(n=h.order.length){v.push({name:"iSortingCols",
+bSortable:!1,className:"dt-bulk"});if(b.colWidths){var f;a=b.colWidths;for(f in a)c[f]!=null?c[f].sWidth=a[f]:c[f]={sWidth:a[f]}}this.columnConfigs=c;return b}},_pipeline:function(a){var b=e.extend({cache:{},pages:2,data:null,method:"GET"},a);a=b.cache;var c=a.cacheLastRequest||null,d=a.cacheLastJson||null,I=a.cacheUpper||null,f=a.cacheLower;f===w&&(f=-1);var g=new z;d&&f!=-1&&g.store(f,d.data,d.recordsFiltered||d.recordsTotal);var k=this;return function(h,m,p){if(this.hasOwnProperty("nTable")){if(h=p.sAjaxSource)k.ajaxUrl=
+h,p.sAjaxSource=null;c=d=I=null;f=-1;g.clear();m({})}else{var n=!1,J=!!c,K,l=h.start,r=h.start,t=h.length,q=h.recordsTotal,u=q;d&&(d.recordsTotal!==w&&(q=d.recordsTotal),u=d.recordsFiltered!==w?d.recordsFiltered:q);k.totalRecords=q;t==-1&&(J=!1,l=0,u!==w?t=u:n=!0);if(!n)if(q=l+t,p.clearCache)g.clear(),p.clearCache=!1,J=!1,n=!0;else if(!c||JSON.stringify(h.order)===JSON.stringify(c.order)&&JSON.stringify(h.columns)===JSON.stringify(c.columns)&&JSON.stringify(h.search)===JSON.stringify(c.search)){var v=g.retrieve(l,q-
+l);v===null&&(n=!0)}else g.clear(),J=!1,n=!0;c=e.extend(!0,{},h);if(n){K=J&&d&&d.seek&&l==I?d.seek:"true";l<f&&(l-=t*(b.pages-1),l<0&&(l=0));f=l;I=h.length!=-1?l+t*b.pages:t;h.start=l;h.length=t*b.pages;e.isFunction(b.data)?(v=b.data(h))&&e.extend(h,v):e.isPlainObject(b.data)&&e.extend(h,b.data);v=[{name:"draw",value:h.draw},{name:"limit",value:t==-1?"none":h.length}];l!=0&&v.push({name:"start",value:l});v.push({name:"seek",value:K});h.search&&h.search.value&&(v.push({name:"sSearch",value:h.search.value}),v.push({name:"iColumns",value:h.columns.length}));if(n=h.order.length){v.push({name:"iSortingCols",
 value:n});u=k.columnConfigs;var A;for(q=0;q<u.length;q++)(A=u[q])&&!A.bSortable&&v.push({name:"bSortable_"+q,value:"false"});for(q=0;q<n;q++)u=h.order[q],v.push({name:"iSortCol_"+q,value:u.column}),v.push({name:"sSortDir_"+q,value:u.dir})}h=e.ajaxS3;var F=!1;e.searchS3!==w&&(h=e.searchS3,F=!0);p.jqXHR=h({type:b.method,url:k.ajaxUrl,data:v,dataType:"json",cache:!1,success:function(x){if(F){var y=document.createElement("a");y.href=window.location.href;const C=new URLSearchParams(y.search);C.get("$search")||
 (C.append("$search","session"),y.search=C.toString(),window.history.replaceState(null,null,y.href))}y=k.totalRecords;x.recordsFiltered!==w&&(y=x.recordsFiltered,k.totalRecords=x.recordsFiltered);g.store(l,x.data,y);d=e.extend(!0,{},x);l!=r&&x.data.splice(0,r-l);t!=-1&&x.data.splice(t,x.data.length);m(x)}})}else p=e.extend(!0,{},d,{draw:h.draw}),p.data=v,m(p)}}},_initCache:function(){var a=e(this.selector+"_dataTable_cache");return this.pipelineCache=a=a.length>0?JSON.parse(a.val()):{}},_headerCallback:function(){},
 _rowCallback:function(){var a=this,b=this.tableConfig,c=b.actionCol,d=b.rowActions;return function(f,g){var k=/>(.*)</i.exec(g[c]);k=k===null?g[c]:k[1];if(d.length||b.bulkActions){for(var h=[],m=0;m<d.length;m++)h.push(a._renderActionButton(k,d[m]));e("td:eq("+c+")",f).html(h.join(""))}b.bulkActions&&a._bulkSelect(f,B(k,a.selectedRows));if(m=b.rowStyles){h=e(f);for(var p in m)B(k,m[p])!=-1&&h.addClass(p)}a._truncateCellContents(f,g);return f}},_drawCallback:function(){var a=this;return function(b){var c=
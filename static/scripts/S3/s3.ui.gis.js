@@ -222,10 +222,15 @@
                     url = S3.Ap.concat(url);
                 } */
 
-                vectorSource = new ol.source.Vector({
-                    url: url,
-                    format: format
-                });
+                if (undefined != layer.tile_url) {
+                    // Load per-tile GeoJSON for the visible extent
+                    vectorSource = this.tileSource(layer.tile_url, format);
+                } else {
+                    vectorSource = new ol.source.Vector({
+                        url: url,
+                        format: format
+                    });
+                }
 
                 vectorLayer = new ol.layer.Vector({
                     source: vectorSource,
@@ -250,6 +255,44 @@
             }
         },
 
+        /**
+         * Vector Source loading GeoJSON per XYZ tile (see FeatureTiles)
+         *
+         * @param {string} tileURL - the URL template with {z}, {x} and {y}
+         * @param {ol.format.GeoJSON} format - the GeoJSON format
+         */
+        tileSource: function(tileURL, format) {
+
+            var tileGrid = ol.tilegrid.createXYZ({tileSize: 256}),
+                tileStrategy = ol.loadingstrategy.tile(tileGrid),
+                source,
+                zoom;
+
+            source = new ol.source.Vector({
+                format: format,
+                strategy: function(extent, resolution) {
+                    // Clusters and simplified geometries are specific for
+                    // the zoom level, so drop all features when it changes
+                    // (lines/polygons spanning multiple tiles have the same
+                    // feature ID in all tiles, so only one copy is kept)
+                    var z = tileGrid.getZForResolution(resolution);
+                    if (zoom !== undefined && z != zoom) {
+                        source.clear(true);
+                    }
+                    zoom = z;
+                    return tileStrategy(extent, resolution);
+                },
+                url: function(extent, resolution) {
+                    var tileCoord = tileGrid.getTileCoordForCoordAndResolution(ol.extent.getCenter(extent), resolution);
+                    return tileURL.replace('{z}', tileCoord[0])
+                                  .replace('{x}', tileCoord[1])
+                                  .replace('{y}', tileCoord[2]);
+                }
+            });
+
+            return source;
+        },
+
         /**
          * Style a Vector Layer
          */
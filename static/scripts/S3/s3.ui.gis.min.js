@@ -1,7 +1,7 @@
 (function(m){m(window.jQuery,window._,window.ol)})(function(m,z,h){var D=0;m.widget("s3.showMap",{options:{id:"default_map",i18n:{loading:"Loading",requires_login:"Requires Login"},lat:0,lon:0,zoom:0,layers_osm:[]},_create:function(){this.id=D;D+=1;this.eventNamespace=".s3Map";this.proxyHost=S3.Ap.concat("/gis/proxy?url=")},_init:function(b){this.refresh()},_destroy:function(){m.Widget.prototype.destroy.call(this)},refresh:function(){var b=this.options,a=this.addLayers();this.map=b=new h.Map({layers:a,
 target:b.id,view:new h.View({center:h.proj.fromLonLat([b.lon,b.lat]),zoom:b.zoom})});this.tooltip=a=m("#"+this.options.id+" .s3-gis-tooltip");a=new h.Overlay({element:a[0],positioning:"bottom-center",stopEvent:!1,offset:[0,-15]});b.addOverlay(a);this.tooltip_ol=a;this._bindEvents(b)},addLayers:function(){var b=[];this.addLayersOSM(b);this.addLayersGeoJSON(b);return b},addLayersOSM:function(b){for(var a,d,f=this.options.layers_osm||[],l,k,g=0;g<f.length;g++)d=f[g],a=void 0!=d.attribution?[d.attribution]:
 [h.source.OSM.ATTRIBUTION],l=void 0!=d.maxZoom?d.maxZoom:19,k=void 0!=d.base?d.base:!0,d=void 0!=d.url?d.url:"https://{a-c}.tile.openstreetmap.org/{z}/{x}/{y}.png",a={attributions:a,maxZoom:l,opaque:k,url:d},b.push(new h.layer.Tile({source:new h.source.OSM(a)}))},addLayersGeoJSON:function(b){var a=this.options,d=a.layers_feature||[];var f=a.layers_geojson||[];var l=a.layers_georss||[];var k=a.layers_shapefile||[];var g=a.layers_theme||[];a=(a.feature_queries||[]).concat(a.feature_resources||[]).concat(d).concat(f).concat(l).concat(k).concat(g);
-for(d=0;d<a.length;d++)f=a[d],k=void 0!=f.projection?new h.format.GeoJSON({dataProjection:"EPSG:"+f.projection}):new h.format.GeoJSON({dataProjection:"EPSG:4326"}),l=this.layerStyle(f),g=f.url,k=new h.source.Vector({url:g,format:k}),l=new h.layer.Vector({source:k,style:l}),void 0!=f.popup_format&&(l.s3_popup_format=f.popup_format),f=void 0!=f.type?f.type:"feature",l.s3_layer_type=f,b.push(l)},layerStyle:function(b){if(void 0!==b.marker)b=new h.style.Style({image:new h.style.Icon({src:S3.Ap.concat("/static/img/markers/"+
+for(d=0;d<a.length;d++)f=a[d],k=void 0!=f.projection?new h.format.GeoJSON({dataProjection:"EPSG:"+f.projection}):new h.format.GeoJSON({dataProjection:"EPSG:4326"}),l=this.layerStyle(f),g=f.url,k=void 0!=f.tile_url?this.tileSource(f.tile_url,k):new h.source.Vector({url:g,format:k}),l=new h.layer.Vector({source:k,style:l}),void 0!=f.popup_format&&(l.s3_popup_format=f.popup_format),f=void 0!=f.type?f.type:"feature",l.s3_layer_type=f,b.push(l)},tileSource:function(b,a){var d=h.tilegrid.createXYZ({tileSize:256}),e=h.loadingstrategy.tile(d),c,g;return c=new h.source.Vector({format:a,strategy:function(a,b){var f=d.getZForResolution(b);void 0!==g&&f!=g&&c.clear(!0);g=f;return e(a,b)},url:function(a,f){a=d.getTileCoordForCoordAndResolution(h.extent.getCenter(a),f);return b.replace("{z}",a[0]).replace("{x}",a[1]).replace("{y}",a[2])}})},layerStyle:function(b){if(void 0!==b.marker)b=new h.style.Style({image:new h.style.Icon({src:S3.Ap.concat("/static/img/markers/"+
 b.marker.i)})});else if(void 0!==b.marker)b=b.style;else{b=new h.style.Fill({color:"rgba(255,255,255,0.4)"});var a=new h.style.Stroke({color:"#3399CC",width:1.25}),d=new h.style.Icon({src:S3.Ap.concat("/static/img/markers/"+this.options.marker)}),f={Point:new h.style.Style({image:d}),LineString:new h.style.Style({stroke:a}),MultiLineString:new h.style.Style({stroke:a}),MultiPoint:new h.style.Style({image:d}),MultiPolygon:new h.style.Style({stroke:a,fill:b}),Polygon:new h.style.Style({stroke:a,fill:b}),
 GeometryCollection:new h.style.Style({stroke:a,fill:b,image:d}),Circle:new h.style.Style({stroke:a,fill:b})};b=function(l){return f[l.getGeometry().getType()]}}return b},addPopup:function(b,a,d,f,l){var k=this.map;a=this.id+"_"+a.ol_uid+"_"+b.get("id")+"_popup";l&&d?(d.indexOf("http://")===0&&(d=this.proxyHost+encodeURIComponent(d)),f='<iframe src="'+d+'" onload="S3.gis.popupLoaded(\''+a+'\')" class="loading" marginWidth="0" marginHeight="0" frameBorder="0"></iframe>'):void 0==f&&(f=this.options.i18n.loading+
 '...<div class="throbber"></div>');m("#"+this.options.id).append('<div id="'+a+'" class="s3-gis-popup"><div class="s3-gis-popup-close"></div><div class="s3-gis-popup-content"></div></div>');var g=m("#"+a),v=new h.Overlay({element:g[0],positioning:"bottom-center",offset:[0,-12]});k.addOverlay(v);b=b.getGeometry().getCoordinates();v.setPosition(b);m("#"+a+" .s3-gis-popup-content").html(f);g.show();m("#"+a+" .s3-gis-popup-close").on("click",{id:a,map:k,overlay:v},this.removePopup);l||void 0==d||this._loadDetails(d,
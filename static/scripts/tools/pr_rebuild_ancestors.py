@@ -0,0 +1,9 @@
+#!/usr/bin/python
+
+# This is a script to rebuild the OU ancestor closure (pr_ancestor) in the Database
+
+# Needs to be run in the web2py environment
+# python web2py.py -S eden -M -R applications/eden/static/scripts/tools/pr_rebuild_ancestors.py
+
+s3db.pr_rebuild_ancestors()
+db.commit()